@@ -57,4 +57,4 @@ def draft_report(
     if template_hint:
         system += f"Report style: {template_hint}. "
     user = f"Report title: {title}\n\nContext:\n{context}\n\nProduce the report draft."
-    return call_llm(system, user, max_tokens=max_tokens)
+    return call_llm(system, user, max_tokens=max_tokens, stage="report")
@@ -61,7 +61,7 @@ def _llm_signal_check(passage: str) -> Dict[str, Any]:
         "risk (schedule/cost risk), change (change order/scope change), or dispute (claim/disagreement)? "
         "Reply with ONLY a JSON object: {\"risk\": true/false, \"change\": true/false, \"dispute\": true/false}. No other text."
     )
-    reply, err = call_llm(system, passage[:1500], max_tokens=64)
+    reply, err = call_llm(system, passage[:1500], max_tokens=64, stage="signals")
     if err:
         return {"risk": False, "change": False, "dispute": False}
     import json
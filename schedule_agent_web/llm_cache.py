@@ -0,0 +1,161 @@
+"""
+Persistent LLM response cache in front of the gateway (schedule_agent_web.llm_gateway).
+
+Replies are keyed by a SHA-256 fingerprint of (provider, model, system, messages, max_tokens,
+temperature), so re-running an extraction-style stage (document classification / relations / summary,
+digest, schedule extraction) on the same input returns the stored reply without a provider call.
+Chat and baseline review / exception calls opt out: a re-run there is a request for a fresh answer.
+Entries live in SQLite (file_store/llm_cache.db) and are evicted least-recently-used once the stored
+replies exceed LLM_CACHE_MAX_MB. LLM_CACHE=0 disables the cache; DELETE /api/admin/llm-cache clears it.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+CACHE_PATH = Path(os.environ.get("LLM_CACHE_PATH") or Path(__file__).resolve().parent / "file_store" / "llm_cache.db")
+try:
+    MAX_BYTES = int(float(os.environ.get("LLM_CACHE_MAX_MB") or 256) * 1024 * 1024)
+except ValueError:
+    MAX_BYTES = 256 * 1024 * 1024
+EVICT_TO = 0.9  # evict down to this fraction of MAX_BYTES
+
+
+def enabled() -> bool:
+    return (os.environ.get("LLM_CACHE") or "1").strip().lower() not in ("0", "false", "off", "no")
+
+
+def fingerprint(provider: str, model: str, system: str | None, messages: list, max_tokens: int,
+                temperature: float | None) -> str:
+    """Cache key of one request (content blocks, e.g. images, included)."""
+    payload = json.dumps([provider, model, system or "", messages, max_tokens, temperature],
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed reply store with byte-bounded LRU eviction and hit / miss counters."""
+
+    def __init__(self, path: Path = CACHE_PATH, max_bytes: int = MAX_BYTES):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        self._bytes = 0
+        self.counts = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(str(self.path), check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key      TEXT PRIMARY KEY,
+                    stage    TEXT NOT NULL DEFAULT '',
+                    reply    TEXT NOT NULL,
+                    size     INTEGER NOT NULL,
+                    created  REAL NOT NULL,
+                    used     REAL NOT NULL,
+                    hits     INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS responses_used ON responses(used)")
+            self._bytes = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            self._db = db
+        return self._db
+
+    def get(self, key: str) -> str | None:
+        """Stored reply (marking it recently used), or None."""
+        try:
+            with self._lock:
+                db = self._conn()
+                row = db.execute("SELECT reply FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.counts["misses"] += 1
+                    return None
+                db.execute("UPDATE responses SET used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+                db.commit()
+                self.counts["hits"] += 1
+                return row[0]
+        except sqlite3.Error:
+            return None
+
+    def put(self, key: str, reply: str, stage: str = "") -> None:
+        size = len(reply.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        try:
+            with self._lock:
+                db = self._conn()
+                old = db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                db.execute("INSERT OR REPLACE INTO responses (key, stage, reply, size, created, used) "
+                           "VALUES (?, ?, ?, ?, ?, ?)", (key, stage, reply, size, now, now))
+                self._bytes += size - (old[0] if old else 0)
+                self.counts["stores"] += 1
+                if self._bytes > self.max_bytes:
+                    self._evict(db)
+                db.commit()
+        except sqlite3.Error:
+            pass
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        """Drop least-recently-used replies until the store is under EVICT_TO of its bound."""
+        target = int(self.max_bytes * EVICT_TO)
+        while self._bytes > target:
+            rows = db.execute("SELECT key, size FROM responses ORDER BY used LIMIT 256").fetchall()
+            if not rows:
+                self._bytes = 0
+                break
+            for key, size in rows:
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._bytes -= size
+                self.counts["evictions"] += 1
+                if self._bytes <= target:
+                    break
+
+    def clear(self, stage: str | None = None) -> int:
+        """Delete every reply (or one stage's); returns the number removed."""
+        try:
+            with self._lock:
+                db = self._conn()
+                if stage is None:
+                    n = db.execute("DELETE FROM responses").rowcount
+                else:
+                    n = db.execute("DELETE FROM responses WHERE stage = ?", (stage,)).rowcount
+                db.commit()
+                self._bytes = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                return n
+        except sqlite3.Error:
+            return 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.counts["hits"] + self.counts["misses"]
+            try:
+                entries = self._conn().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            except sqlite3.Error:
+                entries = None
+            return {**self.counts, "hitRate": round(self.counts["hits"] / lookups, 3) if lookups else None,
+                    "entries": entries, "bytes": self._bytes, "maxBytes": self.max_bytes, "enabled": enabled()}
+
+
+_cache: ResponseCache | None = None
+_cache_lock = threading.Lock()
+
+
+def response_cache() -> ResponseCache:
+    """The process-wide cache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
@@ -0,0 +1,647 @@
+"""
+LLM gateway — one place where every stage (chat, review, digest, NLP, signals, report drafting, vision,
+embeddings) reaches Claude or OpenAI.
+
+Clients are long-lived: one SDK client per provider and API key, each owning a keep-alive connection
+pool, so a request reuses warm TLS connections instead of building a new client (and handshake) per
+call. Async callers get their own clients per event loop. Models, timeouts, retries and token caps are
+read from the environment here and nowhere else:
+
+  ANTHROPIC_MODEL, OPENAI_CHAT_MODEL, LLM_TIMEOUT, LLM_MAX_RETRIES, CLAUDE_MAX_TOKENS, OPENAI_MAX_TOKENS,
+  LLM_MODEL_TTL, LLM_BREAKER_FAILURES, LLM_BREAKER_SECONDS, LLM_PROMPT_CACHE, LLM_PROVIDER.
+
+The Claude model is resolved once per key, not per call: the account's model list is probed once, the
+model that answers is remembered for LLM_MODEL_TTL, and a circuit breaker per model moves calls down the
+fallback chain only after the model is missing (404) or has failed LLM_BREAKER_FAILURES times in a row.
+
+complete() / acomplete() return (reply, error) like the callers they replace; Claude is preferred when
+ANTHROPIC_API_KEY is set. Replies are served from / saved to the persistent response cache
+(schedule_agent_web.llm_cache) unless the caller passes cache=False.
+
+A system prompt may be a list of PromptSegment, stable segments first: Claude gets a prompt-cache
+breakpoint after each stable segment (so an unchanged skill / project prefix is read from the provider's
+cache on the next turn), OpenAI gets the joined text (its prefix caching is automatic). LLM_PROVIDER=fake
+selects a local provider that answers without a network and reports Anthropic-style cache usage, for
+checking prefix hits without keys.
+"""
+from __future__ import annotations
+
+import os
+import hashlib
+import threading
+import time
+import weakref
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, NamedTuple
+
+from schedule_agent_web import llm_cache
+
+try:
+    from anthropic import Anthropic, AsyncAnthropic
+except ImportError:
+    Anthropic = AsyncAnthropic = None
+try:
+    from openai import OpenAI, AsyncOpenAI
+except ImportError:
+    OpenAI = AsyncOpenAI = None
+
+
+def _env_number(name: str, default, cast=int):
+    try:
+        return cast(os.environ.get(name) or default)
+    except ValueError:
+        return default
+
+
+CLAUDE_MODELS = ("claude-sonnet-4-20250514", "claude-3-5-sonnet-20241022", "claude-3-5-haiku-20241022",
+                 "claude-3-haiku-20240307")
+OPENAI_MODEL = "gpt-4o-mini"
+TEMPERATURE = 0.3
+TIMEOUT = _env_number("LLM_TIMEOUT", 600.0, float)
+MAX_RETRIES = _env_number("LLM_MAX_RETRIES", 2)
+CLAUDE_MAX_TOKENS = _env_number("CLAUDE_MAX_TOKENS", 64000)
+OPENAI_MAX_TOKENS = _env_number("OPENAI_MAX_TOKENS", 16384)
+MODEL_TTL = _env_number("LLM_MODEL_TTL", 3600.0, float)
+BREAKER_FAILURES = _env_number("LLM_BREAKER_FAILURES", 3)
+BREAKER_SECONDS = _env_number("LLM_BREAKER_SECONDS", 60.0, float)
+PROMPT_CACHE = (os.environ.get("LLM_PROMPT_CACHE") or "1").strip().lower() not in ("0", "false", "off", "no")
+MAX_BREAKPOINTS = 4  # Anthropic allows four cache_control blocks per request
+STREAM_ABOVE_TOKENS = 8192  # Claude rejects long non-streaming requests
+
+FAKE = "fake"
+NO_KEY = "No API key. Set OPENAI_API_KEY or ANTHROPIC_API_KEY."
+NO_CLAUDE = "ANTHROPIC_API_KEY not set or anthropic package not installed."
+NO_CLAUDE_MODEL = ("No Claude model available. Set ANTHROPIC_MODEL in Vercel to a model your account has "
+                   "(e.g. claude-3-haiku-20240307).")
+QUOTA_HINT = (" Use Claude instead: in Vercel set ANTHROPIC_API_KEY (get a key at console.anthropic.com) "
+              "and redeploy.")
+
+
+# -- keys and configuration ----------------------------------------------------------------------
+
+def _read_key(env: str) -> str:
+    raw = os.environ.get(env) or os.environ.get(env + "_FILE")
+    if raw and Path(raw).is_file():
+        return Path(raw).read_text().strip()
+    return raw or ""
+
+
+def openai_key() -> str:
+    return _read_key("OPENAI_API_KEY")
+
+
+def anthropic_key() -> str:
+    return _read_key("ANTHROPIC_API_KEY")
+
+
+def _usable(key: str) -> bool:
+    return bool(key and len(key) > 10)
+
+
+def provider() -> str | None:
+    """"claude" if an Anthropic key is set (overrides OpenAI when both are), else "openai", else None.
+
+    LLM_PROVIDER=fake selects the local fake provider regardless of keys.
+    """
+    if (os.environ.get("LLM_PROVIDER") or "").strip().lower() == FAKE:
+        return FAKE
+    if _usable(anthropic_key()) and Anthropic is not None:
+        return "claude"
+    if _usable(openai_key()) and OpenAI is not None:
+        return "openai"
+    return None
+
+
+def claude_models(model: str | None = None) -> list[str]:
+    """Models to try in order: the requested / configured one, then the defaults."""
+    first = model or os.environ.get("ANTHROPIC_MODEL") or CLAUDE_MODELS[0]
+    return [first] + [m for m in CLAUDE_MODELS if m != first]
+
+
+def openai_model(model: str | None = None) -> str:
+    return model or os.environ.get("OPENAI_CHAT_MODEL") or OPENAI_MODEL
+
+
+# -- pooled clients ------------------------------------------------------------------------------
+
+_lock = threading.Lock()
+_clients: dict[tuple[str, str], object] = {}
+_async_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def _build(kind: str, key: str, async_: bool):
+    cls = {("claude", False): Anthropic, ("claude", True): AsyncAnthropic,
+           ("openai", False): OpenAI, ("openai", True): AsyncOpenAI}[kind, async_]
+    return cls(api_key=key, timeout=TIMEOUT, max_retries=MAX_RETRIES)
+
+
+def _client(kind: str, key: str):
+    c = _clients.get((kind, key))
+    if c is None:
+        with _lock:
+            c = _clients.get((kind, key))
+            if c is None:
+                c = _clients[kind, key] = _build(kind, key, False)
+    return c
+
+
+def _async_client(kind: str, key: str):
+    """Async clients are bound to the event loop that opened their connections: one pool per loop."""
+    import asyncio
+    loop = asyncio.get_running_loop()
+    with _lock:
+        per_loop = _async_clients.setdefault(loop, {})
+        c = per_loop.get((kind, key))
+        if c is None:
+            c = per_loop[kind, key] = _build(kind, key, True)
+    return c
+
+
+def anthropic_client(key: str | None = None):
+    """Shared Anthropic client for the key (default: ANTHROPIC_API_KEY); None without key or package."""
+    key = key or anthropic_key()
+    return _client("claude", key) if _usable(key) and Anthropic is not None else None
+
+
+def openai_client(key: str | None = None):
+    """Shared OpenAI client for the key (default: OPENAI_API_KEY); None without key or package."""
+    key = key or openai_key()
+    return _client("openai", key) if _usable(key) and OpenAI is not None else None
+
+
+def close() -> None:
+    """Drop the pooled sync clients (their connections close as they are collected)."""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for c in clients:
+        try:
+            c.close()
+        except Exception:
+            pass
+
+
+# -- per-stage counters --------------------------------------------------------------------------
+
+_stats: dict[str, dict] = {}
+
+
+_USAGE_FIELDS = (("inputTokens", "input_tokens"), ("outputTokens", "output_tokens"),
+                 ("promptCacheReadTokens", "cache_read_input_tokens"),
+                 ("promptCacheWriteTokens", "cache_creation_input_tokens"))
+
+
+def _record(stage: str, started: float, err: str | None, cached: bool = False, usage: dict | None = None) -> None:
+    with _lock:
+        s = _stats.get(stage or "other")
+        if s is None:
+            s = _stats[stage or "other"] = {"calls": 0, "cached": 0, "errors": 0, "seconds": 0.0,
+                                            **{name: 0 for name, _ in _USAGE_FIELDS}}
+        s["calls"] += 1
+        s["cached"] += cached
+        s["errors"] += err is not None
+        s["seconds"] += time.perf_counter() - started
+        for name, field in _USAGE_FIELDS:
+            s[name] += (usage or {}).get(field) or 0
+
+
+def stats() -> dict:
+    """Calls (cached ones counted apart), errors and seconds per stage, pooled clients, model health, cache."""
+    with _lock:
+        stages = {k: {**v, "seconds": round(v["seconds"], 3)} for k, v in _stats.items()}
+        clients = len(_clients)
+    return {"stages": stages, "clients": clients, "models": _models.snapshot(),
+            "cache": llm_cache.response_cache().stats()}
+
+
+# -- model resolution ----------------------------------------------------------------------------
+
+MISSING, TRANSIENT, OTHER = "missing", "transient", "other"
+
+
+def _failure_kind(e: Exception) -> str:
+    """missing: the model does not exist for this key; transient: overload, rate limit, timeout, network."""
+    status = getattr(e, "status_code", None)
+    if status == 404 or "not_found" in str(e).lower():
+        return MISSING
+    if status is None:
+        name = type(e).__name__
+        return TRANSIENT if "Timeout" in name or "Connection" in name else OTHER
+    return TRANSIENT if status == 429 or status >= 500 else OTHER
+
+
+class ModelResolver:
+    """Working model per (API key, preferred model), cached for MODEL_TTL, plus a circuit breaker per model.
+
+    A missing model is skipped for MODEL_TTL; a model with BREAKER_FAILURES consecutive transient
+    failures is skipped for BREAKER_SECONDS (then tried again). When every model is skipped the full
+    chain is tried, so an outage never leaves the gateway with nothing to call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resolved: dict[tuple[str, str], tuple[str, float]] = {}
+        self._listed: dict[str, tuple[set[str] | None, float]] = {}
+        self._health: dict[tuple[str, str], list] = {}  # [consecutive failures, skip until, kind]
+
+    def needs_probe(self, key: str) -> bool:
+        listed = self._listed.get(key)
+        return listed is None or listed[1] < time.monotonic()
+
+    def set_listed(self, key: str, models: set[str] | None) -> None:
+        """Model ids the account reports (None if listing is unsupported / failed: plain trial order)."""
+        with self._lock:
+            self._listed[key] = (models, time.monotonic() + MODEL_TTL)
+
+    def candidates(self, key: str, chain: list[str]) -> list[str]:
+        """chain in trial order, skipping open breakers.
+
+        The preferred model (chain[0]) always leads unless its own calls have failed; the remembered
+        fallback and then listed models only order the rest, so a configured alias the listing does
+        not report is still tried first.
+        """
+        now = time.monotonic()
+        with self._lock:
+            resolved = self._resolved.get((key, chain[0]))
+            listed = (self._listed.get(key) or (None, 0))[0]
+            health = self._health
+            rest = chain[1:]
+            if listed:
+                rest = [m for m in rest if m in listed] + [m for m in rest if m not in listed]
+            if resolved and resolved[1] > now and resolved[0] in rest:
+                rest = [resolved[0]] + [m for m in rest if m != resolved[0]]
+            order = chain[:1] + rest
+            usable = [m for m in order if health.get((key, m), (0, 0))[1] <= now]
+        return usable or order
+
+    def succeeded(self, key: str, chain: list[str], model: str) -> None:
+        with self._lock:
+            self._health.pop((key, model), None)
+            self._resolved[key, chain[0]] = (model, time.monotonic() + MODEL_TTL)
+
+    def failed(self, key: str, chain: list[str], model: str, e: Exception) -> bool:
+        """Record a failed call; True if the next model should be tried for this request."""
+        kind = _failure_kind(e)
+        if kind == OTHER:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            h = self._health.setdefault((key, model), [0, 0.0, kind])
+            h[0] += 1
+            h[2] = kind
+            if kind == MISSING:
+                h[1] = now + MODEL_TTL
+            elif h[0] >= BREAKER_FAILURES:
+                h[1] = now + BREAKER_SECONDS
+            if h[1] > now and self._resolved.get((key, chain[0]), ("",))[0] == model:
+                del self._resolved[key, chain[0]]
+        return kind == MISSING
+
+    def snapshot(self) -> dict:
+        """Per model: resolved (serving some key), open (being skipped) and recent failures; no keys."""
+        now = time.monotonic()
+        out: dict[str, dict] = {}
+        with self._lock:
+            for (model, expires) in self._resolved.values():
+                if expires > now:
+                    out.setdefault(model, {"resolved": False, "open": False, "failures": 0})["resolved"] = True
+            for (_, model), (fails, until, kind) in self._health.items():
+                rec = out.setdefault(model, {"resolved": False, "open": False, "failures": 0})
+                rec["failures"] += fails
+                rec["open"] |= until > now
+                rec["last"] = kind
+        return out
+
+    def clear(self) -> None:
+        with self._lock:
+            self._resolved.clear()
+            self._listed.clear()
+            self._health.clear()
+
+
+_models = ModelResolver()
+
+
+def _model_ids(page) -> set[str] | None:
+    ids = {getattr(m, "id", "") for m in getattr(page, "data", None) or []}
+    ids.discard("")
+    return ids or None
+
+
+def _list_models(client) -> set[str] | None:
+    try:
+        return _model_ids(client.models.list(limit=100))
+    except Exception:
+        return None
+
+
+async def _alist_models(client) -> set[str] | None:
+    try:
+        return _model_ids(await client.models.list(limit=100))
+    except Exception:
+        return None
+
+
+# -- prompts -------------------------------------------------------------------------------------
+
+class PromptSegment(NamedTuple):
+    """One part of a system prompt; stable segments end in a prompt-cache breakpoint."""
+
+    name: str
+    text: str
+    stable: bool = True
+
+    @property
+    def version(self) -> str:
+        return hashlib.sha1(self.text.encode("utf-8")).hexdigest()[:12]
+
+
+def system_text(system) -> str:
+    """A system prompt (string or PromptSegment list) as one string."""
+    if system is None or isinstance(system, str):
+        return system or ""
+    return "".join(seg.text for seg in system)
+
+
+def _claude_system(system):
+    """String system prompts pass through; segments become text blocks, stable ones marked for caching."""
+    if system is None or isinstance(system, str):
+        return system or None
+    segs = [seg for seg in system if seg.text]
+    stable = [k for k, seg in enumerate(segs) if seg.stable] if PROMPT_CACHE else []
+    marks = set(stable[-MAX_BREAKPOINTS:])
+    blocks = []
+    for k, seg in enumerate(segs):
+        block = {"type": "text", "text": seg.text}
+        if k in marks:
+            block["cache_control"] = {"type": "ephemeral"}
+        blocks.append(block)
+    return blocks or None
+
+
+class FakeProvider:
+    """Local stand-in for Claude (LLM_PROVIDER=fake): deterministic replies, no network.
+
+    Mimics Anthropic prompt caching: the prefix up to each cache_control block is remembered for
+    TTL seconds; a request reads the longest remembered prefix and writes the rest up to its last
+    breakpoint. usage reports input / cache read / cache write tokens (CHARS_PER_TOKEN chars each).
+    """
+
+    TTL = 300.0
+    CHARS_PER_TOKEN = 4
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._prefixes: dict[str, float] = {}
+
+    def create(self, model: str, max_tokens: int, messages: list, system=None, **_) -> SimpleNamespace:
+        blocks = [{"type": "text", "text": system}] if isinstance(system, str) else list(system or [])
+        for m in messages:
+            content = m["content"]
+            blocks.extend([{"type": "text", "text": content}] if isinstance(content, str) else content)
+        now = time.monotonic()
+        h = hashlib.sha256()
+        pos = read = last_mark = 0
+        marks = []
+        for b in blocks:
+            text = b.get("text") or str(b.get("source", ""))
+            h.update(text.encode("utf-8"))
+            pos += len(text)
+            if b.get("cache_control"):
+                marks.append((h.hexdigest(), pos))
+                last_mark = pos
+        with self._lock:
+            for key, upto in marks:
+                if self._prefixes.get(key, 0) > now:
+                    read = upto
+                self._prefixes[key] = now + self.TTL
+        last = next((m["content"] for m in reversed(messages) if isinstance(m["content"], str)), "")
+        t = self.CHARS_PER_TOKEN
+        usage = SimpleNamespace(input_tokens=(pos - last_mark) // t, output_tokens=0,
+                                cache_read_input_tokens=read // t, cache_creation_input_tokens=(last_mark - read) // t)
+        text = f"[{FAKE} {model}] {last[:200]}"
+        usage.output_tokens = min(len(text) // t, max_tokens)
+        return SimpleNamespace(content=[SimpleNamespace(type="text", text=text)], usage=usage, model=model)
+
+
+_fake = FakeProvider()
+
+
+# -- requests ------------------------------------------------------------------------------------
+
+def _claude_request(system, messages: list, max_tokens: int) -> dict:
+    req = {"max_tokens": min(max_tokens, CLAUDE_MAX_TOKENS),
+           "messages": [{"role": m["role"], "content": m["content"]} for m in messages
+                        if m["role"] in ("user", "assistant")]}
+    system = _claude_system(system)
+    if system:
+        req["system"] = system
+    return req
+
+
+def _claude_text(resp) -> str:
+    return "".join(getattr(b, "text", "") for b in (resp.content or [])).strip()
+
+
+def _usage(obj, *fields: tuple[str, str]) -> dict:
+    """Token counts off a response usage object as {anthropic field name: int}."""
+    out = {}
+    for name, attr in fields:
+        value = obj
+        for part in attr.split("."):
+            value = getattr(value, part, None)
+        if isinstance(value, int):
+            out[name] = value
+    return out
+
+
+def _claude_usage(resp) -> dict:
+    return _usage(getattr(resp, "usage", None), *((f, f) for _, f in _USAGE_FIELDS))
+
+
+def _openai_usage(resp) -> dict:
+    usage = _usage(getattr(resp, "usage", None), ("input_tokens", "prompt_tokens"),
+                   ("output_tokens", "completion_tokens"),
+                   ("cache_read_input_tokens", "prompt_tokens_details.cached_tokens"))
+    if "cache_read_input_tokens" in usage and "input_tokens" in usage:
+        usage["input_tokens"] -= usage["cache_read_input_tokens"]
+    return usage
+
+
+def _openai_request(system, messages: list, max_tokens: int, model: str | None) -> dict:
+    system = system_text(system)
+    head = [{"role": "system", "content": system}] if system else []
+    return {"model": openai_model(model), "messages": head + messages, "temperature": TEMPERATURE,
+            "max_tokens": min(max_tokens, OPENAI_MAX_TOKENS)}
+
+
+def _openai_error(e: Exception) -> str:
+    err = str(e)
+    if "429" in err or "quota" in err.lower() or "insufficient_quota" in err.lower():
+        err += QUOTA_HINT
+    return err
+
+
+def _route(provider_: str | None) -> tuple[str | None, str | None]:
+    """(provider, key) to use, or (None, error)."""
+    chosen = provider_ or provider()
+    if chosen == FAKE:
+        return FAKE, ""
+    if chosen == "claude":
+        key = anthropic_key()
+        return ("claude", key) if _usable(key) and Anthropic is not None else (None, NO_CLAUDE)
+    if chosen == "openai":
+        key = openai_key()
+        if _usable(key) and OpenAI is not None:
+            return "openai", key
+        return None, "No API key or OpenAI not installed. Set OPENAI_API_KEY or ANTHROPIC_API_KEY."
+    return None, NO_KEY
+
+
+def _claude_complete(key: str, req: dict, model: str | None) -> tuple[str, str | None, dict, str | None]:
+    """(reply, error, usage, model that answered) trying the resolver's candidates in order."""
+    client = _client("claude", key)
+    if _models.needs_probe(key):
+        _models.set_listed(key, _list_models(client))
+    chain = claude_models(model)
+    last_err = None
+    for m in _models.candidates(key, chain):
+        try:
+            if req["max_tokens"] > STREAM_ABOVE_TOKENS:
+                with client.messages.stream(model=m, **req) as stream:
+                    text = "".join(stream.text_stream).strip()
+                    resp = stream.get_final_message()
+            else:
+                resp = client.messages.create(model=m, **req)
+                text = _claude_text(resp)
+        except Exception as e:
+            last_err = e
+            if _models.failed(key, chain, m, e):
+                continue
+            return "", str(e), {}, None
+        _models.succeeded(key, chain, m)
+        return text, None, _claude_usage(resp), m
+    return "", str(last_err) if last_err else NO_CLAUDE_MODEL, {}, None
+
+
+async def _claude_acomplete(key: str, req: dict, model: str | None) -> tuple[str, str | None, dict, str | None]:
+    client = _async_client("claude", key)
+    if _models.needs_probe(key):
+        _models.set_listed(key, await _alist_models(client))
+    chain = claude_models(model)
+    last_err = None
+    for m in _models.candidates(key, chain):
+        try:
+            if req["max_tokens"] > STREAM_ABOVE_TOKENS:
+                async with client.messages.stream(model=m, **req) as stream:
+                    text = "".join([t async for t in stream.text_stream]).strip()
+                    resp = await stream.get_final_message()
+            else:
+                resp = await client.messages.create(model=m, **req)
+                text = _claude_text(resp)
+        except Exception as e:
+            last_err = e
+            if _models.failed(key, chain, m, e):
+                continue
+            return "", str(e), {}, None
+        _models.succeeded(key, chain, m)
+        return text, None, _claude_usage(resp), m
+    return "", str(last_err) if last_err else NO_CLAUDE_MODEL, {}, None
+
+
+def _fake_complete(req: dict, model: str | None) -> tuple[str, str | None, dict]:
+    resp = _fake.create(model=claude_models(model)[0], **req)
+    return _claude_text(resp), None, _claude_usage(resp)
+
+
+def _lookup(chosen: str, system, messages: list, max_tokens: int, model: str | None,
+            cache: bool) -> tuple[str | None, str | None]:
+    """(cache key, cached reply) for a request; (None, None) when caching is off for it.
+
+    Claude requests are keyed on the preferred model; replies from a fallback are not stored.
+    """
+    if not cache or not llm_cache.enabled():
+        return None, None
+    if chosen == "openai":
+        req = _openai_request(system, messages, max_tokens, model)
+        fp = llm_cache.fingerprint(chosen, req["model"], None, req["messages"], req["max_tokens"],
+                                   req["temperature"])
+    else:
+        req = _claude_request(None, messages, max_tokens)
+        fp = llm_cache.fingerprint(chosen, claude_models(model)[0], system_text(system), req["messages"],
+                                   req["max_tokens"], None)
+    return fp, llm_cache.response_cache().get(fp)
+
+
+def _store(fp: str | None, text: str, err: str | None, stage: str, cache_if) -> None:
+    if fp and err is None and text and (cache_if is None or cache_if(text)):
+        llm_cache.response_cache().put(fp, text, stage)
+
+
+def complete(system, messages: list, max_tokens: int = 8192, stage: str = "",
+             provider: str | None = None, model: str | None = None, cache: bool = True,
+             cache_if: Callable[[str], bool] | None = None) -> tuple[str, str | None]:
+    """Chat completion on the pooled client; returns (reply, error).
+
+    system is a string or a list of PromptSegment; messages are {"role", "content"} dicts (content may
+    be Claude content blocks); provider forces "claude", "openai" or "fake"; stage labels the call in
+    stats(). Replies come from / go to the response cache unless cache=False; cache_if(reply) can veto
+    storing one (e.g. unparseable JSON).
+    """
+    started = time.perf_counter()
+    chosen, key = _route(provider)
+    if chosen is None:
+        _record(stage, started, key)
+        return "", key
+    fp, hit = _lookup(chosen, system, messages, max_tokens, model, cache)
+    if hit is not None:
+        _record(stage, started, None, cached=True)
+        return hit, None
+    if chosen == FAKE:
+        text, err, usage = _fake_complete(_claude_request(system, messages, max_tokens), model)
+    elif chosen == "claude":
+        text, err, usage, served = _claude_complete(key, _claude_request(system, messages, max_tokens), model)
+        if served != claude_models(model)[0]:
+            fp = None  # a fallback answered; the key names the preferred model
+    else:
+        try:
+            resp = _client("openai", key).chat.completions.create(
+                **_openai_request(system, messages, max_tokens, model))
+            text, err, usage = (resp.choices[0].message.content or "").strip(), None, _openai_usage(resp)
+        except Exception as e:
+            text, err, usage = "", _openai_error(e), {}
+    _store(fp, text, err, stage, cache_if)
+    _record(stage, started, err, usage=usage)
+    return text, err
+
+
+async def acomplete(system, messages: list, max_tokens: int = 8192, stage: str = "",
+                    provider: str | None = None, model: str | None = None, cache: bool = True,
+                    cache_if: Callable[[str], bool] | None = None) -> tuple[str, str | None]:
+    """complete() for async endpoints: awaits the provider without holding a worker thread."""
+    started = time.perf_counter()
+    chosen, key = _route(provider)
+    if chosen is None:
+        _record(stage, started, key)
+        return "", key
+    fp, hit = _lookup(chosen, system, messages, max_tokens, model, cache)
+    if hit is not None:
+        _record(stage, started, None, cached=True)
+        return hit, None
+    if chosen == FAKE:
+        text, err, usage = _fake_complete(_claude_request(system, messages, max_tokens), model)
+    elif chosen == "claude":
+        text, err, usage, served = await _claude_acomplete(key, _claude_request(system, messages, max_tokens), model)
+        if served != claude_models(model)[0]:
+            fp = None  # a fallback answered; the key names the preferred model
+    else:
+        try:
+            resp = await _async_client("openai", key).chat.completions.create(
+                **_openai_request(system, messages, max_tokens, model))
+            text, err, usage = (resp.choices[0].message.content or "").strip(), None, _openai_usage(resp)
+        except Exception as e:
+            text, err, usage = "", _openai_error(e), {}
+    _store(fp, text, err, stage, cache_if)
+    _record(stage, started, err, usage=usage)
+    return text, err
@@ -14,21 +14,15 @@ _REPO_ROOT = Path(__file__).resolve().parent.parent
 load_dotenv(_REPO_ROOT / ".env")
 load_dotenv()  # also allow CWD .env
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Header
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, Response
 from pydantic import BaseModel
 
-# Optional: OpenAI and Anthropic (Claude)
-try:
-    from openai import OpenAI
-except ImportError:
-    OpenAI = None
-try:
-    from anthropic import Anthropic
-except ImportError:
-    Anthropic = None
+# OpenAI and Anthropic (Claude) are optional; every LLM call goes through the pooled gateway.
+from schedule_agent_web import llm_gateway
+from schedule_agent_web.llm_gateway import PromptSegment
 
 app = FastAPI(
     title="VueLogic API",
@@ -106,156 +100,198 @@ def _friendly_file_label(filename: str) -> str:
     return f"Project Document: {name} ({ext})" if ext else f"Project Document: {name}"
 
 
-def get_system_prompt_with_context(session_id: str | None = None) -> str:
-    """Base skill + lessons learned + trust score (if Redis) + uploaded files (always when session_id set)."""
-    base = get_system_prompt_cached()
-    parts = [base]
-    try:
-        from schedule_agent_web.store import get_lessons, get_trust_score, is_persistence_available, get_files, get_file_content
-        if is_persistence_available():
-            lessons = get_lessons()
-            trust = get_trust_score()
-            if lessons:
-                parts.append("\n\n## Current lessons learned (use when proposing options)\n")
-                for i, le in enumerate(lessons[-20:], 1):  # last 20
-                    parts.append(f"- [{i}] {le.get('event', '')}: {le.get('lesson', '')}\n")
-            parts.append("\n\n## Trust score (HITL)\n")
-            parts.append(f"Approvals: {trust.get('approvals', 0)}, Total proposals: {trust.get('total_proposals', 0)}, AI_Agency_Score: {trust.get('ai_agency_score', 0)}. Level 1 (Autonomous) only if score ≥ 0.8; otherwise propose (Level 2/3).\n")
-        # Include uploaded files whenever session_id is provided (works with Redis or local file store)
-        if session_id:
-            files = get_files(session_id)
-            user_files = [f for f in files if not f.get("filename", "").startswith("_")]
-            if user_files:
-                vec_count = sum(1 for f in user_files if f.get("vectorized"))
-                parts.append(
-                    f"\n\n## Project reference data ({len(user_files)} files, {vec_count} vectorized)\n"
-                    "IMPORTANT: The data below comes from the project's reference library. "
-                    "NEVER reveal internal file names, storage paths, file prefixes, or library structure to the user. "
-                    "When referencing data, say 'the project schedule' or 'the contract specifications' — "
-                    "never mention raw filenames or storage paths to the user.\n"
-                    "When the user asks about files, vectorization, or their library, answer using the file list below.\n"
-                )
-                context_budget = 120000
-                context_used = 0
-                import re as _re
-                for f in user_files:
-                    filename = f.get("filename", "")
-                    content = get_file_content(session_id, filename)
-                    if not content:
-                        continue
-                    is_xer = filename.lower().endswith(".xer")
-                    is_pdf = filename.lower().endswith(".pdf")
-                    is_base64 = bool(_re.match(r'^[A-Za-z0-9+/\r\n]{100,}=*$', content[:200].replace('\n','').replace('\r','')))
-                    if is_pdf and is_base64:
-                        label = _friendly_file_label(filename)
-                        try:
-                            from schedule_agent_web.vector_store import _extract_text_from_pdf_bytes
-                            pdf_text = _extract_text_from_pdf_bytes(content)
-                            if pdf_text and pdf_text != content and len(pdf_text) > 50:
-                                budget_left = min(6000, context_budget - context_used)
-                                if budget_left > 500:
-                                    preview = pdf_text[:budget_left]
-                                    parts.append(f"\n### {label} (full document available — RAG retrieval provides deeper content on demand)\n```\n{preview}\n```\n")
-                                    context_used += len(preview)
-                                else:
-                                    parts.append(f"\n### {label} (PDF document available in library)\n")
-                            else:
-                                parts.append(f"\n### {label} (PDF document available in library)\n")
-                        except Exception:
-                            parts.append(f"\n### {label} (PDF document available in library)\n")
-                        continue
-                    if is_xer:
-                        label = _friendly_file_label(filename)
-                        version_hint = ""
-                        fn_lower = filename.lower()
-                        if "baseline_v1" in fn_lower or "_bas." in fn_lower:
-                            version_hint = " — Baseline V1"
-                        elif "baseline_v2" in fn_lower or "_bas-r1" in fn_lower or "r1." in fn_lower:
-                            version_hint = " — Baseline V2"
-                        elif "update_v" in fn_lower:
-                            import re as _re2
-                            m = _re2.search(r'update_v(\d+)', fn_lower)
-                            version_hint = f" — Update V{m.group(1)}" if m else " — Update"
-                        content = _decode_xer_content(content)
-                        xer_summary = _summarize_xer_for_review(content)
-                        budget_per_xer = min(55000, context_budget - context_used)
-                        if budget_per_xer < 500:
-                            parts.append(f"\n### Project Schedule (P6 XER{version_hint}) (budget exceeded — summary not included)\n")
-                            continue
-                        preview = xer_summary[:budget_per_xer]
-                        parts.append(f"\n### Project Schedule (P6 XER{version_hint})\n```\n{preview}\n```\n")
+# Library block per session with the file-list signature it was built from (see _library_segment).
+_LIBRARY_SEGMENTS: dict[str, tuple[tuple, str]] = {}
+_LIBRARY_SEGMENTS_MAX = 64
+
+
+def _library_segment(session_id: str) -> str:
+    """Project reference data block (file previews / XER summaries), rebuilt only when the file list changes."""
+    from schedule_agent_web.store import get_files, get_file_content
+    files = get_files(session_id)
+    user_files = [f for f in files if not f.get("filename", "").startswith("_")]
+    if not user_files:
+        return ""
+    signature = tuple((f.get("filename"), f.get("size"), f.get("uploaded_at"), bool(f.get("vectorized"))) for f in user_files)
+    cached = _LIBRARY_SEGMENTS.get(session_id)
+    if cached and cached[0] == signature:
+        return cached[1]
+    parts = []
+    vec_count = sum(1 for f in user_files if f.get("vectorized"))
+    parts.append(
+        f"\n\n## Project reference data ({len(user_files)} files, {vec_count} vectorized)\n"
+        "IMPORTANT: The data below comes from the project's reference library. "
+        "NEVER reveal internal file names, storage paths, file prefixes, or library structure to the user. "
+        "When referencing data, say 'the project schedule' or 'the contract specifications' — "
+        "never mention raw filenames or storage paths to the user.\n"
+        "When the user asks about files, vectorization, or their library, answer using the file list below.\n"
+    )
+    context_budget = 120000
+    context_used = 0
+    import re as _re
+    for f in user_files:
+        filename = f.get("filename", "")
+        content = get_file_content(session_id, filename)
+        if not content:
+            continue
+        is_xer = filename.lower().endswith(".xer")
+        is_pdf = filename.lower().endswith(".pdf")
+        is_base64 = bool(_re.match(r'^[A-Za-z0-9+/\r\n]{100,}=*$', content[:200].replace('\n','').replace('\r','')))
+        if is_pdf and is_base64:
+            label = _friendly_file_label(filename)
+            try:
+                from schedule_agent_web.vector_store import _extract_text_from_pdf_bytes
+                pdf_text = _extract_text_from_pdf_bytes(content)
+                if pdf_text and pdf_text != content and len(pdf_text) > 50:
+                    budget_left = min(6000, context_budget - context_used)
+                    if budget_left > 500:
+                        preview = pdf_text[:budget_left]
+                        parts.append(f"\n### {label} (full document available — RAG retrieval provides deeper content on demand)\n```\n{preview}\n```\n")
                         context_used += len(preview)
                     else:
-                        label = _friendly_file_label(filename)
-                        budget_left = min(50000, context_budget - context_used)
-                        if budget_left < 500:
-                            continue
-                        preview = content[:budget_left] if len(content) > budget_left else content
-                        parts.append(f"\n### {label}\n```\n{preview}\n```\n")
-                        context_used += len(preview)
-        # Inject philosophy / governance settings so the agent applies them
-        if session_id:
-            try:
-                from schedule_agent_web.store import get_philosophy
-                phil = get_philosophy(session_id)
-                gov = phil.get("governance", {})
-                bas = phil.get("basis", {})
-                pb = phil.get("playbook", {})
-                philo_block = "\n\n## Active Schedule Philosophy (this project)\n"
-                philo_block += "IMPORTANT: Apply these rules in ALL schedule reviews, baseline analyses, and chat responses about schedules.\n\n"
-                philo_block += "### Governance Thresholds\n"
-                std_map = {"dcma": "DCMA 14-Point", "aace": "AACE International", "custom": "Owner Custom"}
-                tone_map = {"exec": "Executive", "tech": "Technical", "aggr": "Aggressive", "cons": "Conservative"}
-                philo_block += f"- Compliance standard: {std_map.get(gov.get('complianceStandard', 'dcma'), gov.get('complianceStandard', 'dcma'))}\n"
-                philo_block += f"- Missing logic tolerance: {gov.get('missingLogicTolerance', 5)}%\n"
-                philo_block += f"- High float threshold: {gov.get('highFloatDays', 44)} days\n"
-                philo_block += f"- High duration threshold: {gov.get('highDurationDays', 20)} days\n"
-                philo_block += f"- Negative lag tolerance: {gov.get('negativeLagTolerance', 0)}\n"
-                philo_block += f"- Hard constraint tolerance: {gov.get('hardConstraintTolerance', 5)}%\n"
-                rules = gov.get("rules", {})
-                active_rules = []
-                if rules.get("leadRestriction"): active_rules.append("Negative lags (leads) are FORBIDDEN")
-                if rules.get("sfBan"): active_rules.append("Start-to-Finish relationships are BANNED")
-                if rules.get("hardConstraintAudit"): active_rules.append("Flag all hard constraints as deficiencies")
-                if rules.get("calendarCheck"): active_rules.append("Every activity MUST have an assigned calendar")
-                if rules.get("fsPreferred"): active_rules.append("Flag when FS relationships < 80%")
-                if active_rules:
-                    philo_block += "- Active rules: " + "; ".join(active_rules) + "\n"
-                philo_block += f"- Narrative tone: {tone_map.get(gov.get('narrativeTone', 'exec'), gov.get('narrativeTone', 'exec'))} — write all review comments and analysis in this tone.\n"
-                philo_block += "\n### Schedule Basis Context\n"
-                philo_block += f"- Delivery method: {bas.get('deliveryMethod', 'Design-Build')}\n"
-                if bas.get("ntpDate"): philo_block += f"- NTP date: {bas['ntpDate']}\n"
-                if bas.get("completionDate"): philo_block += f"- Completion date: {bas['completionDate']}\n"
-                philo_block += f"- WBS breakdown: {bas.get('wbsDriver', 'area')} driven, {bas.get('wbsLevels', 4)} levels\n"
-                if bas.get("wbsRationale"): philo_block += f"- WBS rationale: {bas['wbsRationale']}\n"
-                philo_block += f"- Calendar: {bas.get('workWeek', '5-day')} week, {bas.get('hoursPerDay', 8)} hrs/day, {bas.get('shiftsPerDay', 1)} shift(s)\n"
-                if bas.get("weatherNotes"): philo_block += f"- Weather/seasonal: {bas['weatherNotes']}\n"
-                lr = bas.get("logicRationale", {})
-                if lr.get("fsPref"): philo_block += f"- FS-preferred rationale: {lr['fsPref']}\n"
-                if lr.get("zeroLead"): philo_block += f"- Zero-lead rationale: {lr['zeroLead']}\n"
-                if lr.get("floatThreshold"): philo_block += f"- Float threshold rationale: {lr['floatThreshold']}\n"
-                philo_block += f"- Cost loading: {bas.get('costLoadingLevel', 'work-package')} level\n"
-                if bas.get("costLoadingNotes"): philo_block += f"- Cost loading notes: {bas['costLoadingNotes']}\n"
-                philo_block += "\n### Baseline Review Playbook\n"
-                std_rev = {"approve-noted": "Approve as Noted (preferred)", "approve-full": "Full Approval Required", "reject-resubmit": "Reject & Resubmit"}
-                philo_block += f"- Review standard: {std_rev.get(pb.get('reviewStandard', 'approve-noted'), pb.get('reviewStandard', 'approve-noted'))}\n"
-                philo_block += f"- Max deficiencies before rejection: {pb.get('maxDefectsBeforeReject', 20)}\n"
-                philo_block += f"- Missing scope rejection threshold: {pb.get('missingScopeThreshold', 10)}%\n"
-                cl = pb.get("checklist", {})
-                required_checks = [k for k, v in cl.items() if v]
-                if required_checks:
-                    philo_block += "- Required review checks: " + ", ".join(k.replace("_", " ").title() for k in required_checks) + "\n"
-                oa = pb.get("ownerActivities", [])
-                if oa:
-                    req_oa = [a for a in oa if a.get("required")]
-                    if req_oa:
-                        philo_block += "- Required owner activities in schedule: " + ", ".join(f"{a['name']} ({a['duration']}d)" for a in req_oa) + "\n"
-                parts.append(philo_block)
+                        parts.append(f"\n### {label} (PDF document available in library)\n")
+                else:
+                    parts.append(f"\n### {label} (PDF document available in library)\n")
             except Exception:
-                pass
-        return "".join(parts)
+                parts.append(f"\n### {label} (PDF document available in library)\n")
+            continue
+        if is_xer:
+            label = _friendly_file_label(filename)
+            version_hint = ""
+            fn_lower = filename.lower()
+            if "baseline_v1" in fn_lower or "_bas." in fn_lower:
+                version_hint = " — Baseline V1"
+            elif "baseline_v2" in fn_lower or "_bas-r1" in fn_lower or "r1." in fn_lower:
+                version_hint = " — Baseline V2"
+            elif "update_v" in fn_lower:
+                import re as _re2
+                m = _re2.search(r'update_v(\d+)', fn_lower)
+                version_hint = f" — Update V{m.group(1)}" if m else " — Update"
+            parsed = _get_parsed_xer(content, session_id, filename)
+            xer_summary = parsed.memo("chat_context", _xer_chat_context) or _decode_xer_content(content)
+            budget_per_xer = min(55000, context_budget - context_used)
+            if budget_per_xer < 500:
+                parts.append(f"\n### Project Schedule (P6 XER{version_hint}) (budget exceeded — summary not included)\n")
+                continue
+            preview = xer_summary[:budget_per_xer]
+            parts.append(f"\n### Project Schedule (P6 XER{version_hint})\n```\n{preview}\n```\n")
+            context_used += len(preview)
+        else:
+            label = _friendly_file_label(filename)
+            budget_left = min(50000, context_budget - context_used)
+            if budget_left < 500:
+                continue
+            preview = content[:budget_left] if len(content) > budget_left else content
+            parts.append(f"\n### {label}\n```\n{preview}\n```\n")
+            context_used += len(preview)
+    text = "".join(parts)
+    if len(_LIBRARY_SEGMENTS) >= _LIBRARY_SEGMENTS_MAX:
+        _LIBRARY_SEGMENTS.pop(next(iter(_LIBRARY_SEGMENTS)))
+    _LIBRARY_SEGMENTS[session_id] = (signature, text)
+    return text
+
+
+def _philosophy_segment(session_id: str) -> str:
+    """Active schedule philosophy / governance settings, so the agent applies them."""
+    try:
+        from schedule_agent_web.store import get_philosophy
+        phil = get_philosophy(session_id)
+        gov = phil.get("governance", {})
+        bas = phil.get("basis", {})
+        pb = phil.get("playbook", {})
+        philo_block = "\n\n## Active Schedule Philosophy (this project)\n"
+        philo_block += "IMPORTANT: Apply these rules in ALL schedule reviews, baseline analyses, and chat responses about schedules.\n\n"
+        philo_block += "### Governance Thresholds\n"
+        std_map = {"dcma": "DCMA 14-Point", "aace": "AACE International", "custom": "Owner Custom"}
+        tone_map = {"exec": "Executive", "tech": "Technical", "aggr": "Aggressive", "cons": "Conservative"}
+        philo_block += f"- Compliance standard: {std_map.get(gov.get('complianceStandard', 'dcma'), gov.get('complianceStandard', 'dcma'))}\n"
+        philo_block += f"- Missing logic tolerance: {gov.get('missingLogicTolerance', 5)}%\n"
+        philo_block += f"- High float threshold: {gov.get('highFloatDays', 44)} days\n"
+        philo_block += f"- High duration threshold: {gov.get('highDurationDays', 20)} days\n"
+        philo_block += f"- Negative lag tolerance: {gov.get('negativeLagTolerance', 0)}\n"
+        philo_block += f"- Hard constraint tolerance: {gov.get('hardConstraintTolerance', 5)}%\n"
+        rules = gov.get("rules", {})
+        active_rules = []
+        if rules.get("leadRestriction"): active_rules.append("Negative lags (leads) are FORBIDDEN")
+        if rules.get("sfBan"): active_rules.append("Start-to-Finish relationships are BANNED")
+        if rules.get("hardConstraintAudit"): active_rules.append("Flag all hard constraints as deficiencies")
+        if rules.get("calendarCheck"): active_rules.append("Every activity MUST have an assigned calendar")
+        if rules.get("fsPreferred"): active_rules.append("Flag when FS relationships < 80%")
+        if active_rules:
+            philo_block += "- Active rules: " + "; ".join(active_rules) + "\n"
+        philo_block += f"- Narrative tone: {tone_map.get(gov.get('narrativeTone', 'exec'), gov.get('narrativeTone', 'exec'))} — write all review comments and analysis in this tone.\n"
+        philo_block += "\n### Schedule Basis Context\n"
+        philo_block += f"- Delivery method: {bas.get('deliveryMethod', 'Design-Build')}\n"
+        if bas.get("ntpDate"): philo_block += f"- NTP date: {bas['ntpDate']}\n"
+        if bas.get("completionDate"): philo_block += f"- Completion date: {bas['completionDate']}\n"
+        philo_block += f"- WBS breakdown: {bas.get('wbsDriver', 'area')} driven, {bas.get('wbsLevels', 4)} levels\n"
+        if bas.get("wbsRationale"): philo_block += f"- WBS rationale: {bas['wbsRationale']}\n"
+        philo_block += f"- Calendar: {bas.get('workWeek', '5-day')} week, {bas.get('hoursPerDay', 8)} hrs/day, {bas.get('shiftsPerDay', 1)} shift(s)\n"
+        if bas.get("weatherNotes"): philo_block += f"- Weather/seasonal: {bas['weatherNotes']}\n"
+        lr = bas.get("logicRationale", {})
+        if lr.get("fsPref"): philo_block += f"- FS-preferred rationale: {lr['fsPref']}\n"
+        if lr.get("zeroLead"): philo_block += f"- Zero-lead rationale: {lr['zeroLead']}\n"
+        if lr.get("floatThreshold"): philo_block += f"- Float threshold rationale: {lr['floatThreshold']}\n"
+        philo_block += f"- Cost loading: {bas.get('costLoadingLevel', 'work-package')} level\n"
+        if bas.get("costLoadingNotes"): philo_block += f"- Cost loading notes: {bas['costLoadingNotes']}\n"
+        philo_block += "\n### Baseline Review Playbook\n"
+        std_rev = {"approve-noted": "Approve as Noted (preferred)", "approve-full": "Full Approval Required", "reject-resubmit": "Reject & Resubmit"}
+        philo_block += f"- Review standard: {std_rev.get(pb.get('reviewStandard', 'approve-noted'), pb.get('reviewStandard', 'approve-noted'))}\n"
+        philo_block += f"- Max deficiencies before rejection: {pb.get('maxDefectsBeforeReject', 20)}\n"
+        philo_block += f"- Missing scope rejection threshold: {pb.get('missingScopeThreshold', 10)}%\n"
+        cl = pb.get("checklist", {})
+        required_checks = [k for k, v in cl.items() if v]
+        if required_checks:
+            philo_block += "- Required review checks: " + ", ".join(k.replace("_", " ").title() for k in required_checks) + "\n"
+        oa = pb.get("ownerActivities", [])
+        if oa:
+            req_oa = [a for a in oa if a.get("required")]
+            if req_oa:
+                philo_block += "- Required owner activities in schedule: " + ", ".join(f"{a['name']} ({a['duration']}d)" for a in req_oa) + "\n"
+        return philo_block
     except Exception:
-        return base
+        return ""
+
+
+def _lessons_segment() -> str:
+    """Lessons learned and HITL trust score (only with persistence)."""
+    from schedule_agent_web.store import get_lessons, get_trust_score, is_persistence_available
+    if not is_persistence_available():
+        return ""
+    parts = []
+    lessons = get_lessons()
+    trust = get_trust_score()
+    if lessons:
+        parts.append("\n\n## Current lessons learned (use when proposing options)\n")
+        for i, le in enumerate(lessons[-20:], 1):  # last 20
+            parts.append(f"- [{i}] {le.get('event', '')}: {le.get('lesson', '')}\n")
+    parts.append("\n\n## Trust score (HITL)\n")
+    parts.append(f"Approvals: {trust.get('approvals', 0)}, Total proposals: {trust.get('total_proposals', 0)}, AI_Agency_Score: {trust.get('ai_agency_score', 0)}. Level 1 (Autonomous) only if score ≥ 0.8; otherwise propose (Level 2/3).\n")
+    return "".join(parts)
+
+
+def get_system_prompt_segments(session_id: str | None = None) -> list:
+    """System prompt as segments, most stable first, so prompt caching can reuse the prefix across turns:
+    skill, project library snapshot, philosophy, lessons learned / trust score. Callers append volatile
+    segments (RAG hits, engine traces) with stable=False."""
+    segments = [PromptSegment("skill", get_system_prompt_cached())]
+    builders = [("lessons", _lessons_segment)]
+    if session_id:
+        builders = [("library", lambda: _library_segment(session_id)),
+                    ("philosophy", lambda: _philosophy_segment(session_id))] + builders
+    for name, build in builders:
+        try:
+            text = build()
+        except Exception:
+            continue
+        if text:
+            segments.append(PromptSegment(name, text))
+    return segments
+
+
+def get_system_prompt_with_context(session_id: str | None = None) -> str:
+    """Base skill + uploaded files (always when session_id set) + philosophy + lessons learned / trust score (if Redis)."""
+    return llm_gateway.system_text(get_system_prompt_segments(session_id))
 
 
 class ChatRequest(BaseModel):
@@ -354,22 +390,16 @@ def api_create_project(req: CreateProjectRequest, authorization: str = Header(de
 
 
 def _get_openai_key():
-    raw = os.environ.get("OPENAI_API_KEY") or os.environ.get("OPENAI_API_KEY_FILE")
-    if raw and Path(raw).is_file():
-        return Path(raw).read_text().strip()
-    return raw or ""
+    return llm_gateway.openai_key()
 
 
 def _get_anthropic_key():
-    raw = os.environ.get("ANTHROPIC_API_KEY") or os.environ.get("ANTHROPIC_API_KEY_FILE")
-    if raw and Path(raw).is_file():
-        return Path(raw).read_text().strip()
-    return raw or ""
+    return llm_gateway.anthropic_key()
 
 
 def _use_claude():
     """Use Claude if Anthropic key is set (overrides OpenAI when both set)."""
-    return bool(_get_anthropic_key() and len(_get_anthropic_key()) > 10 and Anthropic is not None)
+    return llm_gateway.provider() == "claude"
 
 
 def get_status_dict():
@@ -379,22 +409,22 @@ def get_status_dict():
     has_openai = bool(openai_key and len(openai_key) > 10)
     has_anthropic = bool(anthropic_key and len(anthropic_key) > 10)
     skill_ok = SKILL_PATH.exists()
-    provider = "claude" if (has_anthropic and Anthropic) else ("openai" if (has_openai and OpenAI) else None)
     return {
         "status": "ok",
-        "has_api_key": has_openai or has_anthropic,
+        "has_api_key": has_openai or has_anthropic or llm_gateway.provider() == llm_gateway.FAKE,
         "has_anthropic_key": has_anthropic,
         "has_openai_key": has_openai,
-        "provider": provider,
+        "provider": llm_gateway.provider(),
         "skill_loaded": skill_ok,
-        "openai_installed": OpenAI is not None,
-        "anthropic_installed": Anthropic is not None,
+        "openai_installed": llm_gateway.OpenAI is not None,
+        "anthropic_installed": llm_gateway.Anthropic is not None,
     }
 
 
 @app.get("/api/status")
 def api_status():
     d = get_status_dict()
+    d["llm"] = llm_gateway.stats()
     try:
         from schedule_agent_web.store import is_persistence_available
         d["persistence_available"] = is_persistence_available()
@@ -531,16 +561,87 @@ def api_philosophy_put(body: dict):
     return {"ok": True, "philosophy": current}
 
 
-@app.get("/api/schedule/intelligence")
-def api_schedule_intelligence(session_id: str = ""):
-    """Analyze uploaded XER against governance thresholds and return DCMA scorecard + metrics."""
-    if not session_id:
-        raise HTTPException(status_code=400, detail="session_id required")
-    from schedule_agent_web.store import get_files, get_file_content, get_philosophy
+def _project_tables(tables, proj_id: str):
+    """One project of a (multi-project) parsed XER, or the whole export when proj_id is blank; 404 if unknown."""
+    if not proj_id:
+        return tables
+    view = tables.project(proj_id)
+    if view is None:
+        raise HTTPException(status_code=404, detail=f"Project '{proj_id}' not found in the XER.")
+    return view
 
-    files = get_files(session_id)
+
+def _code_filter_rows(tables, text: str) -> list[int] | None:
+    """TASK rows matching an activity code / UDF filter ('Area=North;Responsibility=Owner'); None if blank."""
+    if not text.strip():
+        return None
+    from schedule_agent_web.scheduling import activity_codes, parse_filters
+    try:
+        codes = activity_codes(tables)
+        return codes.rows(codes.select(parse_filters(text)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"No activity code or UDF named {e}.")
+
+
+def _compute_session_cpm(tables, proj_id: str | None = None):
+    """CPM result for a parsed schedule (memoised on the parse); None if the engine is unavailable."""
+    try:
+        from schedule_agent_web.scheduling import compute_cpm, numpy_available
+        if not numpy_available():
+            return None
+        return compute_cpm(tables, proj_id=proj_id)
+    except Exception:
+        return None
+
+
+def _task_day_hours(tables):
+    """Function task dict -> working hours per day on its calendar (CALENDAR.day_hr_cnt, default 8)."""
+    try:
+        from schedule_agent_web.scheduling import calendar_day_hours
+        hours = tables.memo("calendar_day_hours", calendar_day_hours)
+    except Exception:
+        hours = {}
+    default = hours.get("") or 8.0
+    return lambda t: hours.get(t.get("clndr_id") or "", default) or default
+
+
+def _logic_report(tables):
+    """Logic graph analytics for a parsed schedule (memoised on the parse); None on failure."""
+    try:
+        from schedule_agent_web.scheduling import analyze_logic
+        return tables.memo("logic", analyze_logic)
+    except Exception:
+        return None
+
+
+def _review_findings(tables, session_id: str | None = None):
+    """Deterministic review comments under the session's philosophy; None if the rules could not run."""
+    try:
+        from schedule_agent_web.scheduling import review_findings
+        from schedule_agent_web.store import get_philosophy
+        return review_findings(tables, get_philosophy(session_id))
+    except Exception:
+        return None
+
+
+def _resource_loading(tables, proj_id: str | None = None, default_max_per_hr: float | None = None):
+    """Time-phased TASKRSRC loading (memoised on the parse); None without assignments or numpy."""
+    try:
+        from schedule_agent_web.scheduling import numpy_available, resource_loading
+        if not numpy_available() or not tables.get("TASKRSRC"):
+            return None
+        return resource_loading(tables, proj_id=proj_id, default_max_per_hr=default_max_per_hr)
+    except Exception:
+        return None
+
+
+def _find_session_xer(session_id: str) -> str | None:
+    """Stored filename of the session's current XER: latest library upload, else latest baseline submission."""
+    from schedule_agent_web.store import get_files
     xer_file = None
-    for f in files:
+    for f in get_files(session_id):
         fn = f.get("filename", "")
         if fn.lower().endswith(".xer") and not fn.startswith("_"):
             xer_file = fn
@@ -548,202 +649,680 @@ def api_schedule_intelligence(session_id: str = ""):
         from schedule_agent_web.baseline import list_submissions
         subs = list_submissions(session_id, submission_type="baseline")
         if subs:
-            latest = subs[-1]
+            latest = subs[0]  # newest version first
             xer_file = f"baseline_v{latest['version']}_{latest['xer_filename']}"
-    if not xer_file:
-        return {"error": "no_xer", "message": "Upload an XER schedule to see intelligence data."}
+    return xer_file
+
 
+def _session_tables(session_id: str, proj_id: str = "", purpose: str = "analyze it", require_tasks: bool = True):
+    """(tables, xer_file, None) for the session's current XER narrowed to proj_id (404 if unknown), or
+    (None, xer_file, error dict) when there is no XER (no_xer: "Upload an XER schedule to <purpose>."),
+    it is unreadable (empty_xer) or, with require_tasks, it has no activities (no_tasks)."""
+    from schedule_agent_web.store import get_file_content
+    xer_file = _find_session_xer(session_id)
+    if not xer_file:
+        return None, None, {"error": "no_xer", "message": f"Upload an XER schedule to {purpose}."}
     raw = get_file_content(session_id, xer_file) or ""
-    xer_text = _decode_xer_content(raw)
-    if not xer_text or len(xer_text) < 50:
-        return {"error": "empty_xer", "message": "XER file is empty or unreadable."}
+    if not raw or len(raw) < 50:
+        return None, xer_file, {"error": "empty_xer", "message": "XER file is empty or unreadable."}
+    tables = _project_tables(_get_parsed_xer(raw, session_id, xer_file), proj_id)
+    if require_tasks and not tables.get("TASK"):
+        return None, xer_file, {"error": "no_tasks", "message": "XER contains no activities."}
+    return tables, xer_file, None
 
-    tables = _parse_xer_tables(xer_text)
+
+@app.get("/api/schedule/intelligence")
+def api_schedule_intelligence(session_id: str = "", proj_id: str = "", filter_: str = Query("", alias="filter")):
+    """Analyze uploaded XER against governance thresholds and return DCMA scorecard + metrics.
+
+    A multi-project export is scored per project: proj_id picks one (see "projects" in the response),
+    otherwise the whole export is scored together. filter scores the activities matching activity codes /
+    UDFs ('Area=North;Responsibility=Owner'); network-wide checks (CPM, logic loops) are left out then.
+    """
+    if not session_id:
+        raise HTTPException(status_code=400, detail="session_id required")
+    from schedule_agent_web.store import get_philosophy
+
+    parsed, xer_file, error = _session_tables(session_id, "", "see intelligence data", require_tasks=False)
+    if error:
+        return error
+    tables = _project_tables(parsed, proj_id)
     phil = get_philosophy(session_id)
     gov = phil.get("governance", {})
 
-    tasks = tables.get("TASK", [])
-    preds = tables.get("TASKPRED", [])
-    wbs = tables.get("PROJWBS", [])
-    cals = tables.get("CALENDAR", [])
-    rsrc = tables.get("TASKRSRC", [])
-
-    total = len(tasks)
-    if total == 0:
+    all_tasks = tables.get("TASK", [])
+    if len(all_tasks) == 0:
         return {"error": "no_tasks", "message": "XER contains no activities."}
+    selected = _code_filter_rows(tables, filter_)
+    scope = tables.subset(selected) if selected is not None else tables
+    tasks = scope.get("TASK", [])
 
-    # Build predecessor/successor maps
-    task_ids = {t.get("task_id") for t in tasks}
-    has_pred = set()
-    has_succ = set()
-    rel_types = {"FS": 0, "SS": 0, "FF": 0, "SF": 0}
-    neg_lag_count = 0
-    cross_wbs_pref = 0
-    task_wbs = {t.get("task_id"): t.get("wbs_id", "") for t in tasks}
-
-    for p in preds:
-        tid = p.get("task_id", "")
-        pid = p.get("pred_task_id", "")
-        has_pred.add(tid)
-        has_succ.add(pid)
-        pt = (p.get("pred_type") or "FS").upper().strip()
-        if pt in rel_types:
-            rel_types[pt] += 1
-        lag = p.get("lag_hr_cnt", "0")
-        try:
-            lag_val = float(lag)
-            if lag_val < 0:
-                neg_lag_count += 1
-        except (ValueError, TypeError):
-            pass
-        if task_wbs.get(tid, "") != task_wbs.get(pid, ""):
-            cross_wbs_pref += 1
-
-    total_rels = sum(rel_types.values())
-    fs_pct = round(rel_types["FS"] / total_rels * 100, 1) if total_rels else 0
-
-    # Missing logic (no pred or no succ) — exclude milestones
-    task_type_map = {t.get("task_id"): (t.get("task_type") or "").upper() for t in tasks}
-    missing_logic = 0
-    for t in tasks:
-        tid = t.get("task_id", "")
-        tt = (t.get("task_type") or "").upper()
-        if tt in ("TT_Mile", "TT_FinMile", "TT_WBS", "TT_LOE"):
-            continue
-        if tid not in has_pred or tid not in has_succ:
-            missing_logic += 1
-    missing_logic_pct = round(missing_logic / total * 100, 1)
-
-    # High float
-    high_float_threshold = gov.get("highFloatDays", 44)
-    high_float_count = 0
-    float_values = []
-    for t in tasks:
-        tt = (t.get("task_type") or "").upper()
-        if tt in ("TT_Mile", "TT_FinMile", "TT_WBS", "TT_LOE"):
-            continue
-        try:
-            tf_hrs = float(t.get("total_float_hr_cnt", 0))
-            tf_days = tf_hrs / 8
-            float_values.append(tf_days)
-            if tf_days > high_float_threshold:
-                high_float_count += 1
-        except (ValueError, TypeError):
-            pass
-    high_float_pct = round(high_float_count / total * 100, 1) if total else 0
-
-    # Negative float
-    neg_float = sum(1 for f in float_values if f < 0)
-    neg_float_pct = round(neg_float / total * 100, 1) if total else 0
-
-    # High duration
-    high_dur_threshold = gov.get("highDurationDays", 20)
-    high_dur_count = 0
-    durations = []
-    for t in tasks:
-        tt = (t.get("task_type") or "").upper()
-        if tt in ("TT_Mile", "TT_FinMile", "TT_WBS", "TT_LOE"):
-            continue
-        try:
-            dur_hrs = float(t.get("target_drtn_hr_cnt", 0))
-            dur_days = dur_hrs / 8
-            durations.append(dur_days)
-            if dur_days > high_dur_threshold:
-                high_dur_count += 1
-        except (ValueError, TypeError):
-            pass
-    high_dur_pct = round(high_dur_count / total * 100, 1) if total else 0
-
-    # Hard constraints
-    constraint_types = ("CS_MSO", "CS_MSOB", "CS_MFO", "CS_MFOB")
-    hard_const_count = sum(1 for t in tasks if (t.get("cstr_type") or "").upper() in constraint_types or (t.get("cstr_type2") or "").upper() in constraint_types)
-    hard_const_pct = round(hard_const_count / total * 100, 1) if total else 0
-
-    # Relationship type distribution
-    sf_count = rel_types.get("SF", 0)
-
-    # Resource loading
-    tasks_with_rsrc = set(r.get("task_id") for r in rsrc)
-    rsrc_loaded_pct = round(len(tasks_with_rsrc) / total * 100, 1) if total else 0
-
-    # Calendar coverage
-    tasks_with_cal = sum(1 for t in tasks if t.get("clndr_id"))
-    cal_pct = round(tasks_with_cal / total * 100, 1) if total else 0
-
-    # Thresholds from governance
-    ml_threshold = gov.get("missingLogicTolerance", 5)
-    hc_threshold = gov.get("hardConstraintTolerance", 5)
-    nl_threshold = gov.get("negativeLagTolerance", 0)
-
-    def _status(actual, threshold, higher_is_bad=True):
-        if higher_is_bad:
-            return "pass" if actual <= threshold else ("warn" if actual <= threshold * 1.5 else "fail")
-        return "pass" if actual >= threshold else ("warn" if actual >= threshold * 0.8 else "fail")
-
-    scorecard = [
-        {"id": 1, "criterion": "Missing Logic", "target": f"≤ {ml_threshold}%", "actual": f"{missing_logic_pct}%", "status": _status(missing_logic_pct, ml_threshold)},
-        {"id": 2, "criterion": "Missing Predecessors", "target": "0", "actual": str(sum(1 for t in tasks if t.get("task_id") not in has_pred and (t.get("task_type") or "").upper() not in ("TT_Mile","TT_FinMile","TT_WBS","TT_LOE"))), "status": _status(sum(1 for t in tasks if t.get("task_id") not in has_pred and (t.get("task_type") or "").upper() not in ("TT_Mile","TT_FinMile","TT_WBS","TT_LOE")), 0)},
-        {"id": 3, "criterion": "Missing Successors", "target": "0", "actual": str(sum(1 for t in tasks if t.get("task_id") not in has_succ and (t.get("task_type") or "").upper() not in ("TT_Mile","TT_FinMile","TT_WBS","TT_LOE"))), "status": _status(sum(1 for t in tasks if t.get("task_id") not in has_succ and (t.get("task_type") or "").upper() not in ("TT_Mile","TT_FinMile","TT_WBS","TT_LOE")), 0)},
-        {"id": 4, "criterion": "High Float", "target": f"≤ {high_float_threshold}d", "actual": f"{high_float_pct}%", "status": _status(high_float_pct, 5)},
-        {"id": 5, "criterion": "Negative Float", "target": "0%", "actual": f"{neg_float_pct}%", "status": _status(neg_float_pct, 0)},
-        {"id": 6, "criterion": "High Duration", "target": f"≤ {high_dur_threshold}d", "actual": f"{high_dur_pct}%", "status": _status(high_dur_pct, 5)},
-        {"id": 7, "criterion": "Negative Lags (Leads)", "target": str(nl_threshold), "actual": str(neg_lag_count), "status": _status(neg_lag_count, nl_threshold)},
-        {"id": 8, "criterion": "SF Relationships", "target": "0", "actual": str(sf_count), "status": _status(sf_count, 0)},
-        {"id": 9, "criterion": "Hard Constraints", "target": f"≤ {hc_threshold}%", "actual": f"{hard_const_pct}%", "status": _status(hard_const_pct, hc_threshold)},
-        {"id": 10, "criterion": "FS Relationship %", "target": "≥ 80%", "actual": f"{fs_pct}%", "status": _status(fs_pct, 80, higher_is_bad=False)},
-        {"id": 11, "criterion": "Resource Loaded", "target": "> 0%", "actual": f"{rsrc_loaded_pct}%", "status": _status(rsrc_loaded_pct, 1, higher_is_bad=False)},
-        {"id": 12, "criterion": "Calendar Assigned", "target": "100%", "actual": f"{cal_pct}%", "status": _status(cal_pct, 95, higher_is_bad=False)},
-    ]
+    # One pass over TASK / TASKPRED; every registered DCMA check reads the same facts
+    from schedule_agent_web.scheduling import build_scorecard, collect_facts
+
+    facts = tables.memo("scorecard_facts", collect_facts) if selected is None else collect_facts(scope)
+
+    # Recomputed network (native CPM engine); None when numpy is unavailable
+    cpm = _compute_session_cpm(tables)
+    cpm_summary = cpm.summary() if cpm is not None else None
+
+    # Loops, redundant ties, open ends and dangling logic from the relationship graph
+    logic = _logic_report(tables) if selected is None else None
 
+    scorecard = build_scorecard(facts, gov, cpm if selected is None else None, logic=logic)
     pass_count = sum(1 for s in scorecard if s["status"] == "pass")
     warn_count = sum(1 for s in scorecard if s["status"] == "warn")
     fail_count = sum(1 for s in scorecard if s["status"] == "fail")
+    day_hours = _task_day_hours(tables)
 
     # Critical path top 10 (lowest float)
-    work_tasks = [t for t in tasks if (t.get("task_type") or "").upper() not in ("TT_Mile", "TT_FinMile", "TT_WBS", "TT_LOE")]
-    def _float_val(t):
-        try: return float(t.get("total_float_hr_cnt", 999999))
-        except: return 999999
-    cp_top = sorted(work_tasks, key=_float_val)[:10]
     critical_path = []
-    for t in cp_top:
-        try:
-            fv = round(float(t.get("total_float_hr_cnt", 0)) / 8, 1)
-        except:
-            fv = 0
-        try:
-            dv = round(float(t.get("target_drtn_hr_cnt", 0)) / 8, 1)
-        except:
-            dv = 0
-        critical_path.append({
-            "task_code": t.get("task_code", ""),
-            "task_name": t.get("task_name", ""),
-            "duration": dv,
-            "total_float": fv,
-            "status": t.get("status_code", ""),
-        })
+    if cpm is not None:
+        target_hrs = all_tasks.floats("target_drtn_hr_cnt")
+        ranked = cpm.ranked(exclude_milestones=True, by="float")
+        if selected is not None:
+            keep = set(selected)
+            ranked = [i for i in ranked if int(cpm.network.rows[i]) in keep]
+        for i in ranked[:10]:
+            row = int(cpm.network.rows[i])
+            dv = target_hrs[row]
+            critical_path.append({
+                "task_code": all_tasks.text("task_code", row),
+                "task_name": all_tasks.text("task_name", row),
+                "duration": cpm.days(dv, i) if dv == dv else 0,
+                "total_float": cpm.days(cpm.total_float[i], i),
+                "status": all_tasks.text("status_code", row),
+            })
+    else:
+        from schedule_agent_web.scheduling.scorecard import EXCLUDED_TYPES
+        work_tasks = [t for t in tasks if (t.get("task_type") or "") not in EXCLUDED_TYPES]
+        def _float_val(t):
+            try: return float(t.get("total_float_hr_cnt", 999999))
+            except: return 999999
+        cp_top = sorted(work_tasks, key=_float_val)[:10]
+        for t in cp_top:
+            try:
+                fv = round(float(t.get("total_float_hr_cnt", 0)) / day_hours(t), 1)
+            except:
+                fv = 0
+            try:
+                dv = round(float(t.get("target_drtn_hr_cnt", 0)) / day_hours(t), 1)
+            except:
+                dv = 0
+            critical_path.append({
+                "task_code": t.get("task_code", ""),
+                "task_name": t.get("task_name", ""),
+                "duration": dv,
+                "total_float": fv,
+                "status": t.get("status_code", ""),
+            })
 
     return {
         "scorecard": scorecard,
         "metrics": {
-            "totalActivities": total,
-            "totalRelationships": total_rels,
+            **facts.metrics(),
             "passCount": pass_count,
             "warnCount": warn_count,
             "failCount": fail_count,
-            "fsPercent": fs_pct,
-            "ssPercent": round(rel_types["SS"] / total_rels * 100, 1) if total_rels else 0,
-            "ffPercent": round(rel_types["FF"] / total_rels * 100, 1) if total_rels else 0,
-            "sfPercent": round(rel_types["SF"] / total_rels * 100, 1) if total_rels else 0,
-            "crossWbsTies": cross_wbs_pref,
-            "avgFloat": round(sum(float_values) / len(float_values), 1) if float_values else 0,
-            "avgDuration": round(sum(durations) / len(durations), 1) if durations else 0,
         },
         "criticalPath": critical_path,
+        "cpm": cpm_summary,
+        "logic": logic.to_dict(limit=25) if logic is not None else None,
+        "projects": parsed.project_info(),
+        "proj_id": proj_id,
+        "filter": {"text": filter_, "activities": len(tasks)} if selected is not None else None,
+        "xer_filename": xer_file,
+    }
+
+
+@app.get("/api/schedule/cpm")
+def api_schedule_cpm(session_id: str = "", proj_id: str = "", critical_only: bool = False, offset: int = 0, limit: int = 200):
+    """Recompute the session's XER with the native CPM engine: early/late dates, total and free float."""
+    if not session_id:
+        raise HTTPException(status_code=400, detail="session_id required")
+    from schedule_agent_web.scheduling import numpy_available
+
+    if not numpy_available():
+        raise HTTPException(status_code=503, detail="CPM engine requires numpy (pip install numpy).")
+    tables, xer_file, error = _session_tables(session_id, proj_id, "run the CPM engine")
+    if error:
+        return error
+    tasks = tables["TASK"]
+    cpm = _compute_session_cpm(tables)
+    if cpm is None:
+        raise HTTPException(status_code=500, detail="CPM calculation failed")
+    offset = max(offset, 0)
+    limit = max(1, min(limit, 1000))
+    ranked = cpm.ranked(critical_only=critical_only)
+    loops = cpm.network.loop_task_ids
+    return {
+        "summary": cpm.summary(),
+        "total": int(len(ranked)),
+        "offset": offset,
+        "limit": limit,
+        "activities": cpm.activities(tasks, ranked, offset=offset, limit=limit),
+        "loopTaskIds": loops[:100],
         "xer_filename": xer_file,
     }
 
 
+@app.get("/api/schedule/risk")
+def api_schedule_risk(session_id: str = "", proj_id: str = "", iterations: int = 1000, seed: int | None = None,
+                      distribution: str = "triangular", low: float = -10.0, likely: float = 0.0, high: float = 25.0,
+                      workers: int = 0, limit: int = 20):
+    """Monte Carlo schedule risk: completion percentiles (P50/P80...), criticality index and tornado.
+
+    Durations are sampled from a percentage range around each remaining duration (low/likely/high %).
+    Pass seed for reproducible results; workers > 1 splits iterations over a process pool (capped at
+    RISK_MAX_WORKERS, default min(4, CPUs)).
+    """
+    if not session_id:
+        raise HTTPException(status_code=400, detail="session_id required")
+    from schedule_agent_web.scheduling import DISTRIBUTIONS, RiskModel, numpy_available, simulate
+    from schedule_agent_web.scheduling.risk import MAX_WORKERS as RISK_MAX_WORKERS
+
+    if not numpy_available():
+        raise HTTPException(status_code=503, detail="Risk engine requires numpy (pip install numpy).")
+    if distribution not in DISTRIBUTIONS:
+        raise HTTPException(status_code=400, detail=f"distribution must be one of {', '.join(DISTRIBUTIONS)}")
+    if not -100.0 <= low <= likely <= high:
+        raise HTTPException(status_code=400, detail="Expected -100 <= low <= likely <= high (percent of duration).")
+    tables, xer_file, error = _session_tables(session_id, proj_id, "run a risk analysis")
+    if error:
+        return error
+    tasks = tables["TASK"]
+    cpm = _compute_session_cpm(tables)
+    if cpm is None:
+        raise HTTPException(status_code=500, detail="CPM calculation failed")
+    iterations = max(1, min(iterations, 20000))
+    workers = max(0, min(workers, RISK_MAX_WORKERS))
+
+    try:
+        model = RiskModel(cpm.network, low_pct=low, likely_pct=likely, high_pct=high, distribution=distribution)
+        result = simulate(cpm.network, iterations=iterations, seed=seed, model=model, workers=workers)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Risk analysis failed: {e}")
+    return {**result.to_dict(tasks, limit=max(1, min(limit, 500))), "xer_filename": xer_file}
+
+
+@app.get("/api/schedule/resources")
+def api_schedule_resources(session_id: str = "", proj_id: str = "", period: str = "week", rsrc_id: str = "",
+                           max_per_hour: float = 0.0, limit: int = 50):
+    """Time-phased resource loading: histograms, peak loading and over-allocation windows per resource.
+
+    Limits come from RSRCRATE.max_qty_per_hr; max_per_hour applies a limit to resources without one.
+    """
+    if not session_id:
+        raise HTTPException(status_code=400, detail="session_id required")
+    from schedule_agent_web.scheduling import PERIODS, numpy_available, resource_loading
+
+    if not numpy_available():
+        raise HTTPException(status_code=503, detail="Resource loading requires numpy (pip install numpy).")
+    if period not in PERIODS:
+        raise HTTPException(status_code=400, detail=f"period must be one of {', '.join(PERIODS)}")
+    tables, xer_file, error = _session_tables(session_id, proj_id, "see resource loading", require_tasks=False)
+    if error:
+        return error
+    if not tables.get("TASKRSRC"):
+        return {"error": "no_resources", "message": "XER contains no resource assignments (TASKRSRC)."}
+    try:
+        loading = resource_loading(tables, default_max_per_hr=max_per_hour if max_per_hour > 0 else None)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Resource loading failed: {e}")
+    if loading is None:
+        return {"error": "no_tasks", "message": "XER contains no activities."}
+    return {**loading.to_dict(period, limit=max(1, min(limit, 500)), rsrc_id=rsrc_id), "xer_filename": xer_file}
+
+
+@app.get("/api/schedule/evm")
+def api_schedule_evm(session_id: str = "", proj_id: str = "", wbs_id: str = "", period: str = "week",
+                     compare: str = "", submission_type: str = "update", limit: int = 200):
+    """Earned value: cumulative PV / EV / AC / forecast curves and SPI, CPI, EAC, earned schedule per WBS.
+
+    compare lists submitted versions (e.g. 'v1,v2' or 'baseline_v1,update_v3') whose curves and
+    metrics are lined up with the current schedule's on one period axis.
+    """
+    if not session_id:
+        raise HTTPException(status_code=400, detail="session_id required")
+    from schedule_agent_web.scheduling import PERIODS, compare_evm, evm, numpy_available
+
+    if not numpy_available():
+        raise HTTPException(status_code=503, detail="Earned value requires numpy (pip install numpy).")
+    if period not in PERIODS:
+        raise HTTPException(status_code=400, detail=f"period must be one of {', '.join(PERIODS)}")
+    stype = submission_type if submission_type in ("baseline", "update") else "update"
+    refs = []
+    for label in (x for x in compare.split(",") if x.strip()):
+        ref = _parse_version_label(label, stype)
+        if not ref:
+            raise HTTPException(status_code=400, detail=f"Unrecognised version '{label}'")
+        refs.append(ref)
+    tables, xer_file, error = _session_tables(session_id, proj_id, "see earned value", require_tasks=False)
+    if error:
+        return error
+    try:
+        result = evm(tables, period=period)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Earned value failed: {e}")
+    if result is None:
+        return {"error": "no_tasks", "message": "XER contains no activities."}
+    if result.node_index(wbs_id) is None:
+        raise HTTPException(status_code=404, detail=f"WBS '{wbs_id}' not found.")
+    out = {**result.to_dict(wbs_id, limit=max(1, min(limit, 2000))), "xer_filename": xer_file}
+    if refs:
+        versions = []
+        for ref in refs:
+            sub = _submission_xer(session_id, *ref)
+            if not sub:
+                raise HTTPException(status_code=404, detail=f"{ref[0].title()} v{ref[1]} XER not found.")
+            parsed = _get_parsed_xer(sub[1], session_id, sub[0])
+            parsed = parsed.project(proj_id) if proj_id else parsed
+            if parsed is None:
+                continue  # project not in that version
+            try:
+                other = evm(parsed, period=period)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Earned value failed for {ref[0]} v{ref[1]}: {e}")
+            if other is not None:
+                versions.append((f"{ref[0]}_v{ref[1]}", other))
+        versions.sort(key=lambda v: v[1].data_date)
+        out["comparison"] = compare_evm(versions + [("current", result)], wbs_id=wbs_id)
+    return out
+
+
+@app.get("/api/schedule/driving-path")
+def api_schedule_driving_path(session_id: str = "", proj_id: str = "", target: str = "", near_days: float = 10.0,
+                              limit: int = 50):
+    """Driving path and near-critical predecessors of a target activity (task_code or task_id).
+
+    The driving path follows ties with zero relationship free float back from the target; near-critical
+    activities have a relative float to the target within near_days. Defaults to the project finish.
+    """
+    if not session_id:
+        raise HTTPException(status_code=400, detail="session_id required")
+    from schedule_agent_web.scheduling import driving_paths, numpy_available
+
+    if not numpy_available():
+        raise HTTPException(status_code=503, detail="Driving path analysis requires numpy (pip install numpy).")
+    tables, xer_file, error = _session_tables(session_id, proj_id, "trace driving paths")
+    if error:
+        return error
+    tasks = tables["TASK"]
+    try:
+        paths = driving_paths(tables)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Driving path analysis failed: {e}")
+    node = paths.node_of(tasks, target) if target.strip() else paths.finish_node()
+    if node is None:
+        raise HTTPException(status_code=404, detail=f"Activity '{target}' not found.")
+    if not paths.cpm.network.in_network[node]:
+        raise HTTPException(status_code=400, detail=f"Activity '{target}' is not part of the scheduled network.")
+    near_days = max(0.0, min(near_days, 365.0))
+    return {**paths.query(tasks, node, near_days=near_days, limit=max(1, min(limit, 1000))), "xer_filename": xer_file}
+
+
+class WhatIfRequest(BaseModel):
+    session_id: str
+    proj_id: str = ""
+    edits: list[dict] = []
+    limit: int = 100
+
+
+@app.post("/api/schedule/what-if")
+def api_schedule_what_if(req: WhatIfRequest):
+    """Re-schedule the session XER under edits without saving them (interactive what-if).
+
+    Edits: {"op": "duration", "activity", "days"}, {"op": "add_tie" | "remove_tie", "pred", "succ", "type",
+    "lag_days"}, {"op": "constraint", "activity", "type" ("" clears), "date"}. Only the activities the
+    edits reach are recomputed from the cached CPM; returns the new project finish, changed activities
+    with float deltas and the critical-path entries / exits.
+    """
+    if not req.session_id:
+        raise HTTPException(status_code=400, detail="session_id required")
+    from schedule_agent_web.scheduling import numpy_available, what_if
+
+    if not numpy_available():
+        raise HTTPException(status_code=503, detail="What-if scheduling requires numpy (pip install numpy).")
+    tables, xer_file, error = _session_tables(req.session_id, req.proj_id, "run what-if scenarios")
+    if error:
+        return error
+    tasks = tables["TASK"]
+    try:
+        engine = what_if(tables)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"What-if scheduling failed: {e}")
+    try:
+        result = engine.run(tasks, req.edits, limit=max(1, min(req.limit, 1000)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**result, "xer_filename": xer_file}
+
+
+@app.get("/api/schedule/activities")
+def api_schedule_activities(session_id: str = "", q: str = "", wbs: str = "", proj_id: str = "", offset: int = 0,
+                            limit: int = 100, fuzzy: bool = True, filter_: str = Query("", alias="filter")):
+    """Find activities by code (exact or prefix) or name tokens, optionally within a WBS subtree; paginated.
+
+    Results rank exact code matches, then code prefixes, then name matches (approximate when fuzzy is on
+    and a word has no match). With wbs, the node's path and child nodes are returned for drill-down.
+    filter keeps activities matching activity codes / UDFs ('Area=North;Responsibility=Owner').
+    """
+    if not session_id:
+        raise HTTPException(status_code=400, detail="session_id required")
+    from schedule_agent_web.scheduling import activity_index
+
+    tables, xer_file, error = _session_tables(session_id, proj_id, "search activities", require_tasks=False)
+    if error:
+        return error
+    index = activity_index(tables)
+    if not index.n:
+        return {"error": "no_tasks", "message": "XER contains no activities."}
+    if wbs and index.wbs_rows(wbs) is None:
+        raise HTTPException(status_code=404, detail=f"WBS '{wbs}' not found.")
+    selected = _code_filter_rows(tables, filter_)
+    page = index.page(q, wbs_id=wbs, offset=max(offset, 0), limit=max(1, min(limit, 1000)), fuzzy=fuzzy,
+                      within=set(selected) if selected is not None else None)
+    if not wbs:
+        page["wbs"] = {"path": [], "children": index.wbs_children("")}
+    return {**page, "xer_filename": xer_file}
+
+
+@app.get("/api/schedule/codes")
+def api_schedule_codes(session_id: str = "", proj_id: str = "", field: str = "",
+                       filter_: str = Query("", alias="filter"), limit: int = 200):
+    """Activity code types, task UDFs and notebook topics of the session XER, with value counts.
+
+    With field, rolls the activities up by that field's values (status counts, critical count, minimum
+    float), within filter ('Area=North;Responsibility=Owner') when given.
+    """
+    if not session_id:
+        raise HTTPException(status_code=400, detail="session_id required")
+    from schedule_agent_web.scheduling import activity_codes, parse_filters
+
+    tables, xer_file, error = _session_tables(session_id, proj_id, "see activity codes", require_tasks=False)
+    if error:
+        return error
+    codes = activity_codes(tables)
+    if not codes.n:
+        return {"error": "no_tasks", "message": "XER contains no activities."}
+    try:
+        bits = codes.select(parse_filters(filter_))
+        out = {"fields": codes.describe(), "activities": codes.n, "matched": bits.bit_count()}
+        if field:
+            limit = max(1, min(limit, 5000))
+            out["field"] = codes.field(field).name
+            out["values"] = codes.values(field)[:limit]
+            out["rollup"] = codes.rollup(field, bits)[:limit]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"No activity code or UDF named {e}.")
+    return {**out, "xer_filename": xer_file}
+
+
+@app.get("/api/schedule/checks")
+def api_schedule_checks(session_id: str = "", proj_id: str = "", checks: str = "", limit: int = 200):
+    """Run the registered schedule checks (submittal pairing, keyword and calendar checks, SS/FF ties)
+    on the session XER; checks is a comma-separated list of check ids (default: all)."""
+    from schedule_agent_web.scheduling import run_checks, schedule_checks
+
+    available = [c.to_dict() for c in schedule_checks()]
+    if not session_id:
+        return {"available": available}
+    ids = [c.strip() for c in checks.split(",") if c.strip()] or None
+    try:
+        schedule_checks(ids)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"Unknown check {e}.")
+    tables, xer_file, error = _session_tables(session_id, proj_id, "run schedule checks")
+    if error:
+        return {**error, "available": available}
+    return {"checks": run_checks(tables, ids, limit=max(1, min(limit, 5000))), "available": available,
+            "xer_filename": xer_file}
+
+
+_DRIVING_PATH_WORDS = ("driving path", "drives ", "driving ", "drivers of", "near-critical", "near critical",
+                       "longest path", "what is holding", "holding up")
+
+
+def _driving_path_context(session_id: str | None, message: str, near_days: float = 10.0, limit: int = 25) -> str:
+    """Driving-path block for the chat system prompt when the message asks what drives an activity.
+
+    The target is the first activity code (or task_id) named in the message, else the project finish.
+    Returns "" when the question is not about driving paths or no schedule is loaded.
+    """
+    import re
+    text = (message or "").lower()
+    if not session_id or not any(w in text for w in _DRIVING_PATH_WORDS):
+        return ""
+    try:
+        from schedule_agent_web.store import get_file_content
+        from schedule_agent_web.scheduling import driving_paths, numpy_available
+        if not numpy_available():
+            return ""
+        xer_file = _find_session_xer(session_id)
+        raw = (get_file_content(session_id, xer_file) or "") if xer_file else ""
+        if len(raw) < 50:
+            return ""
+        tables = _get_parsed_xer(raw, session_id, xer_file)
+        tasks = tables.get("TASK")
+        if not tasks:
+            return ""
+        paths = driving_paths(tables)
+        node = None
+        for token in re.findall(r"[A-Za-z0-9][\w.\-/]*[A-Za-z0-9]", message):
+            node = paths.node_of(tasks, token)
+            if node is not None and paths.cpm.network.in_network[node]:
+                break
+            node = None
+        if node is None:
+            node = paths.finish_node()
+        if node is None:
+            return ""
+        result = paths.query(tasks, node, near_days=near_days, limit=limit)
+    except Exception:
+        return ""
+    t = result["target"]
+    path = result["drivingPath"]
+    start = path["start"]
+    lines = [f"\n\n## Driving path to {t['task_code']} {t['task_name']} (computed by the CPM engine, use when answering)\n",
+             f"{path['length']} driving predecessor(s); the path starts at {start['task_code']} {start['task_name']} "
+             f"(ES {start['early_start']}, driven by {start['driver']})."]
+    if len(path["activities"]) < path["length"]:
+        lines.append(f"Last {len(path['activities'])} activities before the target:")
+    for a in path["activities"]:
+        tie = a["tie"]
+        lag = f" lag {tie['lag_days']}d" if tie["lag_days"] else ""
+        lines.append(f"- {a['task_code']} {a['task_name']}: ES {a['early_start']}, EF {a['early_finish']}, "
+                     f"TF {a['total_float']}d --{tie['type']}{lag}-->")
+    lines.append(f"- {t['task_code']} {t['task_name']}: ES {t['early_start']}, EF {t['early_finish']}, TF {t['total_float']}d")
+    near = result["nearCritical"]["activities"]
+    if near:
+        lines.append(f"\nNear-critical predecessors (relative float to the target within {near_days:g} days):")
+        for a in near:
+            lines.append(f"- {a['task_code']} {a['task_name']}: relative float {a['relative_float']}d, "
+                         f"EF {a['early_finish']}, TF {a['total_float']}d")
+    return "\n".join(lines) + "\n"
+
+
+def _parse_version_label(label: str, default_type: str = "baseline") -> tuple[str, int] | None:
+    """'v2', '2', 'update_v3', 'baseline:1' -> (submission type, version); None if unrecognised."""
+    import re
+    m = re.fullmatch(r"\s*(?:(baseline|update)[_:\s-]*)?v?(\d+)\s*", label or "", re.IGNORECASE)
+    if not m:
+        return None
+    return (m.group(1) or default_type).lower(), int(m.group(2))
+
+
+def _submission_xer(session_id: str, stype: str, version: int) -> tuple[str, str] | None:
+    """(stored filename, raw content) of a baseline/update submission's XER, or None."""
+    from schedule_agent_web.baseline import get_submission
+    from schedule_agent_web.store import get_file_content
+    sub = get_submission(session_id, version, submission_type=stype)
+    if not sub or not sub.get("xer_filename"):
+        return None
+    name = f"{stype}_v{version}_{sub['xer_filename']}"
+    raw = get_file_content(session_id, name) or ""
+    return (name, raw) if len(raw) >= 50 else None
+
+
+def _previous_submission(session_id: str, stype: str, version: int) -> tuple[str, int] | None:
+    """Submission a version is compared against: the previous version, or for update v1 the latest baseline."""
+    from schedule_agent_web.baseline import list_submissions
+    if version > 1:
+        return stype, version - 1
+    if stype == "update":
+        subs = list_submissions(session_id, submission_type="baseline")
+        if subs:
+            return "baseline", subs[0]["version"]
+    return None
+
+
+def _schedule_diff(session_id: str, old: tuple[str, str], new: tuple[str, str]):
+    """Diff of two stored XERs (filename, raw), memoised on the newer parse."""
+    from schedule_agent_web.scheduling import content_key, diff_schedules
+    old_parsed = _get_parsed_xer(old[1], session_id, old[0])
+    new_parsed = _get_parsed_xer(new[1], session_id, new[0])
+    return new_parsed.memo("diff:" + content_key(old[1]), lambda p: diff_schedules(old_parsed, p))
+
+
+def _review_delta_block(session_id: str, stype: str, version: int, limit: int = 25) -> str:
+    """Compact change list against the previous submission for the review prompt ("" if none)."""
+    try:
+        prev = _previous_submission(session_id, stype, version)
+        if not prev:
+            return ""
+        old = _submission_xer(session_id, *prev)
+        new = _submission_xer(session_id, stype, version)
+        if not old or not new:
+            return ""
+        diff = _schedule_diff(session_id, old, new)
+        return diff.delta_block(f"{prev[0]} v{prev[1]}", f"{stype} v{version}", limit=limit)
+    except Exception:
+        return ""
+
+
+@app.get("/api/schedule/diff")
+def api_schedule_diff(session_id: str = "", from_: str = Query("", alias="from"), to: str = "",
+                      submission_type: str = "baseline", limit: int = 200):
+    """Deterministic diff of two submitted XER versions (?from=v1&to=v2; 'update_v2' picks the type)."""
+    if not session_id:
+        raise HTTPException(status_code=400, detail="session_id required")
+    from schedule_agent_web.baseline import list_submissions
+
+    stype = submission_type if submission_type in ("baseline", "update") else "baseline"
+    if to:
+        new_ref = _parse_version_label(to, stype)
+        if not new_ref:
+            raise HTTPException(status_code=400, detail=f"Unrecognised version '{to}'")
+    else:
+        subs = list_submissions(session_id, submission_type=stype)
+        if not subs:
+            return {"error": "no_versions", "message": f"No {stype} submissions to compare."}
+        new_ref = (stype, subs[0]["version"])
+    if from_:
+        old_ref = _parse_version_label(from_, stype)
+        if not old_ref:
+            raise HTTPException(status_code=400, detail=f"Unrecognised version '{from_}'")
+    else:
+        old_ref = _previous_submission(session_id, *new_ref)
+        if not old_ref:
+            return {"error": "no_previous", "message": f"{new_ref[0].title()} v{new_ref[1]} has no earlier version to compare."}
+
+    old = _submission_xer(session_id, *old_ref)
+    if not old:
+        raise HTTPException(status_code=404, detail=f"{old_ref[0].title()} v{old_ref[1]} XER not found.")
+    new = _submission_xer(session_id, *new_ref)
+    if not new:
+        raise HTTPException(status_code=404, detail=f"{new_ref[0].title()} v{new_ref[1]} XER not found.")
+    try:
+        diff = _schedule_diff(session_id, old, new)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Schedule diff failed: {e}")
+    return {
+        "from": {"submission_type": old_ref[0], "version": old_ref[1], "xer_filename": old[0]},
+        "to": {"submission_type": new_ref[0], "version": new_ref[1], "xer_filename": new[0]},
+        **diff.to_dict(limit=max(0, min(limit, 5000))),
+    }
+
+
+def _record_trend(session_id: str, stype: str, version: int, sub: dict | None = None):
+    """Snapshot a submission's XER into the session trend store; manifest entry, or None on failure."""
+    try:
+        from schedule_agent_web.baseline import get_submission
+        from schedule_agent_web.scheduling import trend_store
+        sub = sub or get_submission(session_id, version, submission_type=stype)
+        xer = _submission_xer(session_id, stype, version)
+        if not sub or not xer:
+            return None
+        return trend_store(session_id).record(
+            f"{stype}_v{version}", _get_parsed_xer(xer[1], session_id, xer[0]), submission_type=stype,
+            version=version, xer_filename=sub.get("xer_filename", ""), xer_size=sub.get("xer_size", 0))
+    except Exception:
+        return None
+
+
+def _sync_trends(session_id: str):
+    """Trend store with every submitted XER recorded: snapshots submissions recorded before the store
+    existed (or whose XER was replaced) and drops versions whose submission is gone."""
+    from schedule_agent_web.baseline import list_submissions
+    from schedule_agent_web.scheduling import trend_store
+    store = trend_store(session_id)
+    recorded = {e["label"]: e for e in store.manifest()}
+    labels = set()
+    for sub in list_submissions(session_id):
+        if not sub.get("xer_filename"):
+            continue
+        stype = sub.get("submission_type") or "baseline"
+        label = f"{stype}_v{sub['version']}"
+        labels.add(label)
+        e = recorded.get(label)
+        if e is None or (e.get("xer_filename"), e.get("xer_size")) != (sub["xer_filename"], sub.get("xer_size", 0)):
+            _record_trend(session_id, stype, sub["version"], sub)
+    for label in set(recorded) - labels:
+        store.remove(label)
+    return store
+
+
+@app.get("/api/schedule/trends")
+def api_schedule_trends(session_id: str = "", last: int = 0, limit: int = 50, milestones: str = "",
+                        activity: str = ""):
+    """Trends across the session's baseline / update submissions, from per-version snapshots.
+
+    Returns the per-version history (data date, project finish and slip, BEI), the activities with
+    the most float erosion over the last N versions (all by default) and milestone finish slip
+    (milestones: comma-separated activity codes, default every milestone). activity adds one
+    activity's dates, float and progress in every version.
+    """
+    if not session_id:
+        raise HTTPException(status_code=400, detail="session_id required")
+    from schedule_agent_web.scheduling import numpy_available
+
+    if not numpy_available():
+        raise HTTPException(status_code=503, detail="Trend queries require numpy (pip install numpy).")
+    try:
+        store = _sync_trends(session_id)
+        history = store.history()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Trend store failed: {e}")
+    if not history:
+        return {"error": "no_versions", "message": "Submit a baseline or update XER to start the trend history."}
+    last = max(0, last)
+    limit = max(1, min(limit, 1000))
+    keys = [k.strip() for k in milestones.split(",") if k.strip()] or None
+    out = {
+        "history": history,
+        "floatErosion": store.float_erosion(last=last, limit=limit),
+        "milestoneSlip": store.milestone_slip(keys, last=last, limit=limit),
+    }
+    if activity.strip():
+        rows = store.activity(activity.strip())
+        if rows is None:
+            raise HTTPException(status_code=404, detail=f"Activity '{activity}' not found in any version.")
+        out["activity"] = {"key": activity.strip(), "versions": rows}
+    return out
+
+
 @app.get("/api/conversation")
 def api_get_conversation(session_id: str = ""):
     """Return stored conversation for this session_id (persistence)."""
@@ -1075,7 +1654,7 @@ def api_digest_generate(session_id: str = "", body: dict = {}):
         "Pick the single best-fit category. Return ONLY the JSON array, no markdown."
     )
     messages = [{"role": "user", "content": f"Summarize these chat turns:\n{batch_text}"}]
-    reply, err = _call_llm(system, messages, max_tokens=4096)
+    reply, err = _call_llm(system, messages, max_tokens=4096, stage="digest", cache_if=_is_json_array)
 
     if err or not reply:
         for t in turns:
@@ -1482,6 +2061,15 @@ def api_admin_delete_file(session_id: str = "", filename: str = "", authorizatio
     return {"ok": True, "message": f"'{filename}' deleted by admin."}
 
 
+@app.delete("/api/admin/llm-cache")
+def api_admin_clear_llm_cache(stage: str = "", authorization: str = Header(default="")):
+    """Admin only: drop cached LLM replies (all, or one stage's, e.g. stage=extract)."""
+    _require_admin(authorization)
+    from schedule_agent_web.llm_cache import response_cache
+    removed = response_cache().clear(stage or None)
+    return {"ok": True, "removed": removed, "stage": stage or None}
+
+
 class FileUploadRequest(BaseModel):
     session_id: str
     filename: str
@@ -1776,6 +2364,8 @@ def api_baseline_submit(request: BaselineSubmitRequest):
             updates["resp_size"] = request.resp_size
         _save_files(ver)
         sub = update_submission(request.session_id, ver, stype, **updates)
+        if request.xer_filename and request.xer_content:
+            _record_trend(request.session_id, stype, ver, sub)
         return {"ok": True, "submission": sub, "updated": True}
 
     if not request.xer_filename and not request.narr_filename:
@@ -1801,112 +2391,85 @@ def api_baseline_submit(request: BaselineSubmitRequest):
     )
     ver = sub["version"]
     _save_files(ver)
+    if request.xer_filename and request.xer_content:
+        _record_trend(request.session_id, stype, ver, sub)
     return {"ok": True, "submission": sub}
 
 
 def _decode_xer_content(raw: str) -> str:
     """If content looks like base64 (from legacy binary upload), decode it to text."""
-    import base64, re
-    if not raw or raw.startswith("%T") or raw.startswith("ERMHDR"):
-        return raw
-    if re.match(r'^[A-Za-z0-9+/\r\n]+=*$', raw[:200].replace('\n', '').replace('\r', '')):
-        try:
-            decoded = base64.b64decode(raw).decode("utf-8", errors="replace")
-            if "%T" in decoded[:200] or "ERMHDR" in decoded[:200]:
-                return decoded
-        except Exception:
-            pass
-    return raw
-
-
-def _parse_xer_tables(xer_text: str) -> dict[str, list[dict]]:
-    """Parse XER text into named tables. Returns {table_name: [row_dicts]}."""
-    tables: dict[str, list[dict]] = {}
-    current_table = None
-    headers: list[str] = []
-
-    for line in xer_text.split("\n"):
-        line = line.rstrip("\r")
-        if line.startswith("%T\t"):
-            current_table = line.split("\t", 1)[1].strip()
-            headers = []
-            tables[current_table] = []
-        elif line.startswith("%F\t") and current_table:
-            headers = [h.strip() for h in line.split("\t")[1:]]
-        elif line.startswith("%R\t") and current_table and headers:
-            vals = line.split("\t")[1:]
-            row = {}
-            for i, h in enumerate(headers):
-                row[h] = vals[i].strip() if i < len(vals) else ""
-            tables[current_table].append(row)
-        elif line.startswith("%E"):
-            current_table = None
-            headers = []
-
-    return tables
-
-
-def _summarize_xer_for_review(xer_text: str) -> str:
+    from schedule_agent_web.scheduling import decode_xer_content
+    return decode_xer_content(raw)
+
+
+def _parse_xer_tables(xer_text: str):
+    """Parse XER text into named columnar tables (ParsedXer). tables.get(name, []) yields lazy row views."""
+    from schedule_agent_web.scheduling import parse_xer_text
+    return parse_xer_text(xer_text)
+
+
+def _get_parsed_xer(raw: str, session_id: str | None = None, filename: str | None = None):
+    """Parsed XER for stored content, shared through the content-addressed cache (decodes base64 uploads)."""
+    from schedule_agent_web.scheduling import get_parsed_xer
+    return get_parsed_xer(raw, session_id=session_id, filename=filename)
+
+
+# Token budgets of the XER summary in review prompts and in the chat context (which also carries a CPM brief).
+REVIEW_SUMMARY_TOKENS = 20000
+CHAT_SUMMARY_TOKENS = 12000
+
+
+def _budgeted_xer_summary(tables, max_tokens: int = REVIEW_SUMMARY_TOKENS) -> str:
+    """Token-budgeted summary of a parsed XER, memoised per budget on the parse."""
+    return tables.memo(f"review_summary:{max_tokens}", lambda t: _summarize_xer_tables(t, max_tokens))
+
+
+def _cached_xer_summary(raw: str, session_id: str | None = None, filename: str | None = None,
+                        max_tokens: int = REVIEW_SUMMARY_TOKENS) -> str:
+    """Review summary of stored XER content; built once per distinct upload and reused by chat and review."""
+    from schedule_agent_web.scheduling import CHARS_PER_TOKEN
+    tables = _get_parsed_xer(raw, session_id, filename)
+    return _budgeted_xer_summary(tables, max_tokens) or _decode_xer_content(raw)[:max_tokens * CHARS_PER_TOKEN]
+
+
+def _xer_chat_context(tables) -> str:
+    """Chat context for a parsed XER: recomputed CPM brief followed by the review summary."""
+    summary = _budgeted_xer_summary(tables, CHAT_SUMMARY_TOKENS)
+    if not summary:
+        return ""
+    cpm = _compute_session_cpm(tables)
+    tasks = tables.get("TASK")
+    if cpm is None or not tasks:
+        return summary
+    info = cpm.summary()
+    lines = [
+        f"## CPM (recomputed from logic) — data date {info['dataDate']}, project finish {info['projectFinish']}",
+        f"  Scheduled {info['scheduled']} of {info['activities']} activities; {info['criticalCount']} critical; "
+        f"{info['negativeFloatCount']} with negative float; {info['loopActivities']} in logic loops",
+        "  task_code\ttask_name\tearly_start\tearly_finish\ttotal_float_days\tfree_float_days",
+    ]
+    for a in cpm.activities(tasks, cpm.ranked(critical_only=True), limit=25):
+        lines.append(f"  {a['task_code']}\t{a['task_name']}\t{a['early_start']}\t{a['early_finish']}\t{a['total_float']}\t{a['free_float']}")
+    return "\n".join(lines) + "\n\n" + summary
+
+
+def _summarize_xer_for_review(xer_text: str, max_tokens: int = REVIEW_SUMMARY_TOKENS) -> str:
     """Parse XER and produce a structured summary focused on activities, logic, and WBS."""
-    tables = _parse_xer_tables(xer_text)
-    parts = []
+    return _summarize_xer_tables(_parse_xer_tables(xer_text), max_tokens) or xer_text
 
-    wbs = tables.get("PROJWBS", [])
-    if wbs:
-        parts.append(f"## WBS Structure ({len(wbs)} entries)")
-        for w in wbs[:200]:
-            wbs_id = w.get("wbs_id", "")
-            short = w.get("wbs_short_name", "")
-            name = w.get("wbs_name", "")
-            parent = w.get("parent_wbs_id", "")
-            parts.append(f"  WBS_ID={wbs_id}  SHORT={short}  NAME={name}  PARENT={parent}")
-
-    tasks = tables.get("TASK", [])
-    if tasks:
-        parts.append(f"\n## Activities ({len(tasks)} tasks)")
-        cols = ["task_id", "task_code", "task_name", "wbs_id", "task_type",
-                "total_float_hr_cnt", "duration_type", "target_drtn_hr_cnt",
-                "remain_drtn_hr_cnt", "target_start_date", "target_end_date",
-                "status_code", "phys_complete_pct"]
-        header_line = "\t".join(c for c in cols if any(c in t for t in tasks[:1]))
-        actual_cols = [c for c in cols if tasks and c in tasks[0]]
-        if actual_cols:
-            parts.append("  " + "\t".join(actual_cols))
-            for t in tasks:
-                parts.append("  " + "\t".join(str(t.get(c, "")) for c in actual_cols))
-
-    preds = tables.get("TASKPRED", [])
-    if preds:
-        parts.append(f"\n## Logic Relationships ({len(preds)} ties)")
-        pred_cols = ["task_id", "pred_task_id", "pred_type", "lag_hr_cnt", "pred_type"]
-        actual = [c for c in pred_cols if preds and c in preds[0]]
-        if not actual:
-            actual = list(preds[0].keys()) if preds else []
-        parts.append("  " + "\t".join(actual))
-        for p in preds:
-            parts.append("  " + "\t".join(str(p.get(c, "")) for c in actual))
-
-    rsrc = tables.get("TASKRSRC", [])
-    if rsrc:
-        parts.append(f"\n## Resource Assignments ({len(rsrc)} entries)")
-        rsrc_cols = ["task_id", "rsrc_id", "target_qty", "target_cost", "remain_qty", "remain_cost"]
-        actual = [c for c in rsrc_cols if rsrc and c in rsrc[0]]
-        if actual:
-            parts.append("  " + "\t".join(actual))
-            for r in rsrc[:300]:
-                parts.append("  " + "\t".join(str(r.get(c, "")) for c in actual))
-
-    cal = tables.get("CALENDAR", [])
-    if cal:
-        parts.append(f"\n## Calendars ({len(cal)} entries)")
-        for c in cal[:30]:
-            parts.append(f"  CLNDR_ID={c.get('clndr_id','')}  NAME={c.get('clndr_name','')}")
-
-    if not parts:
-        return xer_text
-
-    summary = "\n".join(parts)
-    return summary
+
+def _summarize_xer_tables(tables, max_tokens: int = REVIEW_SUMMARY_TOKENS) -> str:
+    """Structured summary of already-parsed XER tables, ranked to fit max_tokens ('' when the content had no tables).
+
+    Critical / near-critical work, logic defects and constraint or calendar anomalies come first; WBS
+    and calendars are dictionary-coded so large schedules keep their most relevant rows.
+    """
+    from schedule_agent_web.scheduling import summarize_schedule
+    tasks = tables.get("TASK")
+    # Recomputed float only matters when the export carries none (column absent or every value blank).
+    needs_cpm = bool(tasks) and all(v != v for v in tasks.floats("total_float_hr_cnt"))
+    cpm = _compute_session_cpm(tables) if needs_cpm else None
+    return summarize_schedule(tables, max_tokens, cpm=cpm, logic=_logic_report(tables), loading=_resource_loading(tables))
 
 
 class ReviewExecuteRequest(BaseModel):
@@ -1947,8 +2510,17 @@ def api_baseline_review_execute(request: ReviewExecuteRequest):
     if specs_info:
         specs_content = get_file_content(request.session_id, specs_info["filename"]) or ""
 
-    xer_raw = get_file_content(request.session_id, f"{file_prefix}_v{ver}_{sub['xer_filename']}") or ""
-    xer_content = _decode_xer_content(xer_raw)
+    xer_name = f"{file_prefix}_v{ver}_{sub['xer_filename']}"
+    xer_raw = get_file_content(request.session_id, xer_name) or ""
+    xer_summary = _cached_xer_summary(xer_raw, request.session_id, xer_name) if xer_raw else ""
+    delta_block = _review_delta_block(request.session_id, stype, ver) if xer_raw else ""
+    logic_block = ""
+    findings = None
+    if xer_raw:
+        parsed = _get_parsed_xer(xer_raw, request.session_id, xer_name)
+        logic = _logic_report(parsed)
+        logic_block = logic.evidence_block(limit=30) if logic is not None else ""
+        findings = _review_findings(parsed, request.session_id)
     narr_content = ""
     if sub.get("narr_filename"):
         narr_content = get_file_content(request.session_id, f"{file_prefix}_v{ver}_{sub['narr_filename']}") or ""
@@ -1961,6 +2533,8 @@ def api_baseline_review_execute(request: ReviewExecuteRequest):
 
     prev_last_num = get_last_comment_number(request.session_id)
     start_num = prev_last_num + 1
+    # Rule findings take the first IDs; the model numbers its comments after them.
+    llm_start = start_num + len(findings or [])
 
     col_list = ", ".join(columns)
 
@@ -1988,8 +2562,8 @@ def api_baseline_review_execute(request: ReviewExecuteRequest):
         "Produce a thorough review with actionable comments.\n\n"
         f"Output ONLY a valid JSON array of objects. Each object must have these keys: {col_list}.\n"
         "Rules:\n"
-        f"- 'Comment ID' must be sequential starting from BLR-{start_num:03d}. "
-        f"Previous reviews used IDs up to BLR-{prev_last_num:03d}. "
+        f"- 'Comment ID' must be sequential starting from BLR-{llm_start:03d}. "
+        f"Previous reviews and the deterministic findings used IDs up to BLR-{llm_start - 1:03d}. "
         "Reuse of any prior Comment ID is strictly prohibited.\n"
         "- 'WBS Reference' should identify the WBS element or activity ID the comment relates to, or 'General' if project-wide.\n"
         "- 'Comment Description' should be specific and reference actual activities, logic, or spec requirements.\n"
@@ -2022,6 +2596,8 @@ def api_baseline_review_execute(request: ReviewExecuteRequest):
         "determine if it is physically required (hard) or preferential (soft/resource). "
         "Flag preferential cross-WBS ties as 'Preferential Cross-WBS' with Priority 'Recommendation'.\n"
         "- Check for dangling activities (no predecessor or no successor).\n"
+        "- When a 'Logic Evidence' section is provided, it was computed deterministically from the full TASKPRED "
+        "table: base 'Dangling Logic', 'Redundant Logic' and loop findings on it and cite its activity IDs.\n"
         "- Ensure at least 5-10 logic-specific comments are included in the review.\n\n"
         "- 'Recommendation for Correction' should be clear, actionable guidance.\n"
         "- 'Contractor Response' must always be empty string (for contractor to fill in).\n"
@@ -2054,10 +2630,16 @@ def api_baseline_review_execute(request: ReviewExecuteRequest):
         phil_instructions += f"Negative lag tolerance: {gov.get('negativeLagTolerance', 0)} — maximum number of negative lags (leads) allowed before flagging.\n"
         phil_instructions += f"Hard constraint tolerance: {gov.get('hardConstraintTolerance', 5)}% — flag if hard constraints exceed this percentage of activities.\n"
         rules = gov.get("rules", {})
-        if rules.get("leadRestriction"): phil_instructions += "RULE: Negative lags (leads) are FORBIDDEN. Flag every lead as Mandatory deficiency.\n"
-        if rules.get("sfBan"): phil_instructions += "RULE: Start-to-Finish (SF) relationships are BANNED. Flag every SF as Mandatory deficiency.\n"
-        if rules.get("hardConstraintAudit"): phil_instructions += "RULE: Hard constraints are discouraged. Every Must-Start-On, Must-Finish-On constraint must be flagged.\n"
-        if rules.get("calendarCheck"): phil_instructions += "RULE: Every activity MUST have an assigned calendar. Missing calendars are Mandatory deficiencies.\n"
+        if findings is None:
+            if rules.get("leadRestriction"): phil_instructions += "RULE: Negative lags (leads) are FORBIDDEN. Flag every lead as Mandatory deficiency.\n"
+            if rules.get("sfBan"): phil_instructions += "RULE: Start-to-Finish (SF) relationships are BANNED. Flag every SF as Mandatory deficiency.\n"
+            if rules.get("hardConstraintAudit"): phil_instructions += "RULE: Hard constraints are discouraged. Every Must-Start-On, Must-Finish-On constraint must be flagged.\n"
+            if rules.get("calendarCheck"): phil_instructions += "RULE: Every activity MUST have an assigned calendar. Missing calendars are Mandatory deficiencies.\n"
+        else:
+            phil_instructions += ("Leads, SF relationships, hard constraints, missing calendars and missing owner activities were "
+                                  "checked deterministically; those comments are listed under 'Deterministic Findings'. "
+                                  "Do NOT write comments for them — spend the review on judgement: scope, sequence, durations, "
+                                  "float, narrative and spec compliance.\n")
         if rules.get("fsPreferred"): phil_instructions += "RULE: FS relationships should be ≥ 80% of all relationships. Flag if percentage is lower.\n"
         phil_instructions += f"\nNarrative tone for all comments: {tone_map.get(gov.get('narrativeTone', 'exec'), 'Executive')}\n"
         phil_instructions += f"\nDelivery method: {bas.get('deliveryMethod', 'Design-Build')} — tailor review expectations accordingly.\n"
@@ -2074,11 +2656,11 @@ def api_baseline_review_execute(request: ReviewExecuteRequest):
             phil_instructions += "Required review areas (must be covered): " + ", ".join(required_checks) + "\n"
         oa = pb.get("ownerActivities", [])
         req_oa = [a for a in oa if a.get("required")]
-        if req_oa:
+        if req_oa and findings is None:
             phil_instructions += "Owner activities that MUST appear in the schedule: " + ", ".join(f"{a['name']} ({a['duration']}d)" for a in req_oa) + ". Flag as Mandatory deficiency if missing.\n"
         phil_instructions += "\nAt the END of the review, add a summary comment (last item) with 'WBS Reference': 'Summary' that provides:\n"
         phil_instructions += "- Overall recommendation (Approve as Noted / Reject for Resubmission) based on the review standard and thresholds above.\n"
-        phil_instructions += "- Count of Mandatory vs Recommendation findings.\n"
+        phil_instructions += "- Count of Mandatory vs Recommendation findings (including the deterministic findings).\n"
         phil_instructions += "- Key areas of concern.\n"
         system_prompt += phil_instructions
     except Exception:
@@ -2095,10 +2677,15 @@ def api_baseline_review_execute(request: ReviewExecuteRequest):
             f"Verify each contractor response for compliance with contract specifications. "
             f"Mark 'Addressed (Yes/No)' accordingly.\n{preview}"
         )
-    if xer_content:
-        xer_summary = _summarize_xer_for_review(xer_content)
-        xer_preview = xer_summary[:80000] if len(xer_summary) > 80000 else xer_summary
-        user_msg_parts.append(f"## XER Schedule ({review_label} v{ver})\n{xer_preview}")
+    if xer_summary:
+        user_msg_parts.append(f"## XER Schedule ({review_label} v{ver})\n{xer_summary}")
+    if logic_block:
+        user_msg_parts.append(logic_block)
+    if findings:
+        from schedule_agent_web.scheduling import findings_table
+        user_msg_parts.append(findings_table(findings, first_id=start_num))
+    if delta_block:
+        user_msg_parts.append(delta_block)
     if narr_content:
         preview = narr_content[:8000]
         user_msg_parts.append(f"## Schedule Narrative ({review_label} v{ver})\n{preview}")
@@ -2108,7 +2695,8 @@ def api_baseline_review_execute(request: ReviewExecuteRequest):
     user_msg = "\n\n".join(user_msg_parts)
     user_msg += f"\n\nGenerate the baseline review comments as a JSON array with columns: {col_list}"
 
-    reply, err = _call_llm(system_prompt, [{"role": "user", "content": user_msg}], max_tokens=65536)
+    reply, err = _call_llm(system_prompt, [{"role": "user", "content": user_msg}], max_tokens=65536,
+                           stage="review", cache=False)
     if err:
         raise HTTPException(status_code=502, detail=f"AI review failed: {err}")
 
@@ -2123,12 +2711,13 @@ def api_baseline_review_execute(request: ReviewExecuteRequest):
             {"role": "user", "content": user_msg},
             {"role": "assistant", "content": reply},
             {"role": "user", "content": retry_msg},
-        ], max_tokens=65536)
+        ], max_tokens=65536, stage="review", cache=False)
         if not err2:
             comments = _extract_json_array(reply2)
     if comments is None:
         raise HTTPException(status_code=502, detail="AI returned invalid JSON. Try again.")
 
+    comments = [f.to_comment(columns) for f in findings or []] + comments
     for idx, c in enumerate(comments):
         correct_num = start_num + idx
         c["Comment ID"] = f"BLR-{correct_num:03d}"
@@ -2190,15 +2779,20 @@ def api_baseline_review_execute(request: ReviewExecuteRequest):
             f"## Contractor's Filled Comment Response (Previous Version)\n{resp_content[:12000]}"
         )
         exc_user_parts.append(
-            f"## New P6 XER Schedule ({review_label} v{ver})\n{_summarize_xer_for_review(xer_content)[:80000]}"
+            f"## New P6 XER Schedule ({review_label} v{ver})\n{xer_summary}"
         )
+        if logic_block:
+            exc_user_parts.append(logic_block)
+        if delta_block:
+            exc_user_parts.append(delta_block)
         exc_user_msg = "\n\n".join(exc_user_parts)
         exc_user_msg += (
             "\n\nIdentify all exceptions where the contractor claimed 'addressed' "
             "but the XER evidence shows otherwise. Output as JSON array."
         )
 
-        exc_reply, exc_err = _call_llm(exc_system, [{"role": "user", "content": exc_user_msg}])
+        exc_reply, exc_err = _call_llm(exc_system, [{"role": "user", "content": exc_user_msg}], stage="review",
+                                       cache=False)
         if not exc_err and exc_reply:
             exc_raw = exc_reply.strip()
             if exc_raw.startswith("```"):
@@ -2242,6 +2836,25 @@ def api_baseline_review_execute(request: ReviewExecuteRequest):
     return {"ok": True, "review": meta, "comments": comments}
 
 
+@app.get("/api/baseline/review/findings")
+def api_baseline_review_findings(session_id: str = "", version: int = 0, submission_type: str = "baseline"):
+    """Deterministic review findings for a submission (what execute writes before the AI pass)."""
+    if not session_id:
+        raise HTTPException(status_code=400, detail="session_id required")
+    stype = submission_type if submission_type in ("baseline", "update") else "baseline"
+    sub = _submission_xer(session_id, stype, version)
+    if not sub:
+        raise HTTPException(status_code=404, detail=f"{stype.title()} v{version} XER not found.")
+    findings = _review_findings(_get_parsed_xer(sub[1], session_id, sub[0]), session_id)
+    if findings is None:
+        raise HTTPException(status_code=500, detail="Review rules failed.")
+    counts = {"Mandatory": 0, "Recommendation": 0}
+    for f in findings:
+        counts[f.priority] = counts.get(f.priority, 0) + 1
+    return {"total": len(findings), "counts": counts, "findings": [f.to_dict() for f in findings],
+            "xer_filename": sub[0]}
+
+
 @app.get("/api/baseline/reviews")
 def api_baseline_reviews(session_id: str = ""):
     """List all review results for a project."""
@@ -2354,8 +2967,8 @@ async def api_vision_describe(
         media_type = "image/jpeg"
     user_prompt = (prompt or "").strip() or default_prompt
     try:
-        from schedule_agent_web.vision import describe_image
-        description, err = describe_image(raw, media_type=media_type, prompt=user_prompt)
+        from schedule_agent_web.vision import describe_image_async
+        description, err = await describe_image_async(raw, media_type=media_type, prompt=user_prompt)
         if err:
             raise HTTPException(status_code=502, detail=err)
         return {"description": description, "error": None}
@@ -2792,7 +3405,8 @@ def api_documents_qa(request: DocumentsQARequest):
                 context += f"\nFrom {fn}:\n{txt}\n"
                 sources.append({"filename": fn, "text_preview": txt[:300]})
         system = "You are a project controls analyst. Answer the question using only the provided context. If the context does not contain enough information, say so. Be concise."
-        reply, err = call_llm(system, f"Context:\n{context}\n\nQuestion: {request.question.strip()}", max_tokens=1024)
+        reply, err = call_llm(system, f"Context:\n{context}\n\nQuestion: {request.question.strip()}", max_tokens=1024,
+                              stage="qa")
         if err:
             raise HTTPException(status_code=502, detail=err)
         append_audit(request.session_id, "answer", {"source": "documents_qa", "sources": sources})
@@ -3082,7 +3696,8 @@ def api_extract_schedule(request: ExtractScheduleRequest):
         "Include wbs as a list of {code, name}. Set projectName from the scope. "
         "Reply with ONLY the JSON object—no explanation, no markdown code block, no backticks. Start with { and end with }."
     )
-    reply, err = _call_llm(system, [{"role": "user", "content": user_msg}])
+    reply, err = _call_llm(system, [{"role": "user", "content": user_msg}], stage="extract",
+                           cache_if=lambda r: bool(_parse_json_from_llm(r)))
     if err:
         raise HTTPException(status_code=502, detail=err)
     data = _parse_json_from_llm(reply)
@@ -3093,7 +3708,8 @@ def api_extract_schedule(request: ExtractScheduleRequest):
             "Output ONLY valid JSON. No explanation. Use this exact structure; add as many activities as the scope describes: "
             '{"projectName": "string", "activities": [{"id": "ACT-001", "name": "string", "durationDays": 0, "wbsCode": "1.1", "predecessors": [], "isCritical": false, "totalFloatDays": 0, "healthFlags": [], "directCost": 0, "indirectCost": 0, "isHardCost": true}], "wbs": [{"code": "1", "name": "string"}]}'
         )
-        reply2, err2 = _call_llm(retry_system, [{"role": "user", "content": retry_msg}])
+        reply2, err2 = _call_llm(retry_system, [{"role": "user", "content": retry_msg}], stage="extract",
+                                 cache_if=lambda r: bool(_parse_json_from_llm(r)))
         if not err2:
             data = _parse_json_from_llm(reply2)
         if not data and reply2:
@@ -3121,65 +3737,19 @@ def api_extract_schedule(request: ExtractScheduleRequest):
     return out
 
 
-def _call_llm(system: str, messages_for_llm: list, max_tokens: int = 8192) -> tuple[str, str | None]:
-    """Call OpenAI or Claude; returns (reply, error). Prefers Claude if ANTHROPIC_API_KEY set."""
-    if _use_claude():
-        key = _get_anthropic_key()
-        default_models = ("claude-sonnet-4-20250514", "claude-3-5-sonnet-20241022", "claude-3-5-haiku-20241022", "claude-3-haiku-20240307")
-        model = os.environ.get("ANTHROPIC_MODEL") or default_models[0]
-        models_to_try = [model] + [m for m in default_models if m != model]
-        claude_messages = [{"role": m["role"], "content": m["content"]} for m in messages_for_llm if m["role"] in ("user", "assistant")]
-        if max_tokens > 64000:
-            max_tokens = 64000
-        last_err = None
-        for try_model in models_to_try:
-            try:
-                client = Anthropic(api_key=key)
-                if max_tokens > 8192:
-                    collected = []
-                    with client.messages.stream(
-                        model=try_model,
-                        max_tokens=max_tokens,
-                        system=system,
-                        messages=claude_messages,
-                    ) as stream:
-                        for text_chunk in stream.text_stream:
-                            collected.append(text_chunk)
-                    text = "".join(collected).strip()
-                else:
-                    resp = client.messages.create(
-                        model=try_model,
-                        max_tokens=max_tokens,
-                        system=system,
-                        messages=claude_messages,
-                    )
-                    text = (resp.content[0].text if resp.content else "").strip()
-                return (text, None)
-            except Exception as e:
-                last_err = e
-                if "404" in str(e) or "not_found" in str(e).lower():
-                    continue
-                return ("", str(e))
-        return ("", str(last_err) if last_err else "No Claude model available. Set ANTHROPIC_MODEL in Vercel to a model your account has (e.g. claude-3-haiku-20240307).")
-    # OpenAI
-    key = _get_openai_key()
-    if not key or not OpenAI:
-        return ("", "No API key or OpenAI not installed. Set OPENAI_API_KEY or ANTHROPIC_API_KEY.")
-    try:
-        client = OpenAI(api_key=key)
-        resp = client.chat.completions.create(
-            model=os.environ.get("OPENAI_CHAT_MODEL", "gpt-4o-mini"),
-            messages=[{"role": "system", "content": system}] + messages_for_llm,
-            temperature=0.3,
-            max_tokens=max_tokens,
-        )
-        reply = (resp.choices[0].message.content or "").strip()
-        return (reply, None)
-    except Exception as e:
-        err = str(e)
-        if "429" in err or "quota" in err.lower() or "insufficient_quota" in err.lower():
-            err += " Use Claude instead: in Vercel set ANTHROPIC_API_KEY (get a key at console.anthropic.com) and redeploy."
-        return ("", err)
+def _call_llm(system: str | list, messages_for_llm: list, max_tokens: int = 8192, stage: str = "chat",
+              cache: bool = True, cache_if=None) -> tuple[str, str | None]:
+    """Call OpenAI or Claude; returns (reply, error). Prefers Claude if ANTHROPIC_API_KEY set.
+
+    Identical requests are answered from the response cache unless cache=False; cache_if(reply) decides
+    whether a reply is worth keeping (JSON stages keep only parseable replies, so a retry is a real retry).
+    """
+    return llm_gateway.complete(system, messages_for_llm, max_tokens=max_tokens, stage=stage,
+                                cache=cache, cache_if=cache_if)
+
+
+def _is_json_array(reply: str) -> bool:
+    return _extract_json_array(reply) is not None
 
 
 @app.post("/api/chat", response_model=ChatResponse)
@@ -3192,7 +3762,7 @@ def chat(request: ChatRequest):
             status_code=503,
             detail="Set OPENAI_API_KEY or ANTHROPIC_API_KEY in environment.",
         )
-    system = get_system_prompt_with_context(request.session_id)
+    system = get_system_prompt_segments(request.session_id)
     # RAG: retrieve from Qdrant (+ optional GraphRAG) and inject into context; collect sources for citation (Stage 4)
     rag_sources = []
     try:
@@ -3236,9 +3806,11 @@ def chat(request: ChatRequest):
                 rag_parts.append("\n\n## GraphRAG context\n")
                 rag_parts.append("\n".join(graphrag_texts[:3]))
         if rag_parts:
-            system = system + "".join(rag_parts)
+            system.append(PromptSegment("rag", "".join(rag_parts), stable=False))
     except Exception:
         pass
+    # Driving-path questions: answer from the CPM engine's trace rather than the model's reading of the XER
+    system.append(PromptSegment("trace", _driving_path_context(request.session_id, request.message.strip()), stable=False))
     # Build message history: use client-provided history, or load persisted conversation so agent learns from all prior chat
     # Protection: filter out "poisoned" turns where the assistant incorrectly claimed
     # it lacked access to documents that are now available via RAG.
@@ -3286,7 +3858,7 @@ def chat(request: ChatRequest):
     if len(messages_for_llm) > 40:
         messages_for_llm = messages_for_llm[-40:]
     messages_for_llm.append({"role": "user", "content": request.message.strip()})
-    reply, err = _call_llm(system, messages_for_llm)
+    reply, err = _call_llm(system, messages_for_llm, cache=False)
     if request.session_id and not err:
         try:
             from schedule_agent_web.store import append_to_conversation
@@ -3336,7 +3908,7 @@ def handle_chat_json(message: str, history: list, session_id: str | None = None)
         return {"reply": "", "error": "message is required"}
     if not get_status_dict().get("has_api_key"):
         return {"reply": "", "error": "Set OPENAI_API_KEY or ANTHROPIC_API_KEY in Vercel Environment Variables."}
-    system = get_system_prompt_with_context(session_id)
+    system = get_system_prompt_segments(session_id)
     try:
         from schedule_agent_web.vector_store import search, graphrag_search, is_qdrant_available, is_graphrag_available, _file_search_fallback
         rag_parts = []
@@ -3372,9 +3944,10 @@ def handle_chat_json(message: str, history: list, session_id: str | None = None)
                 rag_parts.append("\n\n## GraphRAG context\n")
                 rag_parts.append("\n".join(graphrag_texts[:3]))
         if rag_parts:
-            system = system + "".join(rag_parts)
+            system.append(PromptSegment("rag", "".join(rag_parts), stable=False))
     except Exception:
         pass
+    system.append(PromptSegment("trace", _driving_path_context(session_id, message.strip()), stable=False))
     _POISON_PHRASES_ALT = (
         "don't have access to", "do not have access to",
         "not available in my", "not in my reference library",
@@ -3399,7 +3972,7 @@ def handle_chat_json(message: str, history: list, session_id: str | None = None)
     if len(messages_for_llm) > 40:
         messages_for_llm = messages_for_llm[-40:]
     messages_for_llm.append({"role": "user", "content": message.strip()})
-    reply, err = _call_llm(system, messages_for_llm)
+    reply, err = _call_llm(system, messages_for_llm, cache=False)
     if session_id and not err:
         try:
             from schedule_agent_web.store import append_to_conversation
@@ -1,10 +1,21 @@
 """
-Stage 3 pipeline: NER → classification → relations → temporal → summarization → save.
+Stage 3 pipeline: NER, classification, relations, temporal, summarization → save.
+
+The three LLM stages (classification, relations, summary) are independent round-trips, so they run
+concurrently on a small shared thread pool while regex / spaCy NER and date extraction run on the
+calling thread; a document takes as long as its slowest stage rather than the sum. The pool holds
+every stage of NLP_CONCURRENT_DOCS documents. Each LLM stage has a timeout (NLP_STAGE_TIMEOUT seconds)
+counted from when it starts running; a stage that fails or times out contributes its empty default
+and is reported in stage_errors, and the rest of the document is still saved.
 """
 from __future__ import annotations
 
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
-from typing import Any
+from typing import Any, Callable
 
 from schedule_agent_web.nlp.ner import extract_entities
 from schedule_agent_web.nlp.classification import classify_document
@@ -14,6 +25,90 @@ from schedule_agent_web.nlp.summarization import summarize_text
 from schedule_agent_web.nlp.nlp_store import NLPDocument, save_nlp_document
 
 
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name) or default)
+    except ValueError:
+        return default
+
+
+STAGE_TIMEOUT = _env_number("NLP_STAGE_TIMEOUT", 90.0)
+
+# Stage name -> (function of the text, value used when the stage fails or times out).
+LLM_STAGES: dict[str, tuple[Callable[[str], Any], Callable[[], Any]]] = {
+    "classification": (classify_document, lambda: {"document_type": "unknown", "risk_signal": False,
+                                                   "change_signal": False, "confidence": 0}),
+    "relations": (extract_relations, list),
+    "summary": (summarize_text, str),
+}
+
+# Documents expected in flight at once; the pool holds every LLM stage of that many documents.
+CONCURRENT_DOCS = max(1, int(_env_number("NLP_CONCURRENT_DOCS", 4)))
+MAX_WORKERS = max(int(_env_number("NLP_WORKERS", 0)), len(LLM_STAGES) * CONCURRENT_DOCS)
+
+_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _executor() -> ThreadPoolExecutor:
+    """Shared pool, bounded so concurrent documents cannot open unbounded LLM connections."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="nlp-stage")
+    return _pool
+
+
+def _run_llm_stages(text: str, local: Callable[[], None], timeout: float) -> tuple[dict[str, Any], dict[str, str]]:
+    """Run LLM_STAGES on the pool while local() runs here; (results, errors) with defaults for failed stages.
+
+    A stage's timeout runs from when a pool thread picks it up, so time queued behind other documents
+    does not count against it; a stage still queued after another `timeout` is cancelled. A stage
+    running at its deadline cannot be interrupted: it is reported as timed out and left to finish in
+    the background (its reply lands in the LLM response cache, so a re-run picks it up).
+    """
+    pool = _executor()
+    submitted = time.monotonic()
+    began: dict[str, float] = {}
+
+    def stage(name: str, fn: Callable[[str], Any]) -> Any:
+        began[name] = time.monotonic()
+        return fn(text)
+
+    futures = {pool.submit(stage, name, fn): name for name, (fn, _) in LLM_STAGES.items()}
+    local()
+    results: dict[str, Any] = {}
+    errors: dict[str, str] = {}
+    pending = set(futures)
+    while pending:
+        now = time.monotonic()
+        deadlines = {f: began.get(futures[f], submitted) + timeout for f in pending}
+        for f in [f for f in pending if deadlines[f] <= now]:
+            name = futures[f]
+            if f.cancel():
+                errors[name] = f"not started within {timeout:g}s (stage pool busy)"
+            elif name in began:
+                errors[name] = f"timed out after {timeout:g}s"
+            else:
+                continue      # picked up just now; its own timeout starts
+            pending.discard(f)
+        if not pending:
+            break
+        done, _ = wait(pending, timeout=max(0.0, min(deadlines[f] for f in pending) - now),
+                       return_when=FIRST_COMPLETED)
+        for f in done:
+            pending.discard(f)
+            try:
+                results[futures[f]] = f.result()
+            except Exception as e:
+                errors[futures[f]] = str(e) or type(e).__name__
+    for name, (_, default) in LLM_STAGES.items():
+        if name in errors:
+            results[name] = default()
+    return results, errors
+
+
 def process_document(session_id: str, doc_id: str, text: str, use_spacy_ner: bool = False) -> dict[str, Any]:
     """
     Run Stage 3 NLP on text (from Stage 1 or Stage 2). Saves to nlp store.
@@ -22,11 +117,15 @@ def process_document(session_id: str, doc_id: str, text: str, use_spacy_ner: boo
     if not session_id or not doc_id:
         return {"status": "error", "error": "session_id and doc_id required"}
     text = text or ""
-    entities = extract_entities(text, use_spacy=use_spacy_ner)
-    classification = classify_document(text)
-    relations = extract_relations(text)
-    dates = extract_dates(text)
-    summary = summarize_text(text)
+    local: dict[str, Any] = {}
+
+    def run_local() -> None:
+        local["entities"] = extract_entities(text, use_spacy=use_spacy_ner)
+        local["dates"] = extract_dates(text)
+
+    llm, stage_errors = _run_llm_stages(text, run_local, STAGE_TIMEOUT)
+    entities, dates = local["entities"], local["dates"]
+    classification, relations, summary = llm["classification"], llm["relations"], llm["summary"]
     created_at = datetime.utcnow().isoformat() + "Z"
     nlp_doc = NLPDocument(
         doc_id=doc_id,
@@ -50,4 +149,5 @@ def process_document(session_id: str, doc_id: str, text: str, use_spacy_ner: boo
         "classification": classification,
         "summary_preview": (summary or "")[:200],
         "created_at": created_at,
+        "stage_errors": stage_errors,
     }
@@ -0,0 +1,168 @@
+"""
+Schedule engine — deterministic P6 XER analytics (parsing, caching, CPM scheduling, scorecards,
+version diffs, logic analytics, risk, resource loading, earned value,
+driving paths, what-if scheduling, activity lookup, activity code / UDF filters, review rules,
+schedule checks, version trends, budgeted prompt summaries).
+"""
+from schedule_agent_web.scheduling.xer_parser import (
+    ParsedXer,
+    XerTable,
+    XerRow,
+    parse_xer_text,
+    parse_xer_file,
+    parse_xer_buffer,
+    parse_xer_lines,
+    decode_xer_content,
+)
+from schedule_agent_web.scheduling.calendars import (
+    P6Calendar,
+    CalendarSet,
+    ContinuousCalendars,
+    parse_clndr_data,
+    load_calendars,
+    calendar_day_hours,
+    calendar_set,
+    hours_to_days,
+)
+from schedule_agent_web.scheduling.cpm import (
+    CpmNetwork,
+    CpmResult,
+    PassPlan,
+    build_network,
+    run_cpm,
+    pass_plan,
+    compute_cpm,
+    rel_type_name,
+    numpy_available,
+)
+from schedule_agent_web.scheduling.scorecard import (
+    ScheduleFacts,
+    Check,
+    collect_facts,
+    build_scorecard,
+    register_check,
+    registered_checks,
+    status_of,
+)
+from schedule_agent_web.scheduling.diff import ScheduleDiff, diff_schedules
+from schedule_agent_web.scheduling.logic import (
+    LogicReport,
+    analyze_logic,
+    redundant_edges,
+    strongly_connected,
+    tie_implied,
+)
+from schedule_agent_web.scheduling.risk import DISTRIBUTIONS, RiskModel, RiskResult, simulate
+from schedule_agent_web.scheduling.resources import PERIODS, ResourceLoading, build_loading, resource_loading, spread
+from schedule_agent_web.scheduling.evm import CURVES, EvmResult, build_evm, compare_evm, evm
+from schedule_agent_web.scheduling.paths import DrivingPaths, PathTree, driving_paths
+from schedule_agent_web.scheduling.whatif import Scenario, WhatIf, what_if
+from schedule_agent_web.scheduling.lookup import ActivityIndex, activity_index
+from schedule_agent_web.scheduling.codes import ActivityCodes, CodeField, activity_codes, parse_filters
+from schedule_agent_web.scheduling.review_rules import Finding, findings_table, review_findings
+from schedule_agent_web.scheduling.checks import (
+    ScheduleCheck,
+    ScheduleFrame,
+    register_schedule_check,
+    run_checks,
+    run_checks_many,
+    schedule_checks,
+    schedule_frame,
+)
+from schedule_agent_web.scheduling.trends import TrendStore, snapshot, trend_store
+from schedule_agent_web.scheduling.summary import CHARS_PER_TOKEN, summarize_schedule
+from schedule_agent_web.scheduling.xer_cache import (
+    get_parsed_xer,
+    invalidate_file,
+    content_key,
+    cache_stats,
+    clear_cache,
+)
+
+__all__ = [
+    "ParsedXer",
+    "XerTable",
+    "XerRow",
+    "parse_xer_text",
+    "parse_xer_file",
+    "parse_xer_buffer",
+    "parse_xer_lines",
+    "decode_xer_content",
+    "P6Calendar",
+    "CalendarSet",
+    "ContinuousCalendars",
+    "parse_clndr_data",
+    "load_calendars",
+    "calendar_day_hours",
+    "calendar_set",
+    "hours_to_days",
+    "CpmNetwork",
+    "CpmResult",
+    "PassPlan",
+    "build_network",
+    "run_cpm",
+    "pass_plan",
+    "compute_cpm",
+    "rel_type_name",
+    "numpy_available",
+    "ScheduleFacts",
+    "Check",
+    "collect_facts",
+    "build_scorecard",
+    "register_check",
+    "registered_checks",
+    "status_of",
+    "ScheduleDiff",
+    "diff_schedules",
+    "LogicReport",
+    "analyze_logic",
+    "strongly_connected",
+    "redundant_edges",
+    "tie_implied",
+    "DISTRIBUTIONS",
+    "RiskModel",
+    "RiskResult",
+    "simulate",
+    "PERIODS",
+    "ResourceLoading",
+    "build_loading",
+    "resource_loading",
+    "spread",
+    "CURVES",
+    "EvmResult",
+    "build_evm",
+    "compare_evm",
+    "evm",
+    "DrivingPaths",
+    "PathTree",
+    "driving_paths",
+    "Scenario",
+    "WhatIf",
+    "what_if",
+    "ActivityIndex",
+    "activity_index",
+    "ActivityCodes",
+    "CodeField",
+    "activity_codes",
+    "parse_filters",
+    "Finding",
+    "findings_table",
+    "review_findings",
+    "ScheduleCheck",
+    "ScheduleFrame",
+    "register_schedule_check",
+    "run_checks",
+    "run_checks_many",
+    "schedule_checks",
+    "schedule_frame",
+    "TrendStore",
+    "snapshot",
+    "trend_store",
+    "CHARS_PER_TOKEN",
+    "summarize_schedule",
+    "get_parsed_xer",
+    "invalidate_file",
+    "content_key",
+    "cache_stats",
+    "clear_cache",
+]
@@ -0,0 +1,482 @@
+"""
+Schedule engine: P6 work calendars.
+
+Parses CALENDAR.clndr_data (work week, exceptions, holidays) and precomputes, per calendar, the
+work pattern of every day in a rolling horizon plus a cumulative work-hours array over those days.
+Converting clock time to working time is then an array lookup, and working time back to clock
+time is a binary search (numpy.searchsorted), vectorised across activities and calendars.
+
+Clock times are hours relative to an origin (the data date). Working time is cumulative working
+hours since the origin's midnight on the activity's own calendar.
+"""
+from __future__ import annotations
+
+import math
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, NamedTuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from schedule_agent_web.scheduling.xer_parser import ParsedXer
+
+P6_EPOCH = date(1899, 12, 30)   # clndr_data exception dates are day serials from this epoch
+_DAY_MIN = 1440
+_ROUND = 6                      # working-hour values are compared at microhour precision
+
+# Initial horizon around the origin (days); grown on demand.
+_HORIZON_BACK = 5 * 366
+_HORIZON_AHEAD = 10 * 366
+
+DEFAULT_DAY_HOURS = 8.0
+
+
+class _Horizon(NamedTuple):
+    """Per-day arrays of a CalendarSet over days [lo, hi) around the origin. Never modified once
+    built: growing the horizon builds a new one, so a conversion reads one consistent snapshot."""
+    lo: int
+    hi: int
+    pattern: Any                # (C, D) pattern index per day
+    cum: Any                    # (C, D + 1) working hours at each midnight
+    key_base: Any               # (C,) offset keeping each calendar's end_key block sorted
+    end_key: Any                # (C * D,) cum at each day's end + key_base, for searchsorted
+    w_lo: float                 # working time every calendar covers
+    w_hi: float
+
+
+def _minutes(value: str) -> int | None:
+    parts = (value or "").strip().split(":")
+    try:
+        h = int(parts[0])
+        m = int(parts[1]) if len(parts) > 1 and parts[1] else 0
+    except ValueError:
+        return None
+    return h * 60 + m
+
+
+def _parse_nodes(text: str) -> list:
+    """Parse P6's '(0||name(attrs)(children))' notation into (name, attrs, children) tuples."""
+    s = "".join((text or "").split()).replace("\x7f", "")
+    pos = 0
+    n = len(s)
+
+    def node():
+        nonlocal pos
+        # s[pos] == '('
+        pos += 1
+        if s.startswith("0||", pos):
+            pos += 3
+        j = s.find("(", pos)
+        if j < 0:
+            raise ValueError("bad calendar node")
+        name = s[pos:j]
+        k = s.find(")", j)
+        if k < 0:
+            raise ValueError("bad calendar attrs")
+        attrs = s[j + 1:k]
+        pos = k + 1
+        children = []
+        if pos < n and s[pos] == "(":
+            pos += 1
+            while pos < n and s[pos] == "(":
+                children.append(node())
+            if pos < n and s[pos] == ")":
+                pos += 1
+        if pos < n and s[pos] == ")":
+            pos += 1
+        return (name, attrs, children)
+
+    out = []
+    try:
+        while pos < n:
+            if s[pos] == "(":
+                out.append(node())
+            else:
+                pos += 1
+    except (ValueError, IndexError):
+        pass
+    return out
+
+
+def _walk(nodes):
+    for node in nodes:
+        yield node
+        yield from _walk(node[2])
+
+
+def _shifts(children) -> list[tuple[int, int]]:
+    """Work intervals (start_min, end_min) from a day's shift nodes ('s|08:00|f|12:00')."""
+    out = []
+    for _, attrs, _ in children:
+        parts = attrs.split("|")
+        kv = dict(zip(parts[0::2], parts[1::2]))
+        s = _minutes(kv.get("s", ""))
+        f = _minutes(kv.get("f", ""))
+        if s is None or f is None:
+            continue
+        if f <= s:
+            f += _DAY_MIN
+        out.append((max(0, s), min(_DAY_MIN, f)))
+    return sorted(out)
+
+
+def parse_clndr_data(text: str) -> tuple[list | None, dict[int, list]]:
+    """(work week, exceptions) from clndr_data.
+
+    Work week is 7 interval lists indexed like date.weekday() (Monday = 0), or None if the data has
+    no DaysOfWeek section. Exceptions map date ordinals to intervals; an empty list is a holiday.
+    """
+    nodes = _parse_nodes(text)
+    week = None
+    exceptions: dict[int, list] = {}
+    for name, attrs, children in _walk(nodes):
+        if name == "DaysOfWeek":
+            week = [[] for _ in range(7)]
+            for day_name, _, shifts in children:
+                if day_name.isdigit() and 1 <= int(day_name) <= 7:
+                    # P6 numbers days 1 = Sunday .. 7 = Saturday.
+                    week[(int(day_name) + 5) % 7] = _shifts(shifts)
+        elif "Exception" in name or "Holiday" in name:
+            for _, ex_attrs, shifts in children:
+                parts = ex_attrs.split("|")
+                kv = dict(zip(parts[0::2], parts[1::2]))
+                try:
+                    serial = int(float(kv.get("d", "")))
+                except ValueError:
+                    continue
+                exceptions[(P6_EPOCH + timedelta(days=serial)).toordinal()] = _shifts(shifts)
+    return week, exceptions
+
+
+def _fallback_week(day_hours: float, week_hours: float) -> list:
+    """Standard week when clndr_data is missing: N working days of day_hours starting 08:00."""
+    day_hours = day_hours if day_hours and day_hours > 0 else DEFAULT_DAY_HOURS
+    days = int(round(week_hours / day_hours)) if week_hours and week_hours > 0 else 5
+    days = max(1, min(7, days))
+    start = 0 if day_hours >= 16 else 8 * 60
+    interval = [(start, min(_DAY_MIN, start + int(round(day_hours * 60))))]
+    return [list(interval) if d < days else [] for d in range(7)]
+
+
+class P6Calendar:
+    """One work calendar: weekly pattern plus dated exceptions."""
+
+    def __init__(self, clndr_id: str, name: str, week: list, exceptions: dict[int, list], day_hours: float):
+        self.clndr_id = clndr_id
+        self.name = name
+        self.week = week
+        self.exceptions = exceptions
+        self.day_hours = day_hours
+
+    @property
+    def week_hours(self) -> float:
+        return sum(f - s for day in self.week for s, f in day) / 60.0
+
+    def is_workday(self, d: date) -> bool:
+        shifts = self.exceptions.get(d.toordinal(), self.week[d.weekday()])
+        return bool(shifts)
+
+
+def load_calendars(parsed: ParsedXer) -> dict[str, P6Calendar]:
+    """Parse every CALENDAR row (base-calendar exceptions are inherited by derived calendars)."""
+    tab = parsed.get("CALENDAR")
+    out: dict[str, P6Calendar] = {}
+    if not tab:
+        return out
+    raw = {}
+    for i in range(len(tab)):
+        cid = tab.text("clndr_id", i)
+        week, exceptions = parse_clndr_data(tab.text("clndr_data", i))
+        raw[cid] = (i, week, exceptions)
+    for cid, (i, week, exceptions) in raw.items():
+        base = raw.get(tab.text("base_clndr_id", i))
+        if base is not None and base[0] != i:
+            if week is None or not any(week):
+                week = base[1]
+            exceptions = {**base[2], **exceptions}
+        day_hours = tab.floats("day_hr_cnt")[i]
+        week_hours = tab.floats("week_hr_cnt")[i]
+        if week is None or not any(week):
+            week = _fallback_week(day_hours, week_hours)
+        cal = P6Calendar(cid, tab.text("clndr_name", i), week, exceptions, 0.0)
+        if day_hours == day_hours and day_hours > 0:
+            cal.day_hours = float(day_hours)
+        else:
+            workdays = sum(1 for d in week if d) or 1
+            cal.day_hours = round(cal.week_hours / workdays, 2) or DEFAULT_DAY_HOURS
+        out[cid] = cal
+    return out
+
+
+def default_calendar_id(parsed: ParsedXer) -> str | None:
+    tab = parsed.get("CALENDAR")
+    if not tab:
+        return None
+    ids = tab.texts("clndr_id")
+    for cid, flag in zip(ids, tab.texts("default_flag")):
+        if flag == "Y":
+            return cid
+    return ids[0] if ids else None
+
+
+def calendar_day_hours(parsed: ParsedXer) -> dict[str, float]:
+    """clndr_id -> working hours per day; the project default calendar is also keyed by ""."""
+    hours = {cid: cal.day_hours for cid, cal in load_calendars(parsed).items()}
+    hours[""] = hours.get(default_calendar_id(parsed) or "", DEFAULT_DAY_HOURS)
+    return hours
+
+
+class ContinuousCalendars:
+    """Every hour is a working hour (P6's 24-hour calendar); working time equals clock time."""
+
+    ids: dict[str, int] = {}
+    default_index = 0
+
+    def to_work(self, cal, t):
+        return np.asarray(t, dtype=np.float64)
+
+    def from_work(self, cal, w, start: bool = False):
+        return np.asarray(w, dtype=np.float64)
+
+    def add(self, cal, t, hours, start: bool = False):
+        return self.from_work(cal, self.to_work(cal, t) + hours, start=start)
+
+    def sub(self, cal, t, hours, start: bool = False):
+        return self.from_work(cal, self.to_work(cal, t) - hours, start=start)
+
+    def work_between(self, cal, a, b):
+        return self.to_work(cal, b) - self.to_work(cal, a)
+
+
+class CalendarSet(ContinuousCalendars):
+    """All calendars of a schedule, precomputed over a shared day horizon around an origin.
+
+    Arrays (C calendars, D days):
+      pattern[c, d]  index of the day's intraday pattern (weekday or exception shifts)
+      cum[c, d]      working hours from the origin's midnight to the start of day d
+      minutes[p, m]  working hours elapsed by minute m of pattern p (0..1440)
+    """
+
+    def __init__(self, calendars: list[P6Calendar], origin: datetime, ids: dict[str, int] | None = None,
+                 default_index: int = 0):
+        if np is None:
+            raise RuntimeError("numpy is required for calendar arithmetic (pip install numpy)")
+        self.calendars = calendars or [P6Calendar("", "24 Hour", [[(0, _DAY_MIN)]] * 7, {}, 24.0)]
+        self.ids = ids if ids is not None else {c.clndr_id: i for i, c in enumerate(self.calendars)}
+        self.default_index = default_index
+        self.origin = origin
+        self._origin_day = origin.date().toordinal()
+        self._origin_hour = origin.hour + origin.minute / 60.0 + origin.second / 3600.0
+        self.day_hours = np.asarray([c.day_hours or DEFAULT_DAY_HOURS for c in self.calendars], dtype=np.float64)
+        self._build_patterns()
+        self._grow_lock = threading.Lock()
+        self._h = self._build(-_HORIZON_BACK, _HORIZON_AHEAD)
+
+    @classmethod
+    def from_parsed(cls, parsed: ParsedXer, origin: datetime) -> "CalendarSet":
+        cals = load_calendars(parsed)
+        order = list(cals.values())
+        ids = {c.clndr_id: i for i, c in enumerate(order)}
+        default = ids.get(default_calendar_id(parsed) or "", 0)
+        return cls(order, origin, ids=ids, default_index=default)
+
+    def __getstate__(self) -> dict:
+        # Shipped to risk worker processes; the lock is per process.
+        state = dict(self.__dict__)
+        del state["_grow_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._grow_lock = threading.Lock()
+
+    # -- precomputation --------------------------------------------------------------------
+
+    def _build_patterns(self) -> None:
+        """Intern every distinct day of shifts (weekdays and exceptions) as one minute-level row."""
+        keys: dict[tuple, int] = {}
+        rows = []
+
+        def intern(shifts) -> int:
+            key = tuple(shifts)
+            if key not in keys:
+                work = np.zeros(_DAY_MIN, dtype=np.float64)
+                for s, f in shifts:
+                    work[s:f] = 1.0
+                rows.append(np.round(np.concatenate(([0.0], np.cumsum(work))) / 60.0, _ROUND))
+                keys[key] = len(rows) - 1
+            return keys[key]
+
+        self._week_pattern = np.asarray([[intern(day) for day in c.week] for c in self.calendars], dtype=np.int64)
+        self._exc_pattern = [{o: intern(sh) for o, sh in c.exceptions.items()} for c in self.calendars]
+        self._minutes = np.vstack(rows)                               # (P, 1441)
+        self._minutes_flat = self._minutes.ravel()
+        self._minutes_key = (self._minutes + 25.0 * np.arange(len(rows))[:, None]).ravel()
+
+    def _build(self, lo: int, hi: int) -> _Horizon:
+        """Per-day patterns and cumulative hours for days [lo, hi) around the origin."""
+        ndays = hi - lo
+        ords = np.arange(self._origin_day + lo, self._origin_day + hi)
+        weekday = (ords - 1) % 7          # date.fromordinal(1) is a Monday
+        pattern = self._week_pattern[:, weekday]
+        for c, exc in enumerate(self._exc_pattern):
+            for o, p in exc.items():
+                k = o - self._origin_day - lo
+                if 0 <= k < ndays:
+                    pattern[c, k] = p
+        daywork = self._minutes[pattern, -1]
+        cum = np.zeros((len(self.calendars), ndays + 1))
+        np.cumsum(daywork, axis=1, out=cum[:, 1:])
+        cum -= cum[:, [-lo]]              # anchor: zero at the origin's midnight
+        cum = np.round(cum, _ROUND)
+        span = float(cum[:, -1].max() - cum[:, 0].min()) + 1.0
+        key_base = span * np.arange(len(self.calendars)) - cum[:, 0]
+        end_key = (cum[:, 1:] + key_base[:, None]).ravel()
+        return _Horizon(lo, hi, pattern, cum, key_base, end_key, float(cum[:, 0].max()), float(cum[:, -1].min()))
+
+    def _grow(self, covers, extend) -> _Horizon:
+        """Current horizon if covers(h), else a wider one (extend(h) -> (lo, hi)) swapped in under the
+        lock. Requests share the CalendarSet through the parse memo, so the arrays are never
+        rebuilt in place."""
+        h = self._h
+        if covers(h):
+            return h
+        with self._grow_lock:
+            h = self._h
+            for _ in range(64):
+                if covers(h):
+                    break
+                h = self._build(*extend(h))
+            self._h = h
+        return h
+
+    def _ensure_days(self, dmin: float, dmax: float) -> _Horizon:
+        def extend(h):
+            span = max(h.hi - h.lo, 366)
+            return h.lo - (span if dmin < h.lo else 0), h.hi + (span if dmax >= h.hi else 0)
+        return self._grow(lambda h: dmin >= h.lo and dmax < h.hi, extend)
+
+    def _ensure_work(self, cal, w) -> _Horizon:
+        h = self._h
+        if w.size == 0 or (w.min() >= h.w_lo and w.max() <= h.w_hi):
+            return h
+
+        def extend(h):
+            span = h.hi - h.lo
+            below = (w < h.cum[cal, 0]).any()
+            above = (w > h.cum[cal, -1]).any()
+            return h.lo - (span if below else 0), h.hi + (span if above else 0)
+        return self._grow(lambda h: not (w < h.cum[cal, 0]).any() and not (w > h.cum[cal, -1]).any(), extend)
+
+    # -- conversions -----------------------------------------------------------------------
+
+    def to_work(self, cal, t):
+        """Working hours (on each element's calendar) elapsed from the origin's midnight to clock time t."""
+        t = np.asarray(t, dtype=np.float64)
+        cal = np.asarray(cal, dtype=np.int64)
+        if cal.shape != t.shape:
+            cal = np.broadcast_to(cal, t.shape)
+        finite = np.isfinite(t)
+        all_finite = finite.all()
+        if not all_finite and not finite.any():
+            return t.copy()
+        tt = (t if all_finite else np.where(finite, t, 0.0)) + self._origin_hour
+        day = np.floor(tt / 24.0)
+        h = self._ensure_days(day.min(), day.max())
+        k = day.astype(np.int64) - h.lo
+        minute = (tt - day * 24.0) * 60.0
+        mi = np.minimum(minute.astype(np.int64), _DAY_MIN - 1)
+        flat = h.pattern[cal, k] * (_DAY_MIN + 1) + mi
+        m0 = self._minutes_flat[flat]
+        w = h.cum[cal, k] + m0 + (self._minutes_flat[flat + 1] - m0) * (minute - mi)
+        return w if all_finite else np.where(finite, w, t)
+
+    def from_work(self, cal, w, start=False):
+        """Clock time at which working time w is reached on each element's calendar.
+
+        start=False gives the finish instant (end of the last working minute, e.g. 17:00);
+        start=True gives the start instant (next moment work resumes, e.g. 08:00 next workday).
+        start may also be a boolean array, choosing per element.
+        """
+        w = np.asarray(w, dtype=np.float64)
+        cal = np.asarray(cal, dtype=np.int64)
+        if cal.shape != w.shape:
+            cal = np.broadcast_to(cal, w.shape)
+        finite = np.isfinite(w)
+        all_finite = finite.all()
+        if not all_finite and not finite.any():
+            return w.copy()
+        ww = np.round(w if all_finite else np.where(finite, w, 0.0), _ROUND)
+        h = self._ensure_work(cal, ww)
+        # searchsorted "right" on x is "left" on the next float above x, which lets the side
+        # vary per element.
+        if np.ndim(start):
+            bump = np.broadcast_to(start, w.shape)
+            side = "left"
+        else:
+            bump = None
+            side = "right" if start else "left"
+        ndays = h.hi - h.lo
+        key = ww + h.key_base[cal]
+        if bump is not None:
+            key = np.where(bump, np.nextafter(key, np.inf), key)
+        k = np.searchsorted(h.end_key, key, side=side) - cal * ndays
+        np.maximum(k, 0, out=k)
+        np.minimum(k, ndays - 1, out=k)
+        r = ww - h.cum[cal, k]
+        p = h.pattern[cal, k]
+        key = r + 25.0 * p
+        if bump is not None:
+            key = np.where(bump, np.nextafter(key, np.inf), key)
+        j = np.searchsorted(self._minutes_key, key, side=side) - p * (_DAY_MIN + 1)
+        np.maximum(j, 1, out=j)
+        np.minimum(j, _DAY_MIN, out=j)
+        flat = p * (_DAY_MIN + 1) + j
+        lo_v = self._minutes_flat[flat - 1]
+        step = self._minutes_flat[flat] - lo_v
+        pos = step > 0
+        frac = np.where(pos, (r - lo_v) / np.where(pos, step, 1.0), 0.0)
+        np.maximum(frac, 0.0, out=frac)
+        np.minimum(frac, 1.0, out=frac)
+        t = (k + h.lo) * 24.0 + (j - 1 + frac) / 60.0 - self._origin_hour
+        return t if all_finite else np.where(finite, t, w)
+
+    # -- helpers ---------------------------------------------------------------------------
+
+    def hours_per_day(self, cal):
+        return self.day_hours[np.asarray(cal, dtype=np.int64)]
+
+    def day_of(self, t):
+        """Day of clock time t, as a day offset from the origin's date."""
+        return np.floor((np.asarray(t, dtype=np.float64) + self._origin_hour) / 24.0).astype(np.int64)
+
+    def day_work(self, first: int, last: int):
+        """Working time (as to_work measures it) at each midnight from day first to day last + 1,
+        shape (calendars, last - first + 2); consecutive differences are the hours worked per day."""
+        h = self._ensure_days(first, last)
+        return h.cum[:, first - h.lo:last - h.lo + 2]
+
+    def workdays_between(self, cal: int, start: date, end: date) -> int:
+        """Working days in [start, end] on one calendar (inclusive)."""
+        a = (datetime.combine(start, datetime.min.time()) - self.origin).total_seconds() / 3600.0
+        b = (datetime.combine(end, datetime.min.time()) - self.origin).total_seconds() / 3600.0 + 24.0
+        days_a = math.floor((a + self._origin_hour) / 24.0)
+        days_b = math.floor((b + self._origin_hour) / 24.0)
+        h = self._ensure_days(days_a, days_b)
+        ka, kb = days_a - h.lo, days_b - h.lo
+        return int((self._minutes[h.pattern[cal, ka:kb], -1] > 0).sum())
+
+
+def calendar_set(parsed: ParsedXer, origin: datetime) -> CalendarSet | None:
+    """CalendarSet for a parsed schedule, or None when numpy is unavailable."""
+    if np is None:
+        return None
+    return CalendarSet.from_parsed(parsed, origin)
+
+
+def hours_to_days(hours: float, day_hours: float | None) -> float:
+    """Working hours to working days on a calendar with day_hours per day (8 if unknown)."""
+    return hours / (day_hours if day_hours and day_hours > 0 else DEFAULT_DAY_HOURS)
@@ -0,0 +1,388 @@
+"""
+Schedule engine: pluggable schedule checks.
+
+A check is a function over a ScheduleFrame, registered with @register_schedule_check and declaring
+the TABLE.field columns it reads; a check whose columns are absent is skipped with a reason instead
+of failing. The frame is a columnar view of one parse, memoised on it: columns are pulled once and
+shared by every check, task_code / task_id lookups are hash maps (submittal -> approval pairing is a
+join on the code suffix, not a scan of every approval per submittal), name and code keyword tests
+are one precompiled regex per keyword set, and calendar names and day hours resolve once per calendar.
+
+run_checks() runs the registered checks over one parse (the API); run_checks_many() runs them over
+many XER files or converted datasets in a process pool (scripts/deeper_checks.py).
+"""
+from __future__ import annotations
+
+import os
+import re
+import time
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Callable
+
+from schedule_agent_web.scheduling.calendars import DEFAULT_DAY_HOURS, calendar_day_hours
+from schedule_agent_web.scheduling.cpm import MILESTONE_TYPES, SUMMARY_TYPES
+from schedule_agent_web.scheduling.xer_parser import ParsedXer, parse_xer_file
+
+MAX_ROWS = 500
+
+
+@lru_cache(maxsize=256)
+def _pattern(words: tuple[str, ...]):
+    return re.compile("|".join(re.escape(w.lower()) for w in words)) if words else None
+
+
+class ScheduleFrame:
+    """Columnar, indexed view of one parse for the checks (TASK rows unless a table is named)."""
+
+    def __init__(self, parsed: ParsedXer, name: str = ""):
+        self.parsed = parsed
+        self.name = name
+        tasks = parsed.get("TASK")
+        self.n = len(tasks) if tasks else 0
+        self._cols: dict[tuple, list] = {}
+        self._by_id: dict[str, int] | None = None
+        self._suffix: dict[str, dict[str, list[int]]] = {}
+        self._day_hours: list[float] | None = None
+        self._cal_names: dict[str, str] | None = None
+        self._matches: dict[tuple, list[int]] = {}
+        self._blobs: dict[str, tuple[str, list[int]]] = {}
+
+    def has(self, table: str, field: str) -> bool:
+        t = self.parsed.get(table)
+        return t is not None and t.has(field)
+
+    def text(self, field: str, table: str = "TASK") -> list[str]:
+        key = (table, field, "t")
+        col = self._cols.get(key)
+        if col is None:
+            t = self.parsed.get(table)
+            col = self._cols[key] = t.texts(field) if t is not None and t.has(field) else [""] * (len(t) if t else 0)
+        return col
+
+    def floats(self, field: str, table: str = "TASK") -> list[float]:
+        key = (table, field, "f")
+        col = self._cols.get(key)
+        if col is None:
+            t = self.parsed.get(table)
+            if t is not None and t.has(field):
+                col = [0.0 if v != v else v for v in t.floats(field)]
+            else:
+                col = [0.0] * (len(t) if t else 0)
+            self._cols[key] = col
+        return col
+
+    # -- indexes -------------------------------------------------------------------------------
+
+    def by_id(self) -> dict[str, int]:
+        """task_id -> TASK row."""
+        if self._by_id is None:
+            self._by_id = {tid: i for i, tid in enumerate(self.text("task_id"))}
+        return self._by_id
+
+    def _blob(self, field: str) -> tuple[str, list[int]]:
+        """A TASK text column lower-cased and joined by newlines, with each row's start offset, so one
+        regex scan in C covers the whole column and only the matches cost Python work."""
+        blob = self._blobs.get(field)
+        if blob is None:
+            col = self.text(field)
+            starts, pos = [], 0
+            for v in col:
+                starts.append(pos)
+                pos += len(v) + 1
+            blob = self._blobs[field] = ("\n".join(col).lower(), starts)
+        return blob
+
+    def _scan(self, field: str, pattern) -> list[int]:
+        text, starts = self._blob(field)
+        rows, last = [], -1
+        for m in pattern.finditer(text):
+            i = bisect_right(starts, m.start()) - 1
+            if i != last:
+                rows.append(i)
+                last = i
+        return rows
+
+    def by_suffix(self, prefix: str) -> dict[str, list[int]]:
+        """Rows whose task_code starts with prefix (case-insensitive), keyed by the rest of the code."""
+        prefix = prefix.lower()
+        index = self._suffix.get(prefix)
+        if index is None:
+            index = self._suffix[prefix] = {}
+            text, starts = self._blob("task_code")
+            for m in re.finditer(r"^" + re.escape(prefix) + r"([^\n]*)", text, re.MULTILINE):
+                index.setdefault(m.group(1).strip(), []).append(bisect_right(starts, m.start()) - 1)
+        return index
+
+    def matching(self, code: tuple[str, ...] = (), name: tuple[str, ...] = ()) -> list[int]:
+        """Rows whose task_code contains any of code or task_name any of name (case-insensitive)."""
+        key = (code, name)
+        rows = self._matches.get(key)
+        if rows is None:
+            found: set[int] = set()
+            for field, words in (("task_code", code), ("task_name", name)):
+                if words:
+                    found.update(self._scan(field, _pattern(words)))
+            rows = self._matches[key] = sorted(found)
+        return rows
+
+    def calendar_names(self) -> dict[str, str]:
+        if self._cal_names is None:
+            self._cal_names = dict(zip(self.text("clndr_id", "CALENDAR"), self.text("clndr_name", "CALENDAR")))
+        return self._cal_names
+
+    def calendars_named(self, words: tuple[str, ...]) -> set[str]:
+        """clndr_ids whose calendar name contains any of words (case-insensitive)."""
+        pat = _pattern(words)
+        return {cid for cid, name in self.calendar_names().items() if pat and pat.search(name.lower())}
+
+    def day_hours(self) -> list[float]:
+        """Working hours per day of each activity's calendar (the project default when unknown)."""
+        if self._day_hours is None:
+            hours = calendar_day_hours(self.parsed) if self.parsed.get("CALENDAR") else {}
+            default = hours.get("") or DEFAULT_DAY_HOURS
+            per_cal = {cid: h or default for cid, h in hours.items()}
+            self._day_hours = [per_cal.get(c, default) for c in self.text("clndr_id")]
+        return self._day_hours
+
+    def days(self, field: str) -> list[float]:
+        """Hour field in working days of each activity's own calendar."""
+        key = ("TASK", field, "d")
+        col = self._cols.get(key)
+        if col is None:
+            col = self._cols[key] = [h / d for h, d in zip(self.floats(field), self.day_hours())]
+        return col
+
+    # -- rows ----------------------------------------------------------------------------------
+
+    def activity(self, i: int, show: tuple[str, ...] = ("duration", "calendar")) -> dict:
+        """One result row: code and name plus the requested extras (duration, float, calendar, dates, type)."""
+        rec = {"task_code": self.text("task_code")[i], "task_name": self.text("task_name")[i]}
+        if "duration" in show:
+            rec["duration"] = round(self.days("target_drtn_hr_cnt")[i], 1)
+        if "float" in show:
+            rec["total_float"] = round(self.days("total_float_hr_cnt")[i], 1)
+        if "calendar" in show:
+            rec["calendar"] = self.calendar_names().get(self.text("clndr_id")[i], "")
+        if "dates" in show:
+            rec["start"] = (self.text("early_start_date")[i] or self.text("target_start_date")[i])[:10]
+            rec["finish"] = (self.text("early_end_date")[i] or self.text("target_end_date")[i])[:10]
+        if "type" in show:
+            rec["task_type"] = self.text("task_type")[i]
+        return rec
+
+
+def schedule_frame(parsed: ParsedXer) -> ScheduleFrame:
+    """ScheduleFrame memoised on the parse."""
+    return parsed.memo("check_frame", ScheduleFrame)
+
+
+class ScheduleCheck:
+    """One registered check: fn(frame) -> {"rows": [...], ...extra summary fields}.
+
+    Rows may be TASK row indexes (listed with frame.activity(i, show) using the result's "show") or
+    anything a "render" callable in the result turns into a dict; only the listed rows are rendered.
+    """
+
+    def __init__(self, check_id: str, title: str, fn: Callable, columns: tuple[str, ...] = (),
+                 order: int = 0, missing: str = ""):
+        self.id = check_id
+        self.title = title
+        self.fn = fn
+        self.columns = columns
+        self.order = order
+        self.missing = missing      # note when the check finds nothing (e.g. required work absent)
+
+    def tables(self) -> set[str]:
+        return {c.split(".", 1)[0] for c in self.columns}
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "title": self.title, "columns": list(self.columns)}
+
+
+_CHECKS: dict[str, ScheduleCheck] = {}
+
+
+def register_schedule_check(check_id: str, title: str, columns: tuple[str, ...] = (), order: int | None = None,
+                            missing: str = ""):
+    """Decorator adding a check; columns are the "TABLE.field" inputs it needs."""
+    def wrap(fn):
+        _CHECKS[check_id] = ScheduleCheck(check_id, title, fn, tuple(columns),
+                                          len(_CHECKS) + 1 if order is None else order, missing)
+        return fn
+    return wrap
+
+
+def schedule_checks(ids: list[str] | None = None) -> list[ScheduleCheck]:
+    """Registered checks in order (only the given ids when set; unknown ids raise KeyError)."""
+    if ids:
+        return [_CHECKS[i] for i in ids]
+    return sorted(_CHECKS.values(), key=lambda c: c.order)
+
+
+def run_checks(parsed: ParsedXer, ids: list[str] | None = None, limit: int = MAX_ROWS) -> list[dict]:
+    """Run checks over one parse; each result carries its rows (up to limit), count and timing."""
+    frame = schedule_frame(parsed)
+    out = []
+    for check in schedule_checks(ids):
+        rec = {"id": check.id, "title": check.title}
+        missing = [c for c in check.columns if not frame.has(*c.split(".", 1))]
+        if missing:
+            out.append({**rec, "skipped": f"missing column(s): {', '.join(missing)}"})
+            continue
+        t0 = time.perf_counter()
+        try:
+            res = check.fn(frame)
+        except Exception as e:
+            out.append({**rec, "error": str(e)})
+            continue
+        rows = res.pop("rows", [])
+        show = res.pop("show", ("duration", "calendar"))
+        render = res.pop("render", None) or (lambda i: frame.activity(i, show))
+        rec.update(res)
+        rec["count"] = len(rows)
+        rec["rows"] = [render(r) for r in rows[:limit]]
+        if not rows and check.missing:
+            rec["note"] = check.missing
+        rec["elapsedMs"] = round((time.perf_counter() - t0) * 1000, 2)
+        out.append(rec)
+    return out
+
+
+def load_schedule(path: str, tables: set[str] | None = None) -> ParsedXer:
+    """Parse an XER file, or open a dataset directory converted by scripts/parse_xer.py."""
+    if os.path.isdir(path):
+        from schedule_agent_web.scheduling.columnar import open_dataset
+        return open_dataset(path, tables=sorted(tables) if tables else None)
+    return parse_xer_file(path)
+
+
+def _run_source(args) -> dict:
+    path, ids, limit = args
+    t0 = time.perf_counter()
+    name = os.path.basename(os.path.normpath(path))
+    try:
+        tables = set().union(*(c.tables() for c in schedule_checks(ids))) | {"TASK", "CALENDAR"}
+        parsed = load_schedule(path, tables)
+        checks = run_checks(parsed, ids, limit=limit)
+    except Exception as e:
+        return {"schedule": name, "path": path, "error": str(e)}
+    return {"schedule": name, "path": path, "checks": checks,
+            "elapsedMs": round((time.perf_counter() - t0) * 1000, 1)}
+
+
+def run_checks_many(paths: list[str], ids: list[str] | None = None, jobs: int = 0,
+                    limit: int = MAX_ROWS) -> list[dict]:
+    """Run checks over many XER files / dataset directories, one schedule per worker process.
+
+    Results come back in input order. Workers import this module afresh, so checks registered at
+    runtime (rather than at import) are only seen when jobs is 1.
+    """
+    schedule_checks(ids)            # fail fast on unknown ids
+    work = [(p, ids, limit) for p in paths]
+    jobs = jobs or os.cpu_count() or 1
+    if jobs > 1 and len(work) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(work))) as ex:
+            return list(ex.map(_run_source, work))
+    return [_run_source(w) for w in work]
+
+
+# -- checks ----------------------------------------------------------------------------------
+
+_TASK_COLS = ("TASK.task_code", "TASK.task_name", "TASK.target_drtn_hr_cnt", "TASK.clndr_id")
+
+
+@register_schedule_check("submittal_pairing", "Submittal vs approval pairing", _TASK_COLS)
+def _submittal_pairing(f: ScheduleFrame) -> dict:
+    """Every SU-<n> submittal joined to its AP-<n> approval(s) on the code suffix."""
+    subs = f.by_suffix("SU-")
+    aps = f.by_suffix("AP-")
+    codes, dur = f.text("task_code"), f.days("target_drtn_hr_cnt")
+
+    def render(row):
+        suffix, i = row
+        rec = f.activity(i)
+        rec["approvals"] = [{"task_code": codes[a], "duration": round(dur[a], 1)} for a in aps.get(suffix, ())]
+        return rec
+    return {"rows": [(suffix, i) for suffix in sorted(subs) for i in subs[suffix]], "render": render,
+            "submittals": sum(len(v) for v in subs.values()),
+            "approvals": sum(len(v) for v in aps.values()),
+            "unmatchedSubmittals": sum(len(v) for s, v in subs.items() if s not in aps),
+            "orphanApprovals": sum(len(v) for s, v in aps.items() if s not in subs)}
+
+
+def _keyword_check(check_id: str, title: str, code: tuple[str, ...] = (), name: tuple[str, ...] = (),
+                   show: tuple[str, ...] = ("duration", "calendar"), missing: str = "") -> None:
+    cols = _TASK_COLS + (("TASK.total_float_hr_cnt",) if "float" in show else ())
+
+    def check(f: ScheduleFrame) -> dict:
+        return {"rows": f.matching(code, name), "show": show}
+    check.__name__ = f"_{check_id}"
+    register_schedule_check(check_id, title, cols, missing=missing)(check)
+
+
+_keyword_check("cofferdam", "Cofferdam segments", code=("cfd",), name=("combi", "cofferdam"))
+_keyword_check("dsm", "DSM production activities", code=("dsm",), name=("deep soil", "soil mixing"),
+               show=("duration", "float", "calendar"))
+_keyword_check("spoil_removal", "Spoil removal activities", name=("spoil",))
+_keyword_check("obstruction_removal", "Obstruction removal activities", code=("obs",), name=("obstruct",),
+               show=("duration", "float", "calendar"))
+
+
+@register_schedule_check("critical_path", "Critical path (TF=0) activities",
+                         _TASK_COLS + ("TASK.total_float_hr_cnt", "TASK.task_type"))
+def _critical_path(f: ScheduleFrame) -> dict:
+    tf, types = f.parsed["TASK"].floats("total_float_hr_cnt"), f.text("task_type")
+    # Milestones, level-of-effort and WBS summary activities inherit float from what they span.
+    skip = MILESTONE_TYPES + SUMMARY_TYPES
+    rows = [i for i in range(f.n) if tf[i] == 0 and types[i] not in skip]
+    start = f.text("early_start_date")
+    target = f.text("target_start_date")
+    rows.sort(key=lambda i: start[i] or target[i] or "9999")
+    return {"rows": rows, "show": ("duration", "dates")}
+
+
+@register_schedule_check("seven_day_calendar", "Activities on 7-day calendars",
+                         _TASK_COLS + ("CALENDAR.clndr_id", "CALENDAR.clndr_name"))
+def _seven_day_calendar(f: ScheduleFrame) -> dict:
+    cals = f.calendars_named(("7/8", "7-day"))
+    return {"rows": [i for i, c in enumerate(f.text("clndr_id")) if c in cals]}
+
+
+_keyword_check("dewatering", "Dewatering activities", name=("dewat",), show=("duration",),
+               missing="NONE FOUND - Dewatering is missing from the schedule")
+_keyword_check("top_fill", "Top fill activities", name=("top fill", "topfill"), show=("duration",),
+               missing="NONE FOUND")
+_keyword_check("scour_protection", "Scour protection activities", name=("scour",))
+_keyword_check("compliance", "Compliance (site controls, buoys)", name=("compliance", "buoy", "site control"),
+               show=("duration",))
+_keyword_check("ntp", "NTP milestones", name=("ntp", "notice to proceed", "notice of award"),
+               show=("type", "duration", "dates"))
+_keyword_check("closeout", "Closeout / final / as-built activities",
+               name=("closeout", "close out", "final", "as-built", "as built", "demob", "punch", "warranty",
+                     "record doc"), show=("duration", "dates"))
+_keyword_check("fish_survey", "Sturgeon / fish survey activities", name=("sturgeon", "fish"), show=("duration",),
+               missing="NONE FOUND - Sturgeon monitoring activities are missing")
+_keyword_check("turbidity_curtain", "Turbidity curtain activities", name=("turbid", "curtain"), show=("duration",),
+               missing="NONE FOUND - Turbidity curtain activities are missing")
+
+
+@register_schedule_check("ss_ff_ties", "SS and FF relationship details",
+                         ("TASKPRED.task_id", "TASKPRED.pred_task_id", "TASKPRED.pred_type", "TASKPRED.lag_hr_cnt",
+                          "TASK.task_id", "TASK.task_code", "TASK.task_name", "TASK.clndr_id"))
+def _ss_ff_ties(f: ScheduleFrame) -> dict:
+    by_id, codes, names, hours = f.by_id(), f.text("task_code"), f.text("task_name"), f.day_hours()
+    tids, pids, lags = f.text("task_id", "TASKPRED"), f.text("pred_task_id", "TASKPRED"), f.floats("lag_hr_cnt", "TASKPRED")
+    types = f.text("pred_type", "TASKPRED")
+
+    def render(k):
+        u, v = by_id.get(pids[k]), by_id.get(tids[k])
+        return {
+            "type": types[k][3:],
+            "pred_code": codes[u] if u is not None else pids[k], "pred_name": names[u] if u is not None else "",
+            "succ_code": codes[v] if v is not None else tids[k], "succ_name": names[v] if v is not None else "",
+            # lag runs on the predecessor's calendar
+            "lag_days": round(lags[k] / (hours[u] if u is not None else DEFAULT_DAY_HOURS), 1),
+        }
+    return {"rows": [k for k, pt in enumerate(types) if pt in ("PR_SS", "PR_FF")], "render": render}
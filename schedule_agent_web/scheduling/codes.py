@@ -0,0 +1,290 @@
+"""
+Schedule engine: activity code, UDF and notebook index.
+
+Joins the activity-side tables onto TASK rows once per parsed schedule (memoised on the parse):
+TASKACTV / ACTVCODE / ACTVTYPE, task UDFVALUE / UDFTYPE (/ UDFCODE) and TASKMEMO / MEMOTYPE.
+Each code type, task UDF and the "Notebook" topics become a field with
+
+- a column of the value on every TASK row (what the activity table and Gantt show),
+- an inverted index value -> TASK rows, turned into an int bitmap on first use, so a filter
+  such as Area=North,South;Responsibility=Owner is a few bitwise ORs / ANDs however large the
+  schedule, and grouped rollups are one pass over each group's rows.
+
+Field names are code type names, UDF labels and "Notebook"; fields and values (short name or
+description) match case-insensitively. A blank value selects activities without one.
+"""
+from __future__ import annotations
+
+from schedule_agent_web.scheduling.calendars import DEFAULT_DAY_HOURS, calendar_day_hours
+from schedule_agent_web.scheduling.scorecard import EXCLUDED_TYPES
+from schedule_agent_web.scheduling.xer_parser import ParsedXer
+
+CODE, UDF, NOTEBOOK = "code", "udf", "notebook"
+NOTEBOOK_FIELD = "Notebook"
+
+# UDFVALUE column holding the value for each UDFTYPE.logical_data_type.
+_UDF_COLUMNS = {
+    "FT_TEXT": "udf_text", "FT_INT": "udf_number", "FT_FLOAT_2_DECIMALS": "udf_number", "FT_MONEY": "udf_number",
+    "FT_START_DATE": "udf_date", "FT_END_DATE": "udf_date", "FT_STATICTYPE": "udf_code_id",
+}
+
+
+class CodeField:
+    """One filterable field: its values' TASK rows and descriptions."""
+
+    __slots__ = ("name", "kind", "postings", "labels", "_lookup", "_column")
+
+    def __init__(self, name: str, kind: str):
+        self.name = name
+        self.kind = kind
+        self.postings: dict[str, list[int]] = {}
+        self.labels: dict[str, str] = {}
+        self._lookup: dict[str, str] | None = None
+        self._column: list[str] | None = None
+
+    def add(self, value: str, row: int) -> None:
+        self.postings.setdefault(value, []).append(row)
+
+    def resolve(self, value: str) -> str | None:
+        """Stored value for a short name or description (case-insensitive); None if unused."""
+        if self._lookup is None:
+            lookup = {}
+            for v in self.postings:
+                lookup.setdefault(self.labels.get(v, "").strip().lower(), v)
+            for v in self.postings:
+                lookup[v.strip().lower()] = v
+            lookup.pop("", None)
+            self._lookup = lookup
+        return self._lookup.get(value.strip().lower())
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "kind": self.kind, "values": len(self.postings),
+                "assigned": len({i for rows in self.postings.values() for i in rows})}
+
+
+class ActivityCodes:
+    """Code / UDF / notebook fields over one parse's TASK rows, with bitmap filters and rollups."""
+
+    def __init__(self, parsed: ParsedXer):
+        self.parsed = parsed
+        tasks = parsed.get("TASK")
+        self.tasks = tasks
+        self.n = n = len(tasks) if tasks else 0
+        self.by_id = {tid: i for i, tid in enumerate(tasks.texts("task_id"))} if n else {}
+        self.all = (1 << n) - 1
+        self.fields: dict[str, CodeField] = {}
+        self._bits: dict[tuple[str, str], int] = {}
+        if n:
+            self._codes()
+            self._udfs()
+            self._memos()
+
+    def _field(self, name: str, kind: str) -> CodeField:
+        key = name.strip().lower()
+        f = self.fields.get(key)
+        if f is None:
+            f = self.fields[key] = CodeField(name.strip(), kind)
+        return f
+
+    def _codes(self) -> None:
+        assigned = self.parsed.get("TASKACTV")
+        if not assigned:
+            return
+        types, codes = self.parsed.get("ACTVTYPE"), self.parsed.get("ACTVCODE")
+        type_names = dict(zip(types.texts("actv_code_type_id"), types.texts("actv_code_type"))) if types else {}
+        values: dict[str, tuple[str, str]] = {}
+        if codes:
+            for cid, short, name in zip(codes.texts("actv_code_id"), codes.texts("short_name"),
+                                        codes.texts("actv_code_name")):
+                values[cid] = (short or name or cid, name)
+        by_id = self.by_id
+        for tid, type_id, cid in zip(assigned.texts("task_id"), assigned.texts("actv_code_type_id"),
+                                     assigned.texts("actv_code_id")):
+            i = by_id.get(tid)
+            if i is None:
+                continue
+            f = self._field(type_names.get(type_id) or f"Code {type_id}", CODE)
+            value, label = values.get(cid, (cid, ""))
+            f.add(value, i)
+            if label:
+                f.labels[value] = label
+
+    def _udfs(self) -> None:
+        udfs = self.parsed.get("UDFVALUE")
+        types = self.parsed.get("UDFTYPE")
+        if not udfs or not types:
+            return
+        task_types = {}
+        for tid, table, name, label, ltype in zip(types.texts("udf_type_id"), types.texts("table_name"),
+                                                  types.texts("udf_type_name"), types.texts("udf_type_label"),
+                                                  types.texts("logical_data_type")):
+            if table == "TASK":
+                task_types[tid] = (label or name or f"UDF {tid}", _UDF_COLUMNS.get(ltype))
+        if not task_types:
+            return
+        codes = self.parsed.get("UDFCODE")
+        code_names = dict(zip(codes.texts("udf_code_id"), codes.texts("short_name"))) if codes else {}
+        cols = {c: udfs.texts(c) for c in set(_UDF_COLUMNS.values()) if udfs.has(c)}
+        by_id = self.by_id
+        for k, (type_id, fk) in enumerate(zip(udfs.texts("udf_type_id"), udfs.texts("fk_id"))):
+            t = task_types.get(type_id)
+            i = by_id.get(fk) if t else None
+            if i is None:
+                continue
+            col = t[1]
+            if col in cols:
+                value = cols[col][k]
+            else:  # unknown logical type: first populated column
+                value = next((cols[c][k] for c in ("udf_text", "udf_number", "udf_date", "udf_code_id")
+                              if c in cols and cols[c][k]), "")
+            if col == "udf_code_id" or (col is None and value in code_names):
+                value = code_names.get(value, value)
+            elif col == "udf_date":
+                value = value[:10]
+            if value:
+                self._field(t[0], UDF).add(value, i)
+
+    def _memos(self) -> None:
+        memos = self.parsed.get("TASKMEMO")
+        if not memos:
+            return
+        types = self.parsed.get("MEMOTYPE")
+        topics = dict(zip(types.texts("memo_type_id"), types.texts("memo_type"))) if types else {}
+        f = self._field(NOTEBOOK_FIELD, NOTEBOOK)
+        seen = set()
+        for tid, type_id in zip(memos.texts("task_id"), memos.texts("memo_type_id")):
+            i = self.by_id.get(tid)
+            topic = topics.get(type_id) or type_id
+            if i is not None and topic and (topic, i) not in seen:
+                seen.add((topic, i))
+                f.add(topic, i)
+
+    # -- fields --------------------------------------------------------------------------------
+
+    def field(self, name: str) -> CodeField:
+        """Field by name (case-insensitive); KeyError if the schedule has no such code type / UDF."""
+        f = self.fields.get((name or "").strip().lower())
+        if f is None:
+            raise KeyError(name)
+        return f
+
+    def describe(self) -> list[dict]:
+        return [f.to_dict() for f in self.fields.values()]
+
+    def values(self, name: str) -> list[dict]:
+        """Values of a field with their descriptions and activity counts, most used first."""
+        f = self.field(name)
+        return [{"value": v, "description": f.labels.get(v, ""), "count": len(rows)}
+                for v, rows in sorted(f.postings.items(), key=lambda kv: (-len(kv[1]), kv[0]))]
+
+    def column(self, name: str) -> list[str]:
+        """The field's value on every TASK row ("" if unassigned; several notebook topics comma-joined)."""
+        f = self.field(name)
+        if f._column is None:
+            col = [""] * self.n
+            for v, rows in f.postings.items():
+                for i in rows:
+                    col[i] = f"{col[i]}, {v}" if col[i] else v
+            f._column = col
+        return f._column
+
+    # -- bitmaps -------------------------------------------------------------------------------
+
+    def bitmap(self, name: str, value: str) -> int:
+        """Bitmap (bit i = TASK row i) of activities with the value; blank value = activities without one."""
+        f = self.field(name)
+        stored = f.resolve(value) if value.strip() else ""
+        if stored is None:
+            return 0
+        key = (f.name.lower(), stored)
+        bits = self._bits.get(key)
+        if bits is None:
+            if stored:
+                bits = self._bits[key] = self.to_bits(f.postings[stored])
+            else:
+                bits = self._bits[key] = self.all & ~self.to_bits(i for rows in f.postings.values() for i in rows)
+        return bits
+
+    def to_bits(self, rows) -> int:
+        buf = bytearray((self.n + 7) // 8)
+        for i in rows:
+            buf[i >> 3] |= 1 << (i & 7)
+        return int.from_bytes(buf, "little")
+
+    def rows(self, bits: int) -> list[int]:
+        """TASK rows set in a bitmap, ascending."""
+        out = []
+        for k, byte in enumerate(bits.to_bytes((self.n + 7) // 8, "little")):
+            if byte:
+                base = k << 3
+                out.extend(base + b for b in range(8) if byte >> b & 1)
+        return out
+
+    def select(self, filters: list[tuple[str, list[str]]]) -> int:
+        """Bitmap of activities matching every (field, values) clause; a clause matches any of its values."""
+        bits = self.all
+        for name, values in filters:
+            any_of = 0
+            for v in values or [""]:
+                any_of |= self.bitmap(name, v)
+            bits &= any_of
+            if not bits:
+                break
+        return bits
+
+    # -- rollups -------------------------------------------------------------------------------
+
+    def rollup(self, name: str, bits: int | None = None) -> list[dict]:
+        """Activities of each value of a field (within bits): status counts, critical count and minimum float."""
+        f = self.field(name)
+        tasks = self.tasks
+        status = tasks.texts("status_code")
+        ttype = tasks.texts("task_type")
+        tf = tasks.floats("total_float_hr_cnt")
+        cal = tasks.texts("clndr_id")
+        hours = calendar_day_hours(self.parsed) if self.parsed.get("CALENDAR") else {}
+        default_hours = hours.get("") or DEFAULT_DAY_HOURS
+        scope = self.all if bits is None else bits
+        groups = [(v, f.labels.get(v, ""), self.bitmap(f.name, v) & scope) for v in f.postings]
+        groups.append(("", "(unassigned)", self.bitmap(f.name, "") & scope))
+        out = []
+        for value, label, group in groups:
+            if not group:
+                continue
+            rec = {"value": value, "description": label, "activities": 0, "complete": 0, "inProgress": 0,
+                   "notStarted": 0, "critical": 0, "minFloatDays": None}
+            low = None
+            for i in self.rows(group):
+                rec["activities"] += 1
+                st = status[i]
+                if st == "TK_Complete":
+                    rec["complete"] += 1
+                    continue
+                rec["inProgress" if st == "TK_Active" else "notStarted"] += 1
+                if ttype[i] in EXCLUDED_TYPES or tf[i] != tf[i]:
+                    continue
+                days = tf[i] / (hours.get(cal[i], default_hours) or default_hours)
+                rec["critical"] += days <= 0
+                low = days if low is None else min(low, days)
+            rec["minFloatDays"] = round(low, 1) if low is not None else None
+            out.append(rec)
+        out.sort(key=lambda r: (not r["value"], -r["activities"], r["value"]))
+        return out
+
+
+def parse_filters(text: str) -> list[tuple[str, list[str]]]:
+    """'Area=North,South;Responsibility=Owner' -> [("Area", ["North", "South"]), ("Responsibility", ["Owner"])]."""
+    out = []
+    for clause in (text or "").split(";"):
+        if not clause.strip():
+            continue
+        name, sep, values = clause.partition("=")
+        if not sep or not name.strip():
+            raise ValueError(f"Expected field=value in filter '{clause.strip()}'")
+        out.append((name.strip(), [v.strip() for v in values.split(",")]))
+    return out
+
+
+def activity_codes(parsed: ParsedXer) -> ActivityCodes:
+    """ActivityCodes memoised on the parse."""
+    return parsed.memo("activity_codes", ActivityCodes)
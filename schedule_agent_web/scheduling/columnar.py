@@ -0,0 +1,289 @@
+"""
+Schedule engine: columnar datasets converted from XER files (scripts/parse_xer.py).
+
+One dataset per XER: a directory holding one file per table plus dataset.json (source, SHA-256 of
+the file bytes, row counts, column types and a SHA-256 per written file). A manifest.json at the output root lists every
+dataset by hash. Formats:
+
+  arrow     Arrow IPC files; read back through a memory map, numeric columns zero-copy
+  parquet   compressed columnar files (read with memory_map=True)
+  jsonl     newline-delimited JSON, one typed object per row (no extra dependencies)
+
+arrow and parquet need pyarrow (pip install pyarrow); jsonl always works. Numeric types are
+inferred: the parser's numeric fields are float64, and text columns whose values are all integers
+or all decimals (ids excepted, they are join keys) are written as int64 / float64.
+
+open_dataset() turns a dataset back into a ParsedXer without re-parsing text, and find_dataset()
+looks one up by content hash (the same key the web app's parse cache uses), so the app can load a
+converted copy of an upload instead of parsing it (see xer_cache, XER_COLUMNAR_DIR).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+import re
+import time
+from array import array
+from typing import Any
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from schedule_agent_web.scheduling.xer_parser import ParsedXer, XerTable, format_number, is_numeric_field, parse_xer_file
+
+FORMATS = ("arrow", "parquet", "jsonl")
+EXTENSIONS = {"arrow": ".arrow", "parquet": ".parquet", "jsonl": ".jsonl"}
+DATASET_FILE = "dataset.json"
+MANIFEST_FILE = "manifest.json"
+
+_INT = re.compile(r"-?\d{1,18}")
+_FLOAT = re.compile(r"-?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?")
+
+
+def pyarrow_available() -> bool:
+    return pa is not None
+
+
+def default_format() -> str:
+    return "arrow" if pa is not None else "jsonl"
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _is_key(field: str) -> bool:
+    return field.endswith("_id") or field.endswith("_code") or field.endswith("_name")
+
+
+def infer_types(table: XerTable) -> dict[str, str]:
+    """Column type per field: float64 for numeric fields, int64 / float64 for text columns whose
+    distinct non-blank values all parse as such (ids and codes stay strings), else string."""
+    out = {}
+    for f in table.fields:
+        if table.is_numeric(f):
+            out[f] = "float64"
+            continue
+        kind = "string"
+        if not _is_key(f):
+            values = {v for v in table.column(f) if v}
+            if values and all(_INT.fullmatch(v) for v in values):
+                kind = "int64"
+            elif values and all(_FLOAT.fullmatch(v) for v in values):
+                kind = "float64"
+        out[f] = kind
+    return out
+
+
+def _typed_column(table: XerTable, field: str, kind: str) -> list:
+    """Python values of one column for the writers (None for blanks / NaN)."""
+    if table.is_numeric(field):
+        return [None if v != v else v for v in table.floats(field)]
+    col = table.column(field)
+    if kind == "int64":
+        return [int(v) if v else None for v in col]
+    if kind == "float64":
+        return [float(v) if v else None for v in col]
+    return col
+
+
+def _write_jsonl(table: XerTable, types: dict[str, str], path: str) -> None:
+    fields = table.fields
+    cols = [_typed_column(table, f, types[f]) for f in fields]
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    with open(path, "w", encoding="utf-8", newline="\n") as fh:
+        for vals in zip(*cols):
+            fh.write(dumps(dict(zip(fields, vals))))
+            fh.write("\n")
+
+
+def _arrow_table(table: XerTable, types: dict[str, str]):
+    arrays = []
+    for f in table.fields:
+        kind = types[f]
+        if table.is_numeric(f):
+            # NaN stays NaN (not null) so the column reads back zero-copy.
+            arrays.append(pa.Array.from_buffers(pa.float64(), len(table), [None, pa.py_buffer(table.floats(f))]))
+        elif kind == "int64":
+            arrays.append(pa.array(_typed_column(table, f, kind), type=pa.int64()))
+        elif kind == "float64":
+            arrays.append(pa.array(_typed_column(table, f, kind), type=pa.float64()))
+        else:
+            arrays.append(pa.array(table.column(f), type=pa.string()))
+    return pa.Table.from_arrays(arrays, names=list(table.fields))
+
+
+def write_table(table: XerTable, out_dir: str, fmt: str, types: dict[str, str] | None = None) -> str:
+    """Write one table; returns the file name (relative to out_dir)."""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    if fmt != "jsonl" and pa is None:
+        raise RuntimeError(f"{fmt} output requires pyarrow (pip install pyarrow); use jsonl instead")
+    types = types or infer_types(table)
+    name = table.name + EXTENSIONS[fmt]
+    path = os.path.join(out_dir, name)
+    tmp = path + ".tmp"
+    if fmt == "jsonl":
+        _write_jsonl(table, types, tmp)
+    else:
+        at = _arrow_table(table, types)
+        if fmt == "parquet":
+            pq.write_table(at, tmp)
+        else:
+            with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, at.schema) as writer:
+                writer.write_table(at, max_chunksize=max(len(table), 1))
+    os.replace(tmp, path)
+    return name
+
+
+def convert_file(path: str, out_dir: str, fmt: str | None = None, tables: list[str] | None = None) -> dict:
+    """Parse one XER and write it as a dataset under out_dir; returns its manifest entry."""
+    fmt = fmt or default_format()
+    t0 = time.perf_counter()
+    parsed = parse_xer_file(path, use_mmap=True)
+    os.makedirs(out_dir, exist_ok=True)
+    entry: dict[str, Any] = {
+        "source": os.path.abspath(path),
+        "sha256": file_sha256(path),
+        "bytes": os.path.getsize(path),
+        "format": fmt,
+        "header": parsed.header,
+        "tables": {},
+    }
+    for name, table in parsed.items():
+        if tables and name not in tables:
+            continue
+        types = infer_types(table)
+        file = write_table(table, out_dir, fmt, types)
+        entry["tables"][name] = {"rows": len(table), "file": file,
+                                 "sha256": file_sha256(os.path.join(out_dir, file)), "columns": types}
+    entry["elapsedMs"] = round((time.perf_counter() - t0) * 1000, 1)
+    with open(os.path.join(out_dir, DATASET_FILE), "w", encoding="utf-8") as fh:
+        json.dump(entry, fh, indent=1)
+    return entry
+
+
+def write_manifest(out_root: str, entries: list[dict]) -> str:
+    """Merge dataset entries into out_root/manifest.json (keyed by dataset directory)."""
+    path = os.path.join(out_root, MANIFEST_FILE)
+    manifest = load_manifest(out_root) or {"datasets": {}}
+    for e in entries:
+        manifest["datasets"][e["dir"]] = e
+    manifest["updated"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=1)
+    os.replace(tmp, path)
+    _manifests.pop(os.path.abspath(out_root), None)
+    return path
+
+
+def load_manifest(out_root: str) -> dict | None:
+    try:
+        with open(os.path.join(out_root, MANIFEST_FILE), encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+# -- reading -----------------------------------------------------------------------------------
+
+def _text_of(values: list, kind: str) -> list[str]:
+    pool: dict[str, str] = {}
+    if kind == "string":
+        return [pool.setdefault(v, v) if v is not None else "" for v in values]
+    if kind == "int64":
+        return [pool.setdefault(s, s) for s in ("" if v is None else str(v) for v in values)]
+    return [pool.setdefault(s, s) for s in ("" if v is None or v != v else format_number(float(v)) for v in values)]
+
+
+def _float_column(values: list):
+    return array("d", (math.nan if v is None else float(v) for v in values))
+
+
+def _from_arrow(name: str, at, types: dict[str, str]) -> XerTable:
+    fields = list(at.column_names)
+    cols = []
+    for f in fields:
+        col = at.column(f)
+        if is_numeric_field(f) and types.get(f, "float64") == "float64":
+            if col.null_count == 0 and col.num_chunks <= 1:
+                cols.append(col.to_numpy())     # zero-copy view over the mapped file
+            else:
+                cols.append(_float_column(col.to_pylist()))
+        else:
+            cols.append(_text_of(col.to_pylist(), types.get(f, "string")))
+    return XerTable.from_columns(name, fields, cols)
+
+
+def _from_jsonl(name: str, path: str, types: dict[str, str]) -> XerTable:
+    fields = list(types)
+    raw: list[list] = [[] for _ in fields]
+    loads = json.loads
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            if not line.strip():
+                continue
+            row = loads(line)
+            for ci, f in enumerate(fields):
+                raw[ci].append(row.get(f))
+    cols = []
+    for ci, f in enumerate(fields):
+        if is_numeric_field(f) and types[f] == "float64":
+            cols.append(_float_column(raw[ci]))
+        else:
+            cols.append(_text_of(raw[ci], types[f]))
+    return XerTable.from_columns(name, fields, cols)
+
+
+def open_dataset(path: str, tables: list[str] | None = None) -> ParsedXer:
+    """ParsedXer over a converted dataset directory (Arrow files are memory-mapped)."""
+    with open(os.path.join(path, DATASET_FILE), encoding="utf-8") as fh:
+        entry = json.load(fh)
+    fmt = entry.get("format", "jsonl")
+    if fmt != "jsonl" and pa is None:
+        raise RuntimeError(f"reading {fmt} datasets requires pyarrow (pip install pyarrow)")
+    out: dict[str, XerTable] = {}
+    for name, info in entry.get("tables", {}).items():
+        if tables and name not in tables:
+            continue
+        file = os.path.join(path, info["file"])
+        types = info.get("columns", {})
+        if fmt == "arrow":
+            with pa.memory_map(file, "r") as src:
+                at = pa.ipc.open_file(src).read_all()
+            out[name] = _from_arrow(name, at, types)
+        elif fmt == "parquet":
+            out[name] = _from_arrow(name, pq.read_table(file, memory_map=True), types)
+        else:
+            out[name] = _from_jsonl(name, file, types)
+    return ParsedXer(out, header=entry.get("header", ""))
+
+
+_manifests: dict[str, tuple[float, dict[str, str]]] = {}
+
+
+def find_dataset(out_root: str, sha256: str) -> str | None:
+    """Directory of the dataset converted from content with this SHA-256 under out_root, if any."""
+    root = os.path.abspath(out_root)
+    path = os.path.join(root, MANIFEST_FILE)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _manifests.get(root)
+    if cached is None or cached[0] != mtime:
+        manifest = load_manifest(root) or {}
+        index = {e.get("sha256"): os.path.join(root, d) for d, e in manifest.get("datasets", {}).items()}
+        cached = _manifests[root] = (mtime, index)
+    d = cached[1].get(sha256)
+    return d if d and os.path.isfile(os.path.join(d, DATASET_FILE)) else None
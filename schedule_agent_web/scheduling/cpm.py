@@ -0,0 +1,653 @@
+"""
+Schedule engine: critical path method over TASK / TASKPRED.
+
+Builds an integer-indexed activity network from the parsed XER, orders it topologically (Kahn),
+and runs level-by-level vectorised forward and backward passes with NumPy. Supports FS/SS/FF/SF
+relationships with lags, progress (actual dates, remaining durations) measured from the data
+date, and the usual P6 constraint types. The passes run in working time on each activity's own
+calendar (see scheduling.calendars) and only ties between different calendars go through clock
+time, so mixed 5-day / 7-day networks cost little more than single-calendar ones. Reported dates
+are clock hours relative to the data date; durations, lags and floats are working hours.
+"""
+from __future__ import annotations
+
+import time
+from itertools import repeat
+from datetime import datetime, timedelta
+from typing import Any
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from schedule_agent_web.scheduling.calendars import CalendarSet, ContinuousCalendars
+from schedule_agent_web.scheduling.xer_parser import ParsedXer, parse_p6_date
+
+REL_FS, REL_SS, REL_FF, REL_SF = 0, 1, 2, 3
+REL_NAMES = ("FS", "SS", "FF", "SF")
+_REL_CODES = {name: code for code, name in enumerate(REL_NAMES)}
+
+MILESTONE_TYPES = ("TT_Mile", "TT_FinMile")
+# Level-of-effort and WBS-summary activities span their logic instead of driving it; they are
+# left out of the network (their ties are dropped) and get no CPM dates.
+SUMMARY_TYPES = ("TT_LOE", "TT_WBS")
+
+# Start-side and finish-side constraint handling (cstr_type / cstr_type2).
+_CSTR_ES_MIN = ("CS_MSOA", "CS_MSO")
+_CSTR_EF_MIN = ("CS_MEOA", "CS_MEO")
+_CSTR_LS_MAX = ("CS_MSOB", "CS_MSO")
+_CSTR_LF_MAX = ("CS_MEOB", "CS_MEO")
+_CSTR_MAND_START = ("CS_MANDSTART",)
+_CSTR_MAND_FIN = ("CS_MANDFIN",)
+
+DEFAULT_DAY_HOURS = 8.0
+
+
+def rel_type_name(value: str) -> str:
+    """Normalise a TASKPRED.pred_type ('PR_FS', 'fs', '') to 'FS'/'SS'/'FF'/'SF' (default FS)."""
+    s = (value or "FS").strip().upper()
+    if s.startswith("PR_"):
+        s = s[3:]
+    return s if s in _REL_CODES else "FS"
+
+
+def numpy_available() -> bool:
+    return np is not None
+
+
+class CpmNetwork:
+    """Integer-indexed activity network in topological order, ready for the passes."""
+
+    def __init__(self):
+        self.task_ids: list[str] = []
+        self.rows: Any = None          # TASK row index for each node
+        self.n = 0
+        self.data_date: datetime | None = None
+        self.must_finish: float = float("nan")
+        self.dur = self.cal = self.day_hours = None
+        self.complete = self.active = self.finish_mile = None
+        self.act_start = self.act_end = None
+        self.es_min = self.ef_min = self.ls_max = self.lf_max = None
+        self.es_force = self.ef_force = None
+        # Edges (node indexes): pred -> succ
+        self.pred = self.succ = self.rtype = self.lag = None
+        # Topological order: order[k] = node; level_ptr delimits levels in that order.
+        self.order = self.level_ptr = None
+        self.in_network = None          # False for summary activities and nodes caught in loops
+        self.loop_task_ids: list[str] = []
+        self.calendars: Any = ContinuousCalendars()
+
+    @property
+    def levels(self) -> int:
+        return max(len(self.level_ptr) - 1, 0) if self.level_ptr is not None else 0
+
+    def index_of(self, task_id: str) -> int | None:
+        idx = getattr(self, "_index", None)
+        if idx is None:
+            idx = self._index = {tid: i for i, tid in enumerate(self.task_ids)}
+        return idx.get(task_id)
+
+
+def _hours_from(dates: list[str], origin: datetime):
+    out = np.full(len(dates), np.nan)
+    for i, s in enumerate(dates):
+        if s:
+            d = parse_p6_date(s)
+            if d is not None:
+                out[i] = (d - origin).total_seconds() / 3600.0
+    return out
+
+
+def _data_date(parsed: ParsedXer, proj_id: str | None) -> tuple[datetime | None, datetime | None]:
+    """(data date, must-finish-by date) of the selected project (first project if none selected)."""
+    proj = parsed.get("PROJECT")
+    if not proj:
+        return None, None
+    ids = proj.texts("proj_id")
+    i = ids.index(proj_id) if proj_id and proj_id in ids else 0
+    dd = parse_p6_date(proj.text("last_recalc_date", i)) or parse_p6_date(proj.text("plan_start_date", i))
+    mfb = parse_p6_date(proj.text("scd_end_date", i))
+    return dd, mfb
+
+
+def build_network(parsed: ParsedXer, proj_id: str | None = None, calendars: Any = None) -> CpmNetwork:
+    """Build the CPM network for one project (or the whole file when proj_id is None).
+
+    calendars defaults to the schedule's own CALENDAR table; pass ContinuousCalendars() to
+    schedule on a 24-hour calendar.
+    """
+    if np is None:
+        raise RuntimeError("numpy is required for CPM scheduling (pip install numpy)")
+    net = CpmNetwork()
+    tasks = parsed.get("TASK")
+    if not tasks:
+        net.rows = np.zeros(0, dtype=np.int64)
+        net.order = np.zeros(0, dtype=np.int64)
+        net.level_ptr = np.zeros(1, dtype=np.int64)
+        return net
+
+    all_ids = tasks.texts("task_id")
+    if proj_id and tasks.has("proj_id"):
+        rows = [i for i, p in enumerate(tasks.texts("proj_id")) if p == proj_id]
+    else:
+        rows = list(range(len(all_ids)))
+    n = len(rows)
+    net.n = n
+    net.rows = np.asarray(rows, dtype=np.int64)
+    net.task_ids = [all_ids[i] for i in rows]
+    index = {tid: k for k, tid in enumerate(net.task_ids)}
+
+    def col_text(field):
+        c = tasks.texts(field)
+        return c if n == len(all_ids) else [c[i] for i in rows]
+
+    def col_float(field):
+        return np.asarray(tasks.floats(field), dtype=np.float64)[net.rows] if n else np.zeros(0)
+
+    ttype = col_text("task_type")
+    status = col_text("status_code")
+    is_mile = np.fromiter((t in MILESTONE_TYPES for t in ttype), bool, n)
+    is_summary = np.fromiter((t in SUMMARY_TYPES for t in ttype), bool, n)
+    net.complete = np.fromiter((s == "TK_Complete" for s in status), bool, n)
+    net.active = np.fromiter((s == "TK_Active" for s in status), bool, n)
+    net.finish_mile = np.fromiter((t == "TT_FinMile" for t in ttype), bool, n)
+
+    remain = col_float("remain_drtn_hr_cnt")
+    target = col_float("target_drtn_hr_cnt")
+    dur = np.where(np.isnan(remain), target, remain)
+    dur = np.where(np.isnan(dur), 0.0, np.maximum(dur, 0.0))
+    dur[is_mile | is_summary | net.complete] = 0.0
+    net.dur = dur
+
+    dd, mfb = _data_date(parsed, proj_id)
+    if dd is None:
+        starts = [d for d in (parse_p6_date(s) for s in col_text("target_start_date")) if d]
+        dd = min(starts) if starts else datetime(2000, 1, 1)
+    net.data_date = dd
+    if mfb is not None:
+        net.must_finish = (mfb - dd).total_seconds() / 3600.0
+
+    # Calendar index per activity (unknown or blank clndr_id -> the default calendar).
+    if calendars is None:
+        calendars = CalendarSet.from_parsed(parsed, dd) if parsed.get("CALENDAR") else ContinuousCalendars()
+    net.calendars = calendars
+    clndr = col_text("clndr_id")
+    cal_ids = getattr(calendars, "ids", None)
+    if cal_ids:
+        default = getattr(calendars, "default_index", 0)
+        net.cal = np.fromiter((cal_ids.get(c, default) for c in clndr), np.int32, n)
+    else:
+        net.cal = np.zeros(n, dtype=np.int32)
+    if isinstance(calendars, CalendarSet):
+        net.day_hours = calendars.day_hours[net.cal]
+    else:
+        net.day_hours = np.full(n, DEFAULT_DAY_HOURS)
+    net.act_start = _hours_from(col_text("act_start_date"), dd)
+    net.act_end = _hours_from(col_text("act_end_date"), dd)
+
+    # Constraint bounds (NaN = none). Unstarted work cannot start before the data date.
+    net.es_min = np.zeros(n)
+    net.ef_min = np.full(n, -np.inf)
+    net.ls_max = np.full(n, np.inf)
+    net.lf_max = np.full(n, np.inf)
+    net.es_force = np.full(n, np.nan)
+    net.ef_force = np.full(n, np.nan)
+    for type_field, date_field in (("cstr_type", "cstr_date"), ("cstr_type2", "cstr_date2")):
+        if not tasks.has(type_field):
+            continue
+        ctypes = col_text(type_field)
+        cdates = col_text(date_field)
+        for k, ct in enumerate(ctypes):
+            if not ct or ct == "CS_ALAP":
+                continue
+            d = parse_p6_date(cdates[k])
+            if d is None:
+                continue
+            h = (d - dd).total_seconds() / 3600.0
+            if ct in _CSTR_ES_MIN:
+                net.es_min[k] = max(net.es_min[k], h)
+            if ct in _CSTR_EF_MIN:
+                net.ef_min[k] = max(net.ef_min[k], h)
+            if ct in _CSTR_LS_MAX:
+                net.ls_max[k] = min(net.ls_max[k], h)
+            if ct in _CSTR_LF_MAX:
+                net.lf_max[k] = min(net.lf_max[k], h)
+            if ct in _CSTR_MAND_START:
+                net.es_force[k] = h
+                net.ls_max[k] = min(net.ls_max[k], h)
+            if ct in _CSTR_MAND_FIN:
+                net.ef_force[k] = h
+                net.lf_max[k] = min(net.lf_max[k], h)
+
+    # Edges between activities of this network; ties to summary activities are dropped.
+    preds = parsed.get("TASKPRED")
+    if preds:
+        missing = repeat(-1)
+        succ = np.fromiter(map(index.get, preds.texts("task_id"), missing), np.int64, len(preds))
+        pred = np.fromiter(map(index.get, preds.texts("pred_task_id"), missing), np.int64, len(preds))
+        ptypes = preds.texts("pred_type")
+        codes = {v: _REL_CODES[rel_type_name(v)] for v in set(ptypes)}
+        rtype = np.fromiter(map(codes.__getitem__, ptypes), np.int8, len(preds))
+        lag = np.asarray(preds.floats("lag_hr_cnt"), dtype=np.float64)
+        lag = np.where(np.isnan(lag), 0.0, lag)
+        keep = (succ >= 0) & (pred >= 0) & (succ != pred)
+        keep[keep] = ~(is_summary[pred[keep]] | is_summary[succ[keep]])
+    else:
+        succ = pred = np.zeros(0, dtype=np.int64)
+        rtype = np.zeros(0, dtype=np.int8)
+        lag = np.zeros(0)
+        keep = np.zeros(0, dtype=bool)
+    net.pred, net.succ, net.rtype, net.lag = pred[keep], succ[keep], rtype[keep], lag[keep]
+
+    _topo_levels(net, ~is_summary)
+    return net
+
+
+def _topo_levels(net: CpmNetwork, eligible) -> None:
+    """Kahn's algorithm assigning each node its longest-path depth; nodes left over sit in loops."""
+    n = net.n
+    out_start = np.zeros(n + 1, dtype=np.int64)
+    eorder = np.argsort(net.pred, kind="stable")
+    np.cumsum(np.bincount(net.pred, minlength=n), out=out_start[1:])
+    succ_sorted = net.succ[eorder].tolist()
+    out_start_l = out_start.tolist()
+    indeg = np.bincount(net.succ, minlength=n).tolist()
+    depth = [0] * n
+    ok = eligible.tolist()
+    stack = [i for i in range(n) if indeg[i] == 0 and ok[i]]
+    seen = 0
+    visited = [False] * n
+    while stack:
+        u = stack.pop()
+        visited[u] = True
+        seen += 1
+        du = depth[u] + 1
+        for e in range(out_start_l[u], out_start_l[u + 1]):
+            v = succ_sorted[e]
+            if depth[v] < du:
+                depth[v] = du
+            indeg[v] -= 1
+            if indeg[v] == 0 and ok[v]:
+                stack.append(v)
+    in_net = np.asarray(visited, dtype=bool) if n else np.zeros(0, bool)
+    net.in_network = in_net
+    net.loop_task_ids = [net.task_ids[i] for i in np.flatnonzero(eligible & ~in_net)]
+    if len(net.pred):
+        live = in_net[net.pred] & in_net[net.succ]
+        net.pred, net.succ, net.rtype, net.lag = net.pred[live], net.succ[live], net.rtype[live], net.lag[live]
+    depth_a = np.asarray(depth, dtype=np.int64)
+    nodes = np.flatnonzero(in_net)
+    nodes = nodes[np.argsort(depth_a[nodes], kind="stable")]
+    net.order = nodes
+    if len(nodes):
+        counts = np.bincount(depth_a[nodes])
+        net.level_ptr = np.concatenate(([0], np.cumsum(counts)))
+    else:
+        net.level_ptr = np.zeros(1, dtype=np.int64)
+
+
+class CpmResult:
+    """Early/late dates and floats for every node of a CpmNetwork (hours from the data date).
+
+    Floats are working hours on each activity's calendar; es_w..lf_w keep the dates as working
+    time too, for callers that need calendar-correct arithmetic on them.
+    """
+
+    def __init__(self, net: CpmNetwork, es, ef, ls, lf, total_float, free_float, project_finish: float,
+                 elapsed: float, work=None):
+        self.network = net
+        self.es, self.ef, self.ls, self.lf = es, ef, ls, lf
+        self.es_w, self.ef_w, self.ls_w, self.lf_w = work if work is not None else (es, ef, ls, lf)
+        self.total_float = total_float
+        self.free_float = free_float
+        self.project_finish = project_finish
+        self.elapsed = elapsed
+        self.critical = (total_float <= 0) & ~net.complete & net.in_network
+
+    def to_datetime(self, hours: float) -> datetime | None:
+        if hours != hours or self.network.data_date is None or abs(hours) == float("inf"):
+            return None
+        return self.network.data_date + timedelta(hours=float(hours))
+
+    def iso(self, hours: float) -> str:
+        d = self.to_datetime(hours)
+        return d.strftime("%Y-%m-%d %H:%M") if d else ""
+
+    def days(self, hours, i: int) -> float | None:
+        if hours != hours:
+            return None
+        return round(float(hours) / float(self.network.day_hours[i] or DEFAULT_DAY_HOURS), 1)
+
+    def activity(self, i: int) -> dict:
+        net = self.network
+        tf = self.total_float[i]
+        ff = self.free_float[i]
+        return {
+            "task_id": net.task_ids[i],
+            "early_start": self.iso(self.es[i]),
+            "early_finish": self.iso(self.ef[i]),
+            "late_start": self.iso(self.ls[i]),
+            "late_finish": self.iso(self.lf[i]),
+            "total_float_hr": None if tf != tf else round(float(tf), 2),
+            "free_float_hr": None if ff != ff else round(float(ff), 2),
+            "total_float": self.days(tf, i),
+            "free_float": self.days(ff, i),
+            "remaining_duration": self.days(net.dur[i], i),
+            "critical": bool(self.critical[i]),
+        }
+
+    def float_days(self):
+        """Total float in days of each activity's own calendar (NaN outside the network)."""
+        return self.total_float / np.where(self.network.day_hours > 0, self.network.day_hours, DEFAULT_DAY_HOURS)
+
+    def critical_path_length(self) -> tuple[float, float]:
+        """(working hours from the data date to the latest early finish on the finishing
+        activity's calendar, lowest total float on the remaining work); (0, 0) if nothing is left."""
+        net = self.network
+        live = np.flatnonzero(net.in_network & ~net.complete)
+        if not live.size:
+            return 0.0, 0.0
+        i = live[np.nanargmax(self.ef[live])]
+        length = float(self.ef_w[i] - net.calendars.to_work(net.cal[i:i + 1], np.zeros(1))[0])
+        return length, float(np.nanmin(self.total_float[live]))
+
+    def ranked(self, critical_only: bool = False, exclude_milestones: bool = False, by: str = "start"):
+        """Node indexes of scheduled, unfinished activities ordered by early start (or total float)."""
+        net = self.network
+        mask = net.in_network & ~net.complete
+        if critical_only:
+            mask &= self.critical
+        if exclude_milestones:
+            mask &= net.dur > 0
+        idx = np.flatnonzero(mask)
+        if by == "float":
+            keys = (self.es[idx], self.total_float[idx])
+        else:
+            keys = (self.total_float[idx], self.es[idx])
+        return idx[np.lexsort(keys)]
+
+    def activities(self, tasks, indexes, offset: int = 0, limit: int | None = None) -> list[dict]:
+        """Activity rows for the given node indexes, joined with code/name/WBS/status from TASK."""
+        net = self.network
+        end = None if limit is None else offset + limit
+        cal_names = [c.name for c in getattr(net.calendars, "calendars", ())]
+        out = []
+        for i in indexes[offset:end]:
+            row = int(net.rows[i])
+            rec = {
+                "task_code": tasks.text("task_code", row),
+                "task_name": tasks.text("task_name", row),
+                "wbs_id": tasks.text("wbs_id", row),
+                "status": tasks.text("status_code", row),
+                "calendar": cal_names[net.cal[i]] if cal_names else "",
+            }
+            rec.update(self.activity(int(i)))
+            out.append(rec)
+        return out
+
+    def summary(self) -> dict:
+        net = self.network
+        live = net.in_network & ~net.complete
+        tf = self.total_float[live]
+        return {
+            "dataDate": net.data_date.strftime("%Y-%m-%d %H:%M") if net.data_date else "",
+            "projectFinish": self.iso(self.project_finish),
+            "activities": int(net.n),
+            "scheduled": int(net.in_network.sum()),
+            "relationships": int(len(net.pred)),
+            "levels": net.levels,
+            "criticalCount": int(self.critical.sum()),
+            "negativeFloatCount": int((tf < 0).sum()),
+            "loopActivities": len(net.loop_task_ids),
+            "elapsedMs": round(self.elapsed * 1000, 1),
+        }
+
+
+class PassPlan:
+    """Ties, bounds and progress of a network in topological space (position k holds node
+    order[k]), prepared once and shared by run_cpm and the risk engine.
+
+    Ties are grouped by level and, within a level, by the date they bound, so each level applies
+    its bounds with one gather and one reduceat. forward() and backward() take durations of shape
+    (m,) or (iterations, m); dates come back as [start | finish] arrays of shape (..., 2m) in
+    working time.
+    """
+
+    def __init__(self, net: CpmNetwork):
+        n = net.n
+        cals = self.calendars = net.calendars
+        order = net.order
+        m = self.m = len(order)
+        self.ptr = net.level_ptr.tolist()
+        cal = net.cal
+
+        # Progress: completed work keeps its actuals; work in progress keeps its actual start and
+        # finishes its remaining duration from the data date. Ties into progressed work no longer drive.
+        done = self.done = net.complete
+        started = net.active & ~done
+        fixed = self.fixed = done | started
+        self.fix_es = np.where(np.isnan(net.act_start), 0.0, np.minimum(net.act_start, 0.0))
+        self.fix_ef = np.where(np.isnan(net.act_end), 0.0, np.minimum(net.act_end, 0.0))
+        fix_es_w = cals.to_work(cal, self.fix_es)
+        # Finish of progressed work = fix_ef + remaining duration (zero once complete).
+        fix_ef_w = np.where(done, cals.to_work(cal, self.fix_ef), cals.to_work(cal, np.zeros(n)))
+        live_edge = ~fixed[net.succ]
+        self.e_pred, self.e_succ = net.pred[live_edge], net.succ[live_edge]
+        e_rt, e_lag = net.rtype[live_edge], net.lag[live_edge]
+        self.e_lag = e_lag
+        self.from_finish = (e_rt == REL_FS) | (e_rt == REL_FF)   # driven by the predecessor's finish
+        self.to_finish = (e_rt == REL_FF) | (e_rt == REL_SF)     # bounds the successor's finish
+        self.cross = cal[self.e_pred] != cal[self.e_succ]
+
+        pos = np.full(n, -1, dtype=np.int64)
+        pos[order] = np.arange(m)
+        self.cal_t = cal_t = cal[order]
+        self.dur = net.dur[order]
+        self.fixed_t = fixed[order]
+        self.done_t = done[order]
+        self.es_force = cals.to_work(cal_t, net.es_force[order])
+        self.ef_force = cals.to_work(cal_t, net.ef_force[order])
+        special = self.fixed_t | ~np.isnan(self.es_force) | ~np.isnan(self.ef_force)
+        self.special_level = (np.add.reduceat(special.astype(np.int64), self.ptr[:-1]) > 0).tolist() if m else []
+        self.fix_es_t, self.fix_ef_t = fix_es_w[order], fix_ef_w[order]
+        self.lb = np.concatenate((cals.to_work(cal_t, net.es_min[order]), cals.to_work(cal_t, net.ef_min[order])))
+        self.ls_max = cals.to_work(cal_t, net.ls_max[order])
+        self.lf_max = cals.to_work(cal_t, net.lf_max[order])
+        ep, eq = pos[self.e_pred], pos[self.e_succ]
+
+        # Forward pass: ties grouped by successor level, reading the predecessor's date; backward: by
+        # predecessor level, reading the successor's. src_start is the side of the date read, which
+        # decides how a working-time value maps back to the clock across calendars.
+        self.fwd = self._group(eq, eq + m * self.to_finish, ep + m * self.from_finish, ep, eq, ~self.from_finish)
+        self.bwd = self._group(ep, ep + m * self.from_finish, eq + m * self.to_finish, ep, eq, ~self.to_finish)
+
+    def _group(self, level_pos, dst, src, ep, eq, src_start) -> dict:
+        ptr = self.ptr
+        grp = np.lexsort((dst, level_pos))
+        e_ptr = np.searchsorted(level_pos[grp], ptr)
+        dst = dst[grp]
+        seg = np.flatnonzero(np.concatenate(([True], dst[1:] != dst[:-1]))) if len(dst) else np.zeros(0, np.int64)
+        cross = self.cross[grp]
+        c = np.concatenate(([0], np.cumsum(cross)))
+        return {
+            "ptr": e_ptr.tolist(),
+            "seg_ptr": np.searchsorted(seg, e_ptr).tolist(),
+            "seg": seg,
+            "dst": dst[seg],
+            "src": src[grp],
+            "lag": self.e_lag[grp],
+            "pcal": self.cal_t[ep[grp]],
+            "scal": self.cal_t[eq[grp]],
+            "src_start": src_start[grp],
+            "cross": cross,
+            "has_cross": (c[e_ptr[1:]] > c[e_ptr[:-1]]).tolist(),   # level has a tie between calendars
+        }
+
+    def forward(self, dur=None):
+        """Early [start | finish] in working time."""
+        m, ptr, cals, g = self.m, self.ptr, self.calendars, self.fwd
+        dur = self.dur if dur is None else dur
+        lead = np.shape(dur)[:-1]
+        esef = np.full(lead + (2 * m,), np.nan)
+        lb = np.broadcast_to(self.lb, lead + (2 * m,)).copy()
+        g_ptr, s_ptr, seg, dst = g["ptr"], g["seg_ptr"], g["seg"], g["dst"]
+        src, lag, cross, has_cross = g["src"], g["lag"], g["cross"], g["has_cross"]
+        for L in range(len(ptr) - 1):
+            a, b = ptr[L], ptr[L + 1]
+            e0, e1 = g_ptr[L], g_ptr[L + 1]
+            if e1 > e0:
+                val = esef[..., src[e0:e1]] + lag[e0:e1]
+                if has_cross[L]:
+                    x = np.flatnonzero(cross[e0:e1])
+                    xe = x + e0
+                    val[..., x] = cals.to_work(g["scal"][xe], cals.from_work(g["pcal"][xe], val[..., x],
+                                                                             start=g["src_start"][xe]))
+                s0, s1 = s_ptr[L], s_ptr[L + 1]
+                t = dst[s0:s1]
+                lb[..., t] = np.maximum(lb[..., t], np.maximum.reduceat(val, seg[s0:s1] - e0, axis=-1))
+            d = dur[..., a:b]
+            start = np.maximum(lb[..., a:b], lb[..., m + a:m + b] - d)
+            if self.special_level[L]:
+                force = self.es_force[a:b]
+                start = np.where(np.isnan(force), start, force)
+                force = self.ef_force[a:b]
+                start = np.where(np.isnan(force), start, force - d)
+                fx = self.fixed_t[a:b]
+                finish = np.where(fx, self.fix_ef_t[a:b], start) + d
+                start = np.where(fx, self.fix_es_t[a:b], start)
+            else:
+                finish = start + d
+            esef[..., a:b] = start
+            esef[..., m + a:m + b] = finish
+        return esef
+
+    def finish_work(self, project_finish):
+        """Clock project finish (scalar or one per iteration) as working time on each position's calendar."""
+        pf = np.asarray(project_finish, dtype=np.float64)
+        ucal, inv = np.unique(self.cal_t, return_inverse=True)
+        w = self.calendars.to_work(ucal, np.broadcast_to(pf[..., None], pf.shape + ucal.shape))
+        return w[..., inv]
+
+    def backward(self, project_finish, dur=None):
+        """Late [start | finish] in working time against a clock project finish."""
+        m, ptr, cals, g = self.m, self.ptr, self.calendars, self.bwd
+        dur = self.dur if dur is None else dur
+        lead = np.shape(dur)[:-1]
+        lslf = np.full(lead + (2 * m,), np.nan)
+        pf_w = self.finish_work(project_finish)
+        ub = np.concatenate((np.broadcast_to(self.ls_max, lead + (m,)),
+                             np.minimum(np.broadcast_to(pf_w, lead + (m,)), self.lf_max)), axis=-1)
+        g_ptr, s_ptr, seg, dst = g["ptr"], g["seg_ptr"], g["seg"], g["dst"]
+        src, lag, cross, has_cross = g["src"], g["lag"], g["cross"], g["has_cross"]
+        for L in range(len(ptr) - 2, -1, -1):
+            a, b = ptr[L], ptr[L + 1]
+            e0, e1 = g_ptr[L], g_ptr[L + 1]
+            if e1 > e0:
+                base = lslf[..., src[e0:e1]]
+                if has_cross[L]:
+                    x = np.flatnonzero(cross[e0:e1])
+                    xe = x + e0
+                    base[..., x] = cals.to_work(g["pcal"][xe], cals.from_work(g["scal"][xe], base[..., x],
+                                                                              start=g["src_start"][xe]))
+                s0, s1 = s_ptr[L], s_ptr[L + 1]
+                t = dst[s0:s1]
+                ub[..., t] = np.minimum(ub[..., t], np.minimum.reduceat(base - lag[e0:e1], seg[s0:s1] - e0, axis=-1))
+            d = dur[..., a:b]
+            finish = np.minimum(ub[..., m + a:m + b], ub[..., a:b] + d)
+            lslf[..., m + a:m + b] = finish
+            lslf[..., a:b] = finish - d
+        return lslf
+
+
+def pass_plan(net: CpmNetwork) -> PassPlan:
+    """PassPlan of a network, built on first use and kept on the network."""
+    plan = getattr(net, "_plan", None)
+    if plan is None:
+        plan = net._plan = PassPlan(net)
+    return plan
+
+
+def run_cpm(net: CpmNetwork) -> CpmResult:
+    """Forward and backward pass over the levels of a built network.
+
+    Dates are carried as working time on each activity's own calendar, so durations and same-
+    calendar lags are plain additions; ties between calendars convert through clock time. Nodes
+    are renumbered into topological order so every level is a contiguous slice, and early
+    start/finish share one array of length 2m ([ES | EF]) as do the bounds, so each tie reads its
+    driving date with one gather and each level applies its bounds with one reduceat.
+    """
+    t0 = time.perf_counter()
+    n = net.n
+    cals = net.calendars
+    order = net.order
+    m = len(order)
+    cal = net.cal
+    plan = pass_plan(net)
+    done, fixed = plan.done, plan.fixed
+
+    esef = plan.forward()
+    es_w = np.full(n, np.nan)
+    ef_w = np.full(n, np.nan)
+    es_w[order], ef_w[order] = esef[:m], esef[m:]
+    es, ef = _to_clock(net, es_w, ef_w)
+    es = np.where(fixed, plan.fix_es, es)
+    ef = np.where(done, plan.fix_ef, ef)
+
+    live_ef = ef[net.in_network & ~done]
+    project_finish = float(np.nanmax(live_ef)) if live_ef.size else 0.0
+    if net.must_finish == net.must_finish:
+        project_finish = net.must_finish
+
+    lslf = plan.backward(project_finish)
+    ls_w = np.full(n, np.nan)
+    lf_w = np.full(n, np.nan)
+    ls_w[order], lf_w[order] = lslf[:m], lslf[m:]
+    ls, lf = _to_clock(net, ls_w, lf_w)
+    ls = np.where(done, es, ls)
+    lf = np.where(done, ef, lf)
+
+    out = done | ~net.in_network
+    total_float = np.where(out, np.nan, lf_w - ef_w)
+
+    # Free float: slack on the tightest outgoing tie, in the predecessor's working time (open
+    # ends float to the project finish).
+    free_float = cals.to_work(cal, np.full(n, project_finish)) - ef_w
+    if len(plan.e_pred):
+        p, q = plan.e_pred, plan.e_succ
+        from_finish, to_finish, cross = plan.from_finish, plan.to_finish, plan.cross
+        bound = np.where(from_finish, ef_w[p], es_w[p]) + plan.e_lag
+        target = np.where(to_finish, ef_w[q], es_w[q])
+        if cross.any():
+            x = np.flatnonzero(cross)
+            target[x] = cals.to_work(cal[p[x]], cals.from_work(cal[q[x]], target[x], start=~to_finish[x]))
+        has_succ = np.zeros(n, dtype=bool)
+        has_succ[p] = True
+        ff = np.full(n, np.inf)
+        np.minimum.at(ff, p, target - bound)
+        free_float = np.where(has_succ, ff, free_float)
+    free_float = np.where(out, np.nan, np.maximum(free_float, 0.0))
+
+    return CpmResult(net, es, ef, ls, lf, total_float, free_float, project_finish,
+                     time.perf_counter() - t0, work=(es_w, ef_w, ls_w, lf_w))
+
+
+def _to_clock(net: CpmNetwork, start_w, finish_w):
+    """Working-time start/finish to clock hours: starts at the next working moment, finishes at
+    the end of the last working minute. Zero-duration activities take one instant (finish
+    milestones the finish side, everything else the start side)."""
+    cals, cal = net.calendars, net.cal
+    start = cals.from_work(cal, start_w, start=True)
+    finish = cals.from_work(cal, finish_w, start=False)
+    zero = net.dur <= 0
+    fin_side = zero & net.finish_mile
+    start = np.where(fin_side, cals.from_work(cal, start_w, start=False), start)
+    finish = np.where(zero & ~fin_side, start, finish)
+    return start, finish
+
+
+def compute_cpm(parsed: ParsedXer, proj_id: str | None = None) -> CpmResult:
+    """CPM result for a parsed schedule, memoised on the parse (shared by all endpoints)."""
+    def build(p):
+        return run_cpm(build_network(p, proj_id=proj_id))
+    return parsed.memo(f"cpm:{proj_id or ''}", build)
@@ -0,0 +1,211 @@
+"""
+Schedule engine: version diff between two parsed XERs (baseline vs update, v1 vs v2).
+
+Activities are hash-joined on task_code (task_id changes between P6 exports; blank codes fall
+back to task_id) and relationships on their (predecessor, successor) codes, so the diff is one
+pass over each side's TASK and TASKPRED regardless of schedule size. Reports added / removed
+activities, duration changes, logic changes (added, removed, retyped, lag), constraint changes
+and float erosion, as JSON (to_dict) or as a compact text block for review prompts (delta_block).
+"""
+from __future__ import annotations
+
+from schedule_agent_web.scheduling.calendars import DEFAULT_DAY_HOURS, calendar_day_hours
+from schedule_agent_web.scheduling.cpm import rel_type_name
+from schedule_agent_web.scheduling.xer_parser import ParsedXer
+
+
+class _Side:
+    """Column views of one schedule keyed by activity code."""
+
+    def __init__(self, parsed: ParsedXer):
+        tasks = parsed.get("TASK")
+        self.tasks = tasks
+        self.rows: dict[str, int] = {}
+        self.key_of: dict[str, str] = {}      # task_id -> join key
+        self.duplicates = 0
+        self.rels: dict[tuple[str, str], tuple[str, float]] = {}   # (pred, succ) -> (FS/SS/FF/SF, lag hours)
+        if not tasks:
+            self.hours: dict[str, float] = {}
+            self.default_hours = DEFAULT_DAY_HOURS
+            return
+        for i, (tid, code) in enumerate(zip(tasks.texts("task_id"), tasks.texts("task_code"))):
+            key = code or tid
+            self.key_of[tid] = key
+            if key in self.rows:
+                self.duplicates += 1
+                continue
+            self.rows[key] = i
+        self.names = tasks.texts("task_name")
+        self.cal = tasks.texts("clndr_id")
+        self.dur = tasks.floats("target_drtn_hr_cnt")
+        self.tf = tasks.floats("total_float_hr_cnt")
+        self.cstr = list(zip(tasks.texts("cstr_type"), tasks.texts("cstr_date"),
+                             tasks.texts("cstr_type2"), tasks.texts("cstr_date2")))
+        self.hours = calendar_day_hours(parsed) if parsed.get("CALENDAR") else {}
+        self.default_hours = self.hours.get("") or DEFAULT_DAY_HOURS
+        preds = parsed.get("TASKPRED")
+        if preds:
+            key_of = self.key_of
+            types = {pt: rel_type_name(pt) for pt in set(preds.texts("pred_type"))}
+            for tid, pid, pt, lag in zip(preds.texts("task_id"), preds.texts("pred_task_id"),
+                                         preds.texts("pred_type"), preds.floats("lag_hr_cnt")):
+                succ, pred = key_of.get(tid), key_of.get(pid)
+                if succ is None or pred is None:
+                    continue
+                self.rels[(pred, succ)] = (types[pt], 0.0 if lag != lag else lag)
+
+    def days(self, hours: float, i: int) -> float | None:
+        if hours != hours:
+            return None
+        return round(hours / (self.hours.get(self.cal[i], self.default_hours) or self.default_hours), 1)
+
+    def constraint(self, i: int) -> str:
+        t1, d1, t2, d2 = self.cstr[i]
+        parts = [f"{t} {d[:10]}".strip() for t, d in ((t1, d1), (t2, d2)) if t]
+        return " + ".join(parts) or "none"
+
+
+class ScheduleDiff:
+    """Differences between two versions of a schedule ("old" -> "new")."""
+
+    def __init__(self):
+        self.old_count = 0
+        self.new_count = 0
+        self.duplicate_codes = 0
+        self.added: list[dict] = []
+        self.removed: list[dict] = []
+        self.duration_changes: list[dict] = []
+        self.logic_added: list[dict] = []
+        self.logic_removed: list[dict] = []
+        self.logic_retyped: list[dict] = []
+        self.lag_changes: list[dict] = []
+        self.constraint_changes: list[dict] = []
+        self.float_erosion: list[dict] = []   # most eroded first
+        self.newly_negative = 0
+
+    def summary(self) -> dict:
+        return {
+            "oldActivities": self.old_count,
+            "newActivities": self.new_count,
+            "added": len(self.added),
+            "removed": len(self.removed),
+            "durationChanges": len(self.duration_changes),
+            "logicAdded": len(self.logic_added),
+            "logicRemoved": len(self.logic_removed),
+            "logicRetyped": len(self.logic_retyped),
+            "lagChanges": len(self.lag_changes),
+            "constraintChanges": len(self.constraint_changes),
+            "floatEroded": len(self.float_erosion),
+            "newlyNegativeFloat": self.newly_negative,
+            "duplicateCodes": self.duplicate_codes,
+        }
+
+    def to_dict(self, limit: int | None = None) -> dict:
+        end = limit if limit is not None and limit >= 0 else None
+        return {
+            "summary": self.summary(),
+            "added": self.added[:end],
+            "removed": self.removed[:end],
+            "durationChanges": self.duration_changes[:end],
+            "logic": {
+                "added": self.logic_added[:end],
+                "removed": self.logic_removed[:end],
+                "retyped": self.logic_retyped[:end],
+                "lagChanges": self.lag_changes[:end],
+            },
+            "constraintChanges": self.constraint_changes[:end],
+            "floatErosion": self.float_erosion[:end],
+        }
+
+    def delta_block(self, from_label: str = "previous", to_label: str = "current", limit: int = 25) -> str:
+        """Compact text of the changes for an LLM prompt (each section capped at limit lines)."""
+        s = self.summary()
+        parts = [
+            f"## Schedule Changes {from_label} -> {to_label} (deterministic diff)",
+            f"  Activities {s['oldActivities']} -> {s['newActivities']}: +{s['added']} added, -{s['removed']} removed, "
+            f"{s['durationChanges']} duration changes, {s['constraintChanges']} constraint changes",
+            f"  Logic: +{s['logicAdded']} added, -{s['logicRemoved']} removed, {s['logicRetyped']} retyped, "
+            f"{s['lagChanges']} lag changes",
+            f"  Float: {s['floatEroded']} activities lost float, {s['newlyNegativeFloat']} newly negative",
+        ]
+
+        def section(title, items, fmt):
+            if not items:
+                return
+            more = f" (showing {limit})" if len(items) > limit else ""
+            parts.append(f"\n### {title} ({len(items)}){more}")
+            parts.extend("  " + fmt(x) for x in items[:limit])
+
+        section("Added Activities", self.added, lambda a: f"+ {a['task_code']}  {a['task_name']}")
+        section("Removed Activities", self.removed, lambda a: f"- {a['task_code']}  {a['task_name']}")
+        section("Duration Changes", self.duration_changes,
+                lambda a: f"{a['task_code']}  {a['task_name']}: {a['old_days']}d -> {a['new_days']}d")
+        section("Relationships Added", self.logic_added,
+                lambda r: f"+ {r['pred']} -> {r['succ']} {r['type']} lag {r['lag_days']}d")
+        section("Relationships Removed", self.logic_removed,
+                lambda r: f"- {r['pred']} -> {r['succ']} {r['type']} lag {r['lag_days']}d")
+        section("Relationships Retyped", self.logic_retyped,
+                lambda r: f"{r['pred']} -> {r['succ']}: {r['old_type']} -> {r['new_type']}")
+        section("Lag Changes", self.lag_changes,
+                lambda r: f"{r['pred']} -> {r['succ']}: {r['old_lag_days']}d -> {r['new_lag_days']}d")
+        section("Constraint Changes", self.constraint_changes,
+                lambda a: f"{a['task_code']}  {a['task_name']}: {a['old']} -> {a['new']}")
+        section("Float Erosion", self.float_erosion,
+                lambda a: f"{a['task_code']}  {a['task_name']}: {a['old_float_days']}d -> {a['new_float_days']}d")
+        return "\n".join(parts)
+
+
+def diff_schedules(old: ParsedXer, new: ParsedXer) -> ScheduleDiff:
+    """Compare two parsed schedules; linear in the number of activities and relationships."""
+    a, b = _Side(old), _Side(new)
+    d = ScheduleDiff()
+    d.old_count, d.new_count = len(a.rows), len(b.rows)
+    d.duplicate_codes = a.duplicates + b.duplicates
+
+    for key, j in b.rows.items():
+        i = a.rows.get(key)
+        if i is None:
+            d.added.append({"task_code": key, "task_name": b.names[j]})
+            continue
+        # Compare raw hours first; only changed activities pay for the calendar lookups.
+        old_hrs, new_hrs = a.dur[i], b.dur[j]
+        if old_hrs != new_hrs and (old_hrs == old_hrs or new_hrs == new_hrs):
+            old_dur, new_dur = a.days(old_hrs, i), b.days(new_hrs, j)
+            if old_dur != new_dur:
+                d.duration_changes.append({"task_code": key, "task_name": b.names[j], "old_days": old_dur,
+                                           "new_days": new_dur})
+        if a.cstr[i] != b.cstr[j]:
+            old_c, new_c = a.constraint(i), b.constraint(j)
+            if old_c != new_c:
+                d.constraint_changes.append({"task_code": key, "task_name": b.names[j], "old": old_c,
+                                             "new": new_c})
+        if b.tf[j] < a.tf[i]:
+            old_tf, new_tf = a.days(a.tf[i], i), b.days(b.tf[j], j)
+            if new_tf < old_tf:
+                d.float_erosion.append({"task_code": key, "task_name": b.names[j], "old_float_days": old_tf,
+                                        "new_float_days": new_tf, "delta_days": round(new_tf - old_tf, 1)})
+                if new_tf < 0 <= old_tf:
+                    d.newly_negative += 1
+    for key, i in a.rows.items():
+        if key not in b.rows:
+            d.removed.append({"task_code": key, "task_name": a.names[i]})
+    d.float_erosion.sort(key=lambda x: x["delta_days"])
+
+    def lag_days(side: _Side, pred: str, lag: float) -> float:
+        i = side.rows.get(pred)
+        return round(lag / DEFAULT_DAY_HOURS, 1) if i is None else side.days(lag, i)
+
+    for (pred, succ), (rt, lag) in b.rels.items():
+        prev = a.rels.get((pred, succ))
+        if prev is None:
+            d.logic_added.append({"pred": pred, "succ": succ, "type": rt, "lag_days": lag_days(b, pred, lag)})
+            continue
+        if prev[0] != rt:
+            d.logic_retyped.append({"pred": pred, "succ": succ, "old_type": prev[0], "new_type": rt})
+        if prev[1] != lag:
+            d.lag_changes.append({"pred": pred, "succ": succ, "old_lag_days": lag_days(a, pred, prev[1]),
+                                  "new_lag_days": lag_days(b, pred, lag)})
+    for (pred, succ), (rt, lag) in a.rels.items():
+        if (pred, succ) not in b.rels:
+            d.logic_removed.append({"pred": pred, "succ": succ, "type": rt, "lag_days": lag_days(a, pred, lag)})
+    return d
@@ -0,0 +1,416 @@
+"""
+Schedule engine: earned value from the XER's cost fields.
+
+Per activity: budget (BAC) from TASKRSRC.target_cost (+ PROJCOST expenses), actual cost from
+act_reg_cost + act_ot_cost (else budget - remaining for started work), remaining cost (ETC) from
+remain_cost, and earned value as budget x percent complete (per complete_pct_type; physical %
+when the type is missing). Time-phasing reuses the resource spreader on each activity's calendar:
+
+  PV         budget over the planned (target) dates
+  EV / AC    earned value and actual cost over the actual dates, up to the data date
+  forecast   actual cost plus ETC over the remaining dates (ends at the bottom-up EAC)
+
+Daily amounts are rolled up the PROJWBS tree in one bottom-up pass (one vectorised add per tree
+level, deepest first) with node 0 as the project total, then accumulated with cumsum and sampled
+per day / week / month. Metrics per node at the data date: SV, CV, SPI, CPI, EAC (CPI-based and
+bottom-up), VAC, TCPI and earned schedule (ES from the daily PV curve, SV(t), SPI(t), IEAC(t)).
+compare_evm() lines up the curves and metrics of several update versions on one date axis.
+"""
+from __future__ import annotations
+
+import time
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from schedule_agent_web.scheduling.calendars import CalendarSet
+from schedule_agent_web.scheduling.cpm import _data_date
+from schedule_agent_web.scheduling.resources import (
+    PERIODS,
+    _cpm_early_dates,
+    _first,
+    _hours,
+    period_bins,
+    spread,
+)
+from schedule_agent_web.scheduling.xer_parser import ParsedXer, parse_p6_date
+
+CURVES = ("pv", "ev", "ac", "forecast")
+
+
+def _ratio(a: float, b: float) -> float | None:
+    return round(a / b, 3) if b and abs(b) > 1e-9 else None
+
+
+def _money(v: float) -> float:
+    return round(float(v), 2)
+
+
+class EvmResult:
+    """Cumulative cost curves and data-date metrics for the project (node 0) and every WBS node."""
+
+    def __init__(self, data_date: datetime, first: int, period: str, labels: list[str], nodes: list[dict],
+                 curves: dict, values: dict, schedule: dict, activities: int, elapsed: float):
+        self.data_date = data_date
+        self.first = first
+        self.period = period
+        self.labels = labels
+        self.nodes = nodes               # wbs_id, code, name, parent_wbs_id, depth ("" for the project)
+        self.curves = curves             # pv / ev / ac / forecast -> (nodes, periods), cumulative
+        self.values = values             # bac / pv / ev / ac / etc -> (nodes,) at the data date
+        self.schedule = schedule         # start / es / at / pd -> (nodes,) days (NaN when unknown)
+        self.activities = activities
+        self.elapsed = elapsed
+        self._index = {n["wbs_id"]: k for k, n in enumerate(nodes)}
+
+    def node_index(self, wbs_id: str = "") -> int | None:
+        return self._index.get(wbs_id or "")
+
+    def _day(self, offset: float) -> str:
+        if offset != offset:
+            return ""
+        return (self.data_date.date() + timedelta(days=float(self.first + offset))).isoformat()
+
+    def metrics(self, k: int = 0) -> dict:
+        v = {name: float(arr[k]) for name, arr in self.values.items()}
+        bac, pv, ev, ac, etc = v["bac"], v["pv"], v["ev"], v["ac"], v["etc"]
+        cpi = _ratio(ev, ac)
+        eac = ac + (bac - ev) / cpi if cpi else None
+        sched = {name: float(arr[k]) for name, arr in self.schedule.items()}
+        start, es, at, pd = sched["start"], sched["es"], sched["at"], sched["pd"]
+        spi_t = _ratio(es, at) if es == es and at == at and at > 0 else None
+        ieac_t = pd / spi_t if spi_t and pd == pd else None
+        node = self.nodes[k]
+        return {
+            "wbs_id": node["wbs_id"],
+            "code": node["code"],
+            "name": node["name"],
+            "bac": _money(bac),
+            "pv": _money(pv),
+            "ev": _money(ev),
+            "ac": _money(ac),
+            "etc": _money(etc),
+            "sv": _money(ev - pv),
+            "cv": _money(ev - ac),
+            "spi": _ratio(ev, pv),
+            "cpi": cpi,
+            "eac": _money(eac) if eac is not None else None,
+            "eacBottomUp": _money(ac + etc),
+            "vac": _money(bac - eac) if eac is not None else None,
+            "tcpi": _ratio(bac - ev, bac - ac),
+            "percentComplete": round(100.0 * ev / bac, 1) if bac else None,
+            "percentSpent": round(100.0 * ac / bac, 1) if bac else None,
+            "earnedSchedule": {
+                "start": self._day(start),
+                "esDays": round(es, 1) if es == es else None,
+                "atDays": round(at, 1) if at == at else None,
+                "svtDays": round(es - at, 1) if es == es and at == at else None,
+                "spit": spi_t,
+                "plannedFinish": self._day(start + pd) if pd == pd else "",
+                "forecastFinish": self._day(start + ieac_t) if ieac_t is not None else "",
+            },
+        }
+
+    def curve(self, k: int = 0) -> dict:
+        return {"period": self.period, "labels": self.labels,
+                **{name: np.round(self.curves[name][k], 2).tolist() for name in CURVES}}
+
+    def wbs_rows(self, limit: int = 200) -> list[dict]:
+        """Metrics of the WBS nodes, largest budget first."""
+        order = np.argsort(-self.values["bac"][1:], kind="stable") + 1
+        return [{**self.metrics(int(k)), "parent_wbs_id": self.nodes[k]["parent_wbs_id"],
+                 "depth": self.nodes[k]["depth"]} for k in order[:limit]]
+
+    def summary(self) -> dict:
+        return {
+            "dataDate": self.data_date.strftime("%Y-%m-%d %H:%M"),
+            "activities": self.activities,
+            "wbsNodes": len(self.nodes) - 1,
+            "elapsedMs": round(self.elapsed * 1000, 1),
+            **self.metrics(0),
+        }
+
+    def to_dict(self, wbs_id: str = "", limit: int = 200) -> dict:
+        k = self.node_index(wbs_id)
+        if k is None:
+            raise KeyError(wbs_id)
+        return {
+            "summary": self.summary(),
+            "node": self.metrics(k) if k else None,
+            "curve": self.curve(k),
+            "wbs": self.wbs_rows(limit),
+        }
+
+
+def _wbs_tree(parsed: ParsedXer, proj_id: str | None):
+    """Nodes (project total first), parent index per node and node indexes grouped by depth."""
+    nodes = [{"wbs_id": "", "code": "", "name": "Project total", "parent_wbs_id": "", "depth": 0}]
+    wbs = parsed.get("PROJWBS")
+    if not wbs:
+        return nodes, np.zeros(1, dtype=np.int64), []
+    ids = wbs.texts("wbs_id")
+    keep = range(len(ids))
+    if proj_id and wbs.has("proj_id"):
+        pids = wbs.texts("proj_id")
+        keep = [i for i in keep if pids[i] == proj_id]
+    short = wbs.texts("wbs_short_name") if wbs.has("wbs_short_name") else [""] * len(ids)
+    names = wbs.texts("wbs_name") if wbs.has("wbs_name") else [""] * len(ids)
+    parents = wbs.texts("parent_wbs_id") if wbs.has("parent_wbs_id") else [""] * len(ids)
+    index = {}
+    for i in keep:
+        index[ids[i]] = len(nodes)
+        nodes.append({"wbs_id": ids[i], "code": short[i], "name": names[i], "parent_wbs_id": parents[i], "depth": 0})
+    parent = np.zeros(len(nodes), dtype=np.int64)
+    for k in range(1, len(nodes)):
+        parent[k] = index.get(nodes[k]["parent_wbs_id"], 0)
+    # Depth by walking up; a cycle in bad data is broken by re-parenting where it closes.
+    depth = np.zeros(len(nodes), dtype=np.int64)
+    for k in range(1, len(nodes)):
+        while True:
+            path, seen, j = [], set(), k
+            while j and not depth[j] and j not in seen:
+                seen.add(j)
+                path.append(j)
+                j = parent[j]
+            if j not in seen:
+                break
+            parent[j] = 0
+        for step, node in enumerate(reversed(path)):
+            depth[node] = depth[j] + step + 1
+    for k in range(1, len(nodes)):
+        nodes[k]["depth"] = int(depth[k])
+    levels = [np.flatnonzero(depth == d) for d in range(int(depth.max()), 0, -1)]
+    return nodes, parent, levels
+
+
+def _rollup(mat, parent, levels):
+    """Add every node's rows into its parent's, deepest level first (in place)."""
+    for nodes in levels:
+        par = parent[nodes]
+        order = np.argsort(par, kind="stable")
+        nodes, par = nodes[order], par[order]
+        heads = np.flatnonzero(np.r_[True, par[1:] != par[:-1]])
+        mat[par[heads]] += np.add.reduceat(mat[nodes], heads, axis=0)
+    return mat
+
+
+def _percent_complete(tasks, rows, costs_started):
+    """Fraction complete per TASK row per its complete_pct_type."""
+    n = len(rows)
+
+    def f(field):
+        return np.asarray(tasks.floats(field), dtype=np.float64)[rows] if tasks.has(field) else np.full(n, np.nan)
+
+    phys = f("phys_complete_pct") / 100.0
+    target, remain = f("target_drtn_hr_cnt"), f("remain_drtn_hr_cnt")
+    drtn = np.where(target > 0, 1.0 - remain / np.where(target > 0, target, 1.0), np.nan)
+    kind = tasks.texts("complete_pct_type") if tasks.has("complete_pct_type") else None
+    if kind is None:
+        pct = _first(phys, drtn)
+    else:
+        use_drtn = np.fromiter((kind[r] == "CP_Drtn" for r in rows), bool, n)
+        use_units = np.fromiter((kind[r] == "CP_Units" for r in rows), bool, n)
+        pct = np.where(use_drtn, _first(drtn, phys), np.where(use_units, _first(costs_started, phys), _first(phys, drtn)))
+    status = tasks.texts("status_code")
+    done = np.fromiter((status[r] == "TK_Complete" for r in rows), bool, n)
+    fresh = np.fromiter((status[r] == "TK_NotStart" for r in rows), bool, n)
+    pct = np.clip(np.nan_to_num(pct, nan=0.0), 0.0, 1.0)
+    pct[done] = 1.0
+    pct[fresh] = 0.0
+    return pct
+
+
+def build_evm(parsed: ParsedXer, proj_id: str | None = None, period: str = "week", cpm=None) -> EvmResult | None:
+    """Earned value curves and metrics for one project (or the whole file); None without TASK."""
+    if np is None:
+        raise RuntimeError("numpy is required for earned value (pip install numpy)")
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+    t0 = time.perf_counter()
+    tasks = parsed.get("TASK")
+    if not tasks:
+        return None
+    dd, _ = _data_date(parsed, proj_id)
+    if dd is None:
+        starts = [d for d in (parse_p6_date(s) for s in tasks.texts("target_start_date")) if d]
+        dd = min(starts) if starts else datetime(2000, 1, 1)
+    all_ids = tasks.texts("task_id")
+    if proj_id and tasks.has("proj_id"):
+        rows = np.asarray([i for i, p in enumerate(tasks.texts("proj_id")) if p == proj_id], dtype=np.int64)
+    else:
+        rows = np.arange(len(all_ids), dtype=np.int64)
+    n = len(rows)
+    pos = np.full(len(all_ids), -1, dtype=np.int64)
+    pos[rows] = np.arange(n)
+    task_pos = dict(zip(all_ids, pos.tolist()))
+
+    # Costs per activity from assignments and expenses.
+    bac = np.zeros(n)
+    act = np.zeros(n)
+    etc = np.zeros(n)
+    has_actual = np.zeros(n, dtype=bool)
+    for table, actual_fields in (("TASKRSRC", ("act_reg_cost", "act_ot_cost")), ("PROJCOST", ("act_cost",))):
+        tab = parsed.get(table)
+        if not tab:
+            continue
+        k = np.fromiter((task_pos.get(t, -1) for t in tab.texts("task_id")), np.int64, len(tab))
+        ok = k >= 0
+
+        def col(field):
+            return np.nan_to_num(np.asarray(tab.floats(field), dtype=np.float64)[ok], nan=0.0) if tab.has(field) else None
+
+        target, remain = col("target_cost"), col("remain_cost")
+        if target is not None:
+            bac += np.bincount(k[ok], weights=target, minlength=n)
+        if remain is not None:
+            etc += np.bincount(k[ok], weights=remain, minlength=n)
+        present = [c for c in (col(f) for f in actual_fields) if c is not None]
+        if present:
+            act += np.bincount(k[ok], weights=sum(present), minlength=n)
+            has_actual[np.unique(k[ok])] = True
+        elif target is not None:
+            spent = target - (remain if remain is not None else 0.0)
+            act += np.bincount(k[ok], weights=np.maximum(spent, 0.0), minlength=n)
+
+    status = tasks.texts("status_code")
+    started = np.fromiter((status[r] in ("TK_Active", "TK_Complete") for r in rows), bool, n)
+    complete = np.fromiter((status[r] == "TK_Complete" for r in rows), bool, n)
+    act[~started & ~has_actual] = 0.0
+    etc[complete] = 0.0
+    spent_share = np.where(bac > 0, act / np.where(bac > 0, bac, 1.0), np.nan)
+    ev = bac * _percent_complete(tasks, rows, spent_share)
+
+    # Windows (clock hours from the data date) on each activity's calendar.
+    hours = {}
+
+    def t_hours(field):
+        if field not in hours:
+            hours[field] = _hours(tasks.texts(field), dd)[rows] if tasks.has(field) else np.full(n, np.nan)
+        return hours[field]
+
+    plan_s, plan_f = t_hours("target_start_date"), t_hours("target_end_date")
+    act_s = t_hours("act_start_date")
+    act_f = _first(t_hours("act_end_date"), np.where(started, np.maximum(act_s, 0.0), np.nan))
+    act_f = np.minimum(act_f, np.maximum(act_s, 0.0))      # actuals stop at the data date
+    rem_s = _first(t_hours("restart_date"), t_hours("early_start_date"))
+    rem_f = _first(t_hours("reend_date"), t_hours("early_end_date"))
+    need = (etc != 0) & (np.isnan(rem_s) | np.isnan(rem_f))
+    if need.any():
+        es, ef = _cpm_early_dates(parsed, rows, proj_id, cpm)
+        rem_s, rem_f = _first(rem_s, es, plan_s), _first(rem_f, ef, plan_f)
+    rem_s = np.maximum(rem_s, 0.0)
+    rem_f = np.maximum(rem_f, rem_s)
+
+    net = cpm.network if cpm is not None else None
+    cals = net.calendars if net is not None and isinstance(net.calendars, CalendarSet) else None
+    if cals is None:
+        cals = CalendarSet.from_parsed(parsed, dd)
+    clndr = tasks.texts("clndr_id")
+    cal = np.fromiter((cals.ids.get(clndr[r], cals.default_index) for r in rows), np.int64, n)
+
+    nodes, parent, levels = _wbs_tree(parsed, proj_id)
+    wbs_index = {node["wbs_id"]: k for k, node in enumerate(nodes) if k}
+    wbs_col = tasks.texts("wbs_id")
+    node = np.fromiter((wbs_index.get(wbs_col[r], 0) for r in rows), np.int64, n)
+    nn = len(nodes)
+
+    # Data-date values per node.
+    ws, wf = cals.to_work(cal, plan_s), cals.to_work(cal, plan_f)
+    w0 = cals.to_work(cal, np.zeros(n))
+    span = wf - ws
+    frac = np.where(span > 1e-9, (w0 - ws) / np.where(span > 1e-9, span, 1.0), (plan_s <= 0).astype(float))
+    frac = np.where(np.isnan(plan_s) | np.isnan(plan_f), 0.0, np.clip(frac, 0.0, 1.0))
+    values = {}
+    for name, amount in (("bac", bac), ("pv", bac * frac), ("ev", ev), ("ac", act), ("etc", etc)):
+        values[name] = _rollup(np.bincount(node, weights=amount, minlength=nn).astype(np.float64), parent, levels)
+
+    # Daily curves, rolled up, accumulated and sampled at period ends.
+    windows = {"pv": (plan_s, plan_f, bac), "ev": (act_s, act_f, ev), "ac": (act_s, act_f, act),
+               "forecast": (rem_s, rem_f, etc)}
+    bounds = [cals.day_of(np.zeros(1))]
+    for s, f, amt in windows.values():
+        ok = np.isfinite(s) & np.isfinite(f) & (amt != 0)
+        if ok.any():
+            bounds.append(cals.day_of(np.r_[s[ok], f[ok]]))
+    days = np.concatenate(bounds)
+    first, ndays = int(days.min()), int(days.max() - days.min() + 1)
+    heads, labels = period_bins(dd.date() + timedelta(days=first), ndays, period)
+    ends = np.r_[heads[1:] - 1, ndays - 1]
+    dd_day = int(cals.day_of(np.zeros(1))[0]) - first
+    curves = {}
+    schedule = {}
+    for name, (s, f, amt) in windows.items():
+        daily = _rollup(spread(cals, cal, s, f, amt, node, nn, first, ndays), parent, levels)
+        cum = np.cumsum(daily, axis=1, out=daily)
+        if name == "pv":
+            schedule = _earned_schedule(cum, values["ev"], dd_day)
+        curves[name] = cum[:, ends]
+    curves["forecast"] += curves["ac"]
+    return EvmResult(dd, first, period, labels, nodes, curves, values, schedule, n, time.perf_counter() - t0)
+
+
+def _earned_schedule(cum_pv, ev, dd_day: int) -> dict:
+    """Earned schedule per node from the cumulative daily PV: start (first day with PV), ES (days
+    from start at which PV equals EV), AT (days from start to the data date), PD (planned days)."""
+    nn, ndays = cum_pv.shape
+    total = cum_pv[:, -1]
+    eps = 1e-9 * np.maximum(np.abs(total), 1.0)
+    live = total > eps
+    start = np.where(live, (cum_pv <= eps[:, None]).sum(axis=1), np.nan)
+    finish = np.where(live, (cum_pv < (total - eps)[:, None]).sum(axis=1) + 1, np.nan)
+    whole = (cum_pv <= (ev + eps)[:, None]).sum(axis=1)
+    c = np.minimum(whole, ndays - 1)
+    before = np.where(c > 0, cum_pv[np.arange(nn), np.maximum(c - 1, 0)], 0.0)
+    step = cum_pv[np.arange(nn), c] - before
+    part = np.where((whole < ndays) & (step > eps), (ev - before) / np.where(step > eps, step, 1.0), 0.0)
+    es = np.where(live, whole + np.clip(part, 0.0, 1.0) - start, np.nan)
+    return {"start": start, "es": es, "at": np.where(live, dd_day - start, np.nan), "pd": finish - start}
+
+
+def evm(parsed: ParsedXer, proj_id: str | None = None, period: str = "week") -> EvmResult | None:
+    """build_evm() memoised on the parse."""
+    return parsed.memo(f"evm:{proj_id or ''}:{period}", lambda p: build_evm(p, proj_id=proj_id, period=period))
+
+
+def compare_evm(results: list[tuple[str, EvmResult]], wbs_id: str = "") -> dict:
+    """Curves and metrics of several versions (label, result) on one period axis, oldest first.
+
+    Cumulative values hold at zero before a version's first period and at their last value after.
+    """
+    labels = sorted({lab for _, r in results for lab in r.labels})
+    at = {lab: i for i, lab in enumerate(labels)}
+    versions = []
+    for label, r in results:
+        k = r.node_index(wbs_id)
+        rec = {"label": label, "dataDate": r.data_date.strftime("%Y-%m-%d %H:%M"),
+               "metrics": r.metrics(k) if k is not None else None}
+        if k is not None:
+            idx = np.asarray([at[lab] for lab in r.labels], dtype=np.int64)
+            for name in CURVES:
+                full = np.zeros(len(labels))
+                full[idx] = r.curves[name][k]
+                # Forward-fill the gaps after each version's last period.
+                mark = np.zeros(len(labels), dtype=np.int64)
+                mark[idx] = idx
+                np.maximum.accumulate(mark, out=mark)
+                filled = full[mark]
+                filled[:idx[0] if len(idx) else len(labels)] = 0.0
+                rec[name] = np.round(filled, 2).tolist()
+        versions.append(rec)
+    changes = []
+    for (a_label, _), (b_label, _), a, b in zip(results, results[1:], versions, versions[1:]):
+        ma, mb = a["metrics"], b["metrics"]
+        if not ma or not mb:
+            continue
+        change = {"from": a_label, "to": b_label}
+        for key in ("bac", "pv", "ev", "ac", "spi", "cpi", "eac", "eacBottomUp"):
+            if ma[key] is not None and mb[key] is not None:
+                change[key] = round(mb[key] - ma[key], 3)
+        fa, fb = ma["earnedSchedule"]["forecastFinish"], mb["earnedSchedule"]["forecastFinish"]
+        if fa and fb:
+            change["forecastFinishDays"] = (datetime.fromisoformat(fb) - datetime.fromisoformat(fa)).days
+        changes.append(change)
+    return {"wbs_id": wbs_id, "labels": labels, "versions": versions, "changes": changes}
@@ -0,0 +1,345 @@
+"""
+Schedule engine: logic graph analytics over TASK / TASKPRED.
+
+Deterministic evidence for the review's logic flags:
+  loops            strongly connected components (iterative Tarjan)
+  redundant ties   u -> v whose constraint a longer path u -> w -> ... -> v already enforces
+  open ends        activities without predecessors / successors (start / finish milestones exempt)
+  dangling         start not driven by any FS/SS tie, or finish driving nothing through FS/FF
+  cross-WBS ties   relationships whose predecessor and successor sit in different WBS elements
+
+Redundancy uses reachability bitsets (Python ints) over the loop-free condensation in topological
+order. Target positions are processed in blocks of BLOCK_BITS so memory stays bounded on large
+networks; each block is one reverse sweep over the edges. A tie found that way is only reported once
+tie_implied() shows the path's accumulated constraint (lags plus intermediate durations, in hours)
+reaches the tie's own side of the successor at least as late as the tie does, so an SS shortcut next
+to an FS chain is redundant while an FS tie with a longer lag than the chain is not.
+"""
+from __future__ import annotations
+
+import heapq
+import time
+from collections import Counter
+
+from schedule_agent_web.scheduling.cpm import MILESTONE_TYPES, SUMMARY_TYPES, rel_type_name
+from schedule_agent_web.scheduling.xer_parser import ParsedXer
+
+BLOCK_BITS = 4096
+# Activities explored per candidate when checking a redundant tie; beyond this it is not reported.
+DOMINANCE_VISITS = 20000
+
+
+def strongly_connected(n: int, succ: list[list[int]]) -> list[int]:
+    """Tarjan SCC (iterative). Returns comp[v]; components are numbered in reverse topological
+    order, so every edge between components goes from a higher to a lower component number."""
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    comp = [-1] * n
+    stack: list[int] = []
+    counter = 0
+    ncomp = 0
+    for root in range(n):
+        if index[root] != -1:
+            continue
+        work = [(root, 0)]
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        while work:
+            v, i = work[-1]
+            out = succ[v]
+            if i < len(out):
+                work[-1] = (v, i + 1)
+                w = out[i]
+                if index[w] == -1:
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = True
+                    work.append((w, 0))
+                elif on_stack[w] and index[w] < low[v]:
+                    low[v] = index[w]
+                continue
+            work.pop()
+            if work:
+                u = work[-1][0]
+                if low[v] < low[u]:
+                    low[u] = low[v]
+            if low[v] == index[v]:
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    comp[w] = ncomp
+                    if w == v:
+                        break
+                ncomp += 1
+    return comp
+
+
+def redundant_edges(n: int, succ: list[list[int]]) -> list[tuple[int, int, int]]:
+    """(u, v, via) for every edge u -> v of a DAG whose nodes are numbered topologically
+    (every edge goes to a higher number) when v is also reachable through another successor via."""
+    out = []
+    for lo in range(0, n, BLOCK_BITS):
+        hi = min(lo + BLOCK_BITS, n)
+        reach = [0] * hi          # bits (v - lo) of block nodes reachable from each node, excluding itself
+        for u in range(hi - 1, -1, -1):
+            targets = succ[u]
+            if not targets:
+                continue
+            acc = 0
+            own = 0
+            for w in targets:
+                if w < hi:
+                    acc |= reach[w]
+                    if w >= lo:
+                        own |= 1 << (w - lo)
+            if own & acc:
+                for v in targets:
+                    if lo <= v < hi and (acc >> (v - lo)) & 1:
+                        via = next(w for w in targets if w != v and w < hi and (reach[w] >> (v - lo)) & 1)
+                        out.append((u, v, via))
+            reach[u] = acc | own
+    return out
+
+
+def tie_implied(u: int, v: int, from_finish: bool, to_finish: bool, lag: float,
+                ties: list[list[tuple[int, bool, bool, float]]], dur: list[float], pos: list[int],
+                skip: list[bool]) -> bool:
+    """True when paths from u to v, other than direct u -> v ties, force v's start (or finish, if
+    to_finish) to at least u's start (finish, if from_finish) + lag hours.
+
+    ties[w] lists (x, from_finish, to_finish, lag_hr) per relationship; dur is each activity's
+    duration in hours. Offsets relative to u's side are propagated in topological order (pos) through
+    both sides of each activity (finish = start + duration); activities flagged in skip (loop members)
+    are not crossed.
+    """
+    best: dict[int, list[float]] = {u: [-dur[u], 0.0] if from_finish else [0.0, dur[u]]}
+    heap = [(pos[u], u)]
+    queued = {u}
+    visits = 0
+    limit = pos[v]
+    while heap:
+        _, w = heapq.heappop(heap)
+        if w == v:
+            break
+        visits += 1
+        if visits > DOMINANCE_VISITS:
+            return False
+        at = best[w]
+        at[1] = max(at[1], at[0] + dur[w])
+        at[0] = max(at[0], at[1] - dur[w])
+        for x, ff, tf, lg in ties[w]:
+            if (w == u and x == v) or skip[x] or pos[x] > limit:
+                continue
+            val = at[ff] + lg
+            got = best.get(x)
+            if got is None:
+                got = best[x] = [float("-inf"), float("-inf")]
+            if val > got[tf]:
+                got[tf] = val
+            if x not in queued:
+                queued.add(x)
+                heapq.heappush(heap, (pos[x], x))
+    end = best.get(v)
+    if end is None:
+        return False
+    start, finish = end
+    finish = max(finish, start + dur[v])
+    start = max(start, finish - dur[v])
+    return (finish if to_finish else start) >= lag - 1e-6
+
+
+class LogicReport:
+    """Evidence tables from analyze_logic(); rows use task codes so they can be quoted in a review."""
+
+    def __init__(self):
+        self.activities = 0
+        self.relationships = 0
+        self.loops: list[list[str]] = []
+        self.redundant: list[dict] = []
+        self.duplicates: list[dict] = []
+        self.open_starts: list[dict] = []
+        self.open_finishes: list[dict] = []
+        self.dangling_starts: list[dict] = []
+        self.dangling_finishes: list[dict] = []
+        self.cross_wbs = 0
+        self.cross_wbs_pairs: list[dict] = []
+        self.elapsed = 0.0
+
+    def summary(self) -> dict:
+        return {
+            "activities": self.activities,
+            "relationships": self.relationships,
+            "loops": len(self.loops),
+            "loopActivities": sum(len(c) for c in self.loops),
+            "redundantTies": len(self.redundant),
+            "duplicateTies": len(self.duplicates),
+            "openStarts": len(self.open_starts),
+            "openFinishes": len(self.open_finishes),
+            "danglingStarts": len(self.dangling_starts),
+            "danglingFinishes": len(self.dangling_finishes),
+            "crossWbsTies": self.cross_wbs,
+        }
+
+    def to_dict(self, limit: int | None = None) -> dict:
+        end = limit if limit is not None and limit >= 0 else None
+        return {
+            "summary": self.summary(),
+            "loops": [c[:50] for c in self.loops[:end]],
+            "redundantTies": self.redundant[:end],
+            "duplicateTies": self.duplicates[:end],
+            "openStarts": self.open_starts[:end],
+            "openFinishes": self.open_finishes[:end],
+            "danglingStarts": self.dangling_starts[:end],
+            "danglingFinishes": self.dangling_finishes[:end],
+            "crossWbsPairs": self.cross_wbs_pairs[:end],
+        }
+
+    def evidence_block(self, limit: int = 30) -> str:
+        """Text tables for the review prompt (each capped at limit rows)."""
+        s = self.summary()
+        parts = [
+            "## Logic Evidence (computed from TASKPRED — cite these, do not re-derive)",
+            f"  {s['activities']} activities, {s['relationships']} relationships; {s['loops']} loops "
+            f"({s['loopActivities']} activities), {s['redundantTies']} redundant ties, {s['duplicateTies']} duplicate ties",
+            f"  Open ends: {s['openStarts']} without predecessor, {s['openFinishes']} without successor; "
+            f"dangling: {s['danglingStarts']} starts, {s['danglingFinishes']} finishes; {s['crossWbsTies']} cross-WBS ties",
+        ]
+
+        def table(title, items, fmt):
+            if not items:
+                return
+            more = f" (showing {limit})" if len(items) > limit else ""
+            parts.append(f"\n### {title} ({len(items)}){more}")
+            parts.extend("  " + fmt(x) for x in items[:limit])
+
+        table("Logic Loops", self.loops, lambda c: " -> ".join(c[:12]) + (" ..." if len(c) > 12 else ""))
+        table("Redundant Ties", self.redundant,
+              lambda r: f"{r['pred']} -> {r['succ']} {r['type']} lag {r['lag_hr']:g}h (implied via {r['via']})")
+        table("Duplicate Ties", self.duplicates, lambda r: f"{r['pred']} -> {r['succ']} x{r['count']}")
+        table("No Predecessor", self.open_starts, lambda a: f"{a['task_code']}  {a['task_name']}")
+        table("No Successor", self.open_finishes, lambda a: f"{a['task_code']}  {a['task_name']}")
+        table("Dangling Start (no FS/SS predecessor)", self.dangling_starts,
+              lambda a: f"{a['task_code']}  {a['task_name']}")
+        table("Dangling Finish (no FS/FF successor)", self.dangling_finishes,
+              lambda a: f"{a['task_code']}  {a['task_name']}")
+        table("Cross-WBS Tie Pairs", self.cross_wbs_pairs,
+              lambda p: f"{p['pred_wbs']} -> {p['succ_wbs']}: {p['count']} ties")
+        return "\n".join(parts)
+
+
+def analyze_logic(parsed: ParsedXer) -> LogicReport:
+    """Loops, redundant / duplicate ties, open ends, dangling logic and cross-WBS ties."""
+    t0 = time.perf_counter()
+    r = LogicReport()
+    tasks = parsed.get("TASK")
+    if not tasks:
+        return r
+    ids = tasks.texts("task_id")
+    codes = tasks.texts("task_code")
+    names = tasks.texts("task_name")
+    ttypes = tasks.texts("task_type")
+    wbs = tasks.texts("wbs_id")
+    n = len(ids)
+    r.activities = n
+    index = {tid: i for i, tid in enumerate(ids)}
+
+    def code(i: int) -> str:
+        return codes[i] or ids[i]
+
+    succ: list[list[int]] = [[] for _ in range(n)]
+    edge_type: dict[tuple[int, int], str] = {}
+    edge_lag: dict[tuple[int, int], float] = {}
+    ties: list[list[tuple[int, bool, bool, float]]] = [[] for _ in range(n)]
+    dur = [max(0.0, d) for d in tasks.floats("target_drtn_hr_cnt")]
+    pair_count: Counter = Counter()
+    start_driven = [False] * n      # has an FS/SS predecessor
+    finish_drives = [False] * n     # has an FS/FF successor
+    has_pred = [False] * n
+    has_succ = [False] * n
+    cross: Counter = Counter()
+    preds = parsed.get("TASKPRED")
+    if preds:
+        types = {pt: rel_type_name(pt) for pt in set(preds.texts("pred_type"))}
+        for tid, pid, pt, lag in zip(preds.texts("task_id"), preds.texts("pred_task_id"),
+                                     preds.texts("pred_type"), preds.floats("lag_hr_cnt")):
+            v, u = index.get(tid), index.get(pid)
+            if u is None or v is None:
+                continue
+            r.relationships += 1
+            rt = types[pt]
+            has_pred[v] = has_succ[u] = True
+            if rt in ("FS", "SS"):
+                start_driven[v] = True
+            if rt in ("FS", "FF"):
+                finish_drives[u] = True
+            if wbs[u] != wbs[v]:
+                r.cross_wbs += 1
+                cross[(wbs[u], wbs[v])] += 1
+            ties[u].append((v, rt in ("FS", "FF"), rt in ("FF", "SF"), lag))
+            pair_count[(u, v)] += 1
+            if pair_count[(u, v)] == 1:
+                succ[u].append(v)
+                edge_type[(u, v)] = rt
+                edge_lag[(u, v)] = lag
+
+    r.duplicates = [{"pred": code(u), "succ": code(v), "count": c}
+                    for (u, v), c in pair_count.items() if c > 1]
+
+    # Loops, then redundancy on the loop-free condensation in topological order.
+    comp = strongly_connected(n, succ)
+    ncomp = max(comp) + 1 if n else 0
+    members: dict[int, list[int]] = {}
+    for v in range(n):
+        members.setdefault(comp[v], []).append(v)
+    r.loops = [[code(v) for v in vs] for vs in members.values() if len(vs) > 1]
+    r.loops += [[code(u)] for u in range(n) if (u, u) in edge_type]
+    pos = [ncomp - 1 - c for c in comp]          # comp numbers are reverse topological
+    rep = [0] * ncomp                             # one original node per position (for reporting)
+    csucc: list[list[int]] = [[] for _ in range(ncomp)]
+    cedge: dict[tuple[int, int], tuple[int, int]] = {}
+    for u in range(n):
+        pu = pos[u]
+        rep[pu] = u
+        for v in succ[u]:
+            pv = pos[v]
+            if pv != pu and (pu, pv) not in cedge:
+                cedge[(pu, pv)] = (u, v)
+                csucc[pu].append(pv)
+    # Reachability only proposes candidates; a tie is redundant when its type and lag are dominated.
+    in_loop = [len(members[comp[v]]) > 1 for v in range(n)]
+    for pu, pv, pw in redundant_edges(ncomp, csucc):
+        u, v = cedge[(pu, pv)]
+        rt, lag = edge_type[(u, v)], edge_lag[(u, v)]
+        if in_loop[u] or in_loop[v] or not tie_implied(
+                u, v, rt in ("FS", "FF"), rt in ("FF", "SF"), lag, ties, dur, pos, in_loop):
+            continue
+        r.redundant.append({"pred": code(u), "succ": code(v), "type": rt, "lag_hr": lag,
+                            "via": code(cedge[(pu, pw)][1])})
+
+    wbs_names = {}
+    projwbs = parsed.get("PROJWBS")
+    if projwbs:
+        wbs_names = dict(zip(projwbs.texts("wbs_id"), projwbs.texts("wbs_short_name")))
+    for i in range(n):
+        tt = ttypes[i]
+        if tt in SUMMARY_TYPES:
+            continue
+        row = {"task_code": code(i), "task_name": names[i]}
+        if not has_pred[i] and tt != "TT_Mile":
+            r.open_starts.append(row)
+        if not has_succ[i] and tt != "TT_FinMile":
+            r.open_finishes.append(row)
+        if tt in MILESTONE_TYPES:
+            continue
+        if has_pred[i] and not start_driven[i]:
+            r.dangling_starts.append(row)
+        if has_succ[i] and not finish_drives[i]:
+            r.dangling_finishes.append(row)
+    r.cross_wbs_pairs = [{"pred_wbs": wbs_names.get(a) or a, "succ_wbs": wbs_names.get(b) or b, "count": c}
+                         for (a, b), c in cross.most_common()]
+    r.elapsed = time.perf_counter() - t0
+    return r
@@ -0,0 +1,269 @@
+"""
+Schedule engine: activity and WBS lookup index.
+
+Built once per parsed schedule (memoised on the parse) so the activity table, Gantt and chat find
+activities without scanning TASK:
+
+- hash maps by task_id and task_code (codes case-insensitive),
+- a sorted code array for prefix search (bisect),
+- an inverted token index over task_name, with a sorted vocabulary for token-prefix matches and
+  close-match (typo) fallback,
+- the WBS parent -> children map, with activities ordered by a depth-first walk of the tree so
+  every WBS subtree's activities are one contiguous slice.
+"""
+from __future__ import annotations
+
+import difflib
+import re
+from bisect import bisect_left, bisect_right
+
+from schedule_agent_web.scheduling.xer_parser import ParsedXer
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+FUZZY_CUTOFF = 0.75
+FUZZY_MATCHES = 5
+RECHECK_ROWS = 2000
+
+# Match kinds, best first; results are ranked by kind, then by code.
+EXACT, CODE_PREFIX, NAME, FUZZY = range(4)
+MATCH_NAMES = ("exact", "codePrefix", "name", "fuzzy")
+
+
+def _tokens(text: str) -> list[str]:
+    return _TOKEN.findall((text or "").lower())
+
+
+class ActivityIndex:
+    """Lookup structures over one parse's TASK and PROJWBS tables (row indexes into TASK)."""
+
+    def __init__(self, parsed: ParsedXer):
+        tasks = parsed.get("TASK")
+        n = len(tasks) if tasks else 0
+        col = (lambda f: tasks.texts(f) if tasks.has(f) else [""] * n) if n else (lambda f: [])
+        self.tasks = tasks
+        self.n = n
+        self.ids = col("task_id")
+        self.codes = col("task_code")
+        self.names = col("task_name")
+        self.wbs_of = col("wbs_id")
+        self.proj_of = col("proj_id")
+        self.by_id = {tid: i for i, tid in enumerate(self.ids)}
+        self.by_code: dict[str, list[int]] = {}
+        for i, code in enumerate(self.codes):
+            self.by_code.setdefault(code.strip().upper(), []).append(i)
+        # Sorted (CODE, row) pairs: a prefix is the slice between two bisections.
+        order = sorted(range(n), key=lambda i: self.codes[i].upper())
+        self.sorted_codes = [self.codes[i].upper() for i in order]
+        self.sorted_rows = order
+        self.code_rank = [0] * n
+        for r, i in enumerate(order):
+            self.code_rank[i] = r
+        postings: dict[str, list[int]] = {}
+        for i, name in enumerate(self.names):
+            for tok in set(_tokens(name)):
+                postings.setdefault(tok, []).append(i)
+        self.postings = postings
+        self.vocab = sorted(postings)
+        self._build_wbs(parsed.get("PROJWBS"))
+
+    # -- WBS -----------------------------------------------------------------------------------
+
+    def _build_wbs(self, wbs) -> None:
+        m = len(wbs) if wbs else 0
+        ids = wbs.texts("wbs_id") if m else []
+        parents = wbs.texts("parent_wbs_id") if m and wbs.has("parent_wbs_id") else [""] * m
+        short = wbs.texts("wbs_short_name") if m and wbs.has("wbs_short_name") else [""] * m
+        names = wbs.texts("wbs_name") if m and wbs.has("wbs_name") else [""] * m
+        self.wbs = {ids[k]: {"wbs_id": ids[k], "code": short[k], "name": names[k], "parent_wbs_id": parents[k]}
+                    for k in range(m)}
+        self.children: dict[str, list[str]] = {}
+        for k in range(m):
+            p = parents[k] if parents[k] in self.wbs and parents[k] != ids[k] else ""
+            self.children.setdefault(p, []).append(ids[k])
+        rows_of: dict[str, list[int]] = {}
+        for i, w in enumerate(self.wbs_of):
+            rows_of.setdefault(w if w in self.wbs else "", []).append(i)
+        # Depth-first walk from the roots: tree_rows lists activities in walk order and span[w] is
+        # the [start, end) slice of w's subtree. Nodes only reachable through a cycle are walked as roots.
+        self.tree_rows: list[int] = []
+        self.span: dict[str, tuple[int, int]] = {}
+        self.depth: dict[str, int] = {}
+        for root in [""] + ids:
+            if root in self.depth:
+                continue
+            stack = [(root, 0, False)]
+            while stack:
+                w, d, closing = stack.pop()
+                if closing:
+                    self.span[w] = (self.span[w][0], len(self.tree_rows))
+                    continue
+                if w in self.depth:
+                    continue
+                self.depth[w] = d
+                self.span[w] = (len(self.tree_rows), len(self.tree_rows))
+                self.tree_rows.extend(rows_of.get(w, ()))
+                stack.append((w, d, True))
+                for c in reversed(self.children.get(w, ())):
+                    stack.append((c, d + 1, False))
+
+    def wbs_rows(self, wbs_id: str) -> list[int] | None:
+        """TASK rows in a WBS node and everything below it; None if the node is unknown."""
+        span = self.span.get(wbs_id)
+        if span is None or not wbs_id:
+            return None
+        return self.tree_rows[span[0]:span[1]]
+
+    def wbs_path(self, wbs_id: str) -> list[dict]:
+        """Ancestors of a WBS node, root first, ending at the node."""
+        out, seen = [], set()
+        while wbs_id in self.wbs and wbs_id not in seen:
+            seen.add(wbs_id)
+            out.append(self.wbs[wbs_id])
+            wbs_id = self.wbs[wbs_id]["parent_wbs_id"]
+        return out[::-1]
+
+    def wbs_children(self, wbs_id: str = "") -> list[dict]:
+        """Child WBS nodes ("" for the roots) with their subtree activity counts."""
+        out = []
+        for w in self.children.get(wbs_id, ()):
+            a, b = self.span.get(w, (0, 0))
+            out.append({**self.wbs[w], "activityCount": b - a, "hasChildren": bool(self.children.get(w))})
+        return out
+
+    # -- lookup --------------------------------------------------------------------------------
+
+    def find(self, key: str) -> int | None:
+        """TASK row of a task_id or task_code; None if unknown."""
+        key = (key or "").strip()
+        i = self.by_id.get(key)
+        if i is not None:
+            return i
+        rows = self.by_code.get(key.upper())
+        return rows[0] if rows else None
+
+    def code_prefix(self, prefix: str) -> list[int]:
+        """Rows whose code starts with prefix (case-insensitive), in code order."""
+        prefix = prefix.strip().upper()
+        lo = bisect_left(self.sorted_codes, prefix)
+        hi = bisect_right(self.sorted_codes, prefix + "\uffff")
+        return self.sorted_rows[lo:hi]
+
+    def _token_rows(self, tok: str, fuzzy: bool) -> tuple[set[int], bool]:
+        """Rows whose name has a token starting with tok; with fuzzy, close matches when none do."""
+        lo = bisect_left(self.vocab, tok)
+        hi = bisect_right(self.vocab, tok + "\uffff")
+        words = self.vocab[lo:hi]
+        approx = False
+        if not words and fuzzy and len(tok) > 2 and tok.isalpha():
+            # Candidates share the first letter: a bounded slice of the vocabulary, not all of it.
+            same = self.vocab[bisect_left(self.vocab, tok[0]):bisect_right(self.vocab, tok[0] + "\uffff")]
+            words = difflib.get_close_matches(tok, same, n=FUZZY_MATCHES, cutoff=FUZZY_CUTOFF)
+            approx = bool(words)
+        rows: set[int] = set()
+        for w in words:
+            rows.update(self.postings[w])
+        return rows, approx
+
+    def name_match(self, q: str, fuzzy: bool = True) -> tuple[set[int], bool]:
+        """Rows whose name matches every query token (by prefix, or approximately); flag if approximate."""
+        toks = _tokens(q)
+        if not toks:
+            return set(), False
+        out: set[int] | None = None
+        approx = False
+        names = self.names
+        for tok in sorted(set(toks), key=len, reverse=True):
+            if out is not None and len(out) <= RECHECK_ROWS:
+                # Few candidates left: test their names rather than union every word with this prefix.
+                kept = {i for i in out if any(t.startswith(tok) for t in _tokens(names[i]))}
+                if kept or not fuzzy:
+                    out = kept
+                    continue
+            rows, a = self._token_rows(tok, fuzzy)
+            approx |= a
+            out = rows if out is None else out & rows
+            if not out:
+                break
+        return out or set(), approx
+
+    def search(self, q: str = "", wbs_id: str = "", proj_id: str = "", fuzzy: bool = True,
+               within: set[int] | None = None) -> tuple[list[int], list[int] | None]:
+        """Rows matching q within a WBS subtree / project / row set, best first, with the match kind of each.
+
+        Empty q lists every activity in scope (kinds None): in WBS walk order when filtered by WBS,
+        else by code.
+        """
+        q = (q or "").strip()
+        base = (self.wbs_rows(wbs_id) or []) if wbs_id else None
+        if not q:
+            rows = base if base is not None else self.sorted_rows
+            if proj_id:
+                proj_of = self.proj_of
+                rows = [i for i in rows if proj_of[i] == proj_id]
+            if within is not None:
+                rows = [i for i in rows if i in within]
+            return rows, None
+        kind: dict[int, int] = {}
+        for i in self.by_code.get(q.upper(), ()):
+            kind[i] = EXACT
+        if q in self.by_id:
+            kind[self.by_id[q]] = EXACT
+        for i in self.code_prefix(q):
+            kind.setdefault(i, CODE_PREFIX)
+        # Typo matching only when the query is not a code.
+        rows, approx = self.name_match(q, fuzzy=fuzzy and not kind)
+        for i in rows:
+            kind.setdefault(i, FUZZY if approx else NAME)
+        scope = set(base) if base is not None else None
+        proj_of, rank, sorted_rows = self.proj_of, self.code_rank, self.sorted_rows
+        groups: list[list[int]] = [[] for _ in MATCH_NAMES]
+        for i, k in kind.items():
+            if ((scope is None or i in scope) and (not proj_id or proj_of[i] == proj_id)
+                    and (within is None or i in within)):
+                groups[k].append(rank[i])
+        out, kinds = [], []
+        for k, ranks in enumerate(groups):
+            ranks.sort()
+            out.extend(sorted_rows[r] for r in ranks)
+            kinds.extend([k] * len(ranks))
+        return out, kinds
+
+    def row(self, i: int) -> dict:
+        tasks = self.tasks
+        wbs = self.wbs.get(self.wbs_of[i])
+        return {
+            "task_id": self.ids[i],
+            "task_code": self.codes[i],
+            "task_name": self.names[i],
+            "wbs_id": self.wbs_of[i],
+            "wbs_code": wbs["code"] if wbs else "",
+            "wbs_name": wbs["name"] if wbs else "",
+            "proj_id": self.proj_of[i],
+            "task_type": tasks.text("task_type", i),
+            "status": tasks.text("status_code", i),
+            "start": tasks.text("act_start_date", i) or tasks.text("early_start_date", i)
+                     or tasks.text("target_start_date", i),
+            "finish": tasks.text("act_end_date", i) or tasks.text("early_end_date", i)
+                      or tasks.text("target_end_date", i),
+            "total_float_hr": tasks.text("total_float_hr_cnt", i),
+        }
+
+    def page(self, q: str = "", wbs_id: str = "", proj_id: str = "", offset: int = 0, limit: int = 100,
+             fuzzy: bool = True, within: set[int] | None = None) -> dict:
+        """One page of search() results as activity rows."""
+        rows, kinds = self.search(q, wbs_id=wbs_id, proj_id=proj_id, fuzzy=fuzzy, within=within)
+        activities = []
+        for k in range(offset, min(offset + limit, len(rows))):
+            rec = self.row(rows[k])
+            if kinds is not None:
+                rec["match"] = MATCH_NAMES[kinds[k]]
+            activities.append(rec)
+        out = {"total": len(rows), "offset": offset, "limit": limit, "activities": activities}
+        if wbs_id:
+            out["wbs"] = {"path": self.wbs_path(wbs_id), "children": self.wbs_children(wbs_id)}
+        return out
+
+
+def activity_index(parsed: ParsedXer) -> ActivityIndex:
+    """ActivityIndex memoised on the parse."""
+    return parsed.memo("activity_index", ActivityIndex)
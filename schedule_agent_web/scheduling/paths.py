@@ -0,0 +1,255 @@
+"""
+Schedule engine: driving and near-critical paths to a target activity.
+
+Every live tie gets its relationship free float (RFF): how far the successor date it bounds sits
+after the predecessor's date plus lag, in the successor's working time (as the forward pass converts
+ties between calendars, so a tie into non-work time still drives). A tie with zero RFF drives its
+successor. For a target activity, a backward shortest-path search over RFF (in days of each
+successor's calendar) gives every predecessor's relative float to the target and the next tie
+toward it: relative float 0 is the driving path, anything up to N days is near-critical.
+
+The per-target trees are cached on the DrivingPaths object (itself memoised on the parse), so
+repeated questions about the same milestone walk the cached "next" pointers and cost the length
+of the path.
+"""
+from __future__ import annotations
+
+import heapq
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from schedule_agent_web.scheduling.calendars import DEFAULT_DAY_HOURS
+from schedule_agent_web.scheduling.cpm import REL_NAMES, CpmResult, compute_cpm, pass_plan
+from schedule_agent_web.scheduling.xer_parser import ParsedXer
+
+DRIVING_TOL_HOURS = 1e-3
+MAX_TREES = 64
+MAX_CHAINS = 20
+
+
+class PathTree:
+    """Predecessors of one target within a float threshold: relative float (days) and next tie.
+
+    Following next from any node walks its tightest path to the target.
+    """
+
+    def __init__(self, target: int, near_days: float, rel: dict[int, float], nxt: dict[int, int]):
+        self.target = target
+        self.near_days = near_days
+        self.rel = rel          # node -> relative float to the target (days)
+        self.next = nxt         # node -> edge index toward the target (absent for the target)
+        self.driving: tuple[list[int], list[int]] | None = None
+
+
+class DrivingPaths:
+    """Relationship free float of every live tie of a CPM result plus cached per-target trees."""
+
+    def __init__(self, cpm: CpmResult):
+        net = cpm.network
+        plan = pass_plan(net)
+        cals, cal = net.calendars, net.cal
+        self.cpm = cpm
+        self.pred, self.succ = plan.e_pred, plan.e_succ
+        self.lag = plan.e_lag
+        self.rtype = np.where(plan.from_finish, np.where(plan.to_finish, 2, 0), np.where(plan.to_finish, 3, 1))
+        es_w, ef_w = cpm.es_w, cpm.ef_w
+        p, q = self.pred, self.succ
+        bound = np.where(plan.from_finish, ef_w[p], es_w[p]) + plan.e_lag
+        if plan.cross.any():
+            x = np.flatnonzero(plan.cross)
+            bound[x] = cals.to_work(cal[q[x]], cals.from_work(cal[p[x]], bound[x], start=~plan.from_finish[x]))
+        rff = np.where(plan.to_finish, ef_w[q], es_w[q]) - bound
+        self.rff = np.where(np.abs(rff) <= DRIVING_TOL_HOURS, 0.0, rff)
+        day_hours = np.where(net.day_hours > 0, net.day_hours, DEFAULT_DAY_HOURS)
+        self.rff_days = self.rff / day_hours[q]
+        # Incoming ties per successor (CSR), tightest first.
+        order = np.lexsort((self.rff, q))
+        self.in_edge = order
+        self.in_ptr = np.searchsorted(q[order], np.arange(net.n + 1))
+        self._trees: OrderedDict = OrderedDict()
+        self._codes: dict[str, int] | None = None
+
+    def node_of(self, tasks, key: str) -> int | None:
+        """Node of a task_id or task_code (codes matched case-insensitively); None if unknown."""
+        net = self.cpm.network
+        key = (key or "").strip()
+        i = net.index_of(key)
+        if i is not None:
+            return i
+        if self._codes is None:
+            codes = tasks.texts("task_code")
+            self._codes = {codes[int(r)].strip().upper(): k for k, r in enumerate(net.rows)}
+        return self._codes.get(key.upper())
+
+    def finish_node(self) -> int | None:
+        """The project finish: of the live activities no live tie leads on from, the one with the
+        latest early finish, preferring a finish milestone on a tie."""
+        net = self.cpm.network
+        live = net.in_network & ~net.complete
+        feeds = np.zeros(net.n, dtype=bool)
+        feeds[self.pred[live[self.succ]]] = True
+        ends = np.flatnonzero(live & ~feeds & ~np.isnan(self.cpm.ef))
+        if not ends.size:
+            return None
+        ef = self.cpm.ef[ends]
+        latest = ends[ef >= ef.max() - DRIVING_TOL_HOURS]
+        miles = latest[net.finish_mile[latest]]
+        return int(miles[0] if miles.size else latest[0])
+
+    def tree(self, target: int, near_days: float = 0.0) -> PathTree:
+        """Backward search from target over ties whose accumulated RFF stays within near_days."""
+        key = (target, round(float(near_days), 3))
+        tree = self._trees.get(key)
+        if tree is not None:
+            self._trees.move_to_end(key)
+            return tree
+        # A wider cached tree for the same target already holds the answer.
+        for (t, nd), wide in self._trees.items():
+            if t == target and nd >= near_days:
+                rel = {k: v for k, v in wide.rel.items() if v <= near_days + 1e-9}
+                tree = PathTree(target, near_days, rel, {k: e for k, e in wide.next.items() if k in rel})
+                break
+        if tree is None:
+            tree = self._search(target, near_days)
+        self._trees[key] = tree
+        while len(self._trees) > MAX_TREES:
+            self._trees.popitem(last=False)
+        return tree
+
+    def _search(self, target: int, near_days: float) -> PathTree:
+        in_ptr, in_edge, pred, rff_days = self.in_ptr, self.in_edge, self.pred, self.rff_days
+        limit = near_days + 1e-9
+        rel = {target: 0.0}
+        nxt: dict[int, int] = {}
+        heap = [(0.0, target)]
+        done = set()
+        while heap:
+            d, node = heapq.heappop(heap)
+            if node in done:
+                continue
+            done.add(node)
+            for k in range(in_ptr[node], in_ptr[node + 1]):
+                e = int(in_edge[k])
+                w = rff_days[e]
+                if w != w:
+                    continue
+                nd = d + max(float(w), 0.0)
+                if nd > limit:
+                    break              # ties are sorted tightest first
+                p = int(pred[e])
+                if nd < rel.get(p, float("inf")):
+                    rel[p] = nd
+                    nxt[p] = e
+                    heapq.heappush(heap, (nd, p))
+        return PathTree(target, near_days, rel, nxt)
+
+    # -- results -----------------------------------------------------------------------------
+
+    def _driver(self, i: int) -> str:
+        """Why the first activity of a driving chain starts when it does: progress, logic, data date,
+        constraint, calendar (ties with slack only from non-work time) or open start."""
+        net = self.cpm.network
+        if net.complete[i] or net.active[i]:
+            return "progress"
+        if (self.rff[self.in_edge[self.in_ptr[i]:self.in_ptr[i + 1]]] == 0.0).any():
+            return "logic"
+        es = self.cpm.es[i]
+        if es == es and abs(es) <= DRIVING_TOL_HOURS:
+            return "data date"
+        if net.es_min[i] > 0 or net.ef_min[i] > -np.inf or not (np.isnan(net.es_force[i]) and np.isnan(net.ef_force[i])):
+            return "constraint"
+        return "open start" if self.in_ptr[i + 1] == self.in_ptr[i] else "calendar"
+
+    def _tie(self, e: int) -> dict:
+        net = self.cpm.network
+        lag = float(self.lag[e])
+        p = int(self.pred[e])
+        return {"type": REL_NAMES[int(self.rtype[e])], "lag_days": self.cpm.days(lag, p) if lag else 0.0,
+                "rff_days": round(float(self.rff_days[e]), 2), "successor": net.task_ids[int(self.succ[e])]}
+
+    def driving_chain(self, target: int) -> tuple[list[int], list[int]]:
+        """Primary driving path ending at target as (nodes, ties), ties[k] joining nodes[k] to
+        nodes[k + 1]: from the target, follow the driving tie into the predecessor with the latest
+        early finish, back to an activity no tie drives. Cached on the target's zero-float tree."""
+        tree = self.tree(target, 0.0)
+        if tree.driving is not None:
+            return tree.driving
+        ef = self.cpm.ef
+        in_ptr, in_edge, pred, rff = self.in_ptr, self.in_edge, self.pred, self.rff
+        nodes, ties = [target], []
+        seen = {target}
+        node = target
+        while True:
+            best = None
+            for k in range(in_ptr[node], in_ptr[node + 1]):
+                e = int(in_edge[k])
+                if rff[e] > 0.0:
+                    break              # ties are sorted tightest first
+                if rff[e] < 0.0:
+                    continue           # overridden by a mandatory or forced constraint
+                p = int(pred[e])
+                if p not in seen and (best is None or ef[p] > ef[int(pred[best])]):
+                    best = e
+            if best is None:
+                break
+            node = int(pred[best])
+            seen.add(node)
+            nodes.append(node)
+            ties.append(best)
+        nodes.reverse()
+        ties.reverse()
+        tree.driving = (nodes, ties)
+        return tree.driving
+
+    def query(self, tasks, target: int, near_days: float = 10.0, limit: int = 50) -> dict:
+        """Driving path (the limit activities nearest the target, plus where it starts), near-critical
+        predecessors by relative float, and near-critical chains up to where they join the driving path."""
+        net = self.cpm.network
+        nodes, ties = self.driving_chain(target)
+        tree = self.tree(target, max(near_days, 0.0))
+        on_path = set(nodes)
+        first = max(len(nodes) - 1 - limit, 0)
+        driving = self.cpm.activities(tasks, nodes[first:-1])
+        for rec, e in zip(driving, ties[first:]):
+            rec["tie"] = self._tie(e)
+        start = self.cpm.activities(tasks, nodes[:1])[0]
+        start["driver"] = self._driver(nodes[0])
+        ef = self.cpm.ef
+        near = sorted((i for i in tree.rel if i not in on_path),
+                      key=lambda i: (tree.rel[i], -(ef[i] if ef[i] == ef[i] else 0.0)))
+        activities = self.cpm.activities(tasks, near[:limit])
+        for rec, i in zip(activities, near):
+            rec["relative_float"] = round(tree.rel[i], 2)
+            if i in tree.next:
+                rec["tie"] = self._tie(tree.next[i])
+        # Near-critical chains: from each entry point (nothing in the tree routes through it) forward
+        # along the cached ties until the chain joins the driving path.
+        fed = {int(self.succ[e]) for e in tree.next.values()}
+        codes = tasks.texts("task_code")
+        chains = []
+        for i in near:
+            if i in fed:
+                continue
+            chain = [i]
+            while chain[-1] in tree.next and chain[-1] not in on_path:
+                chain.append(int(self.succ[tree.next[chain[-1]]]))
+            chains.append({"relative_float": round(tree.rel[i], 2), "length": len(chain),
+                           "joins": codes[int(net.rows[chain[-1]])],
+                           "activities": [codes[int(net.rows[j])] for j in chain]})
+            if len(chains) >= MAX_CHAINS:
+                break
+        return {
+            "target": self.cpm.activities(tasks, [target])[0],
+            "nearDays": near_days,
+            "drivingPath": {"length": len(nodes) - 1, "start": start, "activities": driving},
+            "nearCritical": {"total": len(near), "activities": activities, "chains": chains},
+        }
+
+
+def driving_paths(parsed: ParsedXer, proj_id: str | None = None) -> DrivingPaths:
+    """DrivingPaths over compute_cpm(), memoised on the parse (trees accumulate across calls)."""
+    return parsed.memo(f"paths:{proj_id or ''}", lambda p: DrivingPaths(compute_cpm(p, proj_id=proj_id)))
@@ -0,0 +1,504 @@
+"""
+Schedule engine: time-phased resource loading from TASKRSRC.
+
+Every assignment is spread uniformly over the working time of its window on its activity's
+calendar, into a (resources x days) matrix per series:
+
+  planned     target_qty over the planned dates (assignment, else activity target dates)
+  actual      actual units (act_reg_qty + act_ot_qty, else target - remaining) from the actual
+              start to the actual finish or the data date
+  remaining   remain_qty over the remaining dates (assignment restart/reend, else the activity's
+              remaining / early dates, else the recomputed CPM early dates) from the data date on
+
+Spreading is a difference array per (resource, calendar) pair: each assignment adds its rate
+(units per working hour) on its first day and removes it after its last, a cumulative sum gives
+the running rate, and multiplying by each calendar's working hours per day gives units per day;
+partial first and last days are corrected afterwards. The cost is one pass over the assignments
+plus one over the pairs x days grid, whatever the durations.
+
+From the matrices: histograms by day / week / month, peak loading per resource, and
+over-allocation windows where the forecast (actual + remaining) exceeds the resource's limit
+(RSRCRATE.max_qty_per_hr on the resource's calendar).
+"""
+from __future__ import annotations
+
+import time
+from datetime import date, datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from schedule_agent_web.scheduling.calendars import CalendarSet
+from schedule_agent_web.scheduling.cpm import _data_date, compute_cpm
+from schedule_agent_web.scheduling.xer_parser import ParsedXer, parse_p6_date
+
+SERIES = ("planned", "actual", "remaining", "forecast")
+PERIODS = ("day", "week", "month")
+# Days at or above this share of a resource's peak form its peak-loading windows.
+PEAK_SHARE = 0.8
+_MONDAY = date(1970, 1, 5)
+
+
+def _hours(texts: list[str], origin: datetime):
+    """Clock hours from the origin of each P6 date string (NaN when blank)."""
+    lookup = {}
+    for v in set(texts):
+        d = parse_p6_date(v) if v else None
+        lookup[v] = (d - origin).total_seconds() / 3600.0 if d is not None else np.nan
+    return np.fromiter(map(lookup.__getitem__, texts), np.float64, len(texts))
+
+
+def _first(*arrays):
+    """Element-wise first non-NaN value across arrays."""
+    out = arrays[0].copy()
+    for a in arrays[1:]:
+        gap = np.isnan(out)
+        if not gap.any():
+            break
+        out[gap] = a[gap]
+    return out
+
+
+def spread(cals: CalendarSet, cal, start, finish, amount, row, nrows: int, first: int, ndays: int):
+    """Spread each amount uniformly over the working time of [start, finish] on its calendar.
+
+    start / finish are clock hours from the calendar origin; returns an (nrows, ndays) matrix of
+    amount per day, day 0 being day offset first. Windows without working time put the whole
+    amount on their start day; rows with a NaN start, finish or amount are skipped.
+    """
+    out = np.zeros((nrows, ndays))
+    ok = np.isfinite(start) & np.isfinite(finish) & np.isfinite(amount) & (amount != 0)
+    if not ok.any() or ndays <= 0:
+        return out
+    cal = np.asarray(cal, dtype=np.int64)[ok]
+    row = np.asarray(row, dtype=np.int64)[ok]
+    amount = amount[ok]
+    start = start[ok]
+    finish = np.maximum(finish[ok], start)
+    ws = cals.to_work(cal, start)
+    wf = cals.to_work(cal, finish)
+    ds = cals.day_of(start) - first
+    de = cals.day_of(finish) - first
+    cum = cals.day_work(first, first + ndays - 1)         # (calendars, ndays + 1)
+    ncal = cum.shape[0]
+    flat = out.reshape(-1)
+    size = nrows * ndays
+
+    point = wf - ws <= 1e-9
+    if point.any():
+        flat += np.bincount(row[point] * ndays + ds[point], weights=amount[point], minlength=size)
+    live = ~point
+    if not live.any():
+        return out
+    cal, row, ws, wf, ds, de = cal[live], row[live], ws[live], wf[live], ds[live], de[live]
+    rate = amount[live] / (wf - ws)
+
+    # Running rate per (resource, calendar) pair from a difference array over days.
+    pairs, key = np.unique(row * ncal + cal, return_inverse=True)
+    width = ndays + 1
+    delta = np.bincount(np.concatenate((key * width + ds, key * width + de + 1)),
+                        weights=np.concatenate((rate, -rate)), minlength=len(pairs) * width)
+    running = np.cumsum(delta.reshape(len(pairs), width)[:, :ndays], axis=1)
+    daywork = np.diff(cum, axis=1)
+    load = running * daywork[pairs % ncal]
+    prow = pairs // ncal
+    heads = np.flatnonzero(np.r_[True, prow[1:] != prow[:-1]])
+    out[prow[heads]] += np.add.reduceat(load, heads, axis=0)
+
+    # The first and last days only carry the part of the window that falls inside them.
+    head_cut = -rate * (ws - cum[cal, ds])
+    tail_cut = -rate * (cum[cal, de + 1] - wf)
+    flat += np.bincount(np.concatenate((row * ndays + ds, row * ndays + de)),
+                        weights=np.concatenate((head_cut, tail_cut)), minlength=size)
+    return out
+
+
+def period_bins(start: date, ndays: int, period: str):
+    """(index of each period's first day, period labels) for ndays days from start; weeks start on
+    Monday and are labelled by that Monday, months by YYYY-MM."""
+    days = np.datetime64(start, "D") + np.arange(ndays)
+    if period == "day":
+        return np.arange(ndays), np.datetime_as_string(days).tolist()
+    if period == "week":
+        key = (days - np.datetime64(_MONDAY, "D")).astype(np.int64) // 7
+    else:
+        key = days.astype("datetime64[M]").astype(np.int64)
+    heads = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    if period == "week":
+        labels = np.datetime_as_string(np.datetime64(_MONDAY, "D") + key[heads] * 7)
+    else:
+        labels = np.datetime_as_string(days[heads].astype("datetime64[M]"))
+    return heads, labels.tolist()
+
+
+def _runs(mask):
+    """(row, first column, last column) of every run of True along each row of a 2-D mask."""
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    step = np.diff(padded, axis=1)
+    r, s = np.nonzero(step == 1)
+    _, e = np.nonzero(step == -1)
+    return r, s, e - 1
+
+
+class ResourceLoading:
+    """Units per day for every resource (rows) and day from origin date + first (columns)."""
+
+    def __init__(self, data_date: datetime, first: int, resources: list[dict], series: dict, capacity,
+                 unscheduled: int, elapsed: float):
+        self.data_date = data_date
+        self.first = first
+        self.resources = resources             # rsrc_id, name, short_name, type, assignments, maxPerHour
+        self.series = series                   # planned / actual / remaining -> (R, D)
+        self.capacity = capacity               # (R, D) units per day, NaN where the resource has no limit
+        self.unscheduled = unscheduled
+        self.elapsed = elapsed
+        self.series["forecast"] = series["actual"] + series["remaining"]
+        self._windows_cache: dict[tuple, list] = {}
+
+    @property
+    def days(self) -> int:
+        return int(self.series["planned"].shape[1])
+
+    def date(self, k: int) -> str:
+        return (self.data_date.date() + timedelta(days=int(self.first + k))).isoformat()
+
+    def totals(self, name: str):
+        return self.series[name].sum(axis=1)
+
+    def peaks(self, name: str = "forecast") -> list[dict]:
+        """Peak day, peak units and peak-to-average ratio (over loaded days) per resource."""
+        load = self.series[name]
+        if not load.size:
+            return [{"peak": 0.0, "date": "", "peakToAverage": None} for _ in self.resources]
+        k = load.argmax(axis=1)
+        peak = load[np.arange(len(load)), k]
+        loaded = (load > 1e-9).sum(axis=1)
+        avg = load.sum(axis=1) / np.maximum(loaded, 1)
+        return [{"peak": round(float(peak[r]), 2), "date": self.date(k[r]) if peak[r] > 0 else "",
+                 "peakToAverage": round(float(peak[r] / avg[r]), 2) if peak[r] > 0 else None}
+                for r in range(len(self.resources))]
+
+    def _windows(self, load, mask, limit) -> list[dict]:
+        rows, s, e = _runs(mask)
+        if not len(rows):
+            return []
+        flat_starts = rows * load.shape[1] + s
+        peak = np.maximum.reduceat(np.where(mask, load, 0.0).reshape(-1), flat_starts)
+        if limit is not None:
+            excess = np.add.reduceat(np.where(mask, load - limit, 0.0).reshape(-1), flat_starts)
+            cap = np.maximum.reduceat(np.where(mask, limit, 0.0).reshape(-1), flat_starts)
+        out = []
+        for i in range(len(rows)):
+            res = self.resources[int(rows[i])]
+            rec = {"rsrc_id": res["rsrc_id"], "name": res["name"], "start": self.date(s[i]),
+                   "finish": self.date(e[i]), "days": int(e[i] - s[i] + 1), "peak": round(float(peak[i]), 2)}
+            if limit is not None:
+                rec["excessUnits"] = round(float(excess[i]), 2)
+                rec["limit"] = round(float(cap[i]), 2)
+            out.append(rec)
+        return out
+
+    def overallocations(self, name: str = "forecast") -> list[dict]:
+        """Windows of consecutive days where a resource's load exceeds its limit, worst first."""
+        key = ("over", name)
+        if key not in self._windows_cache:
+            load = self.series[name]
+            cap = self.capacity
+            windows = []
+            if cap is not None and load.size:
+                limited = np.isfinite(cap)
+                over = limited & (load > np.where(limited, cap, 0.0) * (1 + 1e-9) + 1e-9)
+                windows = self._windows(load, over, np.where(limited, cap, 0.0))
+                windows.sort(key=lambda w: -w["excessUnits"])
+            self._windows_cache[key] = windows
+        return self._windows_cache[key]
+
+    def peak_windows(self, name: str = "forecast") -> list[dict]:
+        """Windows where each resource runs at PEAK_SHARE of its own peak or more, longest first."""
+        key = ("peak", name)
+        if key not in self._windows_cache:
+            load = self.series[name]
+            windows = []
+            if load.size:
+                peak = load.max(axis=1, keepdims=True)
+                windows = self._windows(load, (load >= peak * PEAK_SHARE) & (peak > 1e-9), None)
+                windows.sort(key=lambda w: (-w["days"], -w["peak"]))
+            self._windows_cache[key] = windows
+        return self._windows_cache[key]
+
+    def histogram(self, period: str = "week", rows=None, names=("planned", "forecast")) -> dict:
+        """Units per period (day / week / month) for the given resource rows."""
+        if period not in PERIODS:
+            raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+        rows = range(len(self.resources)) if rows is None else rows
+        if not self.days:
+            return {"period": period, "labels": [], "resources": []}
+        heads, labels = period_bins(self.data_date.date() + timedelta(days=self.first), self.days, period)
+        sums = {n: np.add.reduceat(self.series[n], heads, axis=1) for n in names}
+        cap = np.add.reduceat(np.nan_to_num(self.capacity, nan=0.0), heads, axis=1) if self.capacity is not None else None
+        out = []
+        for r in rows:
+            rec = {"rsrc_id": self.resources[r]["rsrc_id"], "name": self.resources[r]["name"]}
+            for n in names:
+                rec[n] = np.round(sums[n][r], 2).tolist()
+            if cap is not None and self.resources[r]["maxPerHour"] is not None:
+                rec["limit"] = np.round(cap[r], 2).tolist()
+            out.append(rec)
+        return {"period": period, "labels": labels, "resources": out}
+
+    def summary(self) -> dict:
+        return {
+            "dataDate": self.data_date.strftime("%Y-%m-%d %H:%M"),
+            "start": self.date(0) if self.days else "",
+            "finish": self.date(self.days - 1) if self.days else "",
+            "days": self.days,
+            "resources": len(self.resources),
+            "assignments": sum(r["assignments"] for r in self.resources),
+            "unscheduledAssignments": self.unscheduled,
+            "elapsedMs": round(self.elapsed * 1000, 1),
+        }
+
+    def resource_rows(self) -> list[dict]:
+        """Per-resource totals, peak and over-allocation counts, largest planned units first."""
+        totals = {n: self.totals(n) for n in ("planned", "actual", "remaining")}
+        peaks = self.peaks()
+        over: dict[str, list] = {}
+        for w in self.overallocations():
+            over.setdefault(w["rsrc_id"], []).append(w)
+        out = []
+        for r, res in enumerate(self.resources):
+            windows = over.get(res["rsrc_id"], [])
+            out.append({**res,
+                        **{f"{n}Units": round(float(totals[n][r]), 2) for n in totals},
+                        "peak": peaks[r],
+                        "overAllocatedDays": sum(w["days"] for w in windows),
+                        "overAllocationWindows": len(windows)})
+        out.sort(key=lambda x: -x["plannedUnits"])
+        return out
+
+    def facts(self, limit: int = 15) -> list[str]:
+        """One compact line per resource for review prompts, most loaded first."""
+        lines = []
+        over: dict[str, list] = {}
+        for w in self.overallocations():
+            over.setdefault(w["rsrc_id"], []).append(w)
+        peak_windows: dict[str, dict] = {}
+        for w in self.peak_windows():
+            peak_windows.setdefault(w["rsrc_id"], w)
+        for rec in self.resource_rows()[:limit]:
+            rid = rec["rsrc_id"]
+            pk = rec["peak"]
+            line = (f"{rec['short_name'] or rec['name'] or rid} {rec['name']} [{rec['type'] or '-'}]: "
+                    f"{rec['assignments']} asg, units planned {_num(rec['plannedUnits'])} / actual "
+                    f"{_num(rec['actualUnits'])} / remaining {_num(rec['remainingUnits'])}")
+            if pk["peak"] > 0:
+                line += f"; peak {_num(pk['peak'])}/d on {pk['date']} (peak/avg {pk['peakToAverage']})"
+                pw = peak_windows.get(rid)
+                if pw:
+                    line += f", >={int(PEAK_SHARE * 100)}% of peak {pw['start']}..{pw['finish']}"
+            windows = over.get(rid)
+            if windows:
+                worst = windows[0]
+                line += (f"; OVER limit {_num(worst['limit'])}/d on {rec['overAllocatedDays']} d in {len(windows)} "
+                         f"window(s), worst {worst['start']}..{worst['finish']} peak {_num(worst['peak'])}/d")
+            lines.append(line)
+        return lines
+
+    def to_dict(self, period: str = "week", limit: int = 50, rsrc_id: str = "") -> dict:
+        rows = self.resource_rows()
+        if rsrc_id:
+            rows = [r for r in rows if r["rsrc_id"] == rsrc_id]
+        rows = rows[:limit]
+        index = {r["rsrc_id"]: k for k, r in enumerate(self.resources)}
+        wanted = {r["rsrc_id"] for r in rows}
+        over = [w for w in self.overallocations() if w["rsrc_id"] in wanted]
+        return {
+            "summary": self.summary(),
+            "resources": rows,
+            "overallocations": over[:limit],
+            "peakWindows": [w for w in self.peak_windows() if w["rsrc_id"] in wanted][:limit],
+            "histogram": self.histogram(period, rows=[index[r["rsrc_id"]] for r in rows]),
+        }
+
+
+def _num(v: float) -> str:
+    return str(int(round(v))) if abs(v) >= 100 or v == int(v) else str(round(v, 1))
+
+
+def _cpm_early_dates(parsed: ParsedXer, trow, proj_id: str | None, cpm=None):
+    """Recomputed early start / finish (clock hours from the data date) of the given TASK rows;
+    NaN for rows outside the network or when CPM is unavailable."""
+    es = np.full(len(trow), np.nan)
+    ef = np.full(len(trow), np.nan)
+    if cpm is None:
+        try:
+            cpm = compute_cpm(parsed, proj_id=proj_id)
+        except Exception:
+            return es, ef
+    node = np.full(len(parsed.get("TASK")), -1, dtype=np.int64)
+    node[cpm.network.rows] = np.arange(cpm.network.n)
+    n = node[trow]
+    has = n >= 0
+    es[has], ef[has] = cpm.es[n[has]], cpm.ef[n[has]]
+    return es, ef
+
+
+def _limits(parsed: ParsedXer, rsrc_ids: list[str], default_max_per_hr: float | None) -> list:
+    """Max units per hour per resource: the latest RSRCRATE row, else default_max_per_hr (None = no limit)."""
+    latest: dict[str, tuple[str, float]] = {}
+    rates = parsed.get("RSRCRATE")
+    if rates and rates.has("max_qty_per_hr"):
+        starts = rates.texts("start_date") if rates.has("start_date") else [""] * len(rates)
+        for rid, start, mx in zip(rates.texts("rsrc_id"), starts, rates.floats("max_qty_per_hr")):
+            if mx == mx and (rid not in latest or start >= latest[rid][0]):
+                latest[rid] = (start, mx)
+    out = []
+    for rid in rsrc_ids:
+        mx = latest[rid][1] if rid in latest else default_max_per_hr
+        out.append(float(mx) if mx is not None and mx > 0 else None)
+    return out
+
+
+def build_loading(parsed: ParsedXer, proj_id: str | None = None, cpm=None,
+                  default_max_per_hr: float | None = None) -> ResourceLoading | None:
+    """Time-phase every TASKRSRC assignment (of one project, or all); None without TASKRSRC / TASK.
+
+    cpm (a CpmResult) supplies remaining dates for activities whose export carries none; it is
+    computed on demand when needed and not given.
+    """
+    if np is None:
+        raise RuntimeError("numpy is required for resource loading (pip install numpy)")
+    t0 = time.perf_counter()
+    assign = parsed.get("TASKRSRC")
+    tasks = parsed.get("TASK")
+    if not assign or not tasks:
+        return None
+    dd, _ = _data_date(parsed, proj_id)
+    if dd is None:
+        starts = [d for d in (parse_p6_date(s) for s in tasks.texts("target_start_date")) if d]
+        dd = min(starts) if starts else datetime(2000, 1, 1)
+
+    keep = np.ones(len(assign), dtype=bool)
+    if proj_id and assign.has("proj_id"):
+        keep = np.fromiter((p == proj_id for p in assign.texts("proj_id")), bool, len(assign))
+    task_row = {tid: i for i, tid in enumerate(tasks.texts("task_id"))}
+    trow = np.fromiter((task_row.get(t, -1) for t in assign.texts("task_id")), np.int64, len(assign))
+    keep &= trow >= 0
+    idx = np.flatnonzero(keep)
+    trow = trow[idx]
+
+    def a_text(field):
+        if not assign.has(field):
+            return None
+        col = assign.texts(field)
+        return [col[i] for i in idx]
+
+    def a_float(field):
+        return np.asarray(assign.floats(field), dtype=np.float64)[idx] if assign.has(field) else None
+
+    def a_hours(field):
+        col = a_text(field)
+        return _hours(col, dd) if col is not None else np.full(len(idx), np.nan)
+
+    task_hours: dict[str, object] = {}
+
+    def t_hours(field):
+        if field not in task_hours:
+            task_hours[field] = _hours(tasks.texts(field), dd) if tasks.has(field) else np.full(len(tasks), np.nan)
+        return task_hours[field][trow]
+
+    # Resources, in first-seen order.
+    rsrc_of = a_text("rsrc_id") or [""] * len(idx)
+    rsrc_ids = list(dict.fromkeys(rsrc_of))
+    rindex = {r: k for k, r in enumerate(rsrc_ids)}
+    row = np.fromiter((rindex[r] for r in rsrc_of), np.int64, len(idx))
+    rtab = parsed.get("RSRC")
+    info: dict[str, tuple] = {}
+    if rtab:
+        cols = [rtab.texts(f) if rtab.has(f) else [""] * len(rtab)
+                for f in ("rsrc_name", "rsrc_short_name", "rsrc_type", "clndr_id")]
+        info = {rid: vals for rid, *vals in zip(rtab.texts("rsrc_id"), *cols)}
+
+    # Calendars: the activity's for spreading, the resource's for its limit.
+    net = cpm.network if cpm is not None else None
+    cals = net.calendars if net is not None and isinstance(net.calendars, CalendarSet) else None
+    if cals is None:
+        cals = CalendarSet.from_parsed(parsed, dd)
+    default = cals.default_index
+    clndr = tasks.texts("clndr_id")
+    cal = np.fromiter((cals.ids.get(clndr[r], default) for r in trow), np.int64, len(trow))
+
+    # Quantities.
+    target = a_float("target_qty")
+    target = np.zeros(len(idx)) if target is None else np.nan_to_num(target, nan=0.0)
+    remain = a_float("remain_qty")
+    remain = target.copy() if remain is None else np.nan_to_num(remain, nan=0.0)
+    status = tasks.texts("status_code")
+    started = np.fromiter((status[r] in ("TK_Active", "TK_Complete") for r in trow), bool, len(trow))
+    complete = np.fromiter((status[r] == "TK_Complete" for r in trow), bool, len(trow))
+    remain[complete] = 0.0
+    reg, ot = a_float("act_reg_qty"), a_float("act_ot_qty")
+    if reg is not None or ot is not None:
+        actual = np.nan_to_num(reg if reg is not None else 0.0, nan=0.0) + np.nan_to_num(ot if ot is not None else 0.0, nan=0.0)
+    else:
+        actual = np.where(started, np.maximum(target - remain, 0.0), 0.0)
+
+    # Windows (clock hours from the data date).
+    plan_s = _first(a_hours("target_start_date"), t_hours("target_start_date"))
+    plan_f = _first(a_hours("target_end_date"), t_hours("target_end_date"))
+    act_s = _first(a_hours("act_start_date"), t_hours("act_start_date"))
+    act_f = _first(a_hours("act_end_date"), t_hours("act_end_date"))
+    act_f = np.where(np.isnan(act_f) & started, np.maximum(act_s, 0.0), act_f)
+    rem_s = _first(a_hours("restart_date"), t_hours("restart_date"), t_hours("early_start_date"))
+    rem_f = _first(a_hours("reend_date"), t_hours("reend_date"), t_hours("early_end_date"))
+    need = (remain != 0) & (np.isnan(rem_s) | np.isnan(rem_f))
+    if need.any():
+        es, ef = _cpm_early_dates(parsed, trow, proj_id, cpm)
+        rem_s, rem_f = _first(rem_s, es), _first(rem_f, ef)
+        rem_s, rem_f = _first(rem_s, plan_s), _first(rem_f, plan_f)
+    rem_s = np.maximum(rem_s, 0.0)
+    rem_f = np.maximum(rem_f, rem_s)
+
+    windows = {"planned": (plan_s, plan_f, target), "actual": (act_s, act_f, actual),
+               "remaining": (rem_s, rem_f, remain)}
+    bounds = []
+    unscheduled = np.zeros(len(idx), dtype=bool)
+    for s, f, amt in windows.values():
+        ok = np.isfinite(s) & np.isfinite(f) & (amt != 0)
+        unscheduled |= (amt != 0) & ~ok
+        if ok.any():
+            bounds.append(cals.day_of(np.r_[s[ok], f[ok]]))
+    if bounds:
+        days = np.concatenate(bounds)
+        first, ndays = int(days.min()), int(days.max() - days.min() + 1)
+    else:
+        first, ndays = 0, 0
+    nres = len(rsrc_ids)
+    series = {name: spread(cals, cal, s, f, amt, row, nres, first, ndays) for name, (s, f, amt) in windows.items()}
+
+    limits = _limits(parsed, rsrc_ids, default_max_per_hr)
+    capacity = None
+    if any(v is not None for v in limits) and ndays:
+        daywork = np.diff(cals.day_work(first, first + ndays - 1), axis=1)
+        rcal = np.fromiter((cals.ids.get(info.get(r, ("", "", "", ""))[3], default) for r in rsrc_ids), np.int64, nres)
+        per_hr = np.asarray([np.nan if v is None else v for v in limits])
+        capacity = per_hr[:, None] * daywork[rcal]
+
+    counts = np.bincount(row, minlength=nres)
+    resources = []
+    for k, rid in enumerate(rsrc_ids):
+        name, short, rtype, _ = info.get(rid, ("", "", "", ""))
+        resources.append({"rsrc_id": rid, "name": name or rid, "short_name": short, "type": rtype,
+                          "assignments": int(counts[k]), "maxPerHour": limits[k]})
+    return ResourceLoading(dd, first, resources, series, capacity, int(unscheduled.sum()),
+                           time.perf_counter() - t0)
+
+
+def resource_loading(parsed: ParsedXer, proj_id: str | None = None,
+                     default_max_per_hr: float | None = None) -> ResourceLoading | None:
+    """build_loading() memoised on the parse."""
+    key = f"resources:{proj_id or ''}:{default_max_per_hr}"
+    return parsed.memo(key, lambda p: build_loading(p, proj_id=proj_id, default_max_per_hr=default_max_per_hr))
@@ -0,0 +1,252 @@
+"""
+Schedule engine: deterministic review rules.
+
+The mechanical part of a baseline / update review follows directly from the parsed schedule and
+the project philosophy (store.get_philosophy): leads, SF ties, hard constraints, missing calendars
+and missing owner activities. review_findings() produces those comments without the LLM, grouped
+per WBS so a large schedule gives one comment per WBS element rather than one per tie; the LLM
+only gets the residual judgement work plus findings_table() so it does not repeat them.
+
+A rule enabled in the philosophy makes its findings Mandatory; a disabled rule still reports as a
+Recommendation once its tolerance is exceeded.
+"""
+from __future__ import annotations
+
+import re
+from collections import defaultdict
+
+from schedule_agent_web.scheduling.calendars import DEFAULT_DAY_HOURS, calendar_day_hours
+from schedule_agent_web.scheduling.cpm import rel_type_name
+from schedule_agent_web.scheduling.lookup import activity_index
+from schedule_agent_web.scheduling.scorecard import HARD_CONSTRAINTS
+from schedule_agent_web.scheduling.xer_parser import ParsedXer
+
+MAX_LISTED = 25
+MANDATORY, RECOMMENDATION = "Mandatory", "Recommendation"
+
+CONSTRAINT_NAMES = {
+    "CS_MSO": "Must Start On", "CS_MSOB": "Start On or Before", "CS_MFO": "Must Finish On",
+    "CS_MFOB": "Finish On or Before", "CS_MEO": "Must Finish On", "CS_MEOB": "Finish On or Before",
+    "CS_MANDSTART": "Mandatory Start", "CS_MANDFIN": "Mandatory Finish",
+}
+
+
+class Finding:
+    """One review comment produced by a rule (values for the standard review columns)."""
+
+    def __init__(self, rule: str, wbs_ref: str, description: str, recommendation: str, priority: str,
+                 logic_flag: str = "", activities: list[str] | None = None, count: int = 0):
+        self.rule = rule
+        self.wbs_ref = wbs_ref
+        self.description = description
+        self.recommendation = recommendation
+        self.priority = priority
+        self.logic_flag = logic_flag
+        self.activities = activities or []
+        self.count = count or len(self.activities)
+
+    def to_comment(self, columns: list[str]) -> dict:
+        """Row for the review sheet; versioned columns ('Comment Description v2') match by base name."""
+        values = {
+            "Comment ID": "",
+            "WBS Reference": self.wbs_ref,
+            "Comment Description": self.description,
+            "Spec Section Reference": "General",
+            "Priority": self.priority,
+            "Logic Flag": self.logic_flag,
+            "Recommendation for Correction": self.recommendation,
+            "Contractor Response": "",
+            "Comment Status": "Open",
+            "Addressed (Yes/No)": None,
+        }
+        return {c: values.get(re.sub(r" v\d+$", "", c), "") for c in columns}
+
+    def to_dict(self) -> dict:
+        return {"rule": self.rule, "wbsReference": self.wbs_ref, "priority": self.priority,
+                "logicFlag": self.logic_flag, "count": self.count, "activities": self.activities[:MAX_LISTED],
+                "description": self.description, "recommendation": self.recommendation}
+
+
+def _listing(items: list[str]) -> str:
+    more = len(items) - MAX_LISTED
+    return ", ".join(items[:MAX_LISTED]) + (f" and {more} more" if more > 0 else "")
+
+
+def _by_wbs(ix, rows: list[int]) -> list[tuple[str, list[int]]]:
+    """Rows grouped by WBS in WBS walk order; the reference is the WBS code (or id)."""
+    groups: dict[str, list[int]] = defaultdict(list)
+    for i in rows:
+        groups[ix.wbs_of[i]].append(i)
+    order = {w: k for k, w in enumerate(ix.depth)}
+    out = []
+    for w in sorted(groups, key=lambda w: order.get(w, len(order))):
+        node = ix.wbs.get(w)
+        out.append(((node["code"] or w) if node else "General", groups[w]))
+    return out
+
+
+def _tie_findings(parsed: ParsedXer, ix, gov: dict) -> list[Finding]:
+    preds = parsed.get("TASKPRED")
+    if not preds:
+        return []
+    rules = gov.get("rules", {})
+    tasks = parsed.get("TASK")
+    hours = calendar_day_hours(parsed) if parsed.get("CALENDAR") else {}
+    default_hours = hours.get("") or DEFAULT_DAY_HOURS
+    clndr = tasks.texts("clndr_id") if tasks.has("clndr_id") else [""] * ix.n
+    leads: list[tuple[int, str]] = []
+    sf: list[tuple[int, str]] = []
+    types = {pt: rel_type_name(pt) for pt in set(preds.texts("pred_type"))}
+    for tid, pid, pt, lag in zip(preds.texts("task_id"), preds.texts("pred_task_id"), preds.texts("pred_type"),
+                                 preds.floats("lag_hr_cnt")):
+        v, u = ix.by_id.get(tid), ix.by_id.get(pid)
+        if u is None or v is None:
+            continue
+        rt = types[pt]
+        tie = f"{ix.codes[u] or pid} -> {ix.codes[v] or tid} {rt}"
+        if lag < 0:
+            days = lag / (hours.get(clndr[u], default_hours) or default_hours)
+            leads.append((v, f"{tie} {days:g}d"))
+        if rt == "SF":
+            sf.append((v, tie))
+
+    out = []
+    lead_rule = bool(rules.get("leadRestriction"))
+    if leads and (lead_rule or len(leads) > int(gov.get("negativeLagTolerance", 0) or 0)):
+        priority = MANDATORY if lead_rule else RECOMMENDATION
+        ties = {}
+        for v, t in leads:
+            ties.setdefault(v, []).append(t)
+        for ref, rows in _by_wbs(ix, list(ties)):
+            items = [t for v in rows for t in ties[v]]
+            out.append(Finding(
+                "leads", ref,
+                f"{len(items)} relationship(s) with negative lag (lead): {_listing(items)}. "
+                + ("Leads are forbidden for this project." if lead_rule else
+                   f"The schedule has {len(leads)} leads against a tolerance of {gov.get('negativeLagTolerance', 0)}."),
+                "Remove the leads: break the predecessor into discrete activities or use an SS/FF tie with a "
+                "positive lag so the overlap is explicit.", priority, "", items))
+    if sf:
+        priority = MANDATORY if rules.get("sfBan") else RECOMMENDATION
+        ties = {}
+        for v, t in sf:
+            ties.setdefault(v, []).append(t)
+        for ref, rows in _by_wbs(ix, list(ties)):
+            items = [t for v in rows for t in ties[v]]
+            out.append(Finding(
+                "sf", ref,
+                f"{len(items)} Start-to-Finish relationship(s): {_listing(items)}. "
+                + ("SF relationships are banned for this project." if rules.get("sfBan") else
+                   "SF ties are counter-intuitive and rarely reflect the work sequence."),
+                "Replace each SF tie with FS/SS/FF logic that reflects the actual sequence of work.",
+                priority, "Incorrect Relationship Type", items))
+    return out
+
+
+def _constraint_findings(parsed: ParsedXer, ix, gov: dict) -> list[Finding]:
+    tasks = parsed.get("TASK")
+    cstr1 = tasks.texts("cstr_type") if tasks.has("cstr_type") else [""] * ix.n
+    cstr2 = tasks.texts("cstr_type2") if tasks.has("cstr_type2") else [""] * ix.n
+    hard: dict[int, str] = {}
+    for i in range(ix.n):
+        kinds = [CONSTRAINT_NAMES.get(c, c) for c in (cstr1[i], cstr2[i]) if c in HARD_CONSTRAINTS]
+        if kinds:
+            hard[i] = f"{ix.codes[i] or ix.ids[i]} ({' / '.join(kinds)})"
+    if not hard:
+        return []
+    audit = bool(gov.get("rules", {}).get("hardConstraintAudit"))
+    tolerance = float(gov.get("hardConstraintTolerance", 5) or 0)
+    pct = round(len(hard) / ix.n * 100, 1) if ix.n else 0
+    out = []
+    if audit:
+        for ref, rows in _by_wbs(ix, list(hard)):
+            items = [hard[i] for i in rows]
+            out.append(Finding(
+                "hardConstraints", ref,
+                f"{len(items)} activit{'y has a' if len(items) == 1 else 'ies have'} hard constraint(s): "
+                f"{_listing(items)}. Hard constraints override logic and mask the true critical path.",
+                "Remove the hard constraints and drive the dates with logic; where a contract date applies, "
+                "use a Start On or After / Finish On or Before constraint on a milestone.",
+                MANDATORY, "", items))
+    if pct > tolerance:
+        out.append(Finding(
+            "hardConstraints", "General",
+            f"{len(hard)} of {ix.n} activities ({pct}%) carry hard constraints, above the {tolerance:g}% tolerance.",
+            "Reduce hard constraints to contractual milestones only.",
+            MANDATORY if audit else RECOMMENDATION, "", [], len(hard)))
+    return out
+
+
+def _calendar_findings(parsed: ParsedXer, ix, gov: dict) -> list[Finding]:
+    tasks = parsed.get("TASK")
+    clndr = tasks.texts("clndr_id") if tasks.has("clndr_id") else [""] * ix.n
+    cal = parsed.get("CALENDAR")
+    known = set(cal.texts("clndr_id")) if cal else None
+    missing = [i for i in range(ix.n) if not clndr[i] or (known is not None and clndr[i] not in known)]
+    if not missing:
+        return []
+    priority = MANDATORY if gov.get("rules", {}).get("calendarCheck") else RECOMMENDATION
+    out = []
+    for ref, rows in _by_wbs(ix, missing):
+        items = [ix.codes[i] or ix.ids[i] for i in rows]
+        out.append(Finding(
+            "calendars", ref,
+            f"{len(items)} activit{'y has' if len(items) == 1 else 'ies have'} no valid calendar "
+            f"(blank or not in the CALENDAR table): {_listing(items)}.",
+            "Assign each activity a calendar included in the export that reflects its work week and shifts.",
+            priority, "", items))
+    return out
+
+
+def _owner_tokens(name: str) -> str:
+    """Owner activity name reduced to match against task names: no parentheticals, singular words."""
+    name = re.sub(r"\(.*?\)", " ", name or "")
+    return " ".join(w[:-1] if len(w) > 4 and w.endswith("s") else w for w in re.findall(r"[a-z0-9]+", name.lower()))
+
+
+def _owner_findings(ix, playbook: dict) -> list[Finding]:
+    out = []
+    for oa in playbook.get("ownerActivities", []) or []:
+        if not oa.get("required") or not oa.get("name"):
+            continue
+        rows, _ = ix.name_match(_owner_tokens(oa["name"]), fuzzy=True)
+        if rows:
+            continue
+        out.append(Finding(
+            "ownerActivities", "General",
+            f"Required owner activity '{oa['name']}' ({oa.get('duration', '')}d) was not found in the schedule.",
+            f"Add '{oa['name']}' with a duration of {oa.get('duration', '')} days and tie it into the logic of the "
+            "work it governs.", MANDATORY))
+    return out
+
+
+def review_findings(parsed: ParsedXer, philosophy: dict) -> list[Finding]:
+    """Mechanical review comments for a parsed schedule under a philosophy (get_philosophy() shape)."""
+    tasks = parsed.get("TASK")
+    if not tasks:
+        return []
+    ix = activity_index(parsed)
+    gov = philosophy.get("governance", {}) or {}
+    out = _tie_findings(parsed, ix, gov)
+    out += _constraint_findings(parsed, ix, gov)
+    out += _calendar_findings(parsed, ix, gov)
+    out += _owner_findings(ix, philosophy.get("playbook", {}) or {})
+    return out
+
+
+def findings_table(findings: list[Finding], first_id: int = 1) -> str:
+    """Compact table of pre-generated comments for the review prompt (one line per comment)."""
+    if not findings:
+        return ""
+    counts = defaultdict(int)
+    for f in findings:
+        counts[f.priority] += 1
+    lines = [
+        "## Deterministic Findings (already written as comments — do NOT repeat or re-number them)",
+        f"  {len(findings)} comments: {counts[MANDATORY]} Mandatory, {counts[RECOMMENDATION]} Recommendation",
+        "  id\trule\tWBS\tpriority\tcount\tactivities",
+    ]
+    for k, f in enumerate(findings):
+        shown = ", ".join(f.activities[:5]) + (" ..." if len(f.activities) > 5 else "")
+        lines.append(f"  BLR-{first_id + k:03d}\t{f.rule}\t{f.wbs_ref}\t{f.priority}\t{f.count}\t{shown}")
+    return "\n".join(lines)
@@ -0,0 +1,312 @@
+"""
+Schedule engine: Monte Carlo schedule risk analysis on top of the CPM network.
+
+Remaining durations are sampled from three-point estimates (a percentage range around each
+activity's duration, or explicit optimistic / most likely / pessimistic hours) for a chunk of
+iterations at a time, as one (iterations x activities) array. The CPM forward and backward passes
+(scheduling.cpm.PassPlan) run on the whole chunk at once in the precomputed topological order, so
+the per-level Python loop is paid once per chunk rather than once per iteration.
+
+Results: completion-date percentiles (P10 ... P90), criticality index (share of iterations in
+which an activity is critical) and sensitivity (correlation of an activity's sampled duration with
+the project finish; the tornado ranking). Chunks draw from independent child seeds of one
+SeedSequence, so a seed reproduces the same answer whether or not a process pool is used.
+"""
+from __future__ import annotations
+
+import os
+import time
+from datetime import timedelta
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from schedule_agent_web.scheduling.cpm import CpmNetwork, pass_plan
+
+DISTRIBUTIONS = ("triangular", "pert", "uniform")
+PERCENTILES = (10, 20, 30, 40, 50, 60, 70, 80, 90, 95)
+# Upper bound on iterations x activities per chunk (each chunk holds a few (chunk, 2m) arrays).
+CHUNK_CELLS = 4_000_000
+MAX_CHUNK = 250
+# Process-pool size cap per simulation (each worker is a process holding a copy of the pass plan).
+MAX_WORKERS = max(1, int(os.environ.get("RISK_MAX_WORKERS") or min(4, os.cpu_count() or 1)))
+_CRITICAL_TOL = 1e-6
+
+
+class RiskModel:
+    """Three-point duration estimates for the uncertain activities of a network (topological positions)."""
+
+    def __init__(self, net: CpmNetwork, low_pct: float = -10.0, likely_pct: float = 0.0, high_pct: float = 25.0,
+                 distribution: str = "triangular", ranges: dict | None = None):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"distribution must be one of {', '.join(DISTRIBUTIONS)}")
+        if not -100.0 <= low_pct <= likely_pct <= high_pct:
+            raise ValueError("expected -100 <= low_pct <= likely_pct <= high_pct")
+        plan = pass_plan(net)
+        self.distribution = distribution
+        self.low_pct, self.likely_pct, self.high_pct = low_pct, likely_pct, high_pct
+        dur = plan.dur
+        low = dur * (1 + low_pct / 100.0)
+        mode = dur * (1 + likely_pct / 100.0)
+        high = dur * (1 + high_pct / 100.0)
+        if ranges:
+            # Explicit estimates (task_id -> (optimistic, most likely, pessimistic) working hours).
+            pos = np.full(net.n, -1, dtype=np.int64)
+            pos[net.order] = np.arange(len(net.order))
+            for tid, est in ranges.items():
+                i = net.index_of(tid)
+                k = -1 if i is None else pos[i]
+                if k < 0 or len(est) != 3:
+                    continue
+                lo, ml, hi = sorted(max(float(v), 0.0) for v in est)
+                low[k], mode[k], high[k] = lo, ml, hi
+        # Work in progress keeps its actual start but its remaining duration is still uncertain.
+        uncertain = (high > low) & ~plan.done_t
+        self.index = np.flatnonzero(uncertain)
+        self.low, self.mode, self.high = low[self.index], mode[self.index], high[self.index]
+
+    def sample(self, rng, size: int):
+        """(size, k) sampled durations of the uncertain activities."""
+        low, mode, high = self.low, self.mode, self.high
+        span = high - low
+        safe = np.where(span > 0, span, 1.0)
+        shape = (size, len(low))
+        if self.distribution == "uniform":
+            return low + rng.random(shape) * span
+        if self.distribution == "pert":
+            a = 1 + 4 * (mode - low) / safe
+            b = 1 + 4 * (high - mode) / safe
+            return low + rng.beta(a, b, size=shape) * span
+        u = rng.random(shape)
+        c = (mode - low) / safe
+        return np.where(u < c, low + np.sqrt(u * span * (mode - low)),
+                        high - np.sqrt((1 - u) * span * (high - mode)))
+
+
+class RiskResult:
+    """Outcome of simulate(): sorted finishes (clock hours from the data date) and per-activity indices."""
+
+    def __init__(self, net: CpmNetwork, model: RiskModel, finishes, criticality, correlation,
+                 deterministic_finish: float, seed: int, elapsed: float, workers: int):
+        self.network = net
+        self.model = model
+        self.finishes = np.sort(finishes)
+        self.criticality = criticality        # per node, share of iterations with zero or negative float
+        self.correlation = correlation        # per node (NaN when the duration is not sampled)
+        self.deterministic_finish = deterministic_finish
+        self.seed = seed
+        self.elapsed = elapsed
+        self.workers = workers
+
+    @property
+    def iterations(self) -> int:
+        return int(len(self.finishes))
+
+    def iso(self, hours: float) -> str:
+        dd = self.network.data_date
+        if dd is None or hours != hours:
+            return ""
+        return (dd + timedelta(hours=float(hours))).strftime("%Y-%m-%d %H:%M")
+
+    def percentile(self, p: float) -> float:
+        return float(np.percentile(self.finishes, p)) if self.iterations else float("nan")
+
+    def probability_by(self, hours: float) -> float | None:
+        """Share of iterations finishing no later than the given clock hour."""
+        if hours != hours or not self.iterations:
+            return None
+        return round(float(np.searchsorted(self.finishes, hours + 1e-6, side="right")) / self.iterations, 3)
+
+    def summary(self) -> dict:
+        net = self.network
+        f = self.finishes
+        det = self.deterministic_finish
+        out = {
+            "iterations": self.iterations,
+            "seed": self.seed,
+            "distribution": self.model.distribution,
+            "range": {"lowPct": self.model.low_pct, "likelyPct": self.model.likely_pct,
+                      "highPct": self.model.high_pct},
+            "uncertainActivities": int(len(self.model.index)),
+            "dataDate": net.data_date.strftime("%Y-%m-%d %H:%M") if net.data_date else "",
+            "deterministicFinish": self.iso(det),
+            "probabilityOfDeterministic": self.probability_by(det),
+            "meanFinish": self.iso(float(f.mean())) if len(f) else "",
+            "stdDevDays": round(float(f.std()) / 24.0, 1) if len(f) else None,
+            "percentiles": {f"P{p}": self.iso(self.percentile(p)) for p in PERCENTILES},
+            "workers": self.workers,
+            "elapsedMs": round(self.elapsed * 1000, 1),
+        }
+        if net.must_finish == net.must_finish:
+            out["mustFinishBy"] = self.iso(net.must_finish)
+            out["probabilityOfMustFinish"] = self.probability_by(net.must_finish)
+        return out
+
+    def histogram(self, bins: int = 20) -> list[dict]:
+        """Finish-date distribution with cumulative probability (the S-curve)."""
+        if not self.iterations:
+            return []
+        counts, edges = np.histogram(self.finishes, bins=max(1, min(bins, len(np.unique(self.finishes)))))
+        cum = np.cumsum(counts) / self.iterations
+        return [{"from": self.iso(edges[i]), "to": self.iso(edges[i + 1]), "count": int(counts[i]),
+                 "cumulative": round(float(cum[i]), 3)} for i in range(len(counts))]
+
+    def _rows(self, tasks, idx, extra) -> list[dict]:
+        net = self.network
+        out = []
+        for i in idx:
+            row = int(net.rows[i])
+            rec = {"task_id": net.task_ids[i], "task_code": tasks.text("task_code", row),
+                   "task_name": tasks.text("task_name", row)}
+            rec.update(extra(int(i)))
+            out.append(rec)
+        return out
+
+    def top_critical(self, tasks, limit: int = 20) -> list[dict]:
+        ci = np.nan_to_num(self.criticality, nan=0.0)
+        idx = np.flatnonzero(ci > 0)
+        idx = idx[np.argsort(-ci[idx], kind="stable")][:limit]
+        return self._rows(tasks, idx, lambda i: {"criticality": round(float(ci[i]), 3)})
+
+    def tornado(self, tasks, limit: int = 20) -> list[dict]:
+        corr = self.correlation
+        idx = np.flatnonzero(~np.isnan(corr))
+        idx = idx[np.argsort(-np.abs(corr[idx]), kind="stable")][:limit]
+        ci = self.criticality
+        return self._rows(tasks, idx, lambda i: {"correlation": round(float(corr[i]), 3),
+                                                 "criticality": round(float(ci[i]), 3)})
+
+    def to_dict(self, tasks, limit: int = 20) -> dict:
+        return {
+            "summary": self.summary(),
+            "histogram": self.histogram(),
+            "criticality": self.top_critical(tasks, limit),
+            "sensitivity": self.tornado(tasks, limit),
+        }
+
+
+def _finish_groups(net: CpmNetwork):
+    """(calendar, read start side?, positions) of the unfinished activities, for the project finish.
+
+    Mirrors the clock conversion of run_cpm: zero-duration activities other than finish
+    milestones finish at their start instant.
+    """
+    plan = pass_plan(net)
+    order = net.order
+    live = ~net.complete[order]
+    zero = plan.dur <= 0
+    start_side = zero & ~net.finish_mile[order]
+    groups = []
+    for c in np.unique(plan.cal_t[live]) if live.any() else ():
+        for side in (False, True):
+            k = np.flatnonzero(live & (plan.cal_t == c) & (start_side == side))
+            if k.size:
+                groups.append((int(c), side, k))
+    return groups
+
+
+def _project_finish(plan, groups, esef):
+    """Clock project finish of each iteration (latest finish of the unfinished activities)."""
+    m = plan.m
+    lead = esef.shape[:-1]
+    best = np.full(lead, -np.inf)
+    for c, side, k in groups:
+        w = np.atleast_1d(esef[..., k if side else m + k].max(axis=-1))
+        t = plan.calendars.from_work(np.full(w.shape, c), w, start=side)
+        best = np.maximum(best, t.reshape(lead))
+    return np.where(np.isfinite(best), best, 0.0)
+
+
+def _run_chunk(plan, model: RiskModel, groups, base_finish: float, seed_seq, size: int) -> dict:
+    rng = np.random.default_rng(seed_seq)
+    m = plan.m
+    x = model.sample(rng, size)
+    dur = np.broadcast_to(plan.dur, (size, m)).copy()
+    dur[:, model.index] = x
+    esef = plan.forward(dur)
+    finish = _project_finish(plan, groups, esef)
+    lslf = plan.backward(finish, dur)
+    live = ~plan.done_t
+    crit = ((lslf[:, m:] - esef[:, m:]) <= _CRITICAL_TOL) & live
+    xc = x - model.mode
+    y = finish - base_finish
+    return {
+        "finish": finish,
+        "critical": crit.sum(axis=0),
+        "sx": xc.sum(axis=0), "sxx": (xc * xc).sum(axis=0), "sxy": (xc * y[:, None]).sum(axis=0),
+        "sy": float(y.sum()), "syy": float((y * y).sum()),
+    }
+
+
+_WORKER_STATE = None
+
+
+def _init_worker(state) -> None:
+    global _WORKER_STATE
+    _WORKER_STATE = state
+
+
+def _worker_chunk(seed_seq, size: int) -> dict:
+    return _run_chunk(*_WORKER_STATE, seed_seq, size)
+
+
+def simulate(net: CpmNetwork, iterations: int = 1000, seed: int | None = None, model: RiskModel | None = None,
+             workers: int = 0, **model_args) -> RiskResult:
+    """Monte Carlo risk analysis of a built network.
+
+    model_args go to RiskModel (low_pct, likely_pct, high_pct, distribution, ranges). workers > 1
+    splits the chunks over a process pool of at most MAX_WORKERS; the result for a given seed does not depend on it.
+    """
+    if np is None:
+        raise RuntimeError("numpy is required for schedule risk analysis (pip install numpy)")
+    t0 = time.perf_counter()
+    plan = pass_plan(net)
+    if model is None:
+        model = RiskModel(net, **model_args)
+    groups = _finish_groups(net)
+    m = plan.m
+    base_finish = float(_project_finish(plan, groups, plan.forward()))
+
+    iterations = max(int(iterations), 1)
+    chunk = max(1, min(MAX_CHUNK, CHUNK_CELLS // max(m, 1)))
+    sizes = [min(chunk, iterations - s) for s in range(0, iterations, chunk)]
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % (2 ** 63))
+    ss = np.random.SeedSequence(seed)
+    seeds = ss.spawn(len(sizes))
+    state = (plan, model, groups, base_finish)
+    workers = min(max(int(workers or 0), 0), MAX_WORKERS)
+    if workers > 1 and len(sizes) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(workers, len(sizes)), initializer=_init_worker,
+                                 initargs=(state,)) as ex:
+            parts = list(ex.map(_worker_chunk, seeds, sizes))
+    else:
+        workers = 1
+        parts = [_run_chunk(*state, s, z) for s, z in zip(seeds, sizes)]
+
+    finishes = np.concatenate([p["finish"] for p in parts])
+    crit_t = sum(p["critical"] for p in parts) / iterations
+    criticality = np.full(net.n, np.nan)
+    criticality[net.order] = crit_t
+    criticality[net.complete] = np.nan
+
+    # Pearson correlation of sampled duration with the project finish, from running sums.
+    k = len(model.index)
+    sx = sum(p["sx"] for p in parts) if k else np.zeros(0)
+    sxx = sum(p["sxx"] for p in parts) if k else np.zeros(0)
+    sxy = sum(p["sxy"] for p in parts) if k else np.zeros(0)
+    sy = sum(p["sy"] for p in parts)
+    syy = sum(p["syy"] for p in parts)
+    n = float(iterations)
+    vx = n * sxx - sx * sx
+    vy = n * syy - sy * sy
+    with np.errstate(invalid="ignore", divide="ignore"):
+        r = np.where((vx > 0) & (vy > 0), (n * sxy - sx * sy) / np.sqrt(np.maximum(vx * vy, 0.0)), 0.0)
+    correlation = np.full(net.n, np.nan)
+    correlation[net.order[model.index]] = np.clip(r, -1.0, 1.0)
+
+    return RiskResult(net, model, finishes, criticality, correlation, base_finish, seed,
+                      time.perf_counter() - t0, workers)
@@ -0,0 +1,345 @@
+"""
+Schedule engine: DCMA-style scorecard.
+
+collect_facts() walks TASK and TASKPRED once each and keeps every count and distribution the
+checks need (ScheduleFacts, memoised on the parse). Checks are small functions registered with
+@register_check; each declares the optional inputs it needs ("cpm", "data_date", "logic") and reads the
+facts, so adding a check never adds another pass over the activities.
+"""
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable
+
+from schedule_agent_web.scheduling.calendars import DEFAULT_DAY_HOURS, calendar_day_hours
+from schedule_agent_web.scheduling.cpm import MILESTONE_TYPES, SUMMARY_TYPES, _data_date, rel_type_name
+from schedule_agent_web.scheduling.xer_parser import ParsedXer
+
+# Activity types left out of logic / float / duration checks.
+EXCLUDED_TYPES = frozenset(MILESTONE_TYPES + SUMMARY_TYPES)
+# Hard constraints (DCMA 5): must start/finish on, start/finish on or before, mandatory dates.
+HARD_CONSTRAINTS = frozenset(("CS_MSO", "CS_MSOB", "CS_MFO", "CS_MFOB", "CS_MEO", "CS_MEOB",
+                              "CS_MANDSTART", "CS_MANDFIN"))
+
+
+class ScheduleFacts:
+    """Per-schedule counts and distributions gathered in one pass over TASK and one over TASKPRED."""
+
+    def __init__(self):
+        self.total = 0
+        self.work = 0                     # activities that are not milestones / LOE / WBS summaries
+        self.missing_pred = 0
+        self.missing_succ = 0
+        self.missing_logic = 0
+        self.float_days: list[float] = []     # sorted, work activities only
+        self.duration_days: list[float] = []  # sorted, work activities only
+        self.float_sum = 0.0
+        self.duration_sum = 0.0
+        self.hard_constraints = 0
+        self.resource_loaded = 0
+        self.with_calendar = 0
+        self.rel_types = {"FS": 0, "SS": 0, "FF": 0, "SF": 0}
+        self.relationships = 0
+        self.negative_lags = 0
+        self.positive_lags = 0
+        self.cross_wbs = 0
+        self.data_date = ""               # "YYYY-MM-DD HH:MM", blank when the file has none
+        self.invalid_dates = 0
+        self.due_by_data_date = 0         # work activities planned to finish by the data date
+        self.completed_by_data_date = 0
+
+    def pct(self, count: float, of: int | None = None) -> float:
+        den = self.total if of is None else of
+        return round(count / den * 100, 1) if den else 0
+
+    def rel_pct(self, kind: str) -> float:
+        return self.pct(self.rel_types.get(kind, 0), self.relationships)
+
+    def floats_above(self, days: float) -> int:
+        return len(self.float_days) - bisect_right(self.float_days, days)
+
+    def floats_below(self, days: float) -> int:
+        return bisect_left(self.float_days, days)
+
+    def durations_above(self, days: float) -> int:
+        return len(self.duration_days) - bisect_right(self.duration_days, days)
+
+    def metrics(self) -> dict:
+        return {
+            "totalActivities": self.total,
+            "totalRelationships": self.relationships,
+            "fsPercent": self.rel_pct("FS"),
+            "ssPercent": self.rel_pct("SS"),
+            "ffPercent": self.rel_pct("FF"),
+            "sfPercent": self.rel_pct("SF"),
+            "crossWbsTies": self.cross_wbs,
+            "avgFloat": round(self.float_sum / len(self.float_days), 1) if self.float_days else 0,
+            "avgDuration": round(self.duration_sum / len(self.duration_days), 1) if self.duration_days else 0,
+        }
+
+
+def collect_facts(parsed: ParsedXer) -> ScheduleFacts:
+    """Gather every scorecard input from the parsed schedule (use parsed.memo to share it)."""
+    f = ScheduleFacts()
+    tasks = parsed.get("TASK")
+    if not tasks:
+        return f
+    preds = parsed.get("TASKPRED")
+    rsrc = parsed.get("TASKRSRC")
+    dd, _ = _data_date(parsed, None)
+    f.data_date = dd.strftime("%Y-%m-%d %H:%M") if dd else ""
+
+    ids = tasks.texts("task_id")
+    wbs_of = dict(zip(ids, tasks.texts("wbs_id")))
+    has_pred: set[str] = set()
+    has_succ: set[str] = set()
+    if preds:
+        f.relationships = len(preds)
+        rel_types = f.rel_types
+        type_names: dict[str, str] = {}
+        for tid, pid, pt, lag in zip(preds.texts("task_id"), preds.texts("pred_task_id"),
+                                     preds.texts("pred_type"), preds.floats("lag_hr_cnt")):
+            has_pred.add(tid)
+            has_succ.add(pid)
+            name = type_names.get(pt)
+            if name is None:
+                name = type_names[pt] = rel_type_name(pt)
+            rel_types[name] += 1
+            if lag < 0:
+                f.negative_lags += 1
+            elif lag > 0:
+                f.positive_lags += 1
+            if wbs_of.get(tid, "") != wbs_of.get(pid, ""):
+                f.cross_wbs += 1
+
+    hours = calendar_day_hours(parsed) if parsed.get("CALENDAR") else {}
+    default_hours = hours.get("") or DEFAULT_DAY_HOURS
+    loaded = set(rsrc.texts("task_id")) if rsrc else set()
+    data_date = f.data_date
+    floats, durations = f.float_days, f.duration_days
+
+    f.total = len(ids)
+    for (tid, ttype, tf, dur, c1, c2, cal, status, act_start, act_end, early_start, early_end,
+         planned_end) in zip(ids, tasks.texts("task_type"), tasks.floats("total_float_hr_cnt"),
+                             tasks.floats("target_drtn_hr_cnt"), tasks.texts("cstr_type"),
+                             tasks.texts("cstr_type2"), tasks.texts("clndr_id"), tasks.texts("status_code"),
+                             tasks.texts("act_start_date"), tasks.texts("act_end_date"),
+                             tasks.texts("early_start_date"), tasks.texts("early_end_date"),
+                             tasks.texts("target_end_date")):
+        if c1 in HARD_CONSTRAINTS or c2 in HARD_CONSTRAINTS:
+            f.hard_constraints += 1
+        if cal:
+            f.with_calendar += 1
+        if tid in loaded:
+            f.resource_loaded += 1
+        if data_date:
+            # DCMA 9: actuals after the data date, or unfinished work forecast before it.
+            if (act_start and act_start[:16] > data_date) or (act_end and act_end[:16] > data_date):
+                f.invalid_dates += 1
+            elif status != "TK_Complete" and (
+                    (status == "TK_NotStart" and early_start and early_start[:16] < data_date)
+                    or (early_end and early_end[:16] < data_date)):
+                f.invalid_dates += 1
+        if ttype in EXCLUDED_TYPES:
+            continue
+        f.work += 1
+        no_pred = tid not in has_pred
+        no_succ = tid not in has_succ
+        f.missing_pred += no_pred
+        f.missing_succ += no_succ
+        f.missing_logic += no_pred or no_succ
+        day_hours = hours.get(cal, default_hours) or default_hours
+        if tf == tf:
+            floats.append(tf / day_hours)
+        if dur == dur:
+            durations.append(dur / day_hours)
+        if data_date and planned_end and planned_end[:16] <= data_date:
+            f.due_by_data_date += 1
+            if status == "TK_Complete":
+                f.completed_by_data_date += 1
+    f.float_sum = sum(floats)
+    f.duration_sum = sum(durations)
+    floats.sort()
+    durations.sort()
+    return f
+
+
+# -- checks ----------------------------------------------------------------------------------
+
+def status_of(actual: float, threshold: float, higher_is_bad: bool = True) -> str:
+    if higher_is_bad:
+        return "pass" if actual <= threshold else ("warn" if actual <= threshold * 1.5 else "fail")
+    return "pass" if actual >= threshold else ("warn" if actual >= threshold * 0.8 else "fail")
+
+
+class Check:
+    """One scorecard row: fn(facts, gov, inputs) -> (target, actual, status), or None to omit."""
+
+    def __init__(self, check_id: int, criterion: str, fn: Callable, requires: tuple[str, ...] = ()):
+        self.id = check_id
+        self.criterion = criterion
+        self.fn = fn
+        self.requires = requires
+
+
+_CHECKS: dict[int, Check] = {}
+
+
+def register_check(check_id: int, criterion: str, requires: tuple[str, ...] = ()):
+    """Decorator adding a check to the scorecard; requires names optional inputs ("cpm", "data_date", "logic")."""
+    def wrap(fn):
+        _CHECKS[check_id] = Check(check_id, criterion, fn, tuple(requires))
+        return fn
+    return wrap
+
+
+def registered_checks() -> list[Check]:
+    return [_CHECKS[k] for k in sorted(_CHECKS)]
+
+
+def build_scorecard(facts: ScheduleFacts, gov: dict | None = None, cpm: Any = None, **extra: Any) -> list[dict]:
+    """Run every registered check whose inputs are available; rows in check-id order.
+
+    Extra keyword inputs (e.g. logic=LogicReport) are offered to checks that require them.
+    """
+    gov = gov or {}
+    inputs = {"cpm": cpm, "data_date": facts.data_date or None, **extra}
+    rows = []
+    for check in registered_checks():
+        if any(inputs.get(name) is None for name in check.requires):
+            continue
+        try:
+            out = check.fn(facts, gov, inputs)
+        except Exception:
+            out = None
+        if out is None:
+            continue
+        target, actual, status = out
+        rows.append({"id": check.id, "criterion": check.criterion, "target": target, "actual": actual,
+                     "status": status})
+    return rows
+
+
+@register_check(1, "Missing Logic")
+def _missing_logic(f: ScheduleFacts, gov: dict, inputs: dict):
+    tol = gov.get("missingLogicTolerance", 5)
+    pct = f.pct(f.missing_logic)
+    return f"≤ {tol}%", f"{pct}%", status_of(pct, tol)
+
+
+@register_check(2, "Missing Predecessors")
+def _missing_predecessors(f: ScheduleFacts, gov: dict, inputs: dict):
+    return "0", str(f.missing_pred), status_of(f.missing_pred, 0)
+
+
+@register_check(3, "Missing Successors")
+def _missing_successors(f: ScheduleFacts, gov: dict, inputs: dict):
+    return "0", str(f.missing_succ), status_of(f.missing_succ, 0)
+
+
+@register_check(4, "High Float")
+def _high_float(f: ScheduleFacts, gov: dict, inputs: dict):
+    days = gov.get("highFloatDays", 44)
+    pct = f.pct(f.floats_above(days))
+    return f"≤ {days}d", f"{pct}%", status_of(pct, 5)
+
+
+@register_check(5, "Negative Float")
+def _negative_float(f: ScheduleFacts, gov: dict, inputs: dict):
+    pct = f.pct(f.floats_below(0))
+    return "0%", f"{pct}%", status_of(pct, 0)
+
+
+@register_check(6, "High Duration")
+def _high_duration(f: ScheduleFacts, gov: dict, inputs: dict):
+    days = gov.get("highDurationDays", 20)
+    pct = f.pct(f.durations_above(days))
+    return f"≤ {days}d", f"{pct}%", status_of(pct, 5)
+
+
+@register_check(7, "Negative Lags (Leads)")
+def _leads(f: ScheduleFacts, gov: dict, inputs: dict):
+    tol = gov.get("negativeLagTolerance", 0)
+    return str(tol), str(f.negative_lags), status_of(f.negative_lags, tol)
+
+
+@register_check(8, "SF Relationships")
+def _sf(f: ScheduleFacts, gov: dict, inputs: dict):
+    sf = f.rel_types["SF"]
+    return "0", str(sf), status_of(sf, 0)
+
+
+@register_check(9, "Hard Constraints")
+def _hard_constraints(f: ScheduleFacts, gov: dict, inputs: dict):
+    tol = gov.get("hardConstraintTolerance", 5)
+    pct = f.pct(f.hard_constraints)
+    return f"≤ {tol}%", f"{pct}%", status_of(pct, tol)
+
+
+@register_check(10, "FS Relationship %")
+def _fs_pct(f: ScheduleFacts, gov: dict, inputs: dict):
+    pct = f.rel_pct("FS")
+    return "≥ 80%", f"{pct}%", status_of(pct, 80, higher_is_bad=False)
+
+
+@register_check(11, "Resource Loaded")
+def _resource_loaded(f: ScheduleFacts, gov: dict, inputs: dict):
+    pct = f.pct(f.resource_loaded)
+    return "> 0%", f"{pct}%", status_of(pct, 1, higher_is_bad=False)
+
+
+@register_check(12, "Calendar Assigned")
+def _calendar_assigned(f: ScheduleFacts, gov: dict, inputs: dict):
+    pct = f.pct(f.with_calendar)
+    return "100%", f"{pct}%", status_of(pct, 95, higher_is_bad=False)
+
+
+@register_check(13, "Negative Float (CPM)", requires=("cpm",))
+def _negative_float_cpm(f: ScheduleFacts, gov: dict, inputs: dict):
+    pct = f.pct(inputs["cpm"].summary()["negativeFloatCount"])
+    return "0%", f"{pct}%", status_of(pct, 0)
+
+
+@register_check(14, "Lags")
+def _lags(f: ScheduleFacts, gov: dict, inputs: dict):
+    tol = gov.get("lagTolerance", 5)
+    pct = f.pct(f.positive_lags, f.relationships)
+    return f"≤ {tol}%", f"{pct}%", status_of(pct, tol)
+
+
+@register_check(15, "Invalid Dates", requires=("data_date",))
+def _invalid_dates(f: ScheduleFacts, gov: dict, inputs: dict):
+    return "0", str(f.invalid_dates), status_of(f.invalid_dates, 0)
+
+
+@register_check(16, "Baseline Execution Index (BEI)", requires=("data_date",))
+def _bei(f: ScheduleFacts, gov: dict, inputs: dict):
+    if not f.due_by_data_date:
+        return None
+    target = gov.get("beiThreshold", 0.95)
+    bei = round(f.completed_by_data_date / f.due_by_data_date, 2)
+    return f"≥ {target}", str(bei), status_of(bei, target, higher_is_bad=False)
+
+
+@register_check(17, "Critical Path Length Index (CPLI)", requires=("cpm",))
+def _cpli(f: ScheduleFacts, gov: dict, inputs: dict):
+    cpm = inputs["cpm"]
+    length, float_hours = cpm.critical_path_length()
+    if length <= 0:
+        return None
+    target = gov.get("cpliThreshold", 0.95)
+    cpli = round((length + float_hours) / length, 2)
+    return f"≥ {target}", str(cpli), status_of(cpli, target, higher_is_bad=False)
+
+
+@register_check(18, "Logic Loops", requires=("logic",))
+def _logic_loops(f: ScheduleFacts, gov: dict, inputs: dict):
+    loops = inputs["logic"].summary()["loops"]
+    return "0", str(loops), status_of(loops, 0)
+
+
+@register_check(19, "Redundant Logic", requires=("logic",))
+def _redundant_logic(f: ScheduleFacts, gov: dict, inputs: dict):
+    tol = gov.get("redundantLogicTolerance", 5)
+    pct = f.pct(inputs["logic"].summary()["redundantTies"], f.relationships)
+    return f"≤ {tol}%", f"{pct}%", status_of(pct, tol)
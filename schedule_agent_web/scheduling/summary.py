@@ -0,0 +1,378 @@
+"""
+Schedule engine: token-budgeted XER summary for LLM prompts.
+
+Instead of dumping every activity and tie and letting the caller slice the text, the summary is
+assembled to a token budget from content ranked by review value:
+
+  activities     negative float, critical / near-critical, logic defects, constraints, calendar
+                 anomalies, long durations and high float first; complete work last
+  ties           by the value of the activities they join, defects (leads, SF, redundant) first
+  WBS rollups    per WBS element: activity count, critical count, lowest float, date span
+  resources      per resource: assignments and units, with peak loading and over-allocation
+                 windows when a time-phased loading (scheduling.resources) is supplied
+
+Rows use a compact encoding: WBS elements and calendars are dictionary-coded (W12, C3), types and
+statuses are abbreviated, and ties are short "pred>succ FS+2d" tuples. Each section gets a share
+of the budget; whatever a section leaves unused flows to the others, and every section states how
+many rows it omitted so the model knows the listing is partial. Tokens are estimated at
+CHARS_PER_TOKEN characters each.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from typing import Iterator
+
+from schedule_agent_web.scheduling.calendars import DEFAULT_DAY_HOURS, calendar_day_hours
+from schedule_agent_web.scheduling.cpm import SUMMARY_TYPES, rel_type_name
+from schedule_agent_web.scheduling.logic import analyze_logic
+from schedule_agent_web.scheduling.scorecard import HARD_CONSTRAINTS
+from schedule_agent_web.scheduling.xer_parser import ParsedXer
+
+CHARS_PER_TOKEN = 4
+NEAR_CRITICAL_DAYS = 10.0
+HIGH_DURATION_DAYS = 20.0
+HIGH_FLOAT_DAYS = 44.0
+
+# Budget shares; unused budget is handed on in FILL_ORDER.
+SHARES = {"activities": 0.55, "ties": 0.27, "wbs": 0.12, "resources": 0.06}
+FILL_ORDER = ("activities", "ties", "wbs", "resources")
+
+_TYPE_CODES = {"TT_Task": "T", "TT_Mile": "SM", "TT_FinMile": "FM", "TT_LOE": "LOE", "TT_WBS": "WBS",
+               "TT_Rsrc": "RD"}
+_STATUS_CODES = {"TK_NotStart": "NS", "TK_Active": "IP", "TK_Complete": "CO"}
+
+LEGEND = (
+    "Encoding: activity rows are code|name|wbs|cal|type|dur_d|float_d|start|finish|status|flags "
+    "(wbs W#, calendar C# per the dictionaries; type T task, SM/FM start/finish milestone, LOE, WBS, RD; "
+    "status NS/IP/CO). Flags: NEG negative float, CRIT zero float, NEAR near-critical, "
+    "K:<type> constraint (hard ones starred), NOPRED/NOSUCC open end, DS/DF dangling start/finish, "
+    "LOOP logic loop, CAL missing/unknown calendar, LONG long duration, HF high float. "
+    "Ties are pred>succ TYPE[+/-lag d], with *RED redundant."
+)
+
+
+def _days(hours: float, per_day: float) -> float | None:
+    if hours != hours:
+        return None
+    return round(hours / (per_day or DEFAULT_DAY_HOURS), 1)
+
+
+def _num(v) -> str:
+    return "" if v is None else (str(int(v)) if v == int(v) else str(v))
+
+
+class _Section:
+    """A titled list of ranked lines produced lazily, filled up to a character allowance."""
+
+    def __init__(self, title: str, total: int, lines: Iterator[str], columns: str = ""):
+        self.title = title
+        self.columns = columns
+        self.total = total
+        self.lines = lines
+        self.out: list[str] = []
+        self.used = 0
+        self.done = total == 0
+
+    def fill(self, allowance: int) -> int:
+        """Append lines while they fit in allowance characters; returns the characters used."""
+        spent = 0
+        while not self.done:
+            line = next(self.lines, None)
+            if line is None:
+                self.done = True
+                break
+            if spent + len(line) + 1 > allowance:
+                self.lines = _prepend(line, self.lines)
+                break
+            self.out.append(line)
+            spent += len(line) + 1
+        self.used += spent
+        return spent
+
+    def render(self) -> str:
+        if not self.total:
+            return ""
+        shown = len(self.out)
+        note = "" if shown >= self.total else f" (showing {shown}, ranked by review value; {self.total - shown} omitted)"
+        head = [f"\n## {self.title} ({self.total}){note}"] + (["  " + self.columns] if self.columns else [])
+        return "\n".join(head + self.out)
+
+
+def _prepend(first: str, rest: Iterator[str]) -> Iterator[str]:
+    yield first
+    yield from rest
+
+
+def summarize_schedule(parsed: ParsedXer, max_tokens: int = 20000, cpm=None, logic=None, loading=None) -> str:
+    """Ranked, dictionary-coded summary of a parsed XER within about max_tokens tokens ('' if no tables).
+
+    cpm (a CpmResult) supplies floats when the XER carries none; logic defaults to analyze_logic();
+    loading (a ResourceLoading) adds peak and over-allocation facts to the resource lines.
+    """
+    if not parsed.tables:
+        return ""
+    budget = max(int(max_tokens), 500) * CHARS_PER_TOKEN
+    tasks = parsed.get("TASK")
+    wbs = parsed.get("PROJWBS")
+    cal = parsed.get("CALENDAR")
+
+    # Dictionaries.
+    wbs_ids = wbs.texts("wbs_id") if wbs else []
+    wbs_code = {w: f"W{i + 1}" for i, w in enumerate(wbs_ids)}
+    cal_ids = cal.texts("clndr_id") if cal else []
+    cal_code = {c: f"C{i + 1}" for i, c in enumerate(cal_ids)}
+    day_hours = parsed.memo("calendar_day_hours", calendar_day_hours) if cal else {}
+    default_hours = day_hours.get("") or DEFAULT_DAY_HOURS
+
+    head = ["## Schedule Summary (ranked by review value within a token budget; sections list what they omit)"]
+    proj = parsed.get("PROJECT")
+    if proj:
+        for i in range(min(len(proj), 5)):
+            head.append(f"  Project {proj.text('proj_short_name', i)}: data date {proj.text('last_recalc_date', i)[:10]}, "
+                        f"start {proj.text('plan_start_date', i)[:10]}, must finish {proj.text('scd_end_date', i)[:10] or 'n/a'}")
+    preds = parsed.get("TASKPRED")
+    head.append(f"  {len(tasks) if tasks else 0} activities, {len(preds) if preds else 0} relationships, "
+                f"{len(wbs_ids)} WBS elements, {len(cal_ids)} calendars")
+    head.append("  " + LEGEND)
+    if cal_ids:
+        names = cal.texts("clndr_name")
+        head.append("  Calendars: " + "; ".join(
+            f"{cal_code[c]}={names[i]} ({_num(day_hours.get(c, default_hours))}h/d)" for i, c in enumerate(cal_ids[:60])))
+
+    sections: dict[str, _Section] = {}
+    act_score: dict[str, int] = {}
+    code_of: dict[str, str] = {}
+    if tasks:
+        act = _activity_section(parsed, tasks, wbs_code, cal_code, day_hours, default_hours, cpm, logic)
+        sections["activities"], act_score, code_of, wbs_stats = act
+        if wbs:
+            sections["wbs"] = _wbs_section(wbs, wbs_code, wbs_stats)
+    elif wbs:
+        sections["wbs"] = _wbs_section(wbs, wbs_code, {})
+    if preds and tasks:
+        sections["ties"] = _tie_section(preds, act_score, code_of, logic if logic is not None else
+                                        parsed.memo("logic", analyze_logic))
+    rsrc = parsed.get("TASKRSRC")
+    if rsrc:
+        sections["resources"] = _resource_section(parsed, rsrc, loading)
+
+    remaining = budget - sum(len(h) + 1 for h in head)
+    remaining -= sum(len(s.title) + len(s.columns) + 80 for s in sections.values())
+    # First pass: each section up to its share; second pass: leftovers in priority order.
+    available = max(remaining, 0)
+    for name in FILL_ORDER:
+        if name in sections:
+            remaining -= sections[name].fill(int(available * SHARES[name]))
+    for name in FILL_ORDER:
+        if name in sections and remaining > 0:
+            remaining -= sections[name].fill(remaining)
+    body = [sections[name].render() for name in ("wbs", "activities", "ties", "resources") if name in sections]
+    return "\n".join(head + [b for b in body if b])
+
+
+def _activity_section(parsed, tasks, wbs_code, cal_code, day_hours, default_hours, cpm, logic):
+    n = len(tasks)
+    ids = tasks.texts("task_id")
+    codes = tasks.texts("task_code")
+    names = tasks.texts("task_name")
+    wbs = tasks.texts("wbs_id")
+    clndr = tasks.texts("clndr_id")
+    ttype = tasks.texts("task_type")
+    status = tasks.texts("status_code")
+    tf = tasks.floats("total_float_hr_cnt")
+    target = tasks.floats("target_drtn_hr_cnt")
+    remain = tasks.floats("remain_drtn_hr_cnt")
+    blank = [""] * n
+
+    def col(*fields):
+        for f in fields:
+            if tasks.has(f):
+                return tasks.texts(f)
+        return blank
+
+    act_start, act_end = col("act_start_date"), col("act_end_date")
+    early_start, early_end = col("early_start_date", "target_start_date"), col("early_end_date", "target_end_date")
+    cstr1, cstr2 = col("cstr_type"), col("cstr_type2")
+
+    # Fall back to recomputed float when the export carries none.
+    cpm_tf = None
+    if cpm is not None and all(v != v for v in tf):
+        net = cpm.network
+        cpm_tf = {net.task_ids[i]: float(cpm.total_float[i]) for i in range(net.n)}
+
+    if logic is None:
+        logic = parsed.memo("logic", analyze_logic)
+    no_pred = {a["task_code"] for a in logic.open_starts}
+    no_succ = {a["task_code"] for a in logic.open_finishes}
+    ds = {a["task_code"] for a in logic.dangling_starts}
+    df = {a["task_code"] for a in logic.dangling_finishes}
+    in_loop = {c for loop in logic.loops for c in loop}
+
+    scores = [0] * n
+    flags: list[list[str]] = [[] for _ in range(n)]
+    fdays: list[float | None] = [None] * n
+    ddays: list[float | None] = [None] * n
+    wbs_stats: dict[str, list] = defaultdict(lambda: [0, 0, None, "", ""])   # count, critical, min float, start, finish
+    for i in range(n):
+        per_day = day_hours.get(clndr[i], default_hours) or default_hours
+        code = codes[i] or ids[i]
+        hours = tf[i] if cpm_tf is None else cpm_tf.get(ids[i], float("nan"))
+        f = fdays[i] = _days(hours, per_day)
+        dur_h = remain[i] if remain[i] == remain[i] else target[i]
+        d = ddays[i] = _days(dur_h, per_day)
+        fl = flags[i]
+        score = 0
+        done = status[i] == "TK_Complete"
+        summary = ttype[i] in SUMMARY_TYPES
+        if f is not None and not done:
+            if f < 0:
+                score += 100
+                fl.append("NEG")
+            elif f <= 0:
+                score += 80
+                fl.append("CRIT")
+            elif f <= NEAR_CRITICAL_DAYS:
+                score += 50
+                fl.append("NEAR")
+            elif f > HIGH_FLOAT_DAYS and not summary:
+                score += 10
+                fl.append("HF")
+        for c in (cstr1[i], cstr2[i]):
+            if c:
+                hard = c in HARD_CONSTRAINTS
+                score += 30 if hard else 15
+                fl.append(f"K:{c[3:] if c.startswith('CS_') else c}{'*' if hard else ''}")
+        if code in no_pred:
+            score += 40
+            fl.append("NOPRED")
+        if code in no_succ:
+            score += 40
+            fl.append("NOSUCC")
+        if code in ds:
+            score += 25
+            fl.append("DS")
+        if code in df:
+            score += 25
+            fl.append("DF")
+        if code in in_loop:
+            score += 60
+            fl.append("LOOP")
+        if not clndr[i] or (cal_code and clndr[i] not in cal_code):
+            score += 30
+            fl.append("CAL")
+        if d is not None and d > HIGH_DURATION_DAYS and not summary:
+            score += 15
+            fl.append("LONG")
+        if status[i] == "TK_Active":
+            score += 5
+        if done:
+            score -= 50
+        scores[i] = score
+        st = wbs_stats[wbs[i]]
+        st[0] += 1
+        if "NEG" in fl or "CRIT" in fl:
+            st[1] += 1
+        if f is not None and not done and (st[2] is None or f < st[2]):
+            st[2] = f
+        s = (act_start[i] or early_start[i])[:10]
+        e = (act_end[i] or early_end[i])[:10]
+        if s and (not st[3] or s < st[3]):
+            st[3] = s
+        if e and e > st[4]:
+            st[4] = e
+
+    order = sorted(range(n), key=lambda i: (-scores[i], fdays[i] if fdays[i] is not None else 1e9,
+                                            (act_start[i] or early_start[i])))
+
+    def lines():
+        for i in order:
+            yield "  " + "|".join((
+                codes[i] or ids[i], names[i], wbs_code.get(wbs[i], wbs[i]), cal_code.get(clndr[i], clndr[i]),
+                _TYPE_CODES.get(ttype[i], ttype[i]), _num(ddays[i]), _num(fdays[i]),
+                (act_start[i] or early_start[i])[:10], (act_end[i] or early_end[i])[:10],
+                _STATUS_CODES.get(status[i], status[i]), ",".join(flags[i])))
+
+    section = _Section("Activities", n, lines(), columns="code|name|wbs|cal|type|dur_d|float_d|start|finish|status|flags")
+    act_score = {ids[i]: scores[i] for i in range(n)}
+    code_of = {ids[i]: codes[i] or ids[i] for i in range(n)}
+    return section, act_score, code_of, wbs_stats
+
+
+def _wbs_section(wbs, wbs_code, stats) -> _Section:
+    ids = wbs.texts("wbs_id")
+    short = wbs.texts("wbs_short_name")
+    names = wbs.texts("wbs_name")
+    parent = wbs.texts("parent_wbs_id")
+    empty = [0, 0, None, "", ""]
+
+    def key(i):
+        st = stats.get(ids[i], empty)
+        return (-st[1], st[2] if st[2] is not None else 1e9, -st[0])
+
+    def lines():
+        for i in sorted(range(len(ids)), key=key):
+            cnt, crit, low, s, e = stats.get(ids[i], empty)
+            yield (f"  {wbs_code[ids[i]]} {short[i]} {names[i]} ^{wbs_code.get(parent[i], '-')}: {cnt} acts, "
+                   f"{crit} crit, min float {_num(low) or '-'}d, {s or '-'}..{e or '-'}")
+
+    return _Section("WBS Rollup (W# dictionary: code short name ^parent)", len(ids), lines())
+
+
+def _tie_section(preds, act_score, code_of, logic) -> _Section:
+    succ = preds.texts("task_id")
+    pred = preds.texts("pred_task_id")
+    ptype = preds.texts("pred_type")
+    lag = preds.floats("lag_hr_cnt")
+    types = {pt: rel_type_name(pt) for pt in set(ptype)}
+    redundant = {(r["pred"], r["succ"]) for r in logic.redundant}
+    keep = []
+    for k in range(len(succ)):
+        s, p = succ[k], pred[k]
+        if s not in code_of or p not in code_of:
+            continue
+        rt = types[ptype[k]]
+        lg = lag[k] if lag[k] == lag[k] else 0.0
+        pc, sc = code_of[p], code_of[s]
+        score = act_score.get(p, 0) + act_score.get(s, 0)
+        red = (pc, sc) in redundant
+        if lg < 0:
+            score += 60
+        elif lg > 0:
+            score += 10
+        if rt == "SF":
+            score += 40
+        if red:
+            score += 40
+        keep.append((-score, pc, sc, rt, lg, red))
+    keep.sort(key=lambda t: t[0])
+
+    def lines():
+        for _, pc, sc, rt, lg, red in keep:
+            lag_txt = "" if not lg else f"{'+' if lg > 0 else ''}{_num(round(lg / DEFAULT_DAY_HOURS, 1))}d"
+            yield f"  {pc}>{sc} {rt}{lag_txt}{' *RED' if red else ''}"
+
+    return _Section("Logic Ties", len(keep), lines())
+
+
+def _resource_section(parsed, rsrc, loading=None) -> _Section:
+    if loading is not None and loading.resources:
+        facts = loading.facts(limit=len(loading.resources))
+        return _Section("Resources (time-phased; units per day on the activity calendars)", len(facts),
+                        ("  " + line for line in facts))
+    names = {}
+    rtab = parsed.get("RSRC")
+    if rtab:
+        names = dict(zip(rtab.texts("rsrc_id"), rtab.texts("rsrc_name")))
+    agg: dict[str, list] = defaultdict(lambda: [0, 0.0, 0.0])
+    for rid, qty, cost in zip(rsrc.texts("rsrc_id"), rsrc.floats("target_qty"), rsrc.floats("target_cost")):
+        a = agg[rid]
+        a[0] += 1
+        a[1] += qty if qty == qty else 0.0
+        a[2] += cost if cost == cost else 0.0
+    ranked = sorted(agg.items(), key=lambda kv: (-kv[1][2], -kv[1][1]))
+
+    def lines():
+        for rid, (cnt, qty, cost) in ranked:
+            yield f"  {names.get(rid) or rid}: {cnt} assignments, {round(qty, 1)} units, cost {round(cost, 2)}"
+
+    return _Section("Resources", len(ranked), lines())
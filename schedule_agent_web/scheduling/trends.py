@@ -0,0 +1,363 @@
+"""
+Schedule engine: trend store across baseline / update submissions.
+
+Every submitted XER is reduced once to a compact per-activity snapshot (start, finish, total
+float, remaining and original duration, percent complete, status, kind) and appended to a
+per-session store under file_store/<session>/trends/, so trend queries never re-parse history:
+
+  keys.tsv             activity keys (task_code, else task_id) and names, append-only; a key's
+                       line number is its id in every snapshot
+  <label>.snap         one snapshot: a JSON header line (rows, column offsets) followed by one
+                       little-endian column block per field: int32 key ids and dates (minutes since
+                       1970), float32 float / durations / percent, int8 status and kind
+  manifest.json        the recorded versions (label, source file, data date, project finish, ...)
+
+A query reads only the columns it needs (e.g. key + float of each version) and lines them up by
+key id: float erosion per activity, finish slip of milestones, BEI and project-finish history.
+About 30 bytes per activity and version: 36 monthly updates of 50k activities take ~55 MB.
+Queries return dates as days since 1970-01-01 (float and durations are days on the activity's
+calendar). Queries need numpy; recording does not.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+from array import array
+from datetime import datetime, timezone
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from schedule_agent_web.scheduling.calendars import DEFAULT_DAY_HOURS, calendar_day_hours
+from schedule_agent_web.scheduling.cpm import MILESTONE_TYPES, SUMMARY_TYPES, _data_date
+from schedule_agent_web.scheduling.xer_parser import ParsedXer, parse_p6_date
+
+MANIFEST_FILE = "manifest.json"
+KEYS_FILE = "keys.tsv"
+EPOCH = datetime(1970, 1, 1)
+
+# Snapshot columns: name -> array typecode (stored little-endian).
+COLUMNS = {
+    "key": "i", "start": "i", "finish": "i", "float": "f", "remaining": "f", "duration": "f", "pct": "f",
+    "status": "b", "kind": "b",
+}
+DATE_COLUMNS = ("start", "finish")
+NO_DATE = -2 ** 31
+_DTYPES = {"i": "<i4", "f": "<f4", "b": "i1"}
+NOT_STARTED, ACTIVE, COMPLETE = 0, 1, 2
+_STATUS = {"TK_NotStart": NOT_STARTED, "TK_Active": ACTIVE, "TK_Complete": COMPLETE}
+TASK_KIND, MILESTONE_KIND, SUMMARY_KIND = 0, 1, 2
+
+_locks: dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _minute(value: str) -> int:
+    d = parse_p6_date(value)
+    return int((d - EPOCH).total_seconds() // 60) if d is not None else NO_DATE
+
+
+def _iso(day: float) -> str:
+    if day != day:
+        return ""
+    return datetime.fromtimestamp(day * 86400.0, tz=timezone.utc).strftime("%Y-%m-%d %H:%M")
+
+
+def _one_line(text: str) -> str:
+    return text.replace("\t", " ").replace("\r", " ").replace("\n", " ")
+
+
+def _round(v, digits: int = 1):
+    return round(float(v), digits) if v == v else None
+
+
+def snapshot(parsed: ParsedXer) -> tuple[list[str], list[str], dict[str, array], dict]:
+    """Per-activity columns of a parsed schedule: (keys, names, columns without "key", summary)."""
+    tasks = parsed.get("TASK")
+    n = len(tasks) if tasks else 0
+    cols = {name: array(code) for name, code in COLUMNS.items() if name != "key"}
+    if not n:
+        return [], [], cols, {"dataDate": None, "activities": 0, "complete": 0, "projectFinish": None}
+    hours = calendar_day_hours(parsed) if parsed.get("CALENDAR") else {}
+    default_hours = hours.get("") or DEFAULT_DAY_HOURS
+    day_hours = [hours.get(c, default_hours) or default_hours for c in tasks.texts("clndr_id")]
+    keys = [code or tid for code, tid in zip(tasks.texts("task_code"), tasks.texts("task_id"))]
+    for act, early, planned, out in ((tasks.texts("act_start_date"), tasks.texts("early_start_date"),
+                                      tasks.texts("target_start_date"), cols["start"]),
+                                     (tasks.texts("act_end_date"), tasks.texts("early_end_date"),
+                                      tasks.texts("target_end_date"), cols["finish"])):
+        out.extend(_minute(a or e or p) for a, e, p in zip(act, early, planned))
+    for field, name in (("total_float_hr_cnt", "float"), ("remain_drtn_hr_cnt", "remaining"),
+                        ("target_drtn_hr_cnt", "duration")):
+        cols[name].extend(v / h for v, h in zip(tasks.floats(field), day_hours))
+    cols["pct"].extend(map(float, tasks.floats("phys_complete_pct")))
+    cols["status"].extend(_STATUS.get(s, NOT_STARTED) for s in tasks.texts("status_code"))
+    kinds = {**{t: MILESTONE_KIND for t in MILESTONE_TYPES}, **{t: SUMMARY_KIND for t in SUMMARY_TYPES}}
+    cols["kind"].extend(kinds.get(t, TASK_KIND) for t in tasks.texts("task_type"))
+    dd, _ = _data_date(parsed, None)
+    finishes = [f for f, k in zip(cols["finish"], cols["kind"]) if f != NO_DATE and k != SUMMARY_KIND]
+    summary = {"dataDate": (dd - EPOCH).total_seconds() / 86400.0 if dd else None, "activities": n,
+               "complete": cols["status"].count(COMPLETE),
+               "projectFinish": max(finishes) / 1440.0 if finishes else None}
+    return keys, tasks.texts("task_name"), cols, summary
+
+
+class TrendStore:
+    """Append-only snapshots of one session's submitted schedules."""
+
+    def __init__(self, root: str):
+        self.root = root
+        with _locks_guard:
+            self._lock = _locks.setdefault(os.path.abspath(root), threading.Lock())
+        self._keys: list[str] | None = None
+        self._names: list[str] = []
+
+    # -- files ---------------------------------------------------------------------------------
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def manifest(self) -> list[dict]:
+        try:
+            with open(self._path(MANIFEST_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def _save_manifest(self, entries: list[dict]) -> None:
+        tmp = self._path(MANIFEST_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entries, f, indent=1)
+        os.replace(tmp, self._path(MANIFEST_FILE))
+
+    def keys(self) -> tuple[list[str], list[str]]:
+        """(activity keys, names) by key id."""
+        if self._keys is None:
+            keys, names = [], []
+            try:
+                with open(self._path(KEYS_FILE), "r", encoding="utf-8") as f:
+                    for line in f:
+                        key, _, name = line.rstrip("\n").partition("\t")
+                        keys.append(key)
+                        names.append(name)
+            except OSError:
+                pass
+            self._keys, self._names = keys, names
+        return self._keys, self._names
+
+    def _key_ids(self, keys: list[str], names: list[str]) -> array:
+        known, known_names = self.keys()
+        ids = {k: i for i, k in enumerate(known)}
+        out, new = array("i"), []
+        for key, name in zip(keys, names):
+            i = ids.get(key)
+            if i is None:
+                i = ids[key] = len(known) + len(new)
+                new.append((key, name))
+            out.append(i)
+        if new:
+            with open(self._path(KEYS_FILE), "a", encoding="utf-8") as f:
+                f.write("".join(f"{_one_line(k)}\t{_one_line(nm)}\n" for k, nm in new))
+            known.extend(k for k, _ in new)
+            known_names.extend(nm for _, nm in new)
+        return out
+
+    # -- recording -----------------------------------------------------------------------------
+
+    def record(self, label: str, parsed: ParsedXer, **meta) -> dict:
+        """Snapshot a parsed schedule as version label (replacing an earlier snapshot of that label)."""
+        keys, names, cols, summary = snapshot(parsed)
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            self._keys = None
+            cols = {"key": self._key_ids(keys, names), **cols}
+            blocks, offset = [], 0
+            for name, col in cols.items():
+                if sys.byteorder != "little" and col.itemsize > 1:
+                    col = array(col.typecode, col)
+                    col.byteswap()
+                data = col.tobytes()
+                blocks.append((name, col.typecode, offset, len(data), data))
+                offset += len(data)
+            header = {"rows": len(keys), "columns": [[n, t, o, s] for n, t, o, s, _ in blocks]}
+            fname = "".join(c if c.isalnum() or c in "-_" else "_" for c in label) + ".snap"
+            tmp = self._path(fname + ".tmp")
+            with open(tmp, "wb") as f:
+                f.write(json.dumps(header).encode("utf-8") + b"\n")
+                for *_, data in blocks:
+                    f.write(data)
+            os.replace(tmp, self._path(fname))
+            entry = {"label": label, "file": fname, **summary, **meta,
+                     "recordedAt": datetime.now(timezone.utc).isoformat()}
+            entries = [e for e in self.manifest() if e.get("label") != label] + [entry]
+            entries.sort(key=lambda e: (e.get("dataDate") or 0, e.get("label", "")))
+            self._save_manifest(entries)
+        return entry
+
+    def remove(self, label: str) -> bool:
+        with self._lock:
+            entries = self.manifest()
+            keep = [e for e in entries if e.get("label") != label]
+            if len(keep) == len(entries):
+                return False
+            self._save_manifest(keep)
+            for e in entries:
+                if e.get("label") == label:
+                    try:
+                        os.remove(self._path(e["file"]))
+                    except OSError:
+                        pass
+        return True
+
+    # -- reading -------------------------------------------------------------------------------
+
+    def read(self, entry: dict, names: tuple[str, ...]) -> dict:
+        """Columns of one snapshot as numpy arrays (only the requested blocks are read); dates in days."""
+        out = {}
+        with open(self._path(entry["file"]), "rb") as f:
+            header = json.loads(f.readline())
+            base = f.tell()
+            blocks = {c[0]: c for c in header["columns"]}
+            for name in names:
+                _, code, offset, size = blocks[name]
+                f.seek(base + offset)
+                col = np.frombuffer(f.read(size), dtype=_DTYPES[code])
+                if name in DATE_COLUMNS:
+                    col = np.where(col == NO_DATE, np.nan, col / 1440.0)
+                out[name] = col
+        return out
+
+    def matrix(self, entries: list[dict], name: str) -> "np.ndarray":
+        """versions x activity-keys matrix of one column (NaN where a version lacks the activity)."""
+        known, _ = self.keys()
+        m = np.full((len(entries), len(known)), np.nan)
+        for r, e in enumerate(entries):
+            cols = self.read(e, ("key", name))
+            m[r, cols["key"]] = cols[name]
+        return m
+
+    # -- queries -------------------------------------------------------------------------------
+
+    def _window(self, last: int = 0) -> list[dict]:
+        entries = self.manifest()
+        return entries[-last:] if last > 0 else entries
+
+    def history(self) -> list[dict]:
+        """Per version: data date, activity counts, project finish and its slip, BEI.
+
+        BEI is DCMA's: activities completed / activities whose baseline finish is on or before the data
+        date (baseline = the first recorded baseline submission, else the first version).
+        """
+        entries = self.manifest()
+        if not entries:
+            return []
+        base = next((e for e in entries if e.get("submission_type") == "baseline"), entries[0])
+        b = self.read(base, ("key", "finish", "kind"))
+        known, _ = self.keys()
+        base_finish = np.full(len(known), np.nan)
+        keep = b["kind"] != SUMMARY_KIND
+        base_finish[b["key"][keep]] = b["finish"][keep]
+        first_finish = entries[0].get("projectFinish")
+        out = []
+        for e in entries:
+            cols = self.read(e, ("key", "status", "kind"))
+            work = cols["kind"] != SUMMARY_KIND
+            completed = int(np.count_nonzero(work & (cols["status"] == COMPLETE)))
+            dd = e.get("dataDate")
+            due = int(np.count_nonzero(base_finish <= dd)) if dd is not None else 0
+            pf = e.get("projectFinish")
+            out.append({
+                "label": e["label"], "submission_type": e.get("submission_type", ""), "version": e.get("version"),
+                "dataDate": _iso(dd) if dd is not None else "", "activities": e.get("activities", 0),
+                "completed": completed, "baselineDue": due, "bei": round(completed / due, 2) if due else None,
+                "projectFinish": _iso(pf) if pf is not None else "",
+                "finishSlipDays": _round(pf - first_finish) if pf is not None and first_finish is not None else None,
+            })
+        return out
+
+    def float_erosion(self, last: int = 0, limit: int = 50) -> dict:
+        """Activities whose total float fell the most over the last N versions (all by default).
+
+        Erosion is the first float an activity has in the window minus its float in the latest version;
+        activities complete in the latest version, or missing from it, are left out.
+        """
+        entries = self._window(last)
+        if not entries:
+            return {"versions": [], "tracked": 0, "eroded": 0, "activities": []}
+        tf = self.matrix(entries, "float")
+        latest = self.read(entries[-1], ("key", "status", "kind"))
+        live = np.zeros(tf.shape[1], bool)
+        live[latest["key"][(latest["status"] != COMPLETE) & (latest["kind"] != SUMMARY_KIND)]] = True
+        seen = ~np.isnan(tf)
+        first = tf[seen.argmax(axis=0), np.arange(tf.shape[1])]
+        erosion = np.where(live & seen[-1], first - tf[-1], np.nan)
+        tracked = ~np.isnan(erosion)
+        order = np.argsort(-np.where(tracked, erosion, -np.inf), kind="stable")
+        order = [int(k) for k in order[:limit] if tracked[k] and erosion[k] > 0]
+        keys, names = self.keys()
+        return {
+            "versions": [e["label"] for e in entries],
+            "tracked": int(tracked.sum()),
+            "eroded": int(np.count_nonzero(erosion[tracked] > 0)),
+            "meanErosionDays": _round(np.mean(erosion[tracked])) if tracked.any() else None,
+            "activities": [{"key": keys[k], "name": names[k], "erosionDays": _round(erosion[k]),
+                            "float": [_round(v) for v in tf[:, k]]} for k in order],
+        }
+
+    def milestone_slip(self, keys: list[str] | None = None, last: int = 0, limit: int = 50) -> dict:
+        """Finish dates of milestones (or of the given activity keys) across versions, largest slip first."""
+        entries = self._window(last)
+        if not entries:
+            return {"versions": [], "milestones": []}
+        fin = self.matrix(entries, "finish")
+        known, names = self.keys()
+        if keys:
+            ids = {k: i for i, k in enumerate(known)}
+            pick = np.array(sorted({ids[k] for k in keys if k in ids}), dtype=np.int64)
+        else:
+            pick = np.flatnonzero(np.fmax.reduce(self.matrix(entries, "kind"), axis=0) == MILESTONE_KIND)
+        rows = []
+        for k in pick:
+            series = fin[:, k]
+            seen = np.flatnonzero(~np.isnan(series))
+            if not len(seen):
+                continue
+            slip = series[seen[-1]] - series[seen[0]]
+            rows.append({"key": known[k], "name": names[k], "slipDays": _round(slip),
+                         "finish": [_iso(v) for v in series]})
+        rows.sort(key=lambda r: -abs(r["slipDays"] or 0))
+        return {"versions": [e["label"] for e in entries], "count": len(rows), "milestones": rows[:limit]}
+
+    def activity(self, key: str) -> list[dict] | None:
+        """One activity's snapshot in every version it appears in; None if never recorded."""
+        known, _ = self.keys()
+        try:
+            k = known.index(key)
+        except ValueError:
+            return None
+        out = []
+        for e in self.manifest():
+            cols = self.read(e, tuple(COLUMNS))
+            hit = np.flatnonzero(cols["key"] == k)
+            if not len(hit):
+                continue
+            i = hit[0]
+            out.append({"label": e["label"], "start": _iso(cols["start"][i]), "finish": _iso(cols["finish"][i]),
+                        "totalFloat": _round(cols["float"][i]), "remaining": _round(cols["remaining"][i]),
+                        "duration": _round(cols["duration"][i]), "pctComplete": _round(cols["pct"][i]),
+                        "status": ("TK_NotStart", "TK_Active", "TK_Complete")[int(cols["status"][i])]})
+        return out
+
+
+def _trend_dir(session_id: str) -> str:
+    from schedule_agent_web.store import _file_store_dir, _safe_session
+    return os.path.join(_file_store_dir(), _safe_session(session_id), "trends")
+
+
+def trend_store(session_id: str) -> TrendStore:
+    """The session's trend store (file_store/<session>/trends/)."""
+    return TrendStore(_trend_dir(session_id))
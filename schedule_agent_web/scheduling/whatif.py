@@ -0,0 +1,564 @@
+"""
+Schedule engine: incremental what-if scheduling.
+
+A what-if applies edits to a scheduled network (duration changes, added / removed ties,
+constraint changes) and re-schedules only what they reach. Starting from the cached CPM result,
+the forward pass re-evaluates the edited activities and then each successor whose early dates
+actually moved, in topological order (a heap keyed on the level position, so an added tie that
+runs against the old order still converges); the backward pass does the same in reverse from the
+edited activities plus, when the project finish moves, the activities the finish constrains. An
+edit off the critical path typically touches a few dozen activities instead of the whole network.
+
+Each activity is recomputed with the same arithmetic as PassPlan (working time on its own calendar,
+ties between calendars converted through clock time), so the result equals a full run_cpm of the
+edited schedule. When an edit reaches more than MAX_SHARE of the network the scenario falls back to
+that full run, which the vectorised passes do faster than the per-activity loop.
+"""
+from __future__ import annotations
+
+import copy
+import heapq
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from schedule_agent_web.scheduling.calendars import DEFAULT_DAY_HOURS
+from schedule_agent_web.scheduling.cpm import (
+    _CSTR_EF_MIN,
+    _CSTR_ES_MIN,
+    _CSTR_LF_MAX,
+    _CSTR_LS_MAX,
+    _CSTR_MAND_FIN,
+    _CSTR_MAND_START,
+    REL_NAMES,
+    CpmResult,
+    _topo_levels,
+    compute_cpm,
+    pass_plan,
+    rel_type_name,
+    run_cpm,
+)
+from schedule_agent_web.scheduling.xer_parser import ParsedXer, parse_p6_date
+
+TOL_HOURS = 1e-6
+MAX_SHARE = 0.05          # fall back to full passes past this share of the network
+MIN_INCREMENTAL = 2000    # ... but never below this many activity updates
+MAX_EDITS = 200
+
+CONSTRAINT_TYPES = sorted(set(_CSTR_ES_MIN + _CSTR_EF_MIN + _CSTR_LS_MAX + _CSTR_LF_MAX
+                              + _CSTR_MAND_START + _CSTR_MAND_FIN))
+
+
+class _TooWide(Exception):
+    """The edits reach too much of the network for the incremental passes to pay off."""
+
+
+class Scenario:
+    """Edits resolved to nodes: durations and constraint bounds (clock hours) per node, ties added
+    as (pred, succ, rtype, lag hours) and live ties removed (PassPlan edge indexes)."""
+
+    def __init__(self):
+        self.dur: dict[int, float] = {}
+        self.bounds: dict[int, tuple] = {}    # node -> (es_min, ef_min, ls_max, lf_max, es_force, ef_force)
+        self.added: list[tuple[int, int, int, float]] = []
+        self.removed: set[int] = set()
+        self.ignored: list[str] = []
+        self.fwd_seeds: set[int] = set()
+        self.bwd_seeds: set[int] = set()
+
+
+class WhatIf:
+    """Incremental re-scheduling of one CPM result; build once per schedule and run many scenarios."""
+
+    def __init__(self, cpm: CpmResult):
+        net = cpm.network
+        plan = pass_plan(net)
+        n, m = net.n, plan.m
+        cals, cal = net.calendars, net.cal
+        self.cpm = cpm
+        self.net = net
+        pos = np.full(n, -1, dtype=np.int64)
+        pos[net.order] = np.arange(m)
+        self.pos = pos.tolist()
+        self.cal = cal.tolist()
+        self.dur = net.dur.tolist()
+        self.fixed = plan.fixed.tolist()
+        fix_es_w = cals.to_work(cal, plan.fix_es)
+        fix_ef_w = np.where(plan.done, cals.to_work(cal, plan.fix_ef), cals.to_work(cal, np.zeros(n)))
+        self.fix_es_w, self.fix_ef_w = fix_es_w.tolist(), fix_ef_w.tolist()
+        # Bounds per node in working time (plan arrays are in topological positions).
+        bounds = np.full((6, n), np.nan)
+        order = net.order
+        bounds[0, order], bounds[1, order] = plan.lb[:m], plan.lb[m:]
+        bounds[2, order], bounds[3, order] = plan.ls_max, plan.lf_max
+        bounds[4, order], bounds[5, order] = plan.es_force, plan.ef_force
+        self.lf_max_w = bounds[3]
+        self.bounds = [bounds[k].tolist() for k in range(6)]
+        # Live ties with the pass semantics, and CSR adjacency both ways.
+        self.e_pred, self.e_succ = plan.e_pred.tolist(), plan.e_succ.tolist()
+        self.e_lag = plan.e_lag.tolist()
+        self.e_ff, self.e_tf, self.e_cross = plan.from_finish.tolist(), plan.to_finish.tolist(), plan.cross.tolist()
+        self.e_rtype = np.where(plan.from_finish, np.where(plan.to_finish, 2, 0),
+                                np.where(plan.to_finish, 3, 1)).tolist()
+        self.live_edge = np.flatnonzero(~plan.fixed[net.succ])     # PassPlan edge -> network edge
+        q, p = plan.e_succ, plan.e_pred
+        o = np.argsort(q, kind="stable")
+        self.in_edge, self.in_ptr = o.tolist(), np.searchsorted(q[o], np.arange(n + 1)).tolist()
+        o = np.argsort(p, kind="stable")
+        self.out_edge, self.out_ptr = o.tolist(), np.searchsorted(p[o], np.arange(n + 1)).tolist()
+        self.ucal = np.unique(cal) if n else np.zeros(0, dtype=np.int32)
+        self.day_hours = np.where(net.day_hours > 0, net.day_hours, DEFAULT_DAY_HOURS).tolist() if n else []
+        self.base = [a.tolist() for a in (cpm.es_w, cpm.ef_w, cpm.ls_w, cpm.lf_w)]
+        self._codes: dict[str, int] | None = None
+
+    # -- edits ---------------------------------------------------------------------------------
+
+    def node_of(self, tasks, key) -> int | None:
+        """Node of a task_id or task_code (codes matched case-insensitively); None if unknown."""
+        key = str(key or "").strip()
+        i = self.net.index_of(key)
+        if i is not None:
+            return i
+        if self._codes is None:
+            codes = tasks.texts("task_code")
+            self._codes = {codes[int(r)].strip().upper(): k for k, r in enumerate(self.net.rows)}
+        return self._codes.get(key.upper())
+
+    def _node(self, tasks, key, what: str = "activity") -> int:
+        i = self.node_of(tasks, key)
+        if i is None:
+            raise ValueError(f"{what.capitalize()} '{key}' not found.")
+        if not self.net.in_network[i]:
+            raise ValueError(f"{what.capitalize()} '{key}' is not part of the scheduled network.")
+        return i
+
+    def _clock_date(self, value) -> float:
+        d = parse_p6_date(str(value or ""))
+        if d is None or self.net.data_date is None:
+            raise ValueError(f"Invalid constraint date '{value}' (use YYYY-MM-DD or YYYY-MM-DD HH:MM).")
+        return (d - self.net.data_date).total_seconds() / 3600.0
+
+    def scenario(self, tasks, edits: list[dict]) -> Scenario:
+        """Resolve edits against the network; raises ValueError on anything that cannot apply.
+
+        {"op": "duration", "activity": code|id, "days": remaining working days}
+        {"op": "add_tie", "pred": ..., "succ": ..., "type": "FS", "lag_days": 0}
+        {"op": "remove_tie", "pred": ..., "succ": ..., "type": optional}
+        {"op": "constraint", "activity": ..., "type": "CS_MSOA" | ... | "" to clear, "date": "2025-03-01"}
+        """
+        if len(edits) > MAX_EDITS:
+            raise ValueError(f"At most {MAX_EDITS} edits per scenario.")
+        net = self.net
+        sc = Scenario()
+        for k, ed in enumerate(edits):
+            op = str(ed.get("op") or "").strip().lower()
+            if op == "duration":
+                v = self._node(tasks, ed.get("activity"))
+                if net.complete[v]:
+                    raise ValueError(f"Activity '{ed.get('activity')}' is complete.")
+                if self.dur[v] <= 0 and v not in sc.dur and self._is_milestone(tasks, v):
+                    raise ValueError(f"Activity '{ed.get('activity')}' is a milestone.")
+                try:
+                    days = float(ed.get("days"))
+                except (TypeError, ValueError):
+                    raise ValueError(f"Edit {k + 1}: 'days' must be a number.")
+                if not days >= 0:
+                    raise ValueError(f"Edit {k + 1}: 'days' must be zero or more.")
+                sc.dur[v] = days * self.day_hours[v]
+                sc.fwd_seeds.add(v)
+                sc.bwd_seeds.add(v)
+            elif op in ("add_tie", "remove_tie"):
+                u = self._node(tasks, ed.get("pred"), "predecessor")
+                v = self._node(tasks, ed.get("succ"), "successor")
+                if u == v:
+                    raise ValueError(f"Edit {k + 1}: an activity cannot be tied to itself.")
+                rtype = ed.get("type")
+                if op == "add_tie":
+                    rt = REL_NAMES.index(rel_type_name(rtype or "FS"))
+                    try:
+                        lag = float(ed.get("lag_days") or 0.0) * self.day_hours[u]
+                    except (TypeError, ValueError):
+                        raise ValueError(f"Edit {k + 1}: 'lag_days' must be a number.")
+                    if self.fixed[v]:
+                        sc.ignored.append(f"Tie {ed.get('pred')} -> {ed.get('succ')} does not drive: the "
+                                          "successor is in progress or complete.")
+                        continue
+                    sc.added.append((u, v, rt, lag))
+                    sc.fwd_seeds.add(v)
+                    sc.bwd_seeds.add(u)
+                else:
+                    rt = REL_NAMES.index(rel_type_name(rtype)) if rtype else None
+                    found = [e for e in self._out(u) if self.e_succ[e] == v and (rt is None or self.e_rtype[e] == rt)]
+                    if not found:
+                        if self.fixed[v]:
+                            sc.ignored.append(f"Tie {ed.get('pred')} -> {ed.get('succ')} does not drive: the "
+                                              "successor is in progress or complete.")
+                            continue
+                        raise ValueError(f"Edit {k + 1}: no tie {ed.get('pred')} -> {ed.get('succ')}"
+                                         + (f" ({REL_NAMES[rt]})" if rt is not None else "") + ".")
+                    sc.removed.update(found)
+                    sc.fwd_seeds.add(v)
+                    sc.bwd_seeds.add(u)
+            elif op == "constraint":
+                v = self._node(tasks, ed.get("activity"))
+                ct = str(ed.get("type") or "").strip().upper()
+                if ct in ("", "NONE"):
+                    sc.bounds[v] = (0.0, -np.inf, np.inf, np.inf, np.nan, np.nan)
+                else:
+                    if ct not in CONSTRAINT_TYPES:
+                        raise ValueError(f"Edit {k + 1}: unsupported constraint '{ct}' "
+                                         f"(one of {', '.join(CONSTRAINT_TYPES)}, or empty to clear).")
+                    h = self._clock_date(ed.get("date"))
+                    sc.bounds[v] = (max(0.0, h) if ct in _CSTR_ES_MIN else 0.0,
+                                    h if ct in _CSTR_EF_MIN else -np.inf,
+                                    h if ct in _CSTR_LS_MAX + _CSTR_MAND_START else np.inf,
+                                    h if ct in _CSTR_LF_MAX + _CSTR_MAND_FIN else np.inf,
+                                    h if ct in _CSTR_MAND_START else np.nan,
+                                    h if ct in _CSTR_MAND_FIN else np.nan)
+                sc.fwd_seeds.add(v)
+                sc.bwd_seeds.add(v)
+            else:
+                raise ValueError(f"Edit {k + 1}: unknown op '{op}' (duration, add_tie, remove_tie, constraint).")
+        self._check_loops(sc)
+        return sc
+
+    def _is_milestone(self, tasks, v: int) -> bool:
+        return tasks.text("task_type", int(self.net.rows[v])) in ("TT_Mile", "TT_FinMile")
+
+    def _out(self, u: int) -> list[int]:
+        return self.out_edge[self.out_ptr[u]:self.out_ptr[u + 1]]
+
+    def _check_loops(self, sc: Scenario) -> None:
+        """Reject added ties that close a loop. A tie forward in the topological order cannot, so
+        only ties against it are searched, over positions no later than their predecessor."""
+        pos = self.pos
+        back = [(u, v) for u, v, _, _ in sc.added if pos[v] <= pos[u]]
+        if not back:
+            return
+        # A path can only climb back down through one of these ties, so it never needs to pass
+        # the highest of their predecessors.
+        limit = max(pos[u] for u, _ in back)
+        extra: dict[int, list[int]] = {}
+        for u, v, _, _ in sc.added:
+            extra.setdefault(u, []).append(v)
+        codes = self.net.task_ids
+        for u, v in back:
+            stack, seen = [v], {v}
+            while stack:
+                x = stack.pop()
+                if x == u:
+                    raise ValueError(f"Tie {codes[u]} -> {codes[v]} would create a logic loop.")
+                nxt = [self.e_succ[e] for e in self._out(x) if e not in sc.removed] + extra.get(x, [])
+                for y in nxt:
+                    if y not in seen and pos[y] <= limit:
+                        seen.add(y)
+                        stack.append(y)
+
+    # -- passes --------------------------------------------------------------------------------
+
+    def _convert(self, to_cal: int, from_cals: list[int], vals: list[float], start: list[bool]) -> list[float]:
+        cals = self.net.calendars
+        w = cals.from_work(np.asarray(from_cals), np.asarray(vals), start=np.asarray(start))
+        return cals.to_work(np.full(len(vals), to_cal), w).tolist()
+
+    def _forward(self, sc: Scenario, cap: int) -> dict[int, tuple[float, float]]:
+        """New early (start, finish) in working time of every activity whose dates move."""
+        pos, cal, fixed, dur = self.pos, self.cal, self.fixed, self.dur
+        e_pred, e_lag, e_ff, e_tf, e_cross = self.e_pred, self.e_lag, self.e_ff, self.e_tf, self.e_cross
+        in_ptr, in_edge, out_ptr, out_edge, succ = self.in_ptr, self.in_edge, self.out_ptr, self.out_edge, self.e_succ
+        b_es, b_ef, _, _, b_esf, b_eff = self.bounds
+        removed = sc.removed
+        add_in: dict[int, list] = {}
+        add_out: dict[int, list] = {}
+        for u, v, rt, lag in sc.added:
+            add_in.setdefault(v, []).append((u, rt in (0, 2), rt in (2, 3), lag))
+            add_out.setdefault(u, []).append(v)
+        bounds_w = {v: self.net.calendars.to_work(np.full(6, cal[v]), np.asarray(b)).tolist()
+                    for v, b in sc.bounds.items()}
+        base_es, base_ef = self.base[0], self.base[1]
+        new: dict[int, tuple[float, float]] = {}
+        heap = [(pos[v], v) for v in sc.fwd_seeds]
+        heapq.heapify(heap)
+        queued = set(sc.fwd_seeds)
+        pops = 0
+        while heap:
+            _, v = heapq.heappop(heap)
+            queued.discard(v)
+            pops += 1
+            if pops > cap:
+                raise _TooWide
+            d = sc.dur.get(v, dur[v])
+            if fixed[v]:
+                s, f = self.fix_es_w[v], self.fix_ef_w[v] + d
+            else:
+                b = bounds_w.get(v)
+                if b is None:
+                    s_lb, f_lb, esf, eff = b_es[v], b_ef[v], b_esf[v], b_eff[v]
+                else:
+                    s_lb, f_lb, esf, eff = b[0], b[1], b[4], b[5]
+                xc, xv, xs, xt = [], [], [], []
+                ties = [(e_pred[e], e_ff[e], e_tf[e], e_lag[e], e_cross[e])
+                        for e in in_edge[in_ptr[v]:in_ptr[v + 1]] if e not in removed]
+                ties += [(u, ff, tf, lag, cal[u] != cal[v]) for u, ff, tf, lag in add_in.get(v, ())]
+                for u, ff, tf, lag, cross in ties:
+                    x = new.get(u)
+                    val = (x[1] if ff else x[0]) if x else (base_ef[u] if ff else base_es[u])
+                    val += lag
+                    if cross:
+                        xc.append(cal[u])
+                        xv.append(val)
+                        xs.append(not ff)
+                        xt.append(tf)
+                    elif tf:
+                        f_lb = max(f_lb, val)
+                    else:
+                        s_lb = max(s_lb, val)
+                if xv:
+                    for val, tf in zip(self._convert(cal[v], xc, xv, xs), xt):
+                        if tf:
+                            f_lb = max(f_lb, val)
+                        else:
+                            s_lb = max(s_lb, val)
+                s = max(s_lb, f_lb - d)
+                if esf == esf:
+                    s = esf
+                if eff == eff:
+                    s = eff - d
+                f = s + d
+            x = new.get(v) or (base_es[v], base_ef[v])
+            if abs(s - x[0]) <= TOL_HOURS and abs(f - x[1]) <= TOL_HOURS:
+                continue
+            new[v] = (s, f)
+            for w in [succ[e] for e in out_edge[out_ptr[v]:out_ptr[v + 1]] if e not in removed] + add_out.get(v, []):
+                if w not in queued:
+                    queued.add(w)
+                    heapq.heappush(heap, (pos[w], w))
+        return new
+
+    def _finish_work(self, project_finish: float) -> dict[int, float]:
+        w = self.net.calendars.to_work(self.ucal, np.full(len(self.ucal), project_finish))
+        return dict(zip(self.ucal.tolist(), w.tolist()))
+
+    def _backward(self, sc: Scenario, seeds: set[int], project_finish: float, cap: int) -> dict[int, tuple[float, float]]:
+        """New late (start, finish) in working time of every activity whose dates move."""
+        pos, cal, dur = self.pos, self.cal, self.dur
+        e_succ, e_lag, e_ff, e_tf, e_cross = self.e_succ, self.e_lag, self.e_ff, self.e_tf, self.e_cross
+        in_ptr, in_edge, out_ptr, out_edge, pred = self.in_ptr, self.in_edge, self.out_ptr, self.out_edge, self.e_pred
+        _, _, b_ls, b_lf, _, _ = self.bounds
+        removed = sc.removed
+        add_out: dict[int, list] = {}
+        add_in: dict[int, list] = {}
+        for u, v, rt, lag in sc.added:
+            add_out.setdefault(u, []).append((v, rt in (0, 2), rt in (2, 3), lag))
+            add_in.setdefault(v, []).append(u)
+        bounds_w = {v: self.net.calendars.to_work(np.full(6, cal[v]), np.asarray(b)).tolist()
+                    for v, b in sc.bounds.items()}
+        pf_w = self._finish_work(project_finish)
+        base_ls, base_lf = self.base[2], self.base[3]
+        new: dict[int, tuple[float, float]] = {}
+        heap = [(-pos[v], v) for v in seeds]
+        heapq.heapify(heap)
+        queued = set(seeds)
+        pops = 0
+        while heap:
+            _, u = heapq.heappop(heap)
+            queued.discard(u)
+            pops += 1
+            if pops > cap:
+                raise _TooWide
+            d = sc.dur.get(u, dur[u])
+            b = bounds_w.get(u)
+            ls_ub, lf_ub = (b_ls[u], b_lf[u]) if b is None else (b[2], b[3])
+            lf_ub = min(pf_w[cal[u]], lf_ub)
+            xc, xv, xs, xt = [], [], [], []
+            ties = [(e_succ[e], e_ff[e], e_tf[e], e_lag[e], e_cross[e])
+                    for e in out_edge[out_ptr[u]:out_ptr[u + 1]] if e not in removed]
+            ties += [(v, ff, tf, lag, cal[u] != cal[v]) for v, ff, tf, lag in add_out.get(u, ())]
+            for v, ff, tf, lag, cross in ties:
+                x = new.get(v)
+                base = (x[1] if tf else x[0]) if x else (base_lf[v] if tf else base_ls[v])
+                if cross:
+                    xc.append(cal[v])
+                    xv.append(base)
+                    xs.append(not tf)
+                    xt.append((ff, lag))
+                elif ff:
+                    lf_ub = min(lf_ub, base - lag)
+                else:
+                    ls_ub = min(ls_ub, base - lag)
+            if xv:
+                for base, (ff, lag) in zip(self._convert(cal[u], xc, xv, xs), xt):
+                    if ff:
+                        lf_ub = min(lf_ub, base - lag)
+                    else:
+                        ls_ub = min(ls_ub, base - lag)
+            f = min(lf_ub, ls_ub + d)
+            s = f - d
+            x = new.get(u) or (base_ls[u], base_lf[u])
+            if abs(s - x[0]) <= TOL_HOURS and abs(f - x[1]) <= TOL_HOURS:
+                continue
+            new[u] = (s, f)
+            for w in [pred[e] for e in in_edge[in_ptr[u]:in_ptr[u + 1]] if e not in removed] + add_in.get(u, []):
+                if w not in queued:
+                    queued.add(w)
+                    heapq.heappush(heap, (-pos[w], w))
+        return new
+
+    def _clock(self, idx, start_w, finish_w, dur):
+        """_to_clock for a subset of nodes, with the scenario's durations."""
+        net = self.net
+        cals, cal = net.calendars, net.cal[idx]
+        start = cals.from_work(cal, start_w, start=True)
+        finish = cals.from_work(cal, finish_w, start=False)
+        zero = dur <= 0
+        fin_side = zero & net.finish_mile[idx]
+        start = np.where(fin_side, cals.from_work(cal, start_w, start=False), start)
+        finish = np.where(zero & ~fin_side, start, finish)
+        return start, finish
+
+    def _project_finish(self, ef_clock) -> float:
+        net = self.net
+        live_ef = ef_clock[net.in_network & ~net.complete]
+        pf = float(np.nanmax(live_ef)) if live_ef.size else 0.0
+        return net.must_finish if net.must_finish == net.must_finish else pf
+
+    def _incremental(self, sc: Scenario):
+        """(moved nodes, their [ES, EF, LS, LF] in working time, project finish, (forward, backward)
+        activities that moved)."""
+        cpm, net = self.cpm, self.net
+        cap = max(MIN_INCREMENTAL, int(MAX_SHARE * len(net.order)))
+        fwd = self._forward(sc, cap)
+        ef_clock = cpm.ef
+        if fwd:
+            idx = np.fromiter(fwd, np.int64, len(fwd))
+            s_w, f_w = np.asarray([fwd[int(i)] for i in idx]).T
+            d = np.asarray([sc.dur.get(int(i), self.dur[i]) for i in idx])
+            ef_clock = ef_clock.copy()
+            ef_clock[idx] = np.where(net.complete[idx], cpm.ef[idx], self._clock(idx, s_w, f_w, d)[1])
+        pf = self._project_finish(ef_clock)
+        seeds = set(sc.bwd_seeds)
+        if abs(pf - cpm.project_finish) > TOL_HOURS:
+            # Activities whose late finish the old finish bound, or the new one now cuts.
+            cals = net.calendars
+            ub_old = np.minimum(cals.to_work(net.cal, np.full(net.n, cpm.project_finish)), self.lf_max_w)
+            ub_new = np.minimum(cals.to_work(net.cal, np.full(net.n, pf)), self.lf_max_w)
+            lf0 = cpm.lf_w
+            hit = net.in_network & ((np.abs(lf0 - ub_old) <= TOL_HOURS) | (lf0 > ub_new + TOL_HOURS))
+            seeds.update(np.flatnonzero(hit).tolist())
+            if len(seeds) > cap:
+                raise _TooWide
+        bwd = self._backward(sc, seeds, pf, cap)
+        idx = np.asarray(sorted(set(fwd) | set(bwd) | set(sc.dur)), dtype=np.int64)
+        base = self.base
+        work = np.empty((4, len(idx)))
+        for k, i in enumerate(idx.tolist()):
+            early, late = fwd.get(i), bwd.get(i)
+            work[:2, k] = early if early else (base[0][i], base[1][i])
+            work[2:, k] = late if late else (base[2][i], base[3][i])
+        return idx, work, pf, (len(fwd), len(bwd))
+
+    def _full(self, sc: Scenario):
+        """The same scenario through a rebuilt network and full passes."""
+        net = self.net
+        ed = copy.copy(net)
+        ed.__dict__.pop("_plan", None)
+        ed.dur = net.dur.copy()
+        for v, h in sc.dur.items():
+            ed.dur[v] = h
+        for k, name in enumerate(("es_min", "ef_min", "ls_max", "lf_max", "es_force", "ef_force")):
+            arr = getattr(net, name).copy()
+            for v, b in sc.bounds.items():
+                arr[v] = b[k]
+            setattr(ed, name, arr)
+        keep = np.ones(len(net.pred), dtype=bool)
+        if sc.removed:
+            keep[self.live_edge[sorted(sc.removed)]] = False
+        add = np.asarray([(u, v) for u, v, _, _ in sc.added], dtype=np.int64).reshape(-1, 2)
+        ed.pred = np.concatenate((net.pred[keep], add[:, 0]))
+        ed.succ = np.concatenate((net.succ[keep], add[:, 1]))
+        ed.rtype = np.concatenate((net.rtype[keep], np.asarray([a[2] for a in sc.added], dtype=net.rtype.dtype)))
+        ed.lag = np.concatenate((net.lag[keep], np.asarray([a[3] for a in sc.added], dtype=np.float64)))
+        _topo_levels(ed, net.in_network.copy())
+        res = run_cpm(ed)
+        cpm = self.cpm
+        moved = np.zeros(net.n, dtype=bool)
+        for new, old in zip((res.es_w, res.ef_w, res.ls_w, res.lf_w), (cpm.es_w, cpm.ef_w, cpm.ls_w, cpm.lf_w)):
+            moved |= ~(np.abs(new - old) <= TOL_HOURS) & ~(np.isnan(new) & np.isnan(old))
+        moved[list(sc.dur)] = True
+        idx = np.flatnonzero(moved)
+        work = np.stack((res.es_w[idx], res.ef_w[idx], res.ls_w[idx], res.lf_w[idx]))
+        return idx, work, res.project_finish, (len(ed.order), len(ed.order))
+
+    def run(self, tasks, edits: list[dict], limit: int = 100) -> dict:
+        """Re-schedule under the edits: new project finish, per-activity date and float changes, and
+        activities entering or leaving the critical path."""
+        t0 = time.perf_counter()
+        cpm, net = self.cpm, self.net
+        sc = self.scenario(tasks, edits)
+        mode = "incremental"
+        try:
+            idx, work, pf, counts = self._incremental(sc)
+        except _TooWide:
+            mode = "full"
+            idx, work, pf, counts = self._full(sc)
+        es_w, ef_w, ls_w, lf_w = work
+        dur = np.asarray([sc.dur.get(int(i), self.dur[i]) for i in idx])
+        es, ef = self._clock(idx, es_w, ef_w, dur)
+        es = np.where(net.active[idx] | net.complete[idx], cpm.es[idx], es)
+        ef = np.where(net.complete[idx], cpm.ef[idx], ef)
+        out = net.complete[idx] | ~net.in_network[idx]
+        tf = np.where(out, np.nan, lf_w - ef_w)
+        crit = (tf <= 0) & ~out
+        was = cpm.critical[idx]
+        day_hours = np.asarray(self.day_hours)[idx] if len(idx) else np.zeros(0)
+        tf0 = cpm.total_float[idx]
+        delta_tf = (tf - tf0) / day_hours
+        delta_ef = (ef_w - cpm.ef_w[idx]) / day_hours
+        rank = np.lexsort((-np.abs(np.nan_to_num(delta_ef)), -np.abs(np.nan_to_num(delta_tf))))
+        codes = tasks.texts("task_code")
+        names = tasks.texts("task_name")
+
+        def code(i):
+            return codes[int(net.rows[i])]
+
+        def days(h, k):
+            return None if h != h else round(float(h) / float(day_hours[k]), 1)
+
+        activities = []
+        for k in rank[:max(limit, 0)]:
+            i = int(idx[k])
+            activities.append({
+                "task_id": net.task_ids[i], "task_code": code(i), "task_name": names[int(net.rows[i])],
+                "early_start": {"before": cpm.iso(cpm.es[i]), "after": cpm.iso(es[k])},
+                "early_finish": {"before": cpm.iso(cpm.ef[i]), "after": cpm.iso(ef[k])},
+                "total_float": {"before": days(tf0[k], k), "after": days(tf[k], k)},
+                "float_delta": None if delta_tf[k] != delta_tf[k] else round(float(delta_tf[k]), 1),
+                "finish_delta": None if delta_ef[k] != delta_ef[k] else round(float(delta_ef[k]), 1),
+                "critical": {"before": bool(was[k]), "after": bool(crit[k])},
+            })
+        joined = idx[crit & ~was]
+        left = idx[was & ~crit]
+        return {
+            "projectFinish": {"before": cpm.iso(cpm.project_finish), "after": cpm.iso(pf),
+                              "deltaDays": round((pf - cpm.project_finish) / 24.0, 1)},
+            "edits": len(edits),
+            "ignored": sc.ignored,
+            "changedCount": int(len(idx)),
+            "activities": activities,
+            "criticalPath": {
+                "joined": [code(i) for i in joined[:limit]], "joinedCount": int(len(joined)),
+                "left": [code(i) for i in left[:limit]], "leftCount": int(len(left)),
+                "criticalCount": int(cpm.critical.sum() + len(joined) - len(left)),
+            },
+            "mode": mode,
+            "recomputed": {"forward": counts[0], "backward": counts[1], "network": int(len(net.order))},
+            "elapsedMs": round((time.perf_counter() - t0) * 1000, 1),
+        }
+
+
+def what_if(parsed: ParsedXer, proj_id: str | None = None) -> WhatIf:
+    """WhatIf over compute_cpm(), memoised on the parse (adjacency built once per schedule)."""
+    return parsed.memo(f"whatif:{proj_id or ''}", lambda p: WhatIf(compute_cpm(p, proj_id=proj_id)))
@@ -0,0 +1,254 @@
+"""
+Schedule engine: content-addressed cache of parsed XER schedules.
+
+Entries are keyed by the SHA-256 of the stored file content, so one upload is decoded and parsed
+once no matter how many endpoints (chat context, intelligence, review) read it. The cache is an
+in-process LRU bounded by an approximate byte budget, which counts each parse's memoised derived
+structures (CPM results, indexes, per-project parses) as they are added; evicted entries can
+optionally be pickled to file_store/<session>/xer_cache/ and reloaded instead of re-parsed, and with
+XER_COLUMNAR_DIR set a copy converted by scripts/parse_xer.py is memory-mapped instead of parsed.
+store.save_file / delete_file call invalidate_file() so replaced or removed uploads release their memory;
+without spilling, an evicted entry's upload-name mappings are dropped with it.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+from schedule_agent_web.scheduling.xer_parser import ParsedXer, decode_xer_content, parse_xer_text
+
+XER_CACHE_MAX_MB = int(os.environ.get("XER_CACHE_MAX_MB", "256") or 256)
+XER_CACHE_SPILL = os.environ.get("XER_CACHE_SPILL", "").strip().lower() in ("1", "true", "yes")
+# Output root of scripts/parse_xer.py; uploads whose bytes were converted there load without parsing.
+XER_COLUMNAR_DIR = os.environ.get("XER_COLUMNAR_DIR", "").strip()
+
+_lock = threading.RLock()
+_entries: "OrderedDict[str, ParsedXer]" = OrderedDict()
+_sizes: dict[str, int] = {}
+_total_bytes = 0
+# (session_id, filename) -> content key, so an upload can be invalidated by name.
+_file_keys: dict[tuple[str, str], str] = {}
+# content key -> sessions that reference it (spill files live under the session directory).
+_key_sessions: dict[str, set[str]] = {}
+# One lock per key being parsed, so concurrent requests for the same file parse it once.
+_inflight: dict[str, threading.Lock] = {}
+_stats = {"hits": 0, "misses": 0, "spill_hits": 0, "columnar_hits": 0, "evictions": 0}
+
+
+def content_key(raw: str) -> str:
+    """SHA-256 of the stored (possibly base64) content."""
+    return hashlib.sha256((raw or "").encode("utf-8", errors="replace")).hexdigest()
+
+
+def _spill_dir(session_id: str) -> str | None:
+    try:
+        from schedule_agent_web.store import _file_store_dir, _safe_session
+        return os.path.join(_file_store_dir(), _safe_session(session_id), "xer_cache")
+    except Exception:
+        return None
+
+
+def _spill_path(session_id: str, key: str) -> str | None:
+    d = _spill_dir(session_id)
+    return os.path.join(d, key + ".pkl") if d else None
+
+
+def _spill(key: str, parsed: ParsedXer) -> None:
+    for session_id in list(_key_sessions.get(key, ())):
+        path = _spill_path(session_id, key)
+        if not path or os.path.isfile(path):
+            continue
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump(parsed, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except Exception:
+            pass
+
+
+def _load_spilled(session_id: str | None, key: str) -> ParsedXer | None:
+    if not XER_CACHE_SPILL or not session_id:
+        return None
+    path = _spill_path(session_id, key)
+    if not path or not os.path.isfile(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            parsed = pickle.load(f)
+        return parsed if isinstance(parsed, ParsedXer) else None
+    except Exception:
+        return None
+
+
+def _load_columnar(key: str, raw: str) -> ParsedXer | None:
+    """Converted copy of this content: matched on the stored text, or on the decoded text of a
+    base64 upload (datasets are keyed by the SHA-256 of the XER file bytes)."""
+    if not XER_COLUMNAR_DIR:
+        return None
+    try:
+        from schedule_agent_web.scheduling.columnar import find_dataset, open_dataset
+        path = find_dataset(XER_COLUMNAR_DIR, key)
+        if path is None:
+            decoded = decode_xer_content(raw or "")
+            if decoded is not raw:
+                path = find_dataset(XER_COLUMNAR_DIR, content_key(decoded))
+        return open_dataset(path) if path else None
+    except Exception:
+        return None
+
+
+def _remove_spilled(session_id: str, key: str) -> None:
+    path = _spill_path(session_id, key)
+    try:
+        if path and os.path.isfile(path):
+            os.remove(path)
+    except Exception:
+        pass
+
+
+def _evict_over_budget() -> None:
+    global _total_bytes
+    budget = XER_CACHE_MAX_MB * 1024 * 1024
+    # Always keep the most recent entry, even if it alone exceeds the budget.
+    while _total_bytes > budget and len(_entries) > 1:
+        key, parsed = _entries.popitem(last=False)
+        _total_bytes -= _sizes.pop(key, 0)
+        _stats["evictions"] += 1
+        if XER_CACHE_SPILL:
+            _spill(key, parsed)
+        else:
+            _forget(key)
+
+
+def _forget(key: str) -> None:
+    """Drop the session and upload-name mappings of a key held neither in memory nor on disk."""
+    _key_sessions.pop(key, None)
+    for name in [name for name, k in _file_keys.items() if k == key]:
+        del _file_keys[name]
+
+
+def _put(key: str, parsed: ParsedXer) -> None:
+    global _total_bytes
+    with _lock:
+        if key in _entries:
+            _entries.move_to_end(key)
+            return
+        size = parsed.nbytes()
+        _entries[key] = parsed
+        _sizes[key] = size
+        _total_bytes += size
+        parsed.on_grow = lambda n: _grown(key, n)
+        _evict_over_budget()
+
+
+def _grown(key: str, size: int) -> None:
+    """A cached parse memoised a derived structure: charge it to the entry and re-check the budget."""
+    global _total_bytes
+    with _lock:
+        if key not in _sizes:
+            return
+        _sizes[key] += size
+        _total_bytes += size
+        _entries.move_to_end(key)
+        _evict_over_budget()
+
+
+def _remember(key: str, session_id: str | None, filename: str | None) -> None:
+    if not session_id:
+        return
+    with _lock:
+        _key_sessions.setdefault(key, set()).add(session_id)
+        if filename:
+            _file_keys[(session_id, filename)] = key
+
+
+def get_cached(key: str) -> ParsedXer | None:
+    """Return the in-memory entry for a content key (no parsing)."""
+    with _lock:
+        parsed = _entries.get(key)
+        if parsed is not None:
+            _entries.move_to_end(key)
+        return parsed
+
+
+def get_parsed_xer(raw: str, session_id: str | None = None, filename: str | None = None) -> ParsedXer:
+    """Decode (base64 if needed) and parse stored XER content, reusing any earlier parse of the same bytes."""
+    key = content_key(raw)
+    _remember(key, session_id, filename)
+    parsed = get_cached(key)
+    if parsed is not None:
+        _stats["hits"] += 1
+        return parsed
+    with _lock:
+        gate = _inflight.setdefault(key, threading.Lock())
+    try:
+        with gate:
+            parsed = get_cached(key)
+            if parsed is not None:
+                _stats["hits"] += 1
+                return parsed
+            parsed = _load_spilled(session_id, key)
+            if parsed is not None:
+                _stats["spill_hits"] += 1
+            else:
+                parsed = _load_columnar(key, raw)
+                if parsed is not None:
+                    _stats["columnar_hits"] += 1
+            if parsed is None:
+                _stats["misses"] += 1
+                parsed = parse_xer_text(decode_xer_content(raw or ""))
+            _put(key, parsed)
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+            # A parse that raised leaves nothing behind to name.
+            if key not in _entries and not XER_CACHE_SPILL:
+                _forget(key)
+    return parsed
+
+
+def invalidate_file(session_id: str, filename: str) -> None:
+    """Forget the parse behind (session, filename); drop it entirely if no other upload shares it."""
+    global _total_bytes
+    with _lock:
+        key = _file_keys.pop((session_id, filename), None)
+        if key is None:
+            return
+        if any(k == key and s == session_id for (s, _), k in _file_keys.items()):
+            return
+        sessions = _key_sessions.get(key, set())
+        sessions.discard(session_id)
+        _remove_spilled(session_id, key)
+        if sessions:
+            return
+        _key_sessions.pop(key, None)
+        if _entries.pop(key, None) is not None:
+            _total_bytes -= _sizes.pop(key, 0)
+
+
+def clear_cache() -> None:
+    global _total_bytes
+    with _lock:
+        _entries.clear()
+        _sizes.clear()
+        _file_keys.clear()
+        _key_sessions.clear()
+        _inflight.clear()
+        _total_bytes = 0
+
+
+def cache_stats() -> dict:
+    with _lock:
+        return {
+            **_stats,
+            "entries": len(_entries),
+            "bytes": _total_bytes,
+            "max_bytes": XER_CACHE_MAX_MB * 1024 * 1024,
+            "spill": XER_CACHE_SPILL,
+            "columnar_dir": XER_COLUMNAR_DIR,
+        }
@@ -0,0 +1,583 @@
+"""
+Schedule engine: streaming columnar XER parser.
+
+Reads a P6 XER export line by line (text, file handle, or mmap'd buffer) and stores every
+%T section as a column-oriented table: one interned header list, one typed array per numeric
+field (durations, float, lags, quantities, costs) and one pooled string list per text field.
+Rows are exposed as lazy views, so no per-row dict is ever built.
+"""
+from __future__ import annotations
+
+import base64
+import io
+import math
+import mmap
+import os
+import re
+import sys
+import threading
+import types
+from array import array
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Any, Callable, Iterable, Iterator
+
+# Fields stored as float64 arrays. Anything else stays text (ids are join keys, keep them as strings).
+NUMERIC_SUFFIXES = ("_hr_cnt", "_qty", "_cost", "_pct", "_per_hr", "_units")
+NUMERIC_FIELDS = frozenset({"udf_number", "cost_per_qty", "max_qty_per_hr"})
+
+# Rows are transposed into columns in chunks (zip runs at C speed; a chunk bounds the transient list).
+_CHUNK_ROWS = 4096
+
+
+def is_numeric_field(field: str) -> bool:
+    return field in NUMERIC_FIELDS or field.endswith(NUMERIC_SUFFIXES)
+
+
+def _to_float(v: str) -> float:
+    """Parse one numeric cell; empty cells become NaN so callers can tell 'missing' from 0."""
+    return float(v) if v else math.nan
+
+
+def format_number(v: float) -> str:
+    """Render a numeric cell the way P6 wrote it ('40', '12.5'); NaN renders as empty."""
+    if v != v:
+        return ""
+    if v.is_integer():
+        return str(int(v))
+    return repr(v)
+
+
+class XerTable:
+    """One %T section stored column-wise. Iterating yields lazy XerRow views."""
+
+    __slots__ = ("name", "fields", "_index", "_columns", "_numeric", "_pools", "_pending", "_nrows")
+
+    def __init__(self, name: str, fields: list[str]):
+        self.name = sys.intern(name)
+        self.fields = [sys.intern(f) for f in fields]
+        self._index = {f: i for i, f in enumerate(self.fields)}
+        self._numeric = [is_numeric_field(f) for f in self.fields]
+        self._columns: list[Any] = [array("d") if num else [] for num in self._numeric]
+        self._pools: list[dict | None] = [None if num else {} for num in self._numeric]
+        self._pending: list[str] = []
+        self._nrows = 0
+
+    @classmethod
+    def from_columns(cls, name: str, fields: list[str], columns: list[Any]) -> "XerTable":
+        """Table over ready-made columns (e.g. read back from a converted dataset).
+
+        Numeric fields take any float64 sequence (array('d'), a NumPy view over a memory map);
+        a list of strings keeps the column as text.
+        """
+        t = cls(name, fields)
+        t._columns = list(columns)
+        t._numeric = [num and not isinstance(col, list) for num, col in zip(t._numeric, t._columns)]
+        t._pools = [None] * len(fields)
+        t._nrows = len(columns[0]) if columns else 0
+        return t
+
+    # -- building --------------------------------------------------------------------------
+
+    def _flush(self) -> None:
+        """Transpose buffered raw '%R' lines into the columns.
+
+        The chunk is joined and split once; when every row has the header's width the columns are
+        plain strided slices of that flat list, so no per-row list or tuple is ever created.
+        """
+        lines = self._pending
+        if not lines:
+            return
+        self._pending = []
+        width = len(self.fields) + 1
+        flat = "\t".join(lines).split("\t")
+        if len(flat) == width * len(lines) and flat[::width].count("%R") == len(lines):
+            columns = [flat[ci::width] for ci in range(1, width)]
+        else:
+            rows = [(line.split("\t") + [""] * width)[1:width] for line in lines]
+            columns = list(zip(*rows)) if rows else []
+        del flat
+        for ci, chunk in enumerate(columns):
+            stripped = list(map(str.strip, chunk))
+            if self._numeric[ci]:
+                col = self._columns[ci]
+                before = len(col)
+                try:
+                    col.extend(map(_to_float, stripped))
+                    continue
+                except ValueError:
+                    del col[before:]
+                    self._demote(ci)
+            pool = self._pools[ci]
+            self._columns[ci].extend(map(pool.setdefault, stripped, stripped))
+        self._nrows += len(lines)
+
+    def _demote(self, ci: int) -> None:
+        """A 'numeric' field held text: fall back to a pooled string column."""
+        self._numeric[ci] = False
+        self._pools[ci] = {}
+        self._columns[ci] = [format_number(v) for v in self._columns[ci]]
+
+    # -- access ----------------------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return self._nrows
+
+    def __iter__(self) -> Iterator["XerRow"]:
+        for i in range(self._nrows):
+            yield XerRow(self, i)
+
+    def __getitem__(self, i: int) -> "XerRow":
+        if i < 0:
+            i += self._nrows
+        if not 0 <= i < self._nrows:
+            raise IndexError(i)
+        return XerRow(self, i)
+
+    def __bool__(self) -> bool:
+        return self._nrows > 0
+
+    def has(self, field: str) -> bool:
+        return field in self._index
+
+    def is_numeric(self, field: str) -> bool:
+        ci = self._index.get(field)
+        return ci is not None and self._numeric[ci]
+
+    def column(self, field: str, default: Any = None) -> Any:
+        """Whole column: array('d') for numeric fields, list[str] otherwise; default if absent."""
+        ci = self._index.get(field)
+        if ci is None:
+            return default
+        return self._columns[ci]
+
+    def floats(self, field: str) -> array:
+        """Column as float64 (text columns are parsed, bad cells become NaN); NaNs if absent."""
+        ci = self._index.get(field)
+        if ci is None:
+            return array("d", [math.nan]) * self._nrows
+        if self._numeric[ci]:
+            return self._columns[ci]
+        out = array("d")
+        for v in self._columns[ci]:
+            try:
+                out.append(float(v) if v else math.nan)
+            except ValueError:
+                out.append(math.nan)
+        return out
+
+    def texts(self, field: str) -> list[str]:
+        """Column rendered as strings (numbers formatted like the source file); blanks if absent."""
+        ci = self._index.get(field)
+        if ci is None:
+            return [""] * self._nrows
+        if self._numeric[ci]:
+            return [format_number(v) for v in self._columns[ci]]
+        return self._columns[ci]
+
+    def value(self, field: str, i: int, default: Any = "") -> Any:
+        ci = self._index.get(field)
+        if ci is None:
+            return default
+        v = self._columns[ci][i]
+        if self._numeric[ci] and v != v:
+            return ""
+        return v
+
+    def text(self, field: str, i: int) -> str:
+        ci = self._index.get(field)
+        if ci is None:
+            return ""
+        v = self._columns[ci][i]
+        return format_number(v) if self._numeric[ci] else v
+
+    def to_dicts(self, as_text: bool = False) -> list[dict]:
+        """Materialise rows as dicts (for JSON export / legacy callers)."""
+        if as_text:
+            cols = [self.texts(f) for f in self.fields]
+        else:
+            cols = [[("" if v != v else v) for v in col] if self._numeric[ci] else col
+                    for ci, col in enumerate(self._columns)]
+        return [dict(zip(self.fields, vals)) for vals in zip(*cols)] if cols else []
+
+    def take(self, rows: list[int]) -> "XerTable":
+        """Table of the given rows, in that order (columns copied; text stays pooled)."""
+        self._flush()
+        cols = []
+        for ci, col in enumerate(self._columns):
+            get = col.__getitem__
+            cols.append(array("d", map(get, rows)) if self._numeric[ci] else list(map(get, rows)))
+        return XerTable.from_columns(self.name, self.fields, cols) if cols else XerTable(self.name, self.fields)
+
+    def nbytes(self) -> int:
+        """Rough in-memory footprint, used by the parsed-schedule cache for its budget."""
+        total = 0
+        for ci, col in enumerate(self._columns):
+            if self._numeric[ci]:
+                total += col.itemsize * len(col)
+            else:
+                pool = self._pools[ci]
+                total += 8 * len(col) + sum(len(s) + 49 for s in (pool if pool is not None else set(col)))
+        return total
+
+
+class XerRow(Mapping):
+    """Lazy read-only view of one row; behaves like the old row dict (get, [], in, keys)."""
+
+    __slots__ = ("_table", "_i")
+
+    def __init__(self, table: XerTable, i: int):
+        self._table = table
+        self._i = i
+
+    def __getitem__(self, field: str) -> Any:
+        t = self._table
+        ci = t._index[field]
+        v = t._columns[ci][self._i]
+        if t._numeric[ci] and v != v:
+            return ""
+        return v
+
+    def get(self, field: str, default: Any = None) -> Any:
+        if field not in self._table._index:
+            return default
+        return self[field]
+
+    def __contains__(self, field: object) -> bool:
+        return field in self._table._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._table.fields)
+
+    def __len__(self) -> int:
+        return len(self._table.fields)
+
+    def text(self, field: str) -> str:
+        return self._table.text(field, self._i)
+
+    @property
+    def index(self) -> int:
+        return self._i
+
+
+class ParsedXer:
+    """All tables of one XER export. get(name, default) mirrors the old dict-of-lists API."""
+
+    def __init__(self, tables: dict[str, XerTable], header: str = ""):
+        self.tables = tables
+        self.header = header
+        # Per-parse memo for derived structures (CPM network, indexes, ...); lives as long as the parse.
+        self.derived: dict[str, Any] = {}
+        self.derived_bytes = 0
+        self._counted: set[int] = set()
+        # One lock per key being built, so concurrent requests build each derived structure once.
+        self._memo_lock = threading.Lock()
+        self._building: dict[str, threading.Lock] = {}
+        # Called with the approximate size of each new memo entry (the parsed-schedule cache's budget).
+        self.on_grow: Callable[[int], None] | None = None
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.tables.get(name, default)
+
+    def __getitem__(self, name: str) -> XerTable:
+        return self.tables[name]
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.tables
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.tables)
+
+    def keys(self):
+        return self.tables.keys()
+
+    def items(self):
+        return self.tables.items()
+
+    def row_counts(self) -> dict[str, int]:
+        return {name: len(t) for name, t in self.tables.items()}
+
+    def nbytes(self) -> int:
+        """Tables plus memoised derived structures (approximate)."""
+        return sum(t.nbytes() for t in self.tables.values()) + self.derived_bytes
+
+    def partition(self) -> dict[str, dict[str, list[int]]]:
+        """Row indexes per proj_id of every table with a proj_id column (built once per parse).
+
+        Rows with a blank proj_id (global calendars, ...) sit under "" and belong to every project;
+        TASKPRED rows carry their successor's project.
+        """
+        def build(_):
+            parts: dict[str, dict[str, list[int]]] = {}
+            for name, t in self.tables.items():
+                if not t.has("proj_id"):
+                    continue
+                by: dict[str, list[int]] = {}
+                for i, pid in enumerate(t.texts("proj_id")):
+                    by.setdefault(pid, []).append(i)
+                parts[name] = by
+            return parts
+        return self.memo("partition", build)
+
+    def projects(self) -> list[str]:
+        """proj_ids of the export: PROJECT order, then any only seen on activities."""
+        parts = self.partition()
+        out = [p for p in self.get("PROJECT").texts("proj_id")] if self.get("PROJECT") else []
+        seen = set(out)
+        for pid in parts.get("TASK", {}):
+            if pid and pid not in seen:
+                seen.add(pid)
+                out.append(pid)
+        return out
+
+    def project(self, proj_id: str) -> "ParsedXer | None":
+        """One project of a multi-project export as its own parse (memoised), so indexes and metrics
+        built on it cost that project's rows only; self for a single-project export, None if unknown."""
+        projects = self.projects()
+        if proj_id not in projects:
+            return None
+        if len(projects) == 1:
+            return self
+
+        def build(_):
+            parts = self.partition()
+            tables = {}
+            for name, t in self.tables.items():
+                by = parts.get(name)
+                if by is None:
+                    tables[name] = t
+                    continue
+                rows = by.get(proj_id, [])
+                shared = by.get("", []) if proj_id else []
+                tables[name] = t.take(sorted(rows + shared) if shared else rows)
+            sub = ParsedXer(tables, header=self.header)
+            sub.on_grow = self._grew  # the project's own memos count against this parse
+            return sub
+        return self.memo(f"project:{proj_id}", build)
+
+    def subset(self, rows: list[int]) -> "ParsedXer":
+        """View of the given TASK rows: their relationships (either end), assignments, codes and notes;
+        tables not keyed by task_id are shared."""
+        tasks = self.get("TASK")
+        ids = set(map(tasks.texts("task_id").__getitem__, rows)) if tasks else set()
+        tables = {}
+        for name, t in self.tables.items():
+            if name == "TASK":
+                tables[name] = t.take(rows)
+            elif name == "TASKPRED":
+                ties = zip(t.texts("task_id"), t.texts("pred_task_id"))
+                tables[name] = t.take([k for k, (tid, pid) in enumerate(ties) if tid in ids or pid in ids])
+            elif t.has("task_id"):
+                tables[name] = t.take([k for k, tid in enumerate(t.texts("task_id")) if tid in ids])
+            else:
+                tables[name] = t
+        return ParsedXer(tables, header=self.header)
+
+    def project_info(self) -> list[dict]:
+        """Projects of the export with their short names and activity / relationship counts."""
+        parts = self.partition()
+        proj = self.get("PROJECT")
+        names = dict(zip(proj.texts("proj_id"), proj.texts("proj_short_name"))) if proj else {}
+        tasks, preds = parts.get("TASK", {}), parts.get("TASKPRED", {})
+        return [{"proj_id": pid, "short_name": names.get(pid, ""), "activities": len(tasks.get(pid, ())),
+                 "relationships": len(preds.get(pid, ()))} for pid in self.projects()]
+
+    def memo(self, key: str, build) -> Any:
+        """Return derived[key], building it once with build(self) (other keys build concurrently)."""
+        value = self.derived.get(key, _UNSET)
+        if value is not _UNSET:
+            return value
+        with self._memo_lock:
+            gate = self._building.setdefault(key, threading.Lock())
+        with gate:
+            value = self.derived.get(key, _UNSET)
+            if value is _UNSET:
+                value = build(self)
+                with self._memo_lock:
+                    self.derived[key] = value
+                    # Objects already counted (the tables; a what-if's CPM network) are skipped.
+                    if not self._counted:
+                        self._counted.update((id(self), *map(id, self.tables.values())))
+                    size = approx_nbytes(value, self._counted)
+                    self._building.pop(key, None)
+                self._grew(size)
+        return value
+
+    def _grew(self, size: int) -> None:
+        with self._memo_lock:
+            self.derived_bytes += size
+        if self.on_grow is not None:
+            self.on_grow(size)
+
+    def __getstate__(self) -> dict:
+        # Derived structures are rebuilt on demand; only the tables are worth spilling to disk.
+        return {"tables": self.tables, "header": self.header}
+
+    def __setstate__(self, state: dict) -> None:
+        self.tables = state["tables"]
+        self.header = state.get("header", "")
+        self.derived = {}
+        self.derived_bytes = 0
+        self._counted = set()
+        self._memo_lock = threading.Lock()
+        self._building = {}
+        self.on_grow = None
+
+
+_UNSET = object()
+
+# Never walked into: code and modules reach the whole program, not the derived structure.
+_OPAQUE = (bool, type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+# Containers longer than this are sized from an evenly spaced sample of their items.
+_SAMPLE = 64
+
+
+def approx_nbytes(obj: Any, seen: set[int] | None = None) -> int:
+    """Rough deep footprint of a derived structure: array buffers, XER tables, containers and plain
+    objects. Anything whose id is in seen (e.g. the parse's own tables) is not counted again."""
+    seen = set() if seen is None else seen
+    total = 0
+    stack = [(obj, 1.0)]
+    while stack:
+        o, weight = stack.pop()
+        if id(o) in seen or o is None or isinstance(o, _OPAQUE):
+            continue
+        seen.add(id(o))
+        if isinstance(o, ParsedXer):
+            total += weight * (o.derived_bytes + sum(t.nbytes() for t in o.tables.values() if id(t) not in seen))
+            continue
+        if isinstance(o, XerTable):
+            total += weight * o.nbytes()
+            continue
+        if hasattr(o, "dtype") and isinstance(getattr(o, "nbytes", None), int):
+            base = getattr(o, "base", None)
+            if base is not None and hasattr(base, "dtype"):
+                stack.append((base, weight))
+            else:
+                total += weight * (o.nbytes + 112)
+            continue
+        total += weight * sys.getsizeof(o)
+        if isinstance(o, (str, bytes, bytearray, int, float, complex, array)):
+            continue
+        if isinstance(o, Mapping):
+            items = list(o.items()) if len(o) <= _SAMPLE else _sample(list(o.items()))
+            scale = weight * len(o) / max(len(items), 1)
+            stack.extend((part, scale) for kv in items for part in kv)
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            items = list(o) if len(o) <= _SAMPLE else _sample(list(o) if isinstance(o, (set, frozenset)) else o)
+            scale = weight * len(o) / max(len(items), 1)
+            stack.extend((item, scale) for item in items)
+        else:
+            fields = getattr(o, "__dict__", None)
+            if fields is not None:
+                stack.append((fields, weight))
+            for name in getattr(type(o), "__slots__", ()):
+                stack.append((getattr(o, name, None), weight))
+    return int(total)
+
+
+def _sample(seq):
+    step = len(seq) / _SAMPLE
+    return [seq[int(k * step)] for k in range(_SAMPLE)]
+
+
+_DATE_CACHE: dict[str, datetime | None] = {}
+
+
+def parse_p6_date(value: str) -> datetime | None:
+    """Parse a P6 date cell ('2024-01-15 08:00', seconds optional); None if blank or malformed.
+
+    XER date columns repeat the same few thousand values, so results are memoised per string.
+    """
+    if not value:
+        return None
+    try:
+        return _DATE_CACHE[value]
+    except KeyError:
+        pass
+    s = value.strip()
+    try:
+        d = datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                     int(s[11:13] or 0), int(s[14:16] or 0), int(s[17:19] or 0))
+    except ValueError:
+        d = None
+    if len(_DATE_CACHE) < 200_000:
+        _DATE_CACHE[value] = d
+    return d
+
+
+def decode_xer_content(raw: str) -> str:
+    """If content looks like base64 (from legacy binary upload), decode it to text."""
+    if not raw or raw.startswith("%T") or raw.startswith("ERMHDR"):
+        return raw
+    if re.match(r'^[A-Za-z0-9+/\r\n]+=*$', raw[:200].replace('\n', '').replace('\r', '')):
+        try:
+            decoded = base64.b64decode(raw).decode("utf-8", errors="replace")
+            if "%T" in decoded[:200] or "ERMHDR" in decoded[:200]:
+                return decoded
+        except Exception:
+            pass
+    return raw
+
+
+def parse_xer_lines(lines: Iterable[str]) -> ParsedXer:
+    """Core streaming parser over any iterable of text lines."""
+    tables: dict[str, XerTable] = {}
+    current: XerTable | None = None
+    current_name: str | None = None
+    pending: list | None = None
+    header = ""
+    for line in lines:
+        if line.startswith("%R\t"):
+            # Hot path: buffer the raw line; splitting and stripping happen column-wise at flush time.
+            if pending is not None:
+                pending.append(line)
+                if len(pending) >= _CHUNK_ROWS:
+                    current._flush()
+                    pending = current._pending
+            continue
+        if not line.startswith("%"):
+            if not header and line.startswith("ERMHDR"):
+                header = line.rstrip("\r\n")
+            continue
+        if current is not None:
+            current._flush()
+        current, pending = None, None
+        if line.startswith("%T\t"):
+            current_name = line.rstrip("\r\n").split("\t", 1)[1].strip()
+            tables[current_name] = XerTable(current_name, [])
+        elif line.startswith("%F\t") and current_name:
+            fields = [h.strip() for h in line.rstrip("\r\n").split("\t")[1:]]
+            current = XerTable(current_name, fields)
+            tables[current_name] = current
+            pending = current._pending
+        elif line.startswith("%E"):
+            current_name = None
+    if current is not None:
+        current._flush()
+    return ParsedXer(tables, header=header)
+
+
+def parse_xer_text(xer_text: str) -> ParsedXer:
+    """Parse XER content already held in memory, streaming over it without splitting into a list."""
+    return parse_xer_lines(io.StringIO(xer_text or ""))
+
+
+def parse_xer_buffer(buf: bytes | bytearray | memoryview | mmap.mmap, encoding: str = "utf-8") -> ParsedXer:
+    """Parse raw XER bytes (e.g. an mmap'd file) one line at a time."""
+    reader = buf if isinstance(buf, mmap.mmap) else io.BytesIO(buf)
+    if isinstance(reader, mmap.mmap):
+        reader.seek(0)
+    return parse_xer_lines(raw.decode(encoding, errors="replace") for raw in iter(reader.readline, b""))
+
+
+def parse_xer_file(path: str | os.PathLike, encoding: str = "utf-8", use_mmap: bool = False) -> ParsedXer:
+    """Parse an XER file from disk through a streaming file handle (or an mmap'd view if use_mmap)."""
+    if use_mmap:
+        with open(path, "rb") as fh:
+            if os.fstat(fh.fileno()).st_size == 0:
+                return ParsedXer({})
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return parse_xer_buffer(mm, encoding=encoding)
+    with open(path, "r", encoding=encoding, errors="replace", newline="") as fh:
+        return parse_xer_lines(fh)
@@ -466,6 +466,17 @@ def update_file_meta(session_id: str, filename: str, **kwargs) -> bool:
         return False
 
 
+def _invalidate_parsed_xer(session_id: str, filename: str) -> None:
+    """Drop any cached parse of a replaced or deleted XER upload."""
+    if not (filename or "").lower().endswith(".xer"):
+        return
+    try:
+        from schedule_agent_web.scheduling.xer_cache import invalidate_file
+        invalidate_file(session_id, filename)
+    except Exception:
+        pass
+
+
 def get_files(session_id: str) -> list:
     """Return list of {filename, size, uploaded_at, category, vectorized} for this session."""
     r = _get_redis()
@@ -490,6 +501,7 @@ def save_file(session_id: str, filename: str, content: str) -> dict | None:
             content_str = content.decode("utf-8", errors="replace")
         except Exception:
             return None
+    _invalidate_parsed_xer(session_id, filename)
     r = _get_redis()
     if r:
         try:
@@ -522,6 +534,7 @@ def get_file_content(session_id: str, filename: str) -> str | None:
 
 def delete_file(session_id: str, filename: str) -> bool:
     """Delete file and its entry. Returns True if deleted."""
+    _invalidate_parsed_xer(session_id, filename)
     r = _get_redis()
     if r:
         try:
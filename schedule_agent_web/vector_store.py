@@ -94,13 +94,10 @@ def _get_embeddings(texts: list[str]) -> list[list[float]]:
     global _embedding_dim
     if not texts:
         return []
-    key = os.environ.get("OPENAI_API_KEY") or os.environ.get("OPENAI_API_KEY_FILE")
-    if key and Path(key).exists():
-        key = Path(key).read_text().strip()
-    if key:
+    from schedule_agent_web.llm_gateway import openai_client
+    client = openai_client()
+    if client is not None:
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=key)
             model = os.environ.get("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
             resp = client.embeddings.create(input=texts, model=model)
             vecs = [e.embedding for e in resp.data]
@@ -5,21 +5,37 @@ Requires ANTHROPIC_API_KEY. Uses Claude's image content block (base64).
 from __future__ import annotations
 
 import base64
-import os
-from pathlib import Path
 
+from schedule_agent_web import llm_gateway
 
-def _get_anthropic_key() -> str:
-    raw = os.environ.get("ANTHROPIC_API_KEY") or os.environ.get("ANTHROPIC_API_KEY_FILE")
-    if raw and Path(raw).is_file():
-        return Path(raw).read_text().strip()
-    return raw or ""
+DEFAULT_PROMPT = (
+    "Describe what you see in this image. If it looks like a construction or project site, summarize the "
+    "visible progress, work in place, and any notable conditions (e.g. scaffolding, concrete, MEP, safety). "
+    "Be concise."
+)
+
+
+def _image_request(image_bytes: bytes, media_type: str, prompt: str) -> tuple[list, str | None]:
+    """Claude message with an image block + text block, or an error if Claude is unavailable."""
+    if not llm_gateway._usable(llm_gateway.anthropic_key()):
+        return [], "ANTHROPIC_API_KEY not set. Get a key at console.anthropic.com."
+    if llm_gateway.Anthropic is None:
+        return [], "anthropic package not installed. pip install anthropic."
+    b64 = base64.standard_b64encode(image_bytes).decode("ascii")
+    content = [
+        {
+            "type": "image",
+            "source": {"type": "base64", "media_type": media_type, "data": b64},
+        },
+        {"type": "text", "text": prompt},
+    ]
+    return [{"role": "user", "content": content}], None
 
 
 def describe_image(
     image_bytes: bytes,
     media_type: str = "image/jpeg",
-    prompt: str = "Describe what you see in this image. If it looks like a construction or project site, summarize the visible progress, work in place, and any notable conditions (e.g. scaffolding, concrete, MEP, safety). Be concise.",
+    prompt: str = DEFAULT_PROMPT,
     max_tokens: int = 1024,
 ) -> tuple[str, str | None]:
     """
@@ -27,32 +43,20 @@ def describe_image(
     image_bytes: raw image bytes (JPEG, PNG, GIF, WebP).
     media_type: "image/jpeg", "image/png", "image/gif", "image/webp".
     """
-    key = _get_anthropic_key()
-    if not key or len(key) < 10:
-        return ("", "ANTHROPIC_API_KEY not set. Get a key at console.anthropic.com.")
-    try:
-        from anthropic import Anthropic
-    except ImportError:
-        return ("", "anthropic package not installed. pip install anthropic.")
+    messages, err = _image_request(image_bytes, media_type, prompt)
+    if err:
+        return ("", err)
+    return llm_gateway.complete(None, messages, max_tokens=max_tokens, stage="vision", provider="claude")
 
-    b64 = base64.standard_b64encode(image_bytes).decode("ascii")
-    # Claude message content: image block + text block
-    content = [
-        {
-            "type": "image",
-            "source": {"type": "base64", "media_type": media_type, "data": b64},
-        },
-        {"type": "text", "text": prompt},
-    ]
-    model = os.environ.get("ANTHROPIC_MODEL", "claude-3-5-sonnet-20241022")
-    try:
-        client = Anthropic(api_key=key)
-        resp = client.messages.create(
-            model=model,
-            max_tokens=max_tokens,
-            messages=[{"role": "user", "content": content}],
-        )
-        text = (resp.content[0].text if resp.content else "").strip()
-        return (text, None)
-    except Exception as e:
-        return ("", str(e))
+
+async def describe_image_async(
+    image_bytes: bytes,
+    media_type: str = "image/jpeg",
+    prompt: str = DEFAULT_PROMPT,
+    max_tokens: int = 1024,
+) -> tuple[str, str | None]:
+    """describe_image() for async endpoints (awaits Claude on the event loop's pooled client)."""
+    messages, err = _image_request(image_bytes, media_type, prompt)
+    if err:
+        return ("", err)
+    return await llm_gateway.acomplete(None, messages, max_tokens=max_tokens, stage="vision", provider="claude")
@@ -1,208 +1,140 @@
 """
 Deeper checks: submittal-review pairing, NTP logic, cofferdam segments, DSM production.
+
+    python scripts/deeper_checks.py [schedule.xer | dataset_dir | dir ...] [--checks a,b] [--jobs N] [--json]
+    python scripts/deeper_checks.py --list
+
+Runs the checks registered in schedule_agent_web.scheduling.checks over each XER file or dataset
+converted by scripts/parse_xer.py (a directory of .xer files expands to its files), one schedule per
+worker process. With no inputs, reads the legacy docs/xer_*.json.
 """
-import json, io, sys, os
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+import argparse
+import io
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from schedule_agent_web.scheduling.checks import run_checks, run_checks_many, schedule_checks
+from schedule_agent_web.scheduling.columnar import DATASET_FILE
+from schedule_agent_web.scheduling.xer_parser import ParsedXer, XerTable
 
 DOCS = os.path.join(os.path.dirname(__file__), '..', 'docs')
 
-def load(name):
-    with open(os.path.join(DOCS, f'xer_{name}.json'), 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-tasks = load('TASK')
-preds = load('TASKPRED')
-cals = load('CALENDAR')
-
-cal_names = {c['clndr_id']: c['clndr_name'] for c in cals}
-task_by_id = {t['task_id']: t for t in tasks}
-
-succ_map = {}
-pred_map = {}
-for p in preds:
-    succ_map.setdefault(p['pred_task_id'], []).append(p)
-    pred_map.setdefault(p['task_id'], []).append(p)
-
-print("=" * 100)
-print("1. SUBMITTAL vs APPROVAL PAIRING CHECK")
-print("=" * 100)
-submittals = [t for t in tasks if t.get('task_code', '').startswith('SU-')]
-approvals = [t for t in tasks if t.get('task_code', '').startswith('AP-')]
-print(f"  Submittals (SU-): {len(submittals)}")
-print(f"  Approvals (AP-): {len(approvals)}")
-
-for s in submittals:
-    s_num = s.get('task_code', '').replace('SU-', '')
-    matching_ap = [a for a in approvals if s_num in a.get('task_code', '')]
-    s_dur = float(s.get('target_drtn_hr_cnt', '0')) / 8
-    print(f"  {s.get('task_code',''):15} {s.get('task_name','')[:55]:56} dur={s_dur:>4.0f} WD  cal={cal_names.get(s.get('clndr_id',''), '')[:30]}")
-    if matching_ap:
-        for a in matching_ap:
-            a_dur = float(a.get('target_drtn_hr_cnt', '0')) / 8
-            print(f"    -> {a.get('task_code',''):12} {a.get('task_name','')[:55]:56} dur={a_dur:>4.0f} WD")
+
+def _inputs(paths):
+    for p in paths:
+        if os.path.isdir(p) and not os.path.isfile(os.path.join(p, DATASET_FILE)):
+            for name in sorted(os.listdir(p)):
+                sub = os.path.join(p, name)
+                if name.lower().endswith('.xer') or os.path.isfile(os.path.join(sub, DATASET_FILE)):
+                    yield sub
+        else:
+            yield p
+
+
+def _legacy():
+    """ParsedXer over the legacy docs/xer_<TABLE>.json row dumps."""
+    tables = {}
+    for name in ('TASK', 'TASKPRED', 'CALENDAR'):
+        path = os.path.join(DOCS, f'xer_{name}.json')
+        if not os.path.isfile(path):
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            rows = json.load(f)
+        fields = list(dict.fromkeys(k for r in rows for k in r))
+        cols = [[str(r.get(k, '') or '') for r in rows] for k in fields]
+        tables[name] = XerTable.from_columns(name, fields, cols)
+    return ParsedXer(tables)
+
+
+def _fmt(rec):
+    parts = [f"{rec.get('task_code', ''):15} {rec.get('task_name', '')[:60]:61}"]
+    if 'task_type' in rec:
+        parts.append(f"type={rec['task_type']}")
+    if 'duration' in rec:
+        parts.append(f"dur={rec['duration']:>4.0f} WD")
+    if 'total_float' in rec:
+        parts.append(f"TF={rec['total_float']:>4.0f}")
+    if 'start' in rec:
+        parts.append(f"{rec['start']} - {rec['finish']}")
+    if rec.get('calendar'):
+        parts.append(f"cal={rec['calendar'][:30]}")
+    return '  ' + '  '.join(parts)
+
+
+def _print_schedule(result):
+    if result.get('schedule'):
+        print(f"### {result['schedule']}")
+    if 'error' in result:
+        print(f"  FAILED: {result['error']}")
+        return
+    for k, c in enumerate(result['checks'], 1):
+        print("=" * 100)
+        print(f"{k}. {c['title'].upper()}")
+        print("=" * 100)
+        if 'skipped' in c or 'error' in c:
+            print(f"  SKIPPED: {c.get('skipped') or c.get('error')}")
+        elif c['id'] == 'submittal_pairing':
+            print(f"  Submittals (SU-): {c['submittals']}")
+            print(f"  Approvals (AP-): {c['approvals']}")
+            for rec in c['rows']:
+                print(_fmt(rec))
+                for a in rec['approvals']:
+                    print(f"    -> {a['task_code']:12} dur={a['duration']:>4.0f} WD")
+                if not rec['approvals']:
+                    print("    -> NO MATCHING APPROVAL FOUND")
+        elif c['id'] == 'ss_ff_ties':
+            for r in c['rows']:
+                print(f"  {r['type']:4}  {r['pred_code']:15} -> {r['succ_code']:15}  lag={r['lag_days']:>4.0f}  "
+                      f"({r['pred_name'][:40]} -> {r['succ_name'][:40]})")
+        else:
+            for rec in c['rows']:
+                print(_fmt(rec))
+        if c.get('note'):
+            print(f"  {c['note']}")
+        if c.get('count', 0) > len(c.get('rows', [])):
+            print(f"  ... {c['count'] - len(c['rows'])} more")
+        print()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Run the registered schedule checks over XER files or datasets.")
+    ap.add_argument('inputs', nargs='*', help="XER files, converted dataset directories, or directories of either")
+    ap.add_argument('-c', '--checks', default='', help="comma-separated check ids (default: all)")
+    ap.add_argument('-j', '--jobs', type=int, default=0, help="worker processes (default: CPU count)")
+    ap.add_argument('-n', '--limit', type=int, default=500, help="rows listed per check")
+    ap.add_argument('--json', action='store_true', help="print results as JSON")
+    ap.add_argument('--list', action='store_true', help="list the registered checks and exit")
+    args = ap.parse_args(argv)
+
+    if args.list:
+        for c in schedule_checks():
+            print(f"  {c.id:22} {c.title:45} {', '.join(c.columns)}")
+        return 0
+    ids = [c.strip() for c in args.checks.split(',') if c.strip()] or None
+    try:
+        schedule_checks(ids)
+    except KeyError as e:
+        ap.error(f"unknown check {e}")
+
+    files = list(_inputs(args.inputs))
+    if args.inputs and not files:
+        ap.error("no XER files or datasets found")
+    if files:
+        results = run_checks_many(files, ids, jobs=args.jobs, limit=args.limit)
     else:
-        print(f"    -> NO MATCHING APPROVAL FOUND")
-
-print()
-print("=" * 100)
-print("2. COFFERDAM SEGMENTS vs SPEC COVERAGE")
-print("=" * 100)
-cfd_tasks = [t for t in tasks if 'cfd' in t.get('task_code', '').lower() or 'combi' in t.get('task_name', '').lower() or 'cofferdam' in t.get('task_name', '').lower()]
-for t in cfd_tasks:
-    dur = float(t.get('target_drtn_hr_cnt', '0')) / 8
-    cal = cal_names.get(t.get('clndr_id', ''), '')[:30]
-    print(f"  {t.get('task_code',''):15} {t.get('task_name','')[:65]:66} dur={dur:>4.0f} WD  cal={cal}")
-
-print()
-print("=" * 100)
-print("3. DSM PRODUCTION ACTIVITIES")
-print("=" * 100)
-dsm_tasks = [t for t in tasks if 'dsm' in t.get('task_code', '').lower() or 'deep soil' in t.get('task_name', '').lower() or 'soil mixing' in t.get('task_name', '').lower()]
-for t in dsm_tasks:
-    dur = float(t.get('target_drtn_hr_cnt', '0')) / 8
-    cal = cal_names.get(t.get('clndr_id', ''), '')[:30]
-    tf = float(t.get('total_float_hr_cnt', '0')) / 8
-    print(f"  {t.get('task_code',''):15} {t.get('task_name','')[:65]:66} dur={dur:>4.0f} WD  TF={tf:>4.0f}  cal={cal}")
-
-print()
-print("=" * 100)
-print("4. SPOIL REMOVAL ACTIVITIES")
-print("=" * 100)
-spoil_tasks = [t for t in tasks if 'spoil' in t.get('task_name', '').lower()]
-for t in spoil_tasks:
-    dur = float(t.get('target_drtn_hr_cnt', '0')) / 8
-    cal = cal_names.get(t.get('clndr_id', ''), '')[:30]
-    print(f"  {t.get('task_code',''):15} {t.get('task_name','')[:65]:66} dur={dur:>4.0f} WD  cal={cal}")
-
-print()
-print("=" * 100)
-print("5. OBSTRUCTION REMOVAL ACTIVITIES")
-print("=" * 100)
-obs_tasks = [t for t in tasks if 'obstruct' in t.get('task_name', '').lower() or 'obs' in t.get('task_code', '').lower()]
-for t in obs_tasks:
-    dur = float(t.get('target_drtn_hr_cnt', '0')) / 8
-    cal = cal_names.get(t.get('clndr_id', ''), '')[:30]
-    tf = float(t.get('total_float_hr_cnt', '0')) / 8
-    print(f"  {t.get('task_code',''):15} {t.get('task_name','')[:65]:66} dur={dur:>4.0f} WD  TF={tf:>4.0f}  cal={cal}")
-
-print()
-print("=" * 100)
-print("6. CRITICAL PATH (TF=0) ACTIVITIES")
-print("=" * 100)
-crit = [t for t in tasks if float(t.get('total_float_hr_cnt', '0')) == 0 and t.get('task_type', '') != 'TT_Mile']
-for t in sorted(crit, key=lambda x: x.get('early_start_date', x.get('target_start_date', '9999'))):
-    dur = float(t.get('target_drtn_hr_cnt', '0')) / 8
-    es = t.get('early_start_date', t.get('target_start_date', ''))[:10]
-    ef = t.get('early_end_date', t.get('target_end_date', ''))[:10]
-    print(f"  {t.get('task_code',''):15} {t.get('task_name','')[:60]:61} dur={dur:>4.0f}  {es} - {ef}")
-
-print()
-print("=" * 100)
-print("7. ACTIVITIES ON 7-DAY CALENDAR")
-print("=" * 100)
-for t in tasks:
-    cal = cal_names.get(t.get('clndr_id', ''), '')
-    if '7/8' in cal or '7-day' in cal.lower():
-        dur = float(t.get('target_drtn_hr_cnt', '0')) / 8
-        print(f"  {t.get('task_code',''):15} {t.get('task_name','')[:55]:56} dur={dur:>4.0f} WD  cal={cal[:35]}")
-
-print()
-print("=" * 100)
-print("8. DEWATERING ACTIVITIES")
-print("=" * 100)
-dewater = [t for t in tasks if 'dewat' in t.get('task_name', '').lower()]
-if not dewater:
-    print("  NONE FOUND - Dewatering is missing from the schedule")
-else:
-    for t in dewater:
-        dur = float(t.get('target_drtn_hr_cnt', '0')) / 8
-        print(f"  {t.get('task_code',''):15} {t.get('task_name','')[:60]:61} dur={dur:>4.0f}")
-
-print()
-print("=" * 100)
-print("9. TOP FILL ACTIVITIES")
-print("=" * 100)
-topfill = [t for t in tasks if 'top fill' in t.get('task_name', '').lower() or 'topfill' in t.get('task_name', '').lower()]
-if not topfill:
-    print("  NONE FOUND")
-else:
-    for t in topfill:
-        dur = float(t.get('target_drtn_hr_cnt', '0')) / 8
-        print(f"  {t.get('task_code',''):15} {t.get('task_name','')[:60]:61} dur={dur:>4.0f}")
-
-print()
-print("=" * 100)
-print("10. SCOUR PROTECTION ACTIVITIES")
-print("=" * 100)
-scour = [t for t in tasks if 'scour' in t.get('task_name', '').lower()]
-for t in scour:
-    dur = float(t.get('target_drtn_hr_cnt', '0')) / 8
-    cal = cal_names.get(t.get('clndr_id', ''), '')[:30]
-    print(f"  {t.get('task_code',''):15} {t.get('task_name','')[:60]:61} dur={dur:>4.0f}  cal={cal}")
-
-print()
-print("=" * 100)
-print("11. COMPLIANCE (SITE CONTROLS, BUOYS)")
-print("=" * 100)
-comp = [t for t in tasks if 'compliance' in t.get('task_name', '').lower() or 'buoy' in t.get('task_name', '').lower() or 'site control' in t.get('task_name', '').lower()]
-for t in comp:
-    dur = float(t.get('target_drtn_hr_cnt', '0')) / 8
-    print(f"  {t.get('task_code',''):15} {t.get('task_name','')[:60]:61} dur={dur:>4.0f}")
-
-print()
-print("=" * 100)
-print("12. NTP MILESTONES")
-print("=" * 100)
-ntp = [t for t in tasks if 'ntp' in t.get('task_name', '').lower() or 'notice to proceed' in t.get('task_name', '').lower() or 'notice of award' in t.get('task_name', '').lower()]
-for t in ntp:
-    dur = float(t.get('target_drtn_hr_cnt', '0')) / 8
-    es = t.get('early_start_date', t.get('target_start_date', ''))[:10]
-    ef = t.get('early_end_date', t.get('target_end_date', ''))[:10]
-    tt = t.get('task_type', '')
-    print(f"  {t.get('task_code',''):15} {t.get('task_name','')[:60]:61} type={tt}  dur={dur:>4.0f}  {es} - {ef}")
-
-print()
-print("=" * 100)
-print("13. CLOSEOUT/FINAL/AS-BUILT ACTIVITIES")
-print("=" * 100)
-close = [t for t in tasks if any(x in t.get('task_name', '').lower() for x in ['closeout', 'close out', 'final', 'as-built', 'as built', 'demob', 'punch', 'warranty', 'record doc'])]
-for t in close:
-    dur = float(t.get('target_drtn_hr_cnt', '0')) / 8
-    es = t.get('early_start_date', t.get('target_start_date', ''))[:10]
-    ef = t.get('early_end_date', t.get('target_end_date', ''))[:10]
-    print(f"  {t.get('task_code',''):15} {t.get('task_name','')[:60]:61} dur={dur:>4.0f}  {es} - {ef}")
-
-print()
-print("=" * 100)
-print("14. STURGEON/FISH SURVEY ACTIVITIES")
-print("=" * 100)
-fish = [t for t in tasks if 'sturgeon' in t.get('task_name', '').lower() or 'fish' in t.get('task_name', '').lower()]
-if not fish:
-    print("  NONE FOUND - Sturgeon monitoring activities are missing")
-else:
-    for t in fish:
-        dur = float(t.get('target_drtn_hr_cnt', '0')) / 8
-        print(f"  {t.get('task_code',''):15} {t.get('task_name','')[:60]:61} dur={dur:>4.0f}")
-
-print()
-print("=" * 100)
-print("15. TURBIDITY CURTAIN ACTIVITIES")
-print("=" * 100)
-turb = [t for t in tasks if 'turbid' in t.get('task_name', '').lower() or 'curtain' in t.get('task_name', '').lower()]
-if not turb:
-    print("  NONE FOUND - Turbidity curtain activities are missing")
-else:
-    for t in turb:
-        dur = float(t.get('target_drtn_hr_cnt', '0')) / 8
-        print(f"  {t.get('task_code',''):15} {t.get('task_name','')[:60]:61} dur={dur:>4.0f}")
-
-print()
-print("=" * 100)
-print("16. SS AND FF RELATIONSHIP DETAILS")
-print("=" * 100)
-for p in preds:
-    if p.get('pred_type') in ('PR_SS', 'PR_FF'):
-        pred_t = task_by_id.get(p['pred_task_id'], {})
-        succ_t = task_by_id.get(p['task_id'], {})
-        lag = float(p.get('lag_hr_cnt', '0')) / 8
-        print(f"  {p['pred_type']:4}  {pred_t.get('task_code',''):15} -> {succ_t.get('task_code',''):15}  lag={lag:>4.0f}  ({pred_t.get('task_name','')[:40]} -> {succ_t.get('task_name','')[:40]})")
+        results = [{'schedule': '', 'checks': run_checks(_legacy(), ids, limit=args.limit)}]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            _print_schedule(r)
+    return 1 if any('error' in r for r in results) else 0
+
+
+if __name__ == '__main__':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.exit(main())
@@ -1,54 +1,104 @@
 """
-Parse P6 XER file and extract key schedule data for review.
-Outputs JSON files for activities, WBS, relationships, calendars, constraints.
+Convert P6 XER files into columnar datasets for analysis scripts and the web app.
+
+    python scripts/parse_xer.py schedule.xer [more.xer | dir ...] -o out/ [--format arrow|parquet|jsonl]
+                                [--tables TASK,TASKPRED] [--jobs N]
+
+Each XER becomes out/<name>/ with one file per table and a dataset.json; out/manifest.json lists
+every dataset with row counts and content hashes. Files are converted in a process pool (one XER
+per worker). arrow is the default when pyarrow is installed, otherwise jsonl. Datasets load back
+with schedule_agent_web.scheduling.columnar.open_dataset() (memory-mapped for arrow), and the web
+app picks them up for matching uploads when XER_COLUMNAR_DIR points at the output root.
 """
-import sys
-import json
+import argparse
 import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from schedule_agent_web.scheduling.columnar import FORMATS, convert_file, default_format, write_manifest
+
+
+def _inputs(paths):
+    for p in paths:
+        if os.path.isdir(p):
+            for name in sorted(os.listdir(p)):
+                if name.lower().endswith('.xer'):
+                    yield os.path.join(p, name)
+        else:
+            yield p
+
+
+def _dataset_names(files):
+    """Output directory per input: the file stem, suffixed when two inputs share one."""
+    seen = {}
+    out = []
+    for f in files:
+        stem = os.path.splitext(os.path.basename(f))[0]
+        n = seen.get(stem, 0)
+        seen[stem] = n + 1
+        out.append(stem if n == 0 else f"{stem}_{n + 1}")
+    return out
+
+
+def _convert(args):
+    path, out_dir, fmt, tables = args
+    return convert_file(path, out_dir, fmt=fmt, tables=tables)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Convert P6 XER files into columnar datasets.")
+    ap.add_argument('inputs', nargs='+', help="XER files or directories containing .xer files")
+    ap.add_argument('-o', '--out', default=None, help="output root (default: next to the first input)")
+    ap.add_argument('-f', '--format', choices=FORMATS, default=None,
+                    help=f"output format (default: {default_format()})")
+    ap.add_argument('-t', '--tables', default='', help="comma-separated tables to keep (default: all)")
+    ap.add_argument('-j', '--jobs', type=int, default=0, help="worker processes (default: CPU count)")
+    args = ap.parse_args(argv)
+
+    files = list(_inputs(args.inputs))
+    if not files:
+        ap.error("no XER files found")
+    out_root = args.out or os.path.join(os.path.dirname(os.path.abspath(files[0])), 'xer_datasets')
+    fmt = args.format or default_format()
+    tables = [t.strip() for t in args.tables.split(',') if t.strip()] or None
+    names = _dataset_names(files)
+    jobs = args.jobs or os.cpu_count() or 1
+    work = [(f, os.path.join(out_root, n), fmt, tables) for f, n in zip(files, names)]
+
+    t0 = time.perf_counter()
+    entries = []
+    failed = 0
+
+    def done(name, result):
+        nonlocal failed
+        try:
+            entry = result()
+        except Exception as e:
+            failed += 1
+            print(f"  FAILED {name}: {e}", file=sys.stderr)
+            return
+        entry['dir'] = name
+        entries.append(entry)
+        rows = sum(t['rows'] for t in entry['tables'].values())
+        print(f"  {name}: {rows} rows in {len(entry['tables'])} tables ({entry['elapsedMs']} ms)")
+
+    if jobs > 1 and len(work) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(work))) as ex:
+            futures = {ex.submit(_convert, w): n for w, n in zip(work, names)}
+            for fut in as_completed(futures):
+                done(futures[fut], fut.result)
+    else:
+        for w, n in zip(work, names):
+            done(n, lambda w=w: _convert(w))
 
-def parse_xer(filepath):
-    tables = {}
-    current_table = None
-    fields = None
-
-    with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
-        for line in f:
-            line = line.rstrip('\n').rstrip('\r')
-            if line.startswith('%T\t'):
-                current_table = line.split('\t')[1].strip()
-                tables[current_table] = []
-                fields = None
-            elif line.startswith('%F\t') and current_table:
-                fields = line.split('\t')[1:]
-            elif line.startswith('%R\t') and current_table and fields:
-                values = line.split('\t')[1:]
-                row = {}
-                for i, field in enumerate(fields):
-                    row[field] = values[i] if i < len(values) else ''
-                tables[current_table].append(row)
-
-    return tables
-
-
-def main():
-    xer_path = sys.argv[1]
-    out_dir = sys.argv[2] if len(sys.argv) > 2 else os.path.dirname(xer_path)
-
-    tables = parse_xer(xer_path)
-
-    print(f"Tables found: {list(tables.keys())}")
-    for tname, rows in tables.items():
-        print(f"  {tname}: {len(rows)} rows")
-
-    for tname in ['PROJECT', 'PROJWBS', 'TASK', 'TASKPRED', 'CALENDAR', 'TASKACTV',
-                   'ACTVCODE', 'ACTVTYPE', 'ACCOUNT', 'RSRC', 'TASKRSRC', 'UDFVALUE',
-                   'UDFTYPE', 'SCHEDOPTIONS', 'PROJPCAT', 'MEMOTYPE']:
-        if tname in tables:
-            outfile = os.path.join(out_dir, f'xer_{tname}.json')
-            with open(outfile, 'w', encoding='utf-8') as f:
-                json.dump(tables[tname], f, indent=2, ensure_ascii=False)
-            print(f"  Wrote {outfile} ({len(tables[tname])} rows)")
+    if entries:
+        manifest = write_manifest(out_root, entries)
+        print(f"Wrote {len(entries)} {fmt} dataset(s) to {out_root} in {time.perf_counter() - t0:.2f}s; manifest {manifest}")
+    return 1 if failed else 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
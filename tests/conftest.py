@@ -0,0 +1,75 @@
+"""Shared helpers: hand-built XER text for small, hand-computable networks."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from schedule_agent_web.scheduling.xer_parser import parse_xer_text
+
+WORKDAYS = {2, 3, 4, 5, 6}  # P6 day numbers: 1 = Sunday .. 7 = Saturday
+
+
+def clndr_data(days, shifts=(("08:00", "12:00"), ("13:00", "17:00"))):
+    parts = ["(0||CalendarData()(", "(0||DaysOfWeek()("]
+    for d in range(1, 8):
+        if d in days:
+            spans = "".join(f"(0||{i}(s|{s}|f|{f})())" for i, (s, f) in enumerate(shifts))
+            parts.append(f"(0||{d}()({spans}))")
+        else:
+            parts.append(f"(0||{d}()())")
+    parts.append("))(0||VIEW(ShowTotal|Y)())(0||Exceptions()())))")
+    return "\x7f".join(parts)
+
+
+CAL_5x8 = (1, 8, clndr_data(WORKDAYS))
+CAL_7x24 = (2, 24, clndr_data(range(1, 8), (("00:00", "00:00"),)))
+
+
+def build_xer(tasks, preds, data_date="2024-01-08 08:00", calendars=(CAL_5x8, CAL_7x24), constraints=None):
+    """XER text for one project.
+
+    tasks: (code, hours[, clndr_id[, task_type[, total_float_hr]]]); preds: (pred_code, succ_code, type, lag_hr)
+    with type one of FS / SS / FF / SF; constraints: {code: (cstr_type, "YYYY-MM-DD HH:MM")}.
+    """
+    constraints = constraints or {}
+    lines = ["ERMHDR\t19.12\t2024-01-08\tProject\tadmin\tdbx\tProject Management\tUSD"]
+
+    def table(name, fields, rows):
+        lines.append(f"%T\t{name}")
+        lines.append("%F\t" + "\t".join(fields))
+        lines.extend("%R\t" + "\t".join(str(v) for v in r) for r in rows)
+
+    table("PROJECT", ["proj_id", "proj_short_name", "last_recalc_date", "plan_start_date"],
+          [(100, "T", data_date, data_date)])
+    table("CALENDAR", ["clndr_id", "default_flag", "clndr_name", "proj_id", "clndr_type", "day_hr_cnt", "clndr_data"],
+          [(cid, "Y" if i == 0 else "N", f"Cal {cid}", "", "CA_Base", hrs, data)
+           for i, (cid, hrs, data) in enumerate(calendars)])
+    table("PROJWBS", ["wbs_id", "proj_id", "proj_node_flag", "wbs_short_name", "wbs_name", "parent_wbs_id"],
+          [(1, 100, "Y", "T", "T", "")])
+    ids = {}
+    rows = []
+    for n, t in enumerate(tasks):
+        code, hours = t[0], t[1]
+        cal = t[2] if len(t) > 2 else 1
+        ttype = t[3] if len(t) > 3 else ("TT_Mile" if hours == 0 else "TT_Task")
+        tf = t[4] if len(t) > 4 else ""
+        ids[code] = 5000 + n
+        cstr_type, cstr_date = constraints.get(code, ("", ""))
+        rows.append((ids[code], 100, 1, cal, code, code, ttype, "TK_NotStart", hours, hours, "DT_FixedDUR2", tf,
+                     cstr_type, cstr_date))
+    table("TASK", ["task_id", "proj_id", "wbs_id", "clndr_id", "task_code", "task_name", "task_type", "status_code",
+                   "target_drtn_hr_cnt", "remain_drtn_hr_cnt", "duration_type", "total_float_hr_cnt",
+                   "cstr_type", "cstr_date"], rows)
+    table("TASKPRED", ["task_pred_id", "task_id", "pred_task_id", "proj_id", "pred_proj_id", "pred_type", "lag_hr_cnt"],
+          [(9000 + n, ids[s], ids[p], 100, 100, f"PR_{typ}", lag) for n, (p, s, typ, lag) in enumerate(preds)])
+    lines.append("%E")
+    return "\r\n".join(lines) + "\r\n"
+
+
+@pytest.fixture
+def xer():
+    def make(tasks, preds, **kw):
+        return parse_xer_text(build_xer(tasks, preds, **kw))
+    return make
@@ -0,0 +1,50 @@
+"""Calendar arithmetic: clock <-> working time, and horizon growth shared across threads."""
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from schedule_agent_web.scheduling.calendars import CalendarSet
+from schedule_agent_web.scheduling.xer_parser import parse_xer_text
+
+from conftest import build_xer
+
+ORIGIN = datetime(2024, 1, 8, 8, 0)   # a Monday, 08:00
+
+
+def _cals():
+    return CalendarSet.from_parsed(parse_xer_text(build_xer([("A", 8)], [])), ORIGIN)
+
+
+def test_round_trip_on_five_day_calendar():
+    cals = _cals()
+    five = np.array([cals.ids["1"]])
+    # Mon 08:00 + 40 working hours finishes Fri 17:00 and the next start is Mon 08:00.
+    w = cals.to_work(five, np.array([0.0])) + 40.0
+    assert cals.from_work(five, w)[0] == 4 * 24 + 9
+    assert cals.from_work(five, w, start=True)[0] == 7 * 24
+
+
+def test_concurrent_horizon_growth_matches_a_fresh_set():
+    shared, fresh = _cals(), _cals()
+    hours = np.linspace(-24 * 365 * 40, 24 * 365 * 60, 4001)
+    cal = np.full(hours.shape, shared.ids["1"])
+    expected = fresh.to_work(cal, hours)
+    failures = []
+
+    def convert(seed):
+        pick = np.random.default_rng(seed).choice(len(hours), 500)
+        for _ in range(20):
+            w = shared.to_work(cal[pick], hours[pick])
+            if not np.array_equal(w, expected[pick]):
+                failures.append(seed)
+            back = shared.from_work(cal[pick], w)
+            if not np.allclose(shared.to_work(cal[pick], back), w):
+                failures.append(seed)
+
+    threads = [threading.Thread(target=convert, args=(k,)) for k in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert failures == []
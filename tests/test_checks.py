@@ -0,0 +1,11 @@
+"""Schedule checks over the stored P6 columns."""
+from schedule_agent_web.scheduling.checks import run_checks
+
+
+def test_critical_path_lists_only_zero_float_work_activities(xer):
+    tasks = [("A", 40, 1, "TT_Task", 0), ("B", 8, 1, "TT_Task", 16), ("M", 0, 1, "TT_Mile", 0),
+             ("F", 0, 1, "TT_FinMile", 0), ("L", 48, 1, "TT_LOE", 0), ("W", 48, 1, "TT_WBS", 0),
+             ("R", 16, 1, "TT_Rsrc", 0), ("C", 8)]        # C: completed, no stored float
+    (check,) = run_checks(xer(tasks, []), ["critical_path"])
+    assert check["count"] == 2
+    assert sorted(r["task_code"] for r in check["rows"]) == ["A", "R"]
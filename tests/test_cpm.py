@@ -0,0 +1,52 @@
+"""CPM passes on small networks whose dates are worked out by hand."""
+from schedule_agent_web.scheduling.cpm import compute_cpm
+
+
+def _dates(result):
+    """Activity dates by position in the builder's task list."""
+    return {int(tid) - 5000: result.activity(i) for i, tid in enumerate(result.network.task_ids)}
+
+
+def test_fs_into_24h_calendar_starts_when_predecessor_finishes(xer):
+    # A: 5 x 8h days Mon 08:00 -> Fri 17:00; B runs round the clock, so it starts Fri 17:00, not Mon.
+    acts = _dates(compute_cpm(xer([("A", 40), ("B", 24, 2)], [("A", "B", "FS", 0)])))
+    assert acts[0]["early_finish"] == "2024-01-12 17:00"
+    assert acts[1]["early_start"] == "2024-01-12 17:00"
+    assert acts[1]["early_finish"] == "2024-01-13 17:00"
+    assert acts[0]["late_finish"] == "2024-01-12 17:00"
+    assert acts[0]["total_float_hr"] == 0.0
+
+
+def test_fs_out_of_24h_calendar_waits_for_next_workday(xer):
+    # A (24h): Mon 08:00 + 120h -> Sat 08:00; B (5x8) picks up Monday morning.
+    acts = _dates(compute_cpm(xer([("A", 120, 2), ("B", 8)], [("A", "B", "FS", 0)])))
+    assert acts[0]["early_finish"] == "2024-01-13 08:00"
+    assert acts[1]["early_start"] == "2024-01-15 08:00"
+    assert acts[1]["early_finish"] == "2024-01-15 17:00"
+
+
+def test_hand_computed_network_with_lags_and_every_tie_type(xer):
+    # 5 x 8h calendar from Mon 2024-01-08 08:00 (lunch 12:00-13:00).
+    #   A 2d: Mon 08:00 -> Tue 17:00
+    #   B 1d, FS A + 8h: Thu 08:00 -> Thu 17:00                      (critical)
+    #   C 3d, SS A + 4h: Mon 13:00 -> Thu 12:00; late start Tue 08:00 (4h float)
+    #   D 1d, FF B: finishes with B, Thu 08:00 -> Thu 17:00          (critical)
+    #   E 1d, SF C + 16h: finish >= Mon 13:00 + 16h = Wed 12:00; 12h float to the project finish
+    tasks = [("A", 16), ("B", 8), ("C", 24), ("D", 8), ("E", 8)]
+    preds = [("A", "B", "FS", 8), ("A", "C", "SS", 4), ("B", "D", "FF", 0), ("C", "E", "SF", 16)]
+    result = compute_cpm(xer(tasks, preds))
+    acts = _dates(result)
+    expected = {
+        0: ("2024-01-08 08:00", "2024-01-09 17:00", "2024-01-08 08:00", "2024-01-09 17:00", 0.0),
+        1: ("2024-01-11 08:00", "2024-01-11 17:00", "2024-01-11 08:00", "2024-01-11 17:00", 0.0),
+        2: ("2024-01-08 13:00", "2024-01-11 12:00", "2024-01-09 08:00", "2024-01-11 17:00", 4.0),
+        3: ("2024-01-11 08:00", "2024-01-11 17:00", "2024-01-11 08:00", "2024-01-11 17:00", 0.0),
+        4: ("2024-01-09 13:00", "2024-01-10 12:00", "2024-01-11 08:00", "2024-01-11 17:00", 12.0),
+    }
+    for k, (es, ef, ls, lf, tf) in expected.items():
+        a = acts[k]
+        assert (a["early_start"], a["early_finish"], a["late_start"], a["late_finish"], a["total_float_hr"]) \
+            == (es, ef, ls, lf, tf), tasks[k][0]
+        assert a["critical"] == (tf == 0.0)
+    assert acts[2]["free_float_hr"] == 0.0      # C's start drives E through the SF tie
+    assert acts[4]["free_float_hr"] == 12.0
@@ -0,0 +1,57 @@
+"""LLM response cache: fingerprints, byte-bounded LRU eviction and clearing."""
+import pytest
+
+from schedule_agent_web.llm_cache import ResponseCache, fingerprint
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(tmp_path / "cache.db", max_bytes=1000)
+
+
+def test_fingerprint_covers_every_request_field():
+    base = ("claude", "m", "sys", [{"role": "user", "content": "hi"}], 100, None)
+    key = fingerprint(*base)
+    assert fingerprint(*base) == key
+    for k, other in enumerate(("openai", "m2", "sys2", [{"role": "user", "content": "ho"}], 101, 0.2)):
+        changed = list(base)
+        changed[k] = other
+        assert fingerprint(*changed) != key
+
+
+def test_round_trip_and_counters(cache):
+    assert cache.get("k") is None
+    cache.put("k", "reply", "extract")
+    assert cache.get("k") == "reply"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["stores"], stats["entries"]) == (1, 1, 1, 1)
+
+
+def test_evicts_least_recently_used_below_the_bound(cache):
+    for k in range(4):
+        cache.put(f"k{k}", "x" * 200)
+    cache.get("k0")                      # k0 is now the most recently used
+    cache.put("k4", "x" * 300)           # 1100 bytes > 1000: evict the oldest until <= 900
+    assert cache.stats()["bytes"] == 900 and cache.stats()["evictions"] == 1
+    assert cache.get("k1") is None
+    assert all(cache.get(k) is not None for k in ("k0", "k2", "k3", "k4"))
+
+
+def test_oversized_reply_is_not_stored(cache):
+    cache.put("big", "x" * 2000)
+    assert cache.get("big") is None
+
+
+def test_replacing_a_key_keeps_the_byte_count(cache):
+    cache.put("k", "x" * 100)
+    cache.put("k", "x" * 50)
+    assert cache.stats()["bytes"] == 50
+
+
+def test_clear_by_stage(cache):
+    cache.put("a", "1", "extract")
+    cache.put("b", "2", "digest")
+    assert cache.clear("extract") == 1
+    assert cache.get("a") is None and cache.get("b") == "2"
+    assert cache.clear() == 1
+    assert cache.stats()["entries"] == 0 and cache.stats()["bytes"] == 0
@@ -0,0 +1,116 @@
+"""Model resolution order and circuit breaker (no provider calls)."""
+from types import SimpleNamespace
+
+import pytest
+
+from schedule_agent_web import llm_gateway
+from schedule_agent_web.llm_gateway import ModelResolver
+
+
+class Status(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+CHAIN = ["claude-sonnet-4-0", "claude-sonnet-4-20250514", "claude-3-7-sonnet-latest"]
+
+
+@pytest.fixture
+def resolver():
+    return ModelResolver()
+
+
+def test_preferred_alias_leads_even_when_not_listed(resolver):
+    resolver.set_listed("k", {"claude-3-7-sonnet-latest", "claude-sonnet-4-20250514"})
+    assert resolver.candidates("k", CHAIN) == [CHAIN[0], "claude-sonnet-4-20250514", "claude-3-7-sonnet-latest"]
+
+
+def test_listing_orders_only_the_fallbacks(resolver):
+    resolver.set_listed("k", {"claude-3-7-sonnet-latest"})
+    assert resolver.candidates("k", CHAIN) == [CHAIN[0], "claude-3-7-sonnet-latest", "claude-sonnet-4-20250514"]
+
+
+def test_missing_model_is_skipped_and_fallback_remembered(resolver):
+    assert resolver.failed("k", CHAIN, CHAIN[0], Status(404)) is True
+    resolver.succeeded("k", CHAIN, CHAIN[2])
+    assert resolver.candidates("k", CHAIN) == [CHAIN[2], CHAIN[1]]
+    assert resolver.candidates("other", CHAIN) == CHAIN
+
+
+def test_breaker_opens_after_repeated_transient_failures(resolver, monkeypatch):
+    monkeypatch.setattr(llm_gateway, "BREAKER_FAILURES", 2)
+    assert resolver.failed("k", CHAIN, CHAIN[0], Status(529)) is False
+    assert resolver.candidates("k", CHAIN)[0] == CHAIN[0]
+    resolver.failed("k", CHAIN, CHAIN[0], Status(529))
+    assert resolver.candidates("k", CHAIN)[0] == CHAIN[1]
+    assert resolver.snapshot()[CHAIN[0]]["open"] is True
+    resolver.succeeded("k", CHAIN, CHAIN[0])
+    assert resolver.candidates("k", CHAIN)[0] == CHAIN[0]
+
+
+def test_breaker_closes_after_cooldown(resolver, monkeypatch):
+    monkeypatch.setattr(llm_gateway, "BREAKER_FAILURES", 1)
+    monkeypatch.setattr(llm_gateway, "BREAKER_SECONDS", 0.0)
+    resolver.failed("k", CHAIN, CHAIN[0], Status(500))
+    assert resolver.candidates("k", CHAIN)[0] == CHAIN[0]
+
+
+def test_every_model_open_falls_back_to_full_chain(resolver):
+    for m in CHAIN:
+        resolver.failed("k", CHAIN, m, Status(404))
+    assert resolver.candidates("k", CHAIN) == CHAIN
+
+
+def test_other_errors_do_not_count(resolver):
+    assert resolver.failed("k", CHAIN, CHAIN[0], Status(400)) is False
+    assert resolver.snapshot() == {}
+
+
+class StubClaude:
+    """messages.create answering for every model except those in `missing` (404)."""
+
+    def __init__(self, missing=()):
+        self.missing = set(missing)
+        self.calls = []
+        self.messages = self
+        self.models = self
+
+    def list(self, limit=100):
+        raise RuntimeError("listing unsupported")
+
+    def create(self, model, **req):
+        self.calls.append(model)
+        if model in self.missing:
+            raise Status(404)
+        return SimpleNamespace(content=[SimpleNamespace(text=f"reply from {model}")], usage=None)
+
+
+@pytest.fixture
+def claude(monkeypatch, tmp_path):
+    from schedule_agent_web import llm_cache
+    monkeypatch.setattr(llm_cache, "_cache", llm_cache.ResponseCache(tmp_path / "cache.db"))
+    monkeypatch.setattr(llm_gateway, "_models", ModelResolver())
+    monkeypatch.setattr(llm_gateway, "_route", lambda provider: ("claude", "k"))
+    monkeypatch.setattr(llm_gateway, "claude_models", lambda model=None: list(CHAIN))
+    monkeypatch.delenv("LLM_CACHE", raising=False)
+
+    def install(stub):
+        monkeypatch.setattr(llm_gateway, "_client", lambda kind, key: stub)
+        return stub
+    return install
+
+
+def test_reply_from_preferred_model_is_cached(claude):
+    stub = claude(StubClaude())
+    assert llm_gateway.complete("sys", [{"role": "user", "content": "hi"}], max_tokens=64)[0] == f"reply from {CHAIN[0]}"
+    assert llm_gateway.complete("sys", [{"role": "user", "content": "hi"}], max_tokens=64)[0] == f"reply from {CHAIN[0]}"
+    assert stub.calls == [CHAIN[0]]
+
+
+def test_reply_from_fallback_is_not_cached_under_preferred_key(claude):
+    stub = claude(StubClaude(missing={CHAIN[0]}))
+    text, err = llm_gateway.complete("sys", [{"role": "user", "content": "hi"}], max_tokens=64)
+    assert err is None and text == f"reply from {CHAIN[1]}"
+    llm_gateway.complete("sys", [{"role": "user", "content": "hi"}], max_tokens=64)
+    assert stub.calls == [CHAIN[0], CHAIN[1], CHAIN[1]]
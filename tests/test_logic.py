@@ -0,0 +1,36 @@
+"""Redundant-tie detection: a shortcut is only redundant when a longer path enforces its type and lag."""
+import pytest
+
+from schedule_agent_web.scheduling.logic import analyze_logic
+
+CHAIN = [("A", "B", "FS", 0), ("B", "C", "FS", 0)]      # start(C) >= finish(A) + 8h
+
+
+def _redundant(xer, shortcut, tasks=(("A", 16), ("B", 8), ("C", 24)), chain=CHAIN):
+    report = analyze_logic(xer(list(tasks), list(chain) + [shortcut]))
+    return [(t["pred"], t["succ"], t["type"]) for t in report.redundant]
+
+
+@pytest.mark.parametrize("shortcut", [
+    ("A", "C", "FS", 0),
+    ("A", "C", "FS", 8),      # exactly the chain's 8h through B
+    ("A", "C", "SS", 24),     # start(A) + 16h duration + 8h
+    ("A", "C", "FF", 32),     # the chain plus C's own 24h
+])
+def test_shortcut_dominated_by_chain_is_redundant(xer, shortcut):
+    assert _redundant(xer, shortcut) == [("A", "C", shortcut[2])]
+
+
+@pytest.mark.parametrize("shortcut", [
+    ("A", "C", "FS", 16),     # longer than the chain: this tie drives C
+    ("A", "C", "FF", 40),
+])
+def test_shortcut_with_longer_lag_is_kept(xer, shortcut):
+    assert _redundant(xer, shortcut) == []
+
+
+def test_fs_shortcut_beside_ss_chain_is_kept(xer):
+    # The SS chain only holds C's start to A's start, so A's finish still needs the FS tie.
+    chain = [("A", "B", "SS", 0), ("B", "C", "SS", 0)]
+    assert _redundant(xer, ("A", "C", "FS", 0), chain=chain) == []
+    assert _redundant(xer, ("A", "C", "SS", 0), chain=chain) == [("A", "C", "SS")]
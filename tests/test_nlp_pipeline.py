@@ -0,0 +1,78 @@
+"""Stage 3 LLM stages: concurrency, per-stage timeouts and defaults."""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from schedule_agent_web.nlp import pipeline
+
+
+def _sleep(seconds, value):
+    def run(text):
+        time.sleep(seconds)
+        return value
+    return run
+
+
+@pytest.fixture
+def stages(monkeypatch):
+    pools = []
+
+    def install(workers, **fns):
+        pools.append(ThreadPoolExecutor(max_workers=workers))
+        monkeypatch.setattr(pipeline, "_pool", pools[-1])
+        monkeypatch.setattr(pipeline, "LLM_STAGES", {name: (fn, str) for name, fn in fns.items()})
+    yield install
+    for pool in pools:
+        pool.shutdown(wait=True)
+
+
+def test_stages_run_concurrently(stages):
+    stages(3, a=_sleep(0.2, "A"), b=_sleep(0.2, "B"), c=_sleep(0.2, "C"))
+    t0 = time.monotonic()
+    results, errors = pipeline._run_llm_stages("", lambda: None, timeout=5)
+    assert results == {"a": "A", "b": "B", "c": "C"} and errors == {}
+    assert time.monotonic() - t0 < 0.5
+
+
+def test_slow_stage_gets_its_default(stages):
+    stages(2, fast=_sleep(0, "ok"), slow=_sleep(0.5, "late"))
+    results, errors = pipeline._run_llm_stages("", lambda: None, timeout=0.1)
+    assert results == {"fast": "ok", "slow": ""}
+    assert "timed out" in errors["slow"]
+
+
+def test_failed_stage_is_reported(stages):
+    def boom(text):
+        raise ValueError("bad reply")
+    stages(2, good=_sleep(0, "ok"), bad=boom)
+    results, errors = pipeline._run_llm_stages("", lambda: None, timeout=1)
+    assert results == {"good": "ok", "bad": ""} and errors == {"bad": "bad reply"}
+
+
+def test_timeout_starts_when_the_stage_runs(stages):
+    # One worker: b waits behind a (0.15s) but its own 0.2s budget starts only when it runs.
+    stages(1, a=_sleep(0.15, "A"), b=_sleep(0.15, "B"))
+    results, errors = pipeline._run_llm_stages("", lambda: None, timeout=0.2)
+    assert results == {"a": "A", "b": "B"} and errors == {}
+
+
+def test_stage_still_queued_is_cancelled(stages):
+    release = threading.Event()
+    ran = []
+
+    def block(text):
+        release.wait(2)
+        return "A"
+
+    def queued(text):
+        ran.append(1)
+        return "B"
+
+    stages(1, a=block, b=queued)
+    results, errors = pipeline._run_llm_stages("", lambda: None, timeout=0.1)
+    release.set()
+    pipeline._pool.shutdown(wait=True)
+    assert "not started" in errors["b"] and results["b"] == ""
+    assert ran == []
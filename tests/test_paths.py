@@ -0,0 +1,39 @@
+"""Driving paths: the default project-finish target and driving ties next to constraint overrides."""
+from schedule_agent_web.scheduling.paths import driving_paths
+
+
+def _codes(paths, tasks, nodes):
+    codes = tasks.texts("task_code")
+    return [codes[int(paths.cpm.network.rows[i])] for i in nodes]
+
+
+def test_default_target_is_the_finish_milestone_not_an_earlier_node_with_the_same_finish(xer):
+    # B, D and M all finish Wed 17:00; only M ends the network.
+    parsed = xer([("A", 16), ("B", 8), ("D", 8), ("M", 0, 1, "TT_FinMile")],
+                 [("A", "B", "FS", 0), ("B", "D", "FF", 0), ("D", "M", "FS", 0)])
+    paths = driving_paths(parsed)
+    target = paths.finish_node()
+    assert _codes(paths, parsed["TASK"], [target]) == ["M"]
+    nodes, _ = paths.driving_chain(target)
+    assert _codes(paths, parsed["TASK"], nodes) == ["A", "B", "D", "M"]
+
+
+def test_finish_milestone_wins_a_tie_between_open_ends(xer):
+    parsed = xer([("A", 16), ("X", 16), ("M", 0, 1, "TT_FinMile")], [("A", "M", "FS", 0)])
+    paths = driving_paths(parsed)
+    assert _codes(paths, parsed["TASK"], [paths.finish_node()]) == ["M"]
+
+
+def test_negative_rff_tie_does_not_hide_the_driving_tie(xer):
+    # T is forced to start Tue 08:00: Y (5 days) runs past it (negative RFF) while Z finishes
+    # Mon 17:00 and drives T with zero RFF.
+    parsed = xer([("Y", 40), ("Z", 8), ("T", 8)], [("Y", "T", "FS", 0), ("Z", "T", "FS", 0)],
+                 constraints={"T": ("CS_MANDSTART", "2024-01-09 08:00")})
+    paths = driving_paths(parsed)
+    tasks = parsed["TASK"]
+    t = paths.node_of(tasks, "T")
+    rff = {_codes(paths, tasks, [int(paths.pred[e])])[0]: float(paths.rff[e]) for e in range(len(paths.pred))}
+    assert rff["Y"] < 0 and rff["Z"] == 0
+    nodes, _ = paths.driving_chain(t)
+    assert _codes(paths, tasks, nodes) == ["Z", "T"]
+    assert paths._driver(t) == "logic"
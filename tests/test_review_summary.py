@@ -0,0 +1,11 @@
+"""Review summary of an export whose total float column is present but blank."""
+from schedule_agent_web.main import _summarize_xer_tables
+
+
+def test_blank_stored_float_falls_back_to_recomputed_float(xer):
+    parsed = xer([("A", 40), ("B", 16), ("C", 8)], [("A", "B", "FS", 0)])
+    assert parsed["TASK"].has("total_float_hr_cnt")
+    rows = {line.split("|")[0].strip(): line.split("|") for line in _summarize_xer_tables(parsed).splitlines()
+            if line.count("|") == 10}
+    assert rows["A"][6] == "0" and "CRIT" in rows["A"][10]
+    assert rows["C"][6] == "6" and "NEAR" in rows["C"][10]
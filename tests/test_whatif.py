@@ -0,0 +1,78 @@
+"""Incremental what-if passes give the same dates as a full run_cpm of the edited network."""
+import random
+
+import numpy as np
+import pytest
+
+from schedule_agent_web.scheduling.cpm import compute_cpm
+from schedule_agent_web.scheduling.whatif import WhatIf, what_if
+from schedule_agent_web.scheduling.xer_parser import parse_xer_text
+
+from conftest import build_xer
+
+TYPES = ["FS", "FS", "FS", "SS", "FF", "SF"]
+
+
+def _network(n=80, seed=3):
+    """Random acyclic network over both test calendars with every tie type and positive / negative lags."""
+    rnd = random.Random(seed)
+    # Milestones at T..7; the scenarios edit durations elsewhere.
+    tasks = [(f"T{i:03d}", 0 if i % 10 == 7 else rnd.choice([8, 16, 40, 24]), rnd.choice([1, 1, 2])) for i in range(n)]
+    preds = []
+    for i in range(1, n):
+        for j in rnd.sample(range(max(0, i - 12), i), min(i, rnd.choice([1, 1, 2, 3]))):
+            preds.append((tasks[j][0], tasks[i][0], rnd.choice(TYPES), rnd.choice([0, 0, 4, 8, -4])))
+    return tasks, preds
+
+
+@pytest.fixture(scope="module")
+def network():
+    tasks, preds = _network()
+    parsed = parse_xer_text(build_xer(tasks, preds))
+    return parsed, what_if(parsed)
+
+
+def _dates(engine: WhatIf, idx, work):
+    out = np.asarray(engine.base, dtype=np.float64).copy()
+    out[:, idx] = work
+    return out
+
+
+SCENARIOS = [
+    [{"op": "duration", "activity": "T010", "days": 9}],
+    [{"op": "duration", "activity": "T040", "days": 0}],
+    [{"op": "add_tie", "pred": "T005", "succ": "T060", "type": "SS", "lag_days": 30}],
+    [{"op": "add_tie", "pred": "T020", "succ": "T070", "type": "FF", "lag_days": 25}],
+    [{"op": "remove_tie", "pred": "T000", "succ": "T001"}],
+    [{"op": "constraint", "activity": "T030", "type": "CS_MSOA", "date": "2024-03-04 08:00"}],
+    [{"op": "constraint", "activity": "T050", "type": "CS_MEOB", "date": "2024-01-10 17:00"}],
+    [{"op": "duration", "activity": "T015", "days": 12},
+     {"op": "add_tie", "pred": "T033", "succ": "T079", "type": "SF", "lag_days": 2}],
+]
+
+
+@pytest.mark.parametrize("edits", SCENARIOS)
+def test_incremental_matches_full_run(network, edits):
+    parsed, engine = network
+    sc = engine.scenario(parsed.get("TASK"), edits)
+    inc_idx, inc_work, inc_pf, _ = engine._incremental(sc)
+    assert len(inc_idx)
+    full_idx, full_work, full_pf, _ = engine._full(sc)
+    assert inc_pf == pytest.approx(full_pf, abs=1e-6)
+    np.testing.assert_allclose(_dates(engine, inc_idx, inc_work), _dates(engine, full_idx, full_work),
+                               atol=1e-6, equal_nan=True)
+
+
+def test_duration_edit_equals_rescheduled_xer(network):
+    parsed, engine = network
+    tasks, preds = _network()
+    code, hours, cal = tasks[10]
+    edited = [(c, 9 * 8 if c == code and cal == 1 else 9 * 24 if c == code else h, k) for c, h, k in tasks]
+    expected = compute_cpm(parse_xer_text(build_xer(edited, preds)))
+    result = engine.run(parsed.get("TASK"), [{"op": "duration", "activity": code, "days": 9}], limit=1000)
+    by_id = {a["task_id"]: a for a in result["activities"]}
+    assert result["projectFinish"]["after"] == expected.iso(expected.project_finish)
+    for i, tid in enumerate(expected.network.task_ids):
+        if tid in by_id:
+            assert by_id[tid]["early_start"]["after"] == expected.activity(i)["early_start"]
+            assert by_id[tid]["early_finish"]["after"] == expected.activity(i)["early_finish"]
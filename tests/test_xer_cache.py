@@ -0,0 +1,75 @@
+"""Parsed-schedule cache budget, including memoised derived structures."""
+import threading
+import time
+
+import pytest
+
+from schedule_agent_web.scheduling import xer_cache
+from schedule_agent_web.scheduling.cpm import compute_cpm
+from schedule_agent_web.scheduling.xer_parser import parse_xer_text
+
+from conftest import build_xer
+
+
+@pytest.fixture
+def cache():
+    xer_cache.clear_cache()
+    yield xer_cache
+    xer_cache.clear_cache()
+
+
+def test_derived_memos_count_against_the_budget(cache):
+    parsed = cache.get_parsed_xer(build_xer([("A", 40), ("B", 24, 2)], [("A", "B", "FS", 0)]))
+    tables = cache.cache_stats()["bytes"]
+    compute_cpm(parsed)
+    assert parsed.derived_bytes > 0
+    assert cache.cache_stats()["bytes"] == tables + parsed.derived_bytes
+
+
+def test_growth_evicts_least_recently_used(cache, monkeypatch):
+    monkeypatch.setattr(xer_cache, "XER_CACHE_MAX_MB", 1)
+    old = cache.get_parsed_xer(build_xer([("A", 8)], []))
+    cache.get_parsed_xer(build_xer([("A", 16)], []))
+    old.memo("big", lambda p: bytearray(2 * 1024 * 1024))
+    stats = cache.cache_stats()
+    assert stats["entries"] == 1 and stats["evictions"] == 1
+    assert cache.get_cached(xer_cache.content_key(build_xer([("A", 8)], []))) is old
+
+
+def test_concurrent_memo_builds_once():
+    parsed = parse_xer_text(build_xer([("A", 8)], []))
+    calls = []
+
+    def build(p):
+        calls.append(1)
+        time.sleep(0.05)
+        return object()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(parsed.memo("slow", build))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert len({id(r) for r in results}) == 1
+
+
+def test_failed_parse_leaves_no_gate_or_names(cache, monkeypatch):
+    def boom(text):
+        raise ValueError("bad XER")
+    monkeypatch.setattr(xer_cache, "parse_xer_text", boom)
+    with pytest.raises(ValueError):
+        cache.get_parsed_xer(build_xer([("A", 8)], []), "s1", "a.xer")
+    assert not xer_cache._inflight
+    assert not xer_cache._file_keys and not xer_cache._key_sessions
+
+
+def test_eviction_drops_upload_names(cache, monkeypatch):
+    monkeypatch.setattr(xer_cache, "XER_CACHE_MAX_MB", 0)
+    monkeypatch.setattr(xer_cache, "XER_CACHE_SPILL", False)
+    for n in range(5):
+        cache.get_parsed_xer(build_xer([("A", 8 + n)], []), "s1", f"v{n}.xer")
+    assert cache.cache_stats()["entries"] == 1
+    assert list(xer_cache._file_keys) == [("s1", "v4.xer")]
+    assert list(xer_cache._key_sessions) == [xer_cache._file_keys[("s1", "v4.xer")]]